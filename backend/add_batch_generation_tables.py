@@ -0,0 +1,39 @@
+"""
+创建批量生成任务表（batch_generation_job / batch_generation_item）的数据库迁移脚本
+执行命令: python add_batch_generation_tables.py
+"""
+import sys
+import os
+
+# 添加 backend 目录到路径
+backend_dir = os.path.dirname(__file__)
+sys.path.insert(0, backend_dir)
+
+from sqlalchemy import inspect
+from app.database import engine, Base
+from app.models import BatchGenerationJob, BatchGenerationItem
+
+NEW_TABLES = [BatchGenerationJob.__table__, BatchGenerationItem.__table__]
+
+def migrate():
+    """执行数据库迁移"""
+    print("开始数据库迁移...")
+
+    try:
+        existing = inspect(engine).get_table_names()
+        for table in NEW_TABLES:
+            if table.name not in existing:
+                print(f"创建 {table.name} 表...")
+                Base.metadata.create_all(bind=engine, tables=[table])
+                print(f"✅ {table.name} 表创建成功")
+            else:
+                print(f"⚠️ {table.name} 表已存在，跳过")
+
+        print("✅ 数据库迁移完成！")
+
+    except Exception as e:
+        print(f"❌ 数据库迁移失败: {e}")
+        raise
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,52 @@
+"""
+为test_run表的status字段添加queued状态的数据库迁移脚本
+SQLite 中 status 为普通字符串列，无需修改；MySQL 的 ENUM 列需要追加新值
+执行命令: python add_queued_status.py
+"""
+import sys
+import os
+
+# 添加 backend 目录到路径
+backend_dir = os.path.dirname(__file__)
+sys.path.insert(0, backend_dir)
+
+from sqlalchemy import text
+from app.database import engine
+
+def migrate():
+    """执行数据库迁移"""
+    print("开始数据库迁移...")
+    
+    try:
+        with engine.connect() as conn:
+            if engine.dialect.name != 'mysql':
+                print(f"⚠️ {engine.dialect.name} 无需迁移，跳过")
+                return
+            
+            result = conn.execute(text("""
+                SELECT COLUMN_TYPE 
+                FROM INFORMATION_SCHEMA.COLUMNS 
+                WHERE TABLE_NAME = 'test_run' 
+                AND COLUMN_NAME = 'status'
+            """))
+            column_type = result.scalar() or ""
+            
+            if 'queued' in column_type.lower():
+                print("⚠️ status 字段已包含 queued，跳过")
+            else:
+                # 沿用现有枚举值的大小写
+                queued = 'QUEUED' if 'RUNNING' in column_type else 'queued'
+                new_type = column_type.replace("enum(", f"enum('{queued}',", 1)
+                print(f"修改 status 字段类型为 {new_type} ...")
+                conn.execute(text(f"ALTER TABLE test_run MODIFY COLUMN status {new_type} NOT NULL"))
+                conn.commit()
+                print("✅ queued 状态添加成功")
+        
+        print("✅ 数据库迁移完成！")
+        
+    except Exception as e:
+        print(f"❌ 数据库迁移失败: {e}")
+        raise
+
+if __name__ == "__main__":
+    migrate()
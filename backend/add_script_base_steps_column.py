@@ -0,0 +1,55 @@
+"""
+添加 script_base_steps 字段到test_case表的数据库迁移脚本（脚本增量重新生成使用）
+执行命令: python add_script_base_steps_column.py
+"""
+import sys
+import os
+
+# 添加 backend 目录到路径
+backend_dir = os.path.dirname(__file__)
+sys.path.insert(0, backend_dir)
+
+from sqlalchemy import text
+from app.database import engine
+
+NEW_COLUMNS = {
+    "script_base_steps": "JSON"
+}
+
+def migrate():
+    """执行数据库迁移"""
+    print("开始数据库迁移...")
+    
+    try:
+        with engine.connect() as conn:
+            if engine.dialect.name == 'sqlite':
+                result = conn.execute(text("PRAGMA table_info(test_case)"))
+                columns = [row[1] for row in result]
+            elif engine.dialect.name == 'mysql':
+                result = conn.execute(text("""
+                    SELECT COLUMN_NAME 
+                    FROM INFORMATION_SCHEMA.COLUMNS 
+                    WHERE TABLE_NAME = 'test_case'
+                """))
+                columns = [row[0] for row in result]
+            else:
+                print(f"⚠️ 不支持的数据库类型: {engine.dialect.name}")
+                return
+            
+            for column, column_type in NEW_COLUMNS.items():
+                if column not in columns:
+                    print(f"添加 {column} 列到 test_case 表...")
+                    conn.execute(text(f"ALTER TABLE test_case ADD COLUMN {column} {column_type}"))
+                    print(f"✅ {column} 列添加成功")
+                else:
+                    print(f"⚠️ {column} 列已存在，跳过")
+            conn.commit()
+        
+        print("✅ 数据库迁移完成！")
+        
+    except Exception as e:
+        print(f"❌ 数据库迁移失败: {e}")
+        raise
+
+if __name__ == "__main__":
+    migrate()
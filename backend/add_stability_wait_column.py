@@ -0,0 +1,55 @@
+"""
+添加stability_wait_ms字段到step_execution表的数据库迁移脚本
+执行命令: python add_stability_wait_column.py
+"""
+import sys
+import os
+
+# 添加 backend 目录到路径
+backend_dir = os.path.dirname(__file__)
+sys.path.insert(0, backend_dir)
+
+from sqlalchemy import text
+from app.database import engine
+
+def migrate():
+    """执行数据库迁移"""
+    print("开始数据库迁移...")
+    
+    try:
+        with engine.connect() as conn:
+            # 检查列是否已存在
+            if engine.dialect.name == 'sqlite':
+                result = conn.execute(text("PRAGMA table_info(step_execution)"))
+                columns = [row[1] for row in result]
+                exists = 'stability_wait_ms' in columns
+            
+            elif engine.dialect.name == 'mysql':
+                result = conn.execute(text("""
+                    SELECT COUNT(*) 
+                    FROM INFORMATION_SCHEMA.COLUMNS 
+                    WHERE TABLE_NAME = 'step_execution' 
+                    AND COLUMN_NAME = 'stability_wait_ms'
+                """))
+                exists = result.scalar() > 0
+            
+            else:
+                print(f"⚠️ 不支持的数据库类型: {engine.dialect.name}")
+                return
+            
+            if not exists:
+                print("添加 stability_wait_ms 列到 step_execution 表...")
+                conn.execute(text("ALTER TABLE step_execution ADD COLUMN stability_wait_ms INTEGER"))
+                conn.commit()
+                print("✅ stability_wait_ms 列添加成功")
+            else:
+                print("⚠️ stability_wait_ms 列已存在，跳过")
+        
+        print("✅ 数据库迁移完成！")
+        
+    except Exception as e:
+        print(f"❌ 数据库迁移失败: {e}")
+        raise
+
+if __name__ == "__main__":
+    migrate()
@@ -12,6 +12,7 @@ from app.models.test_case import TestCase
 from app.models.test_run import TestRun, LLMVerdict
 from app.schemas.project import ProjectCreate, ProjectUpdate, ProjectResponse, ProjectWithStatsResponse
 from app.utils.encryption import encrypt_api_key, decrypt_api_key
+from app.services.llm_registry import llm_registry
 from app.api.dependencies import get_current_user, get_current_admin_user
 
 router = APIRouter(prefix="/projects", tags=["项目管理"])
@@ -160,6 +161,9 @@ async def update_project(
     db.commit()
     db.refresh(project)
     
+    # LLM配置可能已修改，丢弃缓存的客户端
+    llm_registry.invalidate(project.id)
+    
     return ProjectResponse.model_validate(project)
 
 
@@ -179,6 +183,7 @@ async def delete_project(
     
     db.delete(project)
     db.commit()
+    llm_registry.invalidate(project_id)
     
     return None
 
@@ -1,14 +1,13 @@
 """
 Playwright录制脚本API端点
 """
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import subprocess
 import os
 import tempfile
-import json
 import uuid
 import asyncio
 from datetime import datetime
@@ -17,8 +16,8 @@ from app.database import get_db
 from app.models.user import User
 from app.models.project import Project
 from app.api.dependencies import get_current_user
-from app.services.llm_service import LLMService
-from app.utils.encryption import decrypt_api_key
+from app.services.llm_registry import get_llm_service
+from app.services.llm_executor import run_llm_task
 
 router = APIRouter(tags=["录制脚本"])
 
@@ -67,22 +66,13 @@ def convert_playwright_to_json(playwright_code: str, project: Project) -> Dict[s
         llm_provider: str = project.llm_provider  # type: ignore
         llm_model: str = project.llm_model  # type: ignore
         llm_api_key_encrypted: str = project.llm_api_key  # type: ignore
-        llm_base_url: Optional[str] = project.llm_base_url  # type: ignore
         
         if llm_provider and llm_model and llm_api_key_encrypted:
             print("使用LLM转换录制脚本...")
             
-            # 解密 API key
-            llm_api_key = decrypt_api_key(llm_api_key_encrypted)
             print(f"LLM配置: provider={llm_provider}, model={llm_model}")
             
-            llm_service = LLMService(
-                provider=llm_provider,
-                model=llm_model,
-                api_key=llm_api_key,
-                base_url=llm_base_url,
-                config={"temperature": 0.3, "max_tokens": 2000}
-            )
+            llm_service = get_llm_service(project, config_override={"temperature": 0.3, "max_tokens": 2000})
             
             # 构建提示词
             prompt = f"""你是一个Playwright自动化测试专家。请将以下Playwright Python录制代码转换为标准化的JSON格式配置。
@@ -116,7 +106,7 @@ Playwright录制代码:
 - uncheck: 取消勾选（selector为选择器）
 
 重要提示：
-- 系统会在每个步骤执行后自动等待3秒再截图，确保页面完全加载
+- 系统会在每个步骤执行后自动等待页面稳定再截图，确保页面完全加载
 - 你不需要在每个步骤后手动添加waitTime，除非有特殊需要
 
 请只返回JSON，不要包含任何其他说明文字或markdown标记。确保JSON格式正确。
@@ -148,20 +138,8 @@ Playwright录制代码:
   ]
 }}"""
             
-            response = llm_service._call_llm(prompt)
-            
-            # 解析响应
-            response = response.strip()
-            if "```json" in response:
-                start = response.find("```json") + 7
-                end = response.find("```", start)
-                response = response[start:end].strip()
-            elif "```" in response:
-                start = response.find("`") + 3
-                end = response.find("```", start)
-                response = response[start:end].strip()
-            
-            result = json.loads(response)
+            # 相同录制代码的转换结果从缓存读取
+            result = llm_service._call_llm_cached(prompt, llm_service._parse_script_response)
             print(f"LLM转换成功，生成了 {len(result.get('steps', []))} 个步骤")
             return result
         else:
@@ -371,11 +349,14 @@ async def start_record(
 @router.post("/record/{session_id}/stop")
 async def stop_record(
     session_id: str,
+    http_request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     停止录制会话
+    
+    终止 codegen 进程和 LLM 转换都在 LLM 线程池中执行，不阻塞事件循环
     """
     if session_id not in recording_sessions:
         raise HTTPException(
@@ -393,26 +374,14 @@ async def stop_record(
             detail="项目不存在"
         )
     
-    # 终止进程
-    try:
-        session["process"].terminate()
-        session["process"].wait(timeout=5)
-    except:
-        session["process"].kill()
-    
-    # 读取生成的代码
-    output_file = session["output_file"]
-    playwright_code = ""
+    # 先移出会话，避免重复点击停止时并发处理同一会话
+    del recording_sessions[session_id]
     
-    if os.path.exists(output_file):
-        with open(output_file, 'r', encoding='utf-8') as f:
-            playwright_code = f.read()
+    # 终止进程并读取生成的代码（进程仍需等待结束，客户端断开时也要完成）
+    playwright_code = await run_llm_task(None, _terminate_and_read, session["process"], session["output_file"])
     
     # 转换为JSON（传入project对象用于LLM转换）
-    playwright_script = convert_playwright_to_json(playwright_code, project)
-    
-    # 清理会话
-    del recording_sessions[session_id]
+    playwright_script = await run_llm_task(http_request, convert_playwright_to_json, playwright_code, project)
     
     return {
         "status": "stopped",
@@ -421,6 +390,21 @@ async def stop_record(
     }
 
 
+def _terminate_and_read(process: subprocess.Popen, output_file: str) -> str:
+    """终止 codegen 进程并读取录制生成的代码"""
+    try:
+        process.terminate()
+        process.wait(timeout=5)
+    except Exception:
+        process.kill()
+        process.wait()
+    
+    if not os.path.exists(output_file):
+        return ""
+    with open(output_file, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
 @router.post("/convert", response_model=ConvertCodeResponse)
 async def convert_code(
     request: ConvertCodeRequest,
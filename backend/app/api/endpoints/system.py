@@ -0,0 +1,72 @@
+"""
+系统状态API端点
+"""
+from fastapi import APIRouter, Depends
+
+from app.models.user import User
+from app.api.dependencies import get_current_user
+from app.services.browser_pool import browser_pool
+from app.services.run_scheduler import run_scheduler
+from app.services.midscene_sidecar import midscene_sidecar_pool
+from app.services.llm_registry import llm_registry
+from app.services.llm_cache import llm_response_cache
+from app.services.llm_rate_limiter import llm_rate_limiter
+from app.services.batch_generation import batch_generation_jobs
+
+router = APIRouter(prefix="/system", tags=["系统状态"])
+
+
+@router.get("/browser-pool")
+async def get_browser_pool_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取浏览器池统计数据"""
+    return browser_pool.stats()
+
+
+@router.get("/scheduler")
+async def get_scheduler_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取运行调度器统计数据"""
+    return run_scheduler.stats()
+
+
+@router.get("/midscene-sidecar")
+async def get_midscene_sidecar_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取 Midscene sidecar 进程池统计数据"""
+    return midscene_sidecar_pool.stats()
+
+
+@router.get("/llm-clients")
+async def get_llm_client_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取 LLM 客户端注册表统计数据"""
+    return llm_registry.stats()
+
+
+@router.get("/llm-rate-limits")
+async def get_llm_rate_limit_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取 LLM 限流、重试和对冲统计数据"""
+    return llm_rate_limiter.stats()
+
+
+@router.get("/llm-cache")
+async def get_llm_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取 LLM 响应缓存统计数据"""
+    return llm_response_cache.stats()
+
+
+@router.get("/batch-generation")
+async def get_batch_generation_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取批量生成任务统计数据"""
+    return batch_generation_jobs.stats()
@@ -1,10 +1,12 @@
 """
 测试用例管理API端点
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from typing import List, Dict, Any, cast
+from typing import List, Dict, Any, Callable, Iterator, cast
+import json
 from app.database import get_db
 from app.models.user import User
 from app.models.project import Project
@@ -13,10 +15,17 @@ from app.models.test_run import TestRun, LLMVerdict
 from app.schemas.test_case import (
     TestCaseCreate, TestCaseUpdate, TestCaseResponse, TestCaseWithStatsResponse,
     NaturalLanguageRequest, StandardCaseResponse,
-    ScriptGenerationRequest, ScriptGenerationResponse
+    ScriptGenerationRequest, ScriptGenerationResponse,
+    FullCaseGenerationRequest, FullCaseGenerationResponse,
+    ScriptRegenerationRequest, ScriptRegenerationResponse,
+    BatchGenerationRequest, BatchGenerationJobResponse
 )
-from app.services.llm_service import LLMService
-from app.utils.encryption import decrypt_api_key
+from app.services.llm_registry import get_llm_service
+from app.services.llm_executor import run_llm_task, stream_llm_task, submit_llm_task
+from app.services.verdict_cache import verdict_cache
+from app.services.script_regeneration import EXECUTOR_TYPES, regenerate_script, with_script_base
+from app.services.batch_generation import batch_generation_jobs
+from app.config import settings
 from app.api.dependencies import get_current_user, get_current_admin_user
 
 router = APIRouter(tags=["测试用例"])
@@ -97,6 +106,10 @@ async def create_test_case(
         standard_steps=test_case_data.standard_steps,
         playwright_script=test_case_data.playwright_script,
         expected_result=test_case_data.expected_result,
+        # 记录脚本依据的标准化步骤，之后修改步骤时可增量重新生成
+        script_base_steps=with_script_base(
+            None, "playwright", test_case_data.standard_steps, test_case_data.playwright_script
+        ),
         created_by=current_user.id
     )
     db.add(test_case)
@@ -157,14 +170,21 @@ async def update_test_case(
         if isinstance(test_case_data.playwright_script, str):
             # 如果是字符串，尝试解析为 JSON
             try:
-                test_case.playwright_script = json.loads(test_case_data.playwright_script)
+                playwright_script = json.loads(test_case_data.playwright_script)
             except json.JSONDecodeError:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Playwright 脚本格式错误，请提供有效的 JSON"
                 )
         else:
-            test_case.playwright_script = test_case_data.playwright_script
+            playwright_script = test_case_data.playwright_script
+        # 编辑页面总会带上未改动的脚本，只有脚本确实被修改时才视为依据当前标准化步骤生成，
+        # 否则保留原记录，重新生成脚本时才能发现标准化步骤的改动
+        if playwright_script != test_case.playwright_script:
+            test_case.playwright_script = playwright_script
+            test_case.script_base_steps = with_script_base(
+                test_case.script_base_steps, "playwright", test_case.standard_steps, playwright_script
+            )
     
     # 处理 Midscene 脚本（JSON 字符串）
     if test_case_data.midscene_script is not None:
@@ -172,12 +192,16 @@ async def update_test_case(
         try:
             # 验证是否为有效的 JSON
             midscene_data = json.loads(test_case_data.midscene_script)
-            test_case.midscene_script = midscene_data
         except json.JSONDecodeError:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Midscene 脚本格式错误，请提供有效的 JSON"
             )
+        if midscene_data != test_case.midscene_script:
+            test_case.midscene_script = midscene_data
+            test_case.script_base_steps = with_script_base(
+                test_case.script_base_steps, "midscene", test_case.standard_steps, midscene_data
+            )
     
     db.commit()
     db.refresh(test_case)
@@ -209,6 +233,7 @@ async def delete_test_case(
     
     db.delete(test_case)
     db.commit()
+    verdict_cache.clear(case_id)
     
     return None
 
@@ -216,6 +241,7 @@ async def delete_test_case(
 @router.post("/cases/generate-from-nl", response_model=StandardCaseResponse)
 async def generate_case_from_natural_language(
     request: NaturalLanguageRequest,
+    http_request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -228,35 +254,203 @@ async def generate_case_from_natural_language(
             detail="项目不存在"
         )
     
-    # 解密API密钥并创建LLM服务
-    api_key = decrypt_api_key(project.llm_api_key)
-    llm_service = LLMService(
-        provider=project.llm_provider,
-        model=project.llm_model,
-        api_key=api_key,
-        base_url=project.llm_base_url,
-        config=project.llm_config
-    )
+    # 获取共享的LLM服务（复用已解密的密钥和长连接客户端）
+    llm_service = get_llm_service(project)
     
     try:
-        # 调用LLM生成用例
-        result = llm_service.generate_test_case_from_nl(
+        # 调用LLM生成用例（在LLM线程池中执行，客户端断开后取消）
+        result = await run_llm_task(
+            http_request,
+            llm_service.generate_test_case_from_nl,
             natural_language=request.natural_language,
             base_url=project.base_url
         )
         
         return StandardCaseResponse(**result)
     
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"生成测试用例失败: {str(e)}"
+        )
+
+
+@router.post("/cases/generate-full", response_model=FullCaseGenerationResponse)
+async def generate_full_case(
+    request: FullCaseGenerationRequest,
+    http_request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    从自然语言一次生成标准化测试用例和执行脚本
+    
+    用例和脚本在同一次LLM调用中生成；prefetch_other_script 为 true 时，
+    在后台用生成的用例预生成另一种执行器的脚本，之后调用对应的脚本生成接口可直接命中响应缓存。
+    """
+    if request.executor_type not in EXECUTOR_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="执行器类型必须是 playwright 或 midscene"
+        )
+    
+    project = db.query(Project).filter(Project.id == request.project_id).first()
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="项目不存在"
+        )
+    
+    llm_service = get_llm_service(project)
+    base_url = project.base_url
+    
+    try:
+        result = await run_llm_task(
+            http_request,
+            llm_service.generate_case_with_script,
+            natural_language=request.natural_language,
+            base_url=base_url,
+            executor_type=request.executor_type
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"生成测试用例失败: {str(e)}"
         )
+    
+    if request.prefetch_other_script:
+        # 预生成的脚本只写入响应缓存，用例名称和步骤保存时未修改才会命中
+        prefetch = (
+            llm_service.generate_midscene_script
+            if request.executor_type == "playwright"
+            else llm_service.generate_playwright_script
+        )
+        submit_llm_task(
+            prefetch,
+            case_name=result["name"],
+            standard_steps=result["standard_steps"],
+            base_url=base_url
+        )
+    
+    script_field = "playwright_script" if request.executor_type == "playwright" else "midscene_script"
+    return FullCaseGenerationResponse(
+        name=result["name"],
+        description=result["description"],
+        standard_steps=result["standard_steps"],
+        expected_result=result["expected_result"],
+        executor_type=request.executor_type,
+        **{script_field: result["script"]}
+    )
+
+
+@router.post(
+    "/projects/{project_id}/cases/batch-generate",
+    response_model=BatchGenerationJobResponse,
+    status_code=status.HTTP_202_ACCEPTED
+)
+async def batch_generate_cases(
+    project_id: int,
+    request: BatchGenerationRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    批量从自然语言生成用例和脚本
+    
+    后台按有限并发生成（每条场景一次LLM调用），全部完成后在同一个事务中保存成功的用例。
+    立即返回任务ID，通过 GET /cases/batch-jobs/{job_id} 查询逐条进度和失败原因。
+    """
+    if request.executor_type not in EXECUTOR_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="执行器类型必须是 playwright 或 midscene"
+        )
+    
+    descriptions = [text.strip() for text in request.descriptions if text and text.strip()]
+    if not descriptions:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="场景列表不能为空"
+        )
+    if len(descriptions) > settings.BATCH_GENERATION_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"单次最多批量生成 {settings.BATCH_GENERATION_MAX_ITEMS} 条场景"
+        )
+    
+    project = db.query(Project).filter(Project.id == project_id).first()
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="项目不存在"
+        )
+    
+    job = batch_generation_jobs.submit(
+        project_id=project_id,
+        user_id=current_user.id,
+        llm_service=get_llm_service(project),
+        base_url=project.base_url,
+        descriptions=descriptions,
+        executor_type=request.executor_type
+    )
+    return BatchGenerationJobResponse(**job)
+
+
+@router.get("/cases/batch-jobs/{job_id}", response_model=BatchGenerationJobResponse)
+async def get_batch_generation_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """查询批量生成任务的进度"""
+    job = batch_generation_jobs.get(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="批量生成任务不存在或已过期"
+        )
+    return BatchGenerationJobResponse(**job)
+
+
+@router.post("/cases/generate-from-nl/stream")
+async def stream_case_from_natural_language(
+    request: NaturalLanguageRequest,
+    http_request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    从自然语言流式生成标准化测试用例（Server-Sent Events）
+    
+    事件: token（模型输出片段）、step（standard_steps 中刚生成完整的步骤）、
+    result（校验后的完整用例，结构同 /cases/generate-from-nl）、error（生成失败）
+    """
+    project = db.query(Project).filter(Project.id == request.project_id).first()
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="项目不存在"
+        )
+    
+    llm_service = get_llm_service(project)
+    base_url = project.base_url
+    return _sse_response(
+        http_request,
+        lambda: llm_service.stream_test_case_from_nl(
+            natural_language=request.natural_language,
+            base_url=base_url
+        ),
+        lambda result: StandardCaseResponse(**result).model_dump()
+    )
 
 
 @router.post("/cases/generate-script", response_model=ScriptGenerationResponse)
 async def generate_playwright_script(
     request: ScriptGenerationRequest,
+    http_request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -277,19 +471,14 @@ async def generate_playwright_script(
             detail="项目不存在"
         )
     
-    # 解密API密钥并创建LLM服务
-    api_key = decrypt_api_key(project.llm_api_key)
-    llm_service = LLMService(
-        provider=project.llm_provider,
-        model=project.llm_model,
-        api_key=api_key,
-        base_url=project.llm_base_url,
-        config=project.llm_config
-    )
+    # 获取共享的LLM服务（复用已解密的密钥和长连接客户端）
+    llm_service = get_llm_service(project)
     
     try:
         # 调用LLM生成脚本，使用 cast 进行类型转换
-        result = llm_service.generate_playwright_script(
+        result = await run_llm_task(
+            http_request,
+            llm_service.generate_playwright_script,
             case_name=test_case.name,
             standard_steps=cast(List[Dict[str, Any]], test_case.standard_steps),
             base_url=project.base_url
@@ -297,6 +486,8 @@ async def generate_playwright_script(
         
         return ScriptGenerationResponse(playwright_script=result)
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -304,9 +495,126 @@ async def generate_playwright_script(
         )
 
 
+@router.post("/cases/generate-script/stream")
+async def stream_playwright_script(
+    request: ScriptGenerationRequest,
+    http_request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    从标准化用例流式生成Playwright脚本（Server-Sent Events）
+    
+    事件: token（模型输出片段）、step（脚本 steps 中刚生成完整的步骤）、
+    result（校验后的完整脚本，结构同 /cases/generate-script）、error（生成失败）
+    """
+    test_case = db.query(TestCase).filter(TestCase.id == request.test_case_id).first()
+    if not test_case:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="测试用例不存在"
+        )
+    
+    project = db.query(Project).filter(Project.id == test_case.project_id).first()
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="项目不存在"
+        )
+    
+    llm_service = get_llm_service(project)
+    # 响应开始后数据库会话可能已关闭，先取出生成所需的字段
+    case_name = test_case.name
+    standard_steps = cast(List[Dict[str, Any]], test_case.standard_steps)
+    base_url = project.base_url
+    return _sse_response(
+        http_request,
+        lambda: llm_service.stream_playwright_script(
+            case_name=case_name,
+            standard_steps=standard_steps,
+            base_url=base_url
+        ),
+        lambda result: ScriptGenerationResponse(playwright_script=result).model_dump()
+    )
+
+
+@router.post("/cases/{case_id}/regenerate-script", response_model=ScriptRegenerationResponse)
+async def regenerate_case_script(
+    case_id: int,
+    request: ScriptRegenerationRequest,
+    http_request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    按当前标准化步骤重新生成并保存脚本
+    
+    与脚本生成时依据的标准化步骤对比，只让模型生成新增/修改的步骤，未改动的脚本步骤原样保留；
+    没有生成记录（旧用例）或对应关系未知时整体重新生成。
+    """
+    if request.executor_type not in EXECUTOR_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="执行器类型必须是 playwright 或 midscene"
+        )
+    
+    test_case = db.query(TestCase).filter(TestCase.id == case_id).first()
+    if not test_case:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="测试用例不存在"
+        )
+    
+    project = db.query(Project).filter(Project.id == test_case.project_id).first()
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="项目不存在"
+        )
+    
+    llm_service = get_llm_service(project)
+    script_field = "playwright_script" if request.executor_type == "playwright" else "midscene_script"
+    standard_steps = cast(List[Dict[str, Any]], test_case.standard_steps)
+    
+    try:
+        result = await run_llm_task(
+            http_request,
+            regenerate_script,
+            llm_service,
+            case_name=test_case.name,
+            base_url=project.base_url,
+            executor_type=request.executor_type,
+            standard_steps=standard_steps,
+            script=getattr(test_case, script_field),
+            base=(test_case.script_base_steps or {}).get(request.executor_type)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"重新生成脚本失败: {str(e)}"
+        )
+    
+    if result["mode"] != "unchanged":
+        setattr(test_case, script_field, result["script"])
+    test_case.script_base_steps = with_script_base(
+        test_case.script_base_steps, request.executor_type, standard_steps, result["script"], result["step_map"]
+    )
+    db.commit()
+    
+    return ScriptRegenerationResponse(
+        executor_type=request.executor_type,
+        script=result["script"],
+        mode=result["mode"],
+        changed_steps=result["changed_steps"]
+    )
+
+
 @router.post("/cases/generate-midscene-script", response_model=ScriptGenerationResponse)
 async def generate_midscene_script(
     request: ScriptGenerationRequest,
+    http_request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -327,19 +635,14 @@ async def generate_midscene_script(
             detail="项目不存在"
         )
     
-    # 解密API密钥并创建LLM服务
-    api_key = decrypt_api_key(project.llm_api_key)
-    llm_service = LLMService(
-        provider=project.llm_provider,
-        model=project.llm_model,
-        api_key=api_key,
-        base_url=project.llm_base_url,
-        config=project.llm_config
-    )
+    # 获取共享的LLM服务（复用已解密的密钥和长连接客户端）
+    llm_service = get_llm_service(project)
     
     try:
         # 调用LLM生成Midscene脚本
-        result = llm_service.generate_midscene_script(
+        result = await run_llm_task(
+            http_request,
+            llm_service.generate_midscene_script,
             case_name=test_case.name,
             standard_steps=cast(List[Dict[str, Any]], test_case.standard_steps),
             base_url=project.base_url
@@ -347,8 +650,42 @@ async def generate_midscene_script(
         
         return ScriptGenerationResponse(playwright_script=result)
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"生成Midscene脚本失败: {str(e)}"
         )
+
+
+def _format_sse(event: str, data: Any) -> str:
+    """格式化一条 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _sse_response(
+    http_request: Request,
+    stream: Callable[[], Iterator[Dict[str, Any]]],
+    validate: Callable[[Dict[str, Any]], Dict[str, Any]]
+) -> StreamingResponse:
+    """
+    将 LLMService 的流式生成事件转为 SSE 响应
+    
+    生成在 LLM 线程池中执行，客户端断开后停止；result 事件的数据先经 validate 校验。
+    """
+    async def events():
+        try:
+            async for item in stream_llm_task(http_request, stream):
+                data = item["data"]
+                if item["event"] == "result":
+                    data = validate(data)
+                yield _format_sse(item["event"], data)
+        except Exception as e:
+            yield _format_sse("error", {"detail": f"生成失败: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
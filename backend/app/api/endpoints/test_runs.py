@@ -1,10 +1,11 @@
 """
 测试执行API端点
 """
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import List
 import os
+import json
 from datetime import datetime
 
 from app.database import get_db
@@ -15,7 +16,12 @@ from app.models.step_execution import StepExecution, StepStatus
 from app.models.project import Project
 from app.schemas.test_run import TestRunResponse, TestRunDetailResponse, StepExecutionResponse
 from app.services.playwright_executor import PlaywrightExecutor
-from app.services.llm_service import LLMService
+from app.services.async_playwright_executor import async_playwright_runner
+from app.services.llm_registry import get_llm_service
+from app.services.run_scheduler import run_scheduler
+from app.services.verdict_cache import verdict_cache
+from app.services.verdict_rules import evaluate_verdict_rules
+from app.services.assertion_checklist import checklist_hash, verdict_from_checklist
 from app.utils.encryption import decrypt_api_key
 from app.api.dependencies import get_current_user
 from app.config import settings
@@ -23,19 +29,202 @@ from app.config import settings
 router = APIRouter(tags=["测试执行"])
 
 
+def _save_step_execution(db: Session, test_run_id: int, step_data: dict):
+    """将单个步骤的执行结果写入 StepExecution（不提交）"""
+    db.add(StepExecution(
+        test_run_id=test_run_id,
+        step_index=step_data["index"],
+        step_description=step_data["description"],
+        status=StepStatus.SUCCESS if step_data["status"] == "success" else StepStatus.FAILED,
+        screenshot_path=step_data.get("screenshot_path"),
+        vision_observation=step_data.get("vision_observation"),  # 保存视觉观察结果
+        stability_wait_ms=step_data.get("stability_wait_ms"),
+        start_time=datetime.fromisoformat(step_data["start_time"]),
+        end_time=datetime.fromisoformat(step_data["end_time"]) if step_data.get("end_time") else None,
+        error_message=step_data.get("error_message")
+    ))
+
+
+def _save_vision_observations(db: Session, test_run_id: int, shot_steps: list, step_analyses: list):
+    """将逐步视觉分析结果写入对应的 StepExecution.vision_observation（不提交）"""
+    for item in step_analyses:
+        position = item["step_index"] - 1
+        if not 0 <= position < len(shot_steps):
+            continue
+        db.query(StepExecution).filter(
+            StepExecution.test_run_id == test_run_id,
+            StepExecution.step_index == shot_steps[position]["index"]
+        ).update({"vision_observation": json.dumps(item["analysis"], ensure_ascii=False)})
+
+
+def _ensure_assertion_checklist(
+    db: Session,
+    llm_service,
+    test_case: TestCase,
+    script: dict,
+    test_run_id: int,
+    worker_id: str,
+    attempt: int
+):
+    """
+    确保用例有与当前预期结果和脚本对应的断言清单，没有或已过期时编译一次并保存
+
+    与步骤和结果一样，只有运行仍属于本次领取时才保存到用例（租约已被回收的旧执行不再写入）。
+
+    Returns:
+        断言清单，未启用、编译失败或运行已不属于本次领取时返回 None
+    """
+    if not settings.ASSERTION_CHECKLIST_ENABLED or not llm_service or not test_case.expected_result:
+        return None
+    
+    version = checklist_hash(test_case.expected_result, script)
+    if test_case.assertion_checklist_hash == version:
+        return test_case.assertion_checklist
+    
+    try:
+        checklist = llm_service.compile_assertion_checklist(test_case.expected_result, (script or {}).get("steps", []))
+        test_case.assertion_checklist = checklist
+        test_case.assertion_checklist_hash = version
+        if not _commit_if_claimed(db, test_run_id, worker_id, attempt):
+            return None
+        print(f"📋 断言清单已编译: {len(checklist['checks'])} 项，完整覆盖预期结果: {checklist['complete']}")
+        return checklist
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ 编译断言清单失败: {e}")
+        return None
+
+
+def _judge_final_result(db: Session, llm_service, test_case: TestCase, test_run_id: int, exec_result: dict) -> dict:
+    """
+    根据截图给出整体判定
+
+    先核对执行器在最终页面上得到的断言清单结果（只有全部通过才直接判定通过），再用本地规则（最终页面快照 + 脚本末尾的断言步骤 + 预期结果中的关键文字）判定，
+    结论明确时不调用任何模型。
+    否则默认只分析最终截图；最终截图像素和页面文本与该用例某次历史运行完全一致（且预期结果未变）时直接复用历史判定，不再调用视觉模型。
+    项目 llm_config.verdict_scope 为 full_run 时分析全部步骤截图（可配合 vision_mode 合并为一次请求），
+    并把逐步观察结果保存到步骤记录。
+    """
+    steps = exec_result.get("steps", [])
+    all_steps_success = all(s.get("status") == "success" for s in steps)
+    
+    # 收集截图路径
+    shot_steps = [s for s in steps if s.get("screenshot_path")]
+    screenshots = [s["screenshot_path"] for s in shot_steps]
+    print(f"收集到 {len(screenshots)} 张截图")
+    
+    checklist_result = verdict_from_checklist(test_case.assertion_checklist, exec_result.get("assertion_results"))
+    if checklist_result:
+        print(f"📋 断言清单判定: {checklist_result['reason']}")
+        return checklist_result
+    
+    if settings.VERDICT_RULES_ENABLED:
+        script = test_case.midscene_script if test_case.executor_type == "midscene" else test_case.playwright_script
+        rule_result = evaluate_verdict_rules(
+            expected_result=test_case.expected_result,
+            snapshot=exec_result.get("page_snapshot"),
+            executed_steps=steps,
+            script_steps=(script or {}).get("steps", [])
+        )
+        if rule_result and rule_result["confidence"] >= settings.VERDICT_RULES_MIN_CONFIDENCE:
+            print(f"📏 规则判定: {rule_result['reason']}")
+            return rule_result
+    
+    if screenshots and llm_service.config.get("verdict_scope") == "full_run":
+        print(f"分析全部 {len(screenshots)} 张步骤截图进行判定")
+        verdict_result = llm_service.analyze_test_result(
+            expected_result=test_case.expected_result,
+            step_screenshots=screenshots,
+            console_logs=exec_result.get("console_logs", []),
+            step_statuses=shot_steps
+        )
+        _save_vision_observations(db, test_run_id, shot_steps, verdict_result.pop("step_analyses", []))
+        return verdict_result
+    
+    if not screenshots:
+        print(f"没有截图，使用基础判定")
+        return {
+            "verdict": "passed" if all_steps_success else "failed",
+            "confidence": 0.7,
+            "reason": "无截图，基于步骤执行状态判定",
+            "observations": []
+        }
+    
+    # 只使用最后一张截图进行LLM判定（整体判定）
+    final_screenshot = screenshots[-1]
+    print(f"使用最后一张截图进行整体判定: {final_screenshot}")
+    
+    if settings.VERDICT_CACHE_ENABLED:
+        cached = verdict_cache.lookup(
+            test_case.id, test_case.expected_result, final_screenshot, exec_result.get("page_snapshot")
+        )
+        if cached:
+            print(f"♻️ 判定缓存命中: {cached['cache']}")
+            return cached
+    
+    verdict_result = llm_service.analyze_final_result(
+        expected_result=test_case.expected_result,
+        final_screenshot=final_screenshot,
+        console_logs=exec_result.get("console_logs", []),
+        all_steps_success=all_steps_success
+    )
+    
+    if settings.VERDICT_CACHE_ENABLED:
+        verdict_cache.store(
+            test_case.id, test_case.expected_result, final_screenshot,
+            exec_result.get("page_snapshot"), verdict_result, test_run_id
+        )
+    return verdict_result
+
+
+def _commit_if_claimed(db: Session, test_run_id: int, worker_id: str, attempt: int, fields: dict = None) -> bool:
+    """
+    运行仍属于本次领取时提交当前事务（同时写入 fields），否则回滚
+
+    租约过期后运行会被重新入队并由其他 worker 领取，旧的执行不能再写入步骤和结果。
+
+    Returns:
+        是否已提交
+    """
+    values = {TestRun.heartbeat_at: datetime.utcnow(), **(fields or {})}
+    updated = db.query(TestRun).filter(
+        TestRun.id == test_run_id,
+        TestRun.worker_id == worker_id,
+        TestRun.attempt_count == attempt,
+        TestRun.status == TestRunStatus.RUNNING
+    ).update(values, synchronize_session=False)
+    if updated != 1:
+        db.rollback()
+        print(f"⚠️ 运行 {test_run_id} 已不属于本次领取（{worker_id} 第 {attempt} 次），丢弃本次写入")
+        return False
+    db.commit()
+    return True
+
+
 def execute_test_background(
     test_run_id: int,
     test_case_id: int,
-    db_url: str
+    db_url: str,
+    worker_id: str,
+    attempt: int
 ):
-    """后台执行测试任务"""
+    """
+    后台执行测试任务
+
+    Args:
+        test_run_id: 运行ID
+        test_case_id: 用例ID
+        db_url: 数据库连接地址
+        worker_id: 领取该运行的 worker 标识
+        attempt: 本次领取的序号，与 worker_id 一起确认运行仍属于本次领取后才写入步骤和结果
+    """
     from sqlalchemy import create_engine
     from sqlalchemy.orm import sessionmaker
     
     # 创建新的数据库会话
     # SQLite 需要 check_same_thread=False
     if db_url.startswith("sqlite"):
-        engine = create_engine(db_url, connect_args={"check_same_thread": False})
+        engine = create_engine(db_url, connect_args={"check_same_thread": False, "timeout": 30})
     else:
         engine = create_engine(db_url)
     
@@ -48,43 +237,66 @@ def execute_test_background(
         if not test_run:
             return
         
+        # 重新领取的运行清除上一次执行留下的步骤记录，避免步骤重复
+        db.query(StepExecution).filter(
+            StepExecution.test_run_id == test_run_id
+        ).delete(synchronize_session=False)
+        if not _commit_if_claimed(db, test_run_id, worker_id, attempt):
+            return
+        
         # 获取测试用例
         test_case = db.query(TestCase).filter(TestCase.id == test_case_id).first()
         if not test_case:
-            test_run.status = TestRunStatus.ERROR
-            test_run.error_message = "测试用例不存在"
-            test_run.end_time = datetime.utcnow()
-            db.commit()
+            _commit_if_claimed(db, test_run_id, worker_id, attempt, {
+                TestRun.status: TestRunStatus.ERROR,
+                TestRun.error_message: "测试用例不存在",
+                TestRun.end_time: datetime.utcnow()
+            })
             return
         
         # 获取项目
         project = db.query(Project).filter(Project.id == test_case.project_id).first()
         if not project:
-            test_run.status = TestRunStatus.ERROR
-            test_run.error_message = "项目不存在"
-            test_run.end_time = datetime.utcnow()
-            db.commit()
+            _commit_if_claimed(db, test_run_id, worker_id, attempt, {
+                TestRun.status: TestRunStatus.ERROR,
+                TestRun.error_message: "项目不存在",
+                TestRun.end_time: datetime.utcnow()
+            })
             return
         
         # 执行测试脚本（根据执行器类型选择）
         # 初始化LLM服务用于实时视觉分析
         llm_service = None
-        api_key = decrypt_api_key(project.llm_api_key)  # 提前解密API密钥
         try:
-            llm_service = LLMService(
-                provider=project.llm_provider,
-                model=project.llm_model,
-                api_key=api_key,
-                base_url=project.llm_base_url,
-                config=project.llm_config
-            )
+            llm_service = get_llm_service(project)
             print(f"🤖 LLM服务初始化成功，将进行实时视觉分析")
         except Exception as e:
             print(f"⚠️ LLM服务初始化失败: {e}，将跳过视觉分析")
+        # 复用注册表中已解密的API密钥
+        api_key = llm_service.api_key if llm_service else decrypt_api_key(project.llm_api_key)
+        
+        # 已保存的步骤序号（执行过程中实时落库的步骤不再重复保存）
+        persisted_steps = set()
+        
+        def save_step(step_data):
+            try:
+                _save_step_execution(db, test_run_id, step_data)
+                if _commit_if_claimed(db, test_run_id, worker_id, attempt):
+                    persisted_steps.add(step_data["index"])
+            except Exception as e:
+                db.rollback()
+                print(f"⚠️ 保存步骤 {step_data.get('index')} 失败: {e}")
         
         # 根据执行器类型选择执行器
         executor_type = test_case.executor_type if hasattr(test_case, 'executor_type') else 'playwright'
         
+        # 断言清单按用例版本编译一次，由执行器在最终页面上直接核对
+        assertion_checklist = _ensure_assertion_checklist(
+            db, llm_service, test_case,
+            test_case.midscene_script if executor_type == 'midscene' else test_case.playwright_script,
+            test_run_id, worker_id, attempt
+        )
+        
         if executor_type == 'midscene':
             # 使用 Midscene 执行器
             print(f"🌟 使用 Midscene AI 执行器")
@@ -104,7 +316,9 @@ def execute_test_background(
                 artifacts_base_path=settings.ARTIFACTS_PATH,
                 llm_service=llm_service,
                 expected_result=test_case.expected_result,
-                auth_state_path=auth_state_path  # 传递认证状态
+                auth_state_path=auth_state_path,  # 传递认证状态
+                test_case_id=test_case.id,  # 复用该用例的 Midscene 缓存
+                assertion_checklist=assertion_checklist
             )
             
             # 准备环境变量
@@ -149,7 +363,8 @@ def execute_test_background(
             exec_result = executor.execute_script(
                 script=script_to_use,
                 run_id=test_run_id,
-                env_vars=env_vars
+                env_vars=env_vars,
+                on_step=save_step  # 步骤完成即落库，前端轮询可看到实时进度
             )
         else:
             # 使用传统 Playwright 执行器
@@ -165,111 +380,84 @@ def execute_test_background(
             else:
                 print(f"ℹ️ 未找到认证状态，将使用新的浏览器会话")
             
-            executor = PlaywrightExecutor(
-                artifacts_base_path=settings.ARTIFACTS_PATH,
-                llm_service=llm_service,
-                expected_result=test_case.expected_result,
-                auth_state_path=auth_state_path  # 传递认证状态
-            )
-            exec_result = executor.execute_script(
-                script=test_case.playwright_script,
-                run_id=test_run_id
-            )
+            if settings.PLAYWRIGHT_ASYNC_EXECUTOR:
+                # 提交到共享事件循环执行，与其他运行并发共用浏览器
+                exec_result = async_playwright_runner.execute_script(
+                    script=test_case.playwright_script,
+                    run_id=test_run_id,
+                    auth_state_path=auth_state_path,
+                    assertion_checklist=assertion_checklist
+                )
+            else:
+                executor = PlaywrightExecutor(
+                    artifacts_base_path=settings.ARTIFACTS_PATH,
+                    llm_service=llm_service,
+                    expected_result=test_case.expected_result,
+                    auth_state_path=auth_state_path,  # 传递认证状态
+                    assertion_checklist=assertion_checklist
+                )
+                exec_result = executor.execute_script(
+                    script=test_case.playwright_script,
+                    run_id=test_run_id
+                )
         
-        # 保存步骤执行记录
+        # 补写未实时保存的步骤执行记录
         for step_data in exec_result.get("steps", []):
-            step = StepExecution(
-                test_run_id=test_run_id,
-                step_index=step_data["index"],
-                step_description=step_data["description"],
-                status=StepStatus.SUCCESS if step_data["status"] == "success" else StepStatus.FAILED,
-                screenshot_path=step_data.get("screenshot_path"),
-                vision_observation=step_data.get("vision_observation"),  # 保存视觉观察结果
-                start_time=datetime.fromisoformat(step_data["start_time"]),
-                end_time=datetime.fromisoformat(step_data["end_time"]) if step_data.get("end_time") else None,
-                error_message=step_data.get("error_message")
-            )
-            db.add(step)
+            if step_data["index"] not in persisted_steps:
+                _save_step_execution(db, test_run_id, step_data)
         
-        db.commit()
+        if not _commit_if_claimed(db, test_run_id, worker_id, attempt):
+            return
         
-        # 更新运行记录
-        test_run.artifacts_path = exec_result.get("artifacts_path")
+        # 运行记录的最终字段，判定完成后按本次领取条件一次写入
+        result_fields = {TestRun.artifacts_path: exec_result.get("artifacts_path")}
         
         print(f"\n========== 测试执行完成，开始更新状态 ==========")
         print(f"exec_result.success = {exec_result.get('success')}")
         print(f"exec_result.error_message = {exec_result.get('error_message')}")
         
         if exec_result.get("success"):
-            test_run.status = TestRunStatus.SUCCESS
-            print(f"✅ 测试执行成功，状态已更新为 SUCCESS")
+            result_fields[TestRun.status] = TestRunStatus.SUCCESS
+            print(f"✅ 测试执行成功，状态将更新为 SUCCESS")
             
             # 使用LLM判定结果（只分析最终截图）
             try:
                 print(f"\n开始LLM判定...")
-                api_key = decrypt_api_key(project.llm_api_key)
-                llm_service = LLMService(
-                    provider=project.llm_provider,
-                    model=project.llm_model,
-                    api_key=api_key,
-                    base_url=project.llm_base_url,
-                    config=project.llm_config
-                )
+                llm_service = get_llm_service(project)
                 
-                # 收集截图路径
-                screenshots = [s.get("screenshot_path") for s in exec_result.get("steps", []) if s.get("screenshot_path")]
-                print(f"收集到 {len(screenshots)} 张截图")
-                
-                # 只使用最后一张截图进行LLM判定（整体判定）
-                if screenshots:
-                    final_screenshot = screenshots[-1]
-                    print(f"使用最后一张截图进行整体判定: {final_screenshot}")
-                    
-                    verdict_result = llm_service.analyze_final_result(
-                        expected_result=test_case.expected_result,
-                        final_screenshot=final_screenshot,
-                        console_logs=exec_result.get("console_logs", []),
-                        all_steps_success=all(s.get("status") == "success" for s in exec_result.get("steps", []))
-                    )
-                else:
-                    print(f"没有截图，使用基础判定")
-                    verdict_result = {
-                        "verdict": "passed" if all(s.get("status") == "success" for s in exec_result.get("steps", [])) else "failed",
-                        "confidence": 0.7,
-                        "reason": "无截图，基于步骤执行状态判定",
-                        "observations": []
-                    }
+                verdict_result = _judge_final_result(db, llm_service, test_case, test_run_id, exec_result)
                 
                 print(f"LLM判定结果: {verdict_result}")
                 
                 # 保存判定结果
                 verdict_map = {"passed": LLMVerdict.PASSED, "failed": LLMVerdict.FAILED, "unknown": LLMVerdict.UNKNOWN}
-                test_run.llm_verdict = verdict_map.get(verdict_result.get("verdict"), LLMVerdict.UNKNOWN)
+                result_fields[TestRun.llm_verdict] = verdict_map.get(verdict_result.get("verdict"), LLMVerdict.UNKNOWN)
                 
                 # 将完整的判定结果（包括 observations）序列化为 JSON 存储
-                import json
-                test_run.llm_reason = json.dumps(verdict_result, ensure_ascii=False)
+                result_fields[TestRun.llm_reason] = json.dumps(verdict_result, ensure_ascii=False)
                 
-                print(f"✅ LLM判定完成: {test_run.llm_verdict}")
+                print(f"✅ LLM判定完成: {result_fields[TestRun.llm_verdict]}")
                 
             except Exception as e:
                 print(f"❌ LLM判定失败: {e}")
                 import traceback
                 traceback.print_exc()
-                test_run.llm_verdict = LLMVerdict.UNKNOWN
-                test_run.llm_reason = f"LLM判定失败: {str(e)}"
+                db.rollback()
+                result_fields[TestRun.llm_verdict] = LLMVerdict.UNKNOWN
+                result_fields[TestRun.llm_reason] = f"LLM判定失败: {str(e)}"
         
         else:
-            test_run.status = TestRunStatus.FAILED
-            test_run.error_message = exec_result.get("error_message")
-            print(f"❌ 测试执行失败: {test_run.error_message}")
+            result_fields[TestRun.status] = TestRunStatus.FAILED
+            result_fields[TestRun.error_message] = exec_result.get("error_message")
+            print(f"❌ 测试执行失败: {exec_result.get('error_message')}")
         
-        test_run.end_time = datetime.utcnow()
+        result_fields[TestRun.end_time] = datetime.utcnow()
         print(f"\n保存测试运行记录...")
-        db.commit()
+        if not _commit_if_claimed(db, test_run_id, worker_id, attempt, result_fields):
+            return
         print(f"✅ 测试运行记录已保存")
-        print(f"最终状态: {test_run.status}")
-        print(f"LLM判定: {test_run.llm_verdict}")
+        print(f"最终状态: {result_fields[TestRun.status]}")
+        print(f"LLM判定: {result_fields.get(TestRun.llm_verdict)}")
         print(f"========== 状态更新完成 ==========\n")
         
     except Exception as e:
@@ -279,12 +467,12 @@ def execute_test_background(
         traceback.print_exc()
         
         try:
-            test_run = db.query(TestRun).filter(TestRun.id == test_run_id).first()
-            if test_run:
-                test_run.status = TestRunStatus.ERROR  # type: ignore
-                test_run.error_message = str(e)  # type: ignore
-                test_run.end_time = datetime.utcnow()  # type: ignore
-                db.commit()
+            db.rollback()
+            if _commit_if_claimed(db, test_run_id, worker_id, attempt, {
+                TestRun.status: TestRunStatus.ERROR,
+                TestRun.error_message: str(e),
+                TestRun.end_time: datetime.utcnow()
+            }):
                 print(f"✅ 已将状态更新为 ERROR")
         except Exception as commit_error:
             print(f"❌ 更新错误状态失败: {commit_error}")
@@ -297,7 +485,6 @@ def execute_test_background(
 @router.post("/cases/{case_id}/execute", response_model=TestRunResponse)
 async def execute_test_case(
     case_id: int,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -310,41 +497,23 @@ async def execute_test_case(
             detail="测试用例不存在"
         )
     
-    # 创建运行记录
+    # 创建运行记录并进入队列，由调度器按并发限制执行
     test_run = TestRun(
         test_case_id=case_id,
-        status=TestRunStatus.RUNNING,
+        status=TestRunStatus.QUEUED,
         trigger_by=current_user.id
     )
     db.add(test_run)
     db.commit()
     db.refresh(test_run)
     
-    # 构建数据库URL用于后台任务
-    # 使用 SQLite - 需要从 app/api/endpoints/ 往上4层到 backend/
-    import os
-    # __file__ -> app/api/endpoints/test_runs.py
-    # 需要4个 dirname 到达 backend/
-    db_path = os.path.join(
-        os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), 
-        "ui_test_platform.db"
-    )
-    db_url = f"sqlite:///{db_path}"
-    print(f"后台任务使用数据库路径: {db_path}")
-    
-    # 如果需要使用 MySQL，取消下面的注释并注释掉上面的 SQLite 配置
-    # from app.config import settings as config_settings
-    # db_url = f"mysql+pymysql://{config_settings.DB_USER}:{config_settings.DB_PASSWORD}@{config_settings.DB_HOST}:{config_settings.DB_PORT}/{config_settings.DB_NAME}?charset=utf8mb4"
-    
-    # 添加后台任务
-    background_tasks.add_task(
-        execute_test_background,
-        test_run.id,
-        case_id,
-        db_url
-    )
+    run_scheduler.notify()
     
-    return TestRunResponse.model_validate(test_run)
+    response = TestRunResponse.model_validate(test_run)
+    queue_info = run_scheduler.queue_info(db, test_run)
+    response.queue_position = queue_info["queue_position"]
+    response.eta_seconds = queue_info["eta_seconds"]
+    return response
 
 
 @router.get("/runs/{run_id}", response_model=TestRunDetailResponse)
@@ -382,8 +551,10 @@ async def get_test_run(
         "error_message": test_run.error_message,
         "artifacts_path": test_run.artifacts_path,
         "created_at": test_run.created_at,
+        "worker_id": test_run.worker_id,
         "steps": [StepExecutionResponse.model_validate(s) for s in steps],
-        "test_case": None
+        "test_case": None,
+        **run_scheduler.queue_info(db, test_run)
     }
     
     if test_case:
@@ -415,7 +586,16 @@ async def list_test_runs(
         query = query.join(TestCase).filter(TestCase.project_id == project_id)
     
     runs = query.order_by(TestRun.start_time.desc()).limit(limit).all()
-    return [TestRunResponse.model_validate(run) for run in runs]
+    
+    # 为排队中的运行补充队列位置和预计等待时间
+    responses = [TestRunResponse.model_validate(run) for run in runs]
+    if any(run.status == TestRunStatus.QUEUED for run in runs):
+        estimates = run_scheduler.queue_estimates(db)
+        for response in responses:
+            if response.id in estimates:
+                response.queue_position = estimates[response.id]["queue_position"]
+                response.eta_seconds = estimates[response.id]["eta_seconds"]
+    return responses
 
 
 @router.get("/runs/{run_id}/steps", response_model=List[StepExecutionResponse])
@@ -14,6 +14,7 @@ class Settings(BaseSettings):
     DB_USER: str = "root"
     DB_PASSWORD: str = ""
     DB_NAME: str = "ui_test_platform"
+    DATABASE_URL: Optional[str] = None  # 完整数据库URL，设置后覆盖默认的 SQLite 文件（多节点部署时指向共享数据库）
     
     # JWT配置
     JWT_SECRET_KEY: str = "your-secret-key-change-in-production"
@@ -29,6 +30,76 @@ class Settings(BaseSettings):
     
     # 执行配置
     MAX_EXECUTION_TIME: int = 300  # 5分钟
+    BROWSER_HEADLESS: bool = False  # 默认有头模式，可以看到浏览器
+    
+    # 浏览器池配置
+    BROWSER_POOL_ENABLED: bool = True
+    BROWSER_POOL_MAX_SIZE: int = 4  # 常驻浏览器最大数量
+    BROWSER_POOL_MAX_RUNS: int = 50  # 单个浏览器执行多少次后回收
+    PLAYWRIGHT_ASYNC_EXECUTOR: bool = False  # Playwright 运行在共享事件循环中以协程执行，同一类型浏览器的所有运行共用一个进程（不使用浏览器池）
+    
+    # 页面稳定性检测配置（截图前等待页面静止）
+    PAGE_STABILITY_TIMEOUT_MS: int = 3000  # 最长等待时间
+    PAGE_STABILITY_QUIET_MS: int = 500  # 网络/DOM/布局需保持静止的时间窗口
+    
+    # Midscene 常驻执行进程配置
+    MIDSCENE_SIDECAR_ENABLED: bool = True
+    MIDSCENE_SIDECAR_POOL_SIZE: int = 2  # 最多同时保留的 sidecar 进程数（按 LLM 配置区分）
+    MIDSCENE_CACHE_ENABLED: bool = True  # 复用 Midscene 的 AI 规划/定位缓存（按用例、脚本和起始页面区分）
+    
+    # 运行调度配置
+    RUN_SCHEDULER_WORKERS: int = 4  # 同时执行的最大运行数
+    RUN_SCHEDULER_PROJECT_LIMIT: int = 2  # 每个项目同时执行的最大运行数
+    RUN_SCHEDULER_POLL_INTERVAL: float = 2.0  # 扫描队列的间隔（秒）
+    RUN_SCHEDULER_EMBEDDED: bool = True  # API 进程内是否执行运行；关闭后只入队，由独立 worker 执行
+    RUN_LEASE_SECONDS: int = 60  # 运行租约时长，worker 失联超过该时间后运行会被重新入队
+    RUN_HEARTBEAT_INTERVAL: int = 15  # worker 续约间隔（秒）
+    RUN_MAX_ATTEMPTS: int = 2  # 单个运行最多被领取的次数，超过后标记为错误
+    
+    # LLM 客户端配置
+    LLM_CLIENT_CACHE_SIZE: int = 32  # 进程内最多缓存的 LLM 客户端数（按项目和配置区分）
+    LLM_HTTP_TIMEOUT: float = 120.0  # LLM 请求超时（秒）
+    LLM_HTTP_MAX_CONNECTIONS: int = 20  # 单个客户端的最大连接数
+    LLM_CACHE_ENABLED: bool = True  # 缓存用例/脚本生成的LLM响应（相同提示词直接复用）
+    LLM_CACHE_TTL_SECONDS: int = 604800  # 缓存有效期（默认7天）
+    LLM_CACHE_MAX_MB: int = 100  # 缓存文件总大小上限（MB）
+    LLM_VISION_CONCURRENCY: int = 4  # 单次判定中并发分析的截图数
+    LLM_VISION_TIMEOUT: float = 60.0  # 单张截图视觉分析的超时（秒）
+    VISION_IMAGE_FORMAT: str = "JPEG"  # 上传给视觉模型前的截图编码格式（JPEG / WEBP / PNG）
+    VISION_IMAGE_QUALITY: int = 80  # JPEG/WebP 压缩质量
+    VISION_IMAGE_MAX_TILES: int = 3  # 长截图最多切分的张数
+    VISION_BATCH_MAX_IMAGES: int = 8  # 批量视觉分析时单次请求最多包含的截图数
+    VERDICT_ESCALATE_BELOW: float = 0.8  # 分级判定模型（llm_config.verdict_models）置信度低于该值时升级到下一级
+    
+    # LLM 限流与重试配置（按提供商 + 接口地址 + 密钥区分，进程内所有执行线程共享）
+    LLM_RATE_LIMIT_RPM: int = 60  # 每分钟最多请求数（所有进程合计），0 表示不限流（项目可用 llm_config.rate_limit_rpm 覆盖）
+    LLM_RATE_LIMIT_PROCESSES: int = 1  # 共用同一 LLM 配额的进程数（API 进程 + 独立 worker 进程），每个进程按 1/N 的速率和突发数限流
+    LLM_RATE_LIMIT_BURST: int = 10  # 允许的突发请求数
+    LLM_RATE_LIMIT_MAX_WAIT: float = 120.0  # 等待令牌或 Retry-After 的最长时间（秒），超过后直接失败
+    LLM_MAX_RETRIES: int = 4  # 429 / 5xx / 超时等临时错误的最大重试次数
+    LLM_RETRY_BASE_DELAY: float = 1.0  # 指数退避的初始延迟（秒）
+    LLM_RETRY_MAX_DELAY: float = 30.0  # 单次退避的最大延迟（秒）
+    LLM_HEDGE_MIN_SAMPLES: int = 20  # 计算 p95 延迟所需的最少样本数
+    LLM_HEDGE_DEFAULT_DELAY: float = 30.0  # 样本不足时，超过该时长未返回即向备用提供商发起对冲请求（秒）
+    LLM_HEDGE_MAX_WORKERS: int = 16  # 对冲请求线程池大小
+    LLM_ENDPOINT_MAX_WORKERS: int = 8  # 接口中用例/脚本生成等同步 LLM 任务的线程池大小（超出的请求排队）
+    LLM_DISCONNECT_POLL_INTERVAL: float = 1.0  # 等待 LLM 任务时检测客户端断开的间隔（秒）
+    
+    # 判定缓存配置（最终截图像素和页面文本与历史运行完全一致时复用判定）
+    VERDICT_CACHE_ENABLED: bool = True
+    VERDICT_CACHE_MAX_ENTRIES: int = 20  # 每个用例最多保留的历史判定数
+    
+    # 规则判定配置（根据最终页面快照和断言步骤判定，结论明确时跳过视觉模型）
+    VERDICT_RULES_ENABLED: bool = True
+    VERDICT_RULES_MIN_CONFIDENCE: float = 0.9  # 规则判定置信度不低于该值时直接采用（只有断言步骤、无可核对文字时为 0.85）
+    ASSERTION_CHECKLIST_ENABLED: bool = True  # 将预期结果预编译为断言清单，执行结束时由执行器直接核对
+    PAGE_SNAPSHOT_PER_STEP: bool = True  # 每步截图时在旁边保存压缩的页面文本快照（llm_config.analysis_mode=text 时代替截图发给模型）
+    
+    # 批量生成配置（一次导入多条自然语言场景）
+    BATCH_GENERATION_CONCURRENCY: int = 8  # 同时进行的用例生成数（所有批量任务合计，仍受 LLM 限流约束）
+    BATCH_GENERATION_MAX_ITEMS: int = 500  # 单个批量任务最多包含的场景数
+    BATCH_GENERATION_JOB_TTL: int = 3600  # 已结束的批量任务保留多久以供查询（秒）
+    BATCH_GENERATION_STALE_SECONDS: int = 300  # 执行中的批量任务超过多久未更新视为处理进程已退出（秒）
     
     # CORS配置
     CORS_ORIGINS: list = ["http://localhost:5173", "http://localhost:5174", "http://localhost:3000"]
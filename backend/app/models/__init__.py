@@ -5,6 +5,7 @@ from .test_case import TestCase
 from .test_run import TestRun
 from .step_execution import StepExecution
 from .audit_log import AuditLog
+from .batch_generation import BatchGenerationJob, BatchGenerationItem
 
 __all__ = [
     "User",
@@ -12,5 +13,7 @@ __all__ = [
     "TestCase",
     "TestRun",
     "StepExecution",
-    "AuditLog"
+    "AuditLog",
+    "BatchGenerationJob",
+    "BatchGenerationItem"
 ]
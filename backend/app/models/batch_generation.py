@@ -0,0 +1,54 @@
+"""
+批量生成任务模型
+"""
+from sqlalchemy import Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy.orm import relationship, Mapped, mapped_column
+from datetime import datetime
+from typing import Optional
+from app.database import Base
+
+
+class BatchGenerationJob(Base):
+    """批量生成任务表模型"""
+    __tablename__ = "batch_generation_job"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)  # 任务ID（uuid hex）
+    project_id: Mapped[int] = mapped_column(Integer, ForeignKey("project.id", ondelete="CASCADE"), nullable=False, index=True)
+    created_by: Mapped[int] = mapped_column(Integer, ForeignKey("user.id"), nullable=False)
+    executor_type: Mapped[str] = mapped_column(String(20), nullable=False)
+    status: Mapped[str] = mapped_column(String(20), nullable=False, index=True)  # running / saving / completed / failed
+    total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    completed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    succeeded: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    worker_id: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)  # 执行该任务的进程
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, index=True)  # 执行进程最近一次更新时间
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, index=True)
+
+    # 关系
+    items = relationship(
+        "BatchGenerationItem",
+        back_populates="job",
+        cascade="all, delete-orphan",
+        order_by="BatchGenerationItem.item_index"
+    )
+
+
+class BatchGenerationItem(Base):
+    """批量生成任务中单条场景的表模型"""
+    __tablename__ = "batch_generation_item"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True, autoincrement=True)
+    job_id: Mapped[str] = mapped_column(String(32), ForeignKey("batch_generation_job.id", ondelete="CASCADE"), nullable=False, index=True)
+    item_index: Mapped[int] = mapped_column(Integer, nullable=False)
+    natural_language: Mapped[str] = mapped_column(Text, nullable=False)
+    status: Mapped[str] = mapped_column(String(20), nullable=False)  # pending / running / generated / saved / failed
+    name: Mapped[Optional[str]] = mapped_column(String(200), nullable=True)
+    test_case_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    result: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)  # 生成结果，整批保存后清空
+
+    # 关系
+    job = relationship("BatchGenerationJob", back_populates="items")
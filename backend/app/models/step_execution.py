@@ -27,6 +27,7 @@ class StepExecution(Base):
     status: Mapped[StepStatus] = mapped_column(Enum(StepStatus), nullable=False)
     screenshot_path: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
     vision_observation: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # 视觉观察结果（JSON格式）
+    stability_wait_ms: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # 截图前等待页面稳定的实际耗时（毫秒）
     start_time: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
     end_time: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     error_message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
@@ -24,6 +24,9 @@ class TestCase(Base):
     midscene_script: Any = mapped_column(JSON, nullable=True)  # Midscene 脚本（可选）
     expected_result: Mapped[str] = mapped_column(Text, nullable=False)
     executor_type: Mapped[str] = mapped_column(String(50), nullable=False, default='playwright', server_default='playwright', comment='执行器类型: playwright 或 midscene')
+    assertion_checklist: Any = mapped_column(JSON, nullable=True)  # 由预期结果编译的断言清单 {checks, complete}
+    assertion_checklist_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)  # 编译清单时的预期结果和脚本哈希
+    script_base_steps: Any = mapped_column(JSON, nullable=True)  # 各执行器脚本生成时依据的标准化步骤 {executor_type: {standard_steps, step_map}}
     created_by: Mapped[int] = mapped_column(Integer, ForeignKey("user.id"), nullable=False, index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -11,6 +11,7 @@ from app.database import Base
 
 class TestRunStatus(str, enum.Enum):
     """测试运行状态枚举"""
+    QUEUED = "queued"
     RUNNING = "running"
     SUCCESS = "success"
     FAILED = "failed"
@@ -39,6 +40,10 @@ class TestRun(Base):
     error_message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     artifacts_path: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    worker_id: Mapped[Optional[str]] = mapped_column(String(100), nullable=True, index=True)  # 领取该运行的 worker
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)  # worker 最近一次续约时间
+    lease_expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, index=True)  # 租约到期时间
+    attempt_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')  # 被领取的次数
     
     # 关系
     test_case = relationship("TestCase", back_populates="test_runs")
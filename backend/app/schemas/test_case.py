@@ -89,6 +89,21 @@ class StandardCaseResponse(BaseModel):
     expected_result: str
 
 
+class FullCaseGenerationRequest(BaseModel):
+    """自然语言一次生成用例和脚本请求Schema"""
+    project_id: int
+    natural_language: str = Field(..., min_length=1)
+    executor_type: str = Field("playwright", description="脚本对应的执行器: playwright 或 midscene")
+    prefetch_other_script: bool = Field(False, description="是否在后台预生成另一种执行器的脚本（写入响应缓存）")
+
+
+class FullCaseGenerationResponse(StandardCaseResponse):
+    """自然语言一次生成用例和脚本响应Schema"""
+    executor_type: str
+    playwright_script: Optional[Dict[str, Any]] = None
+    midscene_script: Optional[Dict[str, Any]] = None
+
+
 class ScriptGenerationRequest(BaseModel):
     """生成脚本请求Schema"""
     test_case_id: int
@@ -97,3 +112,48 @@ class ScriptGenerationRequest(BaseModel):
 class ScriptGenerationResponse(BaseModel):
     """生成脚本响应Schema"""
     playwright_script: Dict[str, Any]
+
+
+class ScriptRegenerationRequest(BaseModel):
+    """按当前标准化步骤重新生成脚本请求Schema"""
+    executor_type: str = Field("playwright", description="重新生成的脚本: playwright 或 midscene")
+
+
+class ScriptRegenerationResponse(BaseModel):
+    """重新生成脚本响应Schema"""
+    executor_type: str
+    script: Dict[str, Any]
+    mode: str = Field(..., description="unchanged: 步骤无变化; incremental: 只生成了改动的步骤; full: 整体重新生成")
+    changed_steps: int = Field(0, description="有改动的标准化步骤数")
+
+
+class BatchGenerationRequest(BaseModel):
+    """批量生成用例请求Schema"""
+    descriptions: List[str] = Field(..., min_length=1, description="自然语言场景列表，每条生成一个用例")
+    executor_type: str = Field("playwright", description="生成的脚本对应的执行器: playwright 或 midscene")
+
+
+class BatchGenerationItem(BaseModel):
+    """批量生成中单条场景的进度"""
+    index: int
+    natural_language: str
+    status: str = Field(..., description="pending / running / generated / saved / failed")
+    name: Optional[str] = None
+    test_case_id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class BatchGenerationJobResponse(BaseModel):
+    """批量生成任务响应Schema"""
+    job_id: str
+    project_id: int
+    executor_type: str
+    status: str = Field(..., description="running / saving / completed / failed")
+    total: int
+    completed: int
+    succeeded: int
+    failed: int
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    items: List[BatchGenerationItem]
@@ -22,6 +22,7 @@ class StepExecutionResponse(BaseModel):
     status: StepStatus
     screenshot_path: Optional[str] = None
     vision_observation: Optional[str] = None  # 视觉观察结果（JSON字符串）
+    stability_wait_ms: Optional[int] = None  # 截图前等待页面稳定的实际耗时（毫秒）
     start_time: datetime
     end_time: Optional[datetime] = None
     error_message: Optional[str] = None
@@ -43,6 +44,9 @@ class TestRunResponse(BaseModel):
     error_message: Optional[str] = None
     artifacts_path: Optional[str] = None
     created_at: datetime
+    worker_id: Optional[str] = None  # 执行该运行的 worker
+    queue_position: Optional[int] = None  # 排队位置（仅 queued 状态）
+    eta_seconds: Optional[int] = None  # 预计开始执行前的等待秒数（仅 queued 状态）
     
     class Config:
         from_attributes = True
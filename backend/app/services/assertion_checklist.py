@@ -0,0 +1,186 @@
+"""
+断言清单服务
+将用例的预期结果预编译为结构化检查项（文字存在、URL、元素可见、元素数量等），
+执行器在运行结束时直接在页面中逐项核对，结论明确时判定无需调用模型
+"""
+import json
+import hashlib
+from typing import Dict, Any, List, Optional
+
+
+# 支持的检查类型
+CHECK_TYPES = (
+    "text_present",    # 页面可见文字包含 value
+    "text_absent",     # 页面可见文字不包含 value
+    "url_matches",     # 当前 URL 匹配正则 value（正则无效时按子串匹配）
+    "title_contains",  # 页面标题包含 value
+    "element_visible", # selector 对应的元素可见；没有 selector 时查找文字包含 value 的可见元素
+    "element_count",   # selector 对应的可见元素数量在 [min, max] 之间
+)
+
+# 在页面中逐项核对检查项，参数为检查项列表，返回附带 passed/actual 的结果列表
+CHECKLIST_EVAL_SCRIPT = """(checks) => {
+  const norm = (text) => (text || '').replace(/\\s+/g, ' ').trim().toLowerCase();
+  const visible = (el) => {
+    const rect = el.getBoundingClientRect();
+    const style = window.getComputedStyle(el);
+    return rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none';
+  };
+  const bySelector = (selector) => Array.from(document.querySelectorAll(selector)).filter(visible);
+  const byText = (text) => {
+    const target = norm(text);
+    return Array.from(document.querySelectorAll('body *')).filter(
+      (el) => el.children.length === 0 || ['BUTTON', 'A', 'LABEL'].includes(el.tagName)
+    ).filter((el) => visible(el) && norm(el.innerText || el.value).includes(target));
+  };
+  const bodyText = norm(document.body ? document.body.innerText : '');
+
+  const evaluate = (check) => {
+    switch (check.type) {
+      case 'text_present':
+        return { passed: bodyText.includes(norm(check.value)) };
+      case 'text_absent':
+        return { passed: !bodyText.includes(norm(check.value)) };
+      case 'url_matches': {
+        let matched;
+        try {
+          matched = new RegExp(check.value).test(location.href);
+        } catch (e) {
+          matched = location.href.includes(check.value);
+        }
+        return { passed: matched, actual: location.href };
+      }
+      case 'title_contains':
+        return { passed: norm(document.title).includes(norm(check.value)), actual: document.title };
+      case 'element_visible': {
+        const count = check.selector ? bySelector(check.selector).length : byText(check.value).length;
+        return { passed: count > 0, actual: count };
+      }
+      case 'element_count': {
+        const count = bySelector(check.selector).length;
+        const min = check.min == null ? 1 : check.min;
+        return { passed: count >= min && (check.max == null || count <= check.max), actual: count };
+      }
+      default:
+        return { passed: null, error: `未知的检查类型: ${check.type}` };
+    }
+  };
+
+  return checks.map((check) => {
+    try {
+      return Object.assign({}, check, evaluate(check));
+    } catch (e) {
+      // 选择器无效等情况，该项无法判断
+      return Object.assign({}, check, { passed: null, error: String(e) });
+    }
+  });
+}"""
+
+
+def checklist_hash(expected_result: str, script: Optional[Dict[str, Any]]) -> str:
+    """
+    清单对应的用例版本哈希
+
+    清单依赖预期结果和脚本中的选择器，两者任一变化后需要重新编译。
+    """
+    payload = json.dumps([expected_result or "", script or {}], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def normalize_checklist(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    校验模型返回的清单，丢弃无法执行的检查项
+
+    Returns:
+        {checks: [...], complete: bool}
+    """
+    checks = []
+    for item in raw.get("checks") or []:
+        if not isinstance(item, dict) or item.get("type") not in CHECK_TYPES:
+            continue
+        check = {"type": item["type"]}
+        for key in ("value", "selector", "description"):
+            if isinstance(item.get(key), str) and item[key].strip():
+                check[key] = item[key].strip()
+        for key in ("min", "max"):
+            if isinstance(item.get(key), int):
+                check[key] = item[key]
+
+        if check["type"] == "element_count" and "selector" not in check:
+            continue
+        if check["type"] == "element_visible" and not ("selector" in check or "value" in check):
+            continue
+        if check["type"] not in ("element_visible", "element_count") and "value" not in check:
+            continue
+        checks.append(check)
+
+    # 有检查项被丢弃时，清单不再完整覆盖预期结果
+    complete = bool(raw.get("complete")) and len(checks) == len(raw.get("checks") or [])
+    return {"checks": checks, "complete": complete and bool(checks)}
+
+
+def evaluate_checklist(page, checklist: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """在页面中核对清单（同步 Playwright 页面），失败时返回 None"""
+    if not checklist or not checklist.get("checks"):
+        return None
+    try:
+        return page.evaluate(CHECKLIST_EVAL_SCRIPT, checklist["checks"])
+    except Exception as e:
+        print(f"⚠️ 核对断言清单失败: {e}")
+        return None
+
+
+async def evaluate_checklist_async(page, checklist: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """在页面中核对清单（异步 Playwright 页面），失败时返回 None"""
+    if not checklist or not checklist.get("checks"):
+        return None
+    try:
+        return await page.evaluate(CHECKLIST_EVAL_SCRIPT, checklist["checks"])
+    except Exception as e:
+        print(f"⚠️ 核对断言清单失败: {e}")
+        return None
+
+
+def verdict_from_checklist(checklist: Dict[str, Any], results: Optional[List[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """
+    根据清单核对结果给出判定
+
+    只有全部检查项通过且清单完整覆盖预期结果时判定通过；
+    检查项由模型编译，未通过可能是选择器或文本写错而不是页面真的不符合预期，
+    因此有检查项未通过、无法判断或清单不完整时都返回 None，交给规则和视觉判定。
+    """
+    if not checklist or not results:
+        return None
+    if any(r.get("passed") is None for r in results):
+        return None
+
+    failed = [r for r in results if not r["passed"]]
+    if failed:
+        print(f"📋 断言清单有 {len(failed)} 项未通过，交给后续判定: " + "；".join(_describe(r) for r in failed))
+        return None
+    if not checklist.get("complete"):
+        return None
+
+    return {
+        "verdict": "passed",
+        "confidence": 0.95,
+        "reason": f"[断言清单] 全部 {len(results)} 项检查通过",
+        "observations": [
+            {
+                "step_index": "final",
+                "type": "assertion",
+                "description": "✓ " + _describe(r),
+                "severity": "info"
+            }
+            for r in results
+        ],
+        "source": "checklist",
+        "checks": results
+    }
+
+
+def _describe(result: Dict[str, Any]) -> str:
+    """检查项的简短描述"""
+    target = result.get("description") or result.get("value") or result.get("selector")
+    actual = f"（实际: {result['actual']}）" if result.get("actual") is not None else ""
+    return f"{result['type']} {target}{actual}"
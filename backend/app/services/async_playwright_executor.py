@@ -0,0 +1,339 @@
+"""
+异步Playwright执行引擎服务
+基于 playwright.async_api，在同一个事件循环中以协程方式并发执行多个用例，共享浏览器；
+调度器的工作线程通过 async_playwright_runner 把运行提交到后台事件循环执行
+"""
+import os
+import asyncio
+import threading
+from typing import Dict, Any, Optional
+from datetime import datetime
+from playwright.async_api import async_playwright, Playwright, Browser, Page
+
+from app.config import settings
+from app.services.page_stability import AsyncPageStabilityDetector
+from app.services.page_snapshot import capture_page_snapshot_async, save_snapshot, save_step_snapshot_async
+from app.services.assertion_checklist import evaluate_checklist_async
+from app.services.browser_pool import SUPPORTED_BROWSERS
+
+
+class AsyncPlaywrightExecutor:
+    """
+    异步Playwright脚本执行器
+
+    与 PlaywrightExecutor 的步骤语义和返回结构一致，但每次运行的 context/page 都是局部变量，
+    因此一个执行器实例可以同时驱动多个运行；同一浏览器类型的所有运行共享一个浏览器进程。
+    """
+
+    def __init__(self, artifacts_base_path: str, headless: Optional[bool] = None):
+        """
+        初始化执行器
+
+        Args:
+            artifacts_base_path: 工件存储基础路径
+            headless: 是否以无头模式启动浏览器，默认使用 BROWSER_HEADLESS 配置
+        """
+        self.artifacts_base_path = artifacts_base_path
+        self.headless = settings.BROWSER_HEADLESS if headless is None else headless
+        self.playwright: Optional[Playwright] = None
+        self.browsers: Dict[str, Browser] = {}
+        self._browser_lock = asyncio.Lock()
+
+    async def __aenter__(self) -> "AsyncPlaywrightExecutor":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def execute_script(
+        self,
+        script: Dict[str, Any],
+        run_id: int,
+        auth_state_path: Optional[str] = None,
+        assertion_checklist: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        执行Playwright脚本
+
+        Args:
+            script: Playwright脚本配置
+            run_id: 运行ID
+            auth_state_path: 认证状态文件路径（可选）
+            assertion_checklist: 断言清单，执行结束时在最终页面上核对（可选）
+
+        Returns:
+            执行结果 {success, steps, error_message, artifacts_path, console_logs, page_snapshot, assertion_results}
+        """
+        # 创建工件目录
+        run_artifacts_path = os.path.join(self.artifacts_base_path, f"runs/{run_id}")
+        screenshots_path = os.path.join(run_artifacts_path, "screenshots")
+        logs_path = os.path.join(run_artifacts_path, "logs")
+        network_path = os.path.join(run_artifacts_path, "network")
+
+        os.makedirs(screenshots_path, exist_ok=True)
+        os.makedirs(logs_path, exist_ok=True)
+        os.makedirs(network_path, exist_ok=True)
+
+        result = {
+            "success": False,
+            "steps": [],
+            "error_message": None,
+            "artifacts_path": run_artifacts_path,
+            "console_logs": [],
+            "page_snapshot": None,
+            "assertion_results": None
+        }
+
+        console_logs = []
+        context = None
+
+        try:
+            browser = await self._get_browser(script.get("browser", "chromium"))
+
+            # 每次运行使用独立的上下文（支持加载认证状态）
+            context_options = {
+                "viewport": script.get("viewport", {"width": 1280, "height": 720}),
+                "record_har_path": os.path.join(network_path, "traffic.har")
+            }
+            if auth_state_path and os.path.exists(auth_state_path):
+                context_options["storage_state"] = auth_state_path
+                print(f"✅ 加载认证状态: {auth_state_path}")
+
+            context = await browser.new_context(**context_options)
+            page = await context.new_page()
+
+            def handle_console(msg):
+                console_logs.append(f"[{msg.type}] {msg.text}")
+
+            page.on("console", handle_console)
+
+            stability = AsyncPageStabilityDetector(
+                page,
+                max_wait_ms=settings.PAGE_STABILITY_TIMEOUT_MS,
+                quiet_ms=settings.PAGE_STABILITY_QUIET_MS
+            )
+            await stability.attach()
+
+            for step in script.get("steps", []):
+                step_result = await self._execute_step(page, stability, step, screenshots_path)
+                result["steps"].append(step_result)
+
+                # 如果步骤失败,停止执行
+                if step_result["status"] == "failed":
+                    break
+
+            # 记录最终页面快照，供本地规则判定使用
+            result["page_snapshot"] = await capture_page_snapshot_async(page)
+            if result["page_snapshot"]:
+                save_snapshot(result["page_snapshot"], os.path.join(run_artifacts_path, "final_snapshot.json.gz"))
+            result["assertion_results"] = await evaluate_checklist_async(page, assertion_checklist)
+
+            with open(os.path.join(logs_path, "console.log"), "w", encoding="utf-8") as f:
+                f.write("\n".join(console_logs))
+
+            result["console_logs"] = console_logs
+            result["success"] = all(s["status"] == "success" for s in result["steps"])
+
+        except Exception as e:
+            result["error_message"] = str(e)
+            result["success"] = False
+
+        finally:
+            if context:
+                try:
+                    # 关闭上下文时才会写出 HAR 文件
+                    await context.close()
+                except Exception as e:
+                    print(f"清理资源时出错: {e}")
+
+        return result
+
+    async def close(self):
+        """关闭共享浏览器和 Playwright 驱动"""
+        for browser in self.browsers.values():
+            try:
+                await browser.close()
+            except Exception as e:
+                print(f"关闭浏览器时出错: {e}")
+        self.browsers = {}
+
+        if self.playwright:
+            await self.playwright.stop()
+            self.playwright = None
+
+    async def _get_browser(self, browser_type: str) -> Browser:
+        """获取共享浏览器，首次使用或浏览器崩溃时启动"""
+        if browser_type not in SUPPORTED_BROWSERS:
+            browser_type = "chromium"
+
+        async with self._browser_lock:
+            if self.playwright is None:
+                self.playwright = await async_playwright().start()
+
+            browser = self.browsers.get(browser_type)
+            if browser is None or not browser.is_connected():
+                browser = await getattr(self.playwright, browser_type).launch(headless=self.headless)
+                self.browsers[browser_type] = browser
+            return browser
+
+    async def _execute_step(
+        self,
+        page: Page,
+        stability: AsyncPageStabilityDetector,
+        step: Dict[str, Any],
+        screenshots_path: str
+    ) -> Dict[str, Any]:
+        """
+        执行单个步骤
+
+        Args:
+            page: 本次运行的页面
+            stability: 本次运行的页面稳定性检测器
+            step: 步骤配置
+            screenshots_path: 截图保存路径
+
+        Returns:
+            步骤执行结果
+        """
+        step_result = {
+            "index": step.get("index", 0),
+            "description": step.get("description", ""),
+            "status": "success",
+            "screenshot_path": None,
+            "error_message": None,
+            "start_time": datetime.utcnow().isoformat(),
+            "end_time": None,
+            "stability_wait_ms": None
+        }
+
+        try:
+            action = step.get("action")
+            selector = step.get("selector")
+            value = step.get("value")
+            timeout = step.get("timeout", 30000)
+
+            if action == "goto":
+                await page.goto(value, timeout=timeout, wait_until="networkidle")
+
+            elif action == "click":
+                await page.click(selector, timeout=timeout)
+
+            elif action == "fill":
+                await page.fill(selector, value, timeout=timeout)
+
+            elif action == "select":
+                await page.select_option(selector, value, timeout=timeout)
+
+            elif action == "waitForSelector":
+                await page.wait_for_selector(selector, timeout=timeout)
+
+            elif action == "waitTime":
+                await asyncio.sleep(step.get("duration", 1000) / 1000)
+
+            elif action == "screenshot":
+                step_result["screenshot_path"] = await self._take_screenshot(page, step, screenshots_path)
+
+            elif action == "assertText":
+                text = await page.locator(selector).inner_text(timeout=timeout)
+                expected = step.get("expected", "")
+                if expected not in text:
+                    raise Exception(f"文本断言失败: 期望包含'{expected}', 实际为'{text}'")
+
+            elif action == "assertVisible":
+                if not await page.locator(selector).is_visible(timeout=timeout):
+                    raise Exception(f"元素不可见: {selector}")
+
+            # 默认截屏
+            if step.get("screenshot", True) and action != "screenshot":
+                stable = await stability.wait(step.get("stability_timeout"))
+                step_result["stability_wait_ms"] = stable["waited_ms"]
+                step_result["screenshot_path"] = await self._take_screenshot(page, step, screenshots_path)
+
+        except Exception as e:
+            step_result["status"] = "failed"
+            step_result["error_message"] = str(e)
+
+        step_result["end_time"] = datetime.utcnow().isoformat()
+        return step_result
+
+    async def _take_screenshot(self, page: Page, step: Dict[str, Any], screenshots_path: str) -> str:
+        """截图（并保存页面快照）后返回截图相对于 artifacts 目录的路径"""
+        screenshot_path = os.path.join(screenshots_path, f"step_{step['index']}.png")
+        await page.screenshot(path=screenshot_path, full_page=True)
+        if settings.PAGE_SNAPSHOT_PER_STEP:
+            # 在截图旁保存页面文本快照，供文本分析模式使用
+            await save_step_snapshot_async(page, screenshot_path)
+        return screenshot_path.replace(self.artifacts_base_path, "").replace("\\", "/").lstrip("/")
+
+
+class AsyncPlaywrightRunner:
+    """
+    在后台线程的事件循环中运行共享的 AsyncPlaywrightExecutor
+
+    调度器的工作线程调用 execute_script 后阻塞等待结果，而浏览器操作都在同一个事件循环中以协程执行，
+    同一浏览器类型的所有运行共用一个浏览器进程。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[AsyncPlaywrightExecutor] = None
+
+    def execute_script(
+        self,
+        script: Dict[str, Any],
+        run_id: int,
+        auth_state_path: Optional[str] = None,
+        assertion_checklist: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """在事件循环中执行脚本并等待结果，参数和返回值与 AsyncPlaywrightExecutor.execute_script 一致"""
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(
+            self._executor.execute_script(
+                script=script,
+                run_id=run_id,
+                auth_state_path=auth_state_path,
+                assertion_checklist=assertion_checklist
+            ),
+            loop
+        )
+        return future.result()
+
+    def shutdown(self, timeout: float = 30):
+        """关闭共享浏览器并停止事件循环"""
+        with self._lock:
+            loop, thread, executor = self._loop, self._thread, self._executor
+            self._loop = self._thread = self._executor = None
+        if loop is None:
+            return
+
+        try:
+            asyncio.run_coroutine_threadsafe(executor.close(), loop).result(timeout)
+        except Exception as e:
+            print(f"关闭异步 Playwright 执行器时出错: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """首次使用时启动事件循环线程"""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._executor = AsyncPlaywrightExecutor(artifacts_base_path=settings.ARTIFACTS_PATH)
+                self._thread = threading.Thread(target=self._run_loop, args=(loop,), name="async-playwright", daemon=True)
+                self._thread.start()
+                self._loop = loop
+                print("🎭 异步 Playwright 执行器已启动")
+            return self._loop
+
+    def _run_loop(self, loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+
+# 进程级异步执行器
+async_playwright_runner = AsyncPlaywrightRunner()
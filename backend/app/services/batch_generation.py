@@ -0,0 +1,383 @@
+"""
+批量生成测试用例服务
+一次提交多条自然语言场景，按有限并发调用 LLM 同时生成用例和脚本（每条一次调用，见 generate_case_with_script），
+全部生成完成后在同一个事务中保存成功的用例。
+任务和逐条状态保存在 batch_generation_job / batch_generation_item 表中，任一 API 进程都可以按任务 ID 查询进度；
+执行任务的进程定期刷新 updated_at，进程退出后任务在超过 BATCH_GENERATION_STALE_SECONDS 时被标记为失败。
+"""
+import os
+import uuid
+import socket
+import threading
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
+from sqlalchemy import func, case, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.test_case import TestCase
+from app.models.batch_generation import BatchGenerationJob, BatchGenerationItem
+from app.services.script_regeneration import with_script_base
+
+
+ACTIVE_STATUSES = ("running", "saving")
+
+
+class BatchGenerationJobs:
+    """批量生成任务管理器（本进程的所有任务共用一个有界线程池）"""
+
+    def __init__(self, concurrency: int = 8, job_ttl_seconds: int = 3600, stale_seconds: int = 300):
+        """
+        Args:
+            concurrency: 本进程同时进行的 LLM 生成数（所有任务合计）
+            job_ttl_seconds: 已结束的任务保留多久以供查询（秒）
+            stale_seconds: 执行中的任务超过多久未更新视为执行进程已退出（秒）
+        """
+        self.concurrency = concurrency
+        self.job_ttl = timedelta(seconds=job_ttl_seconds)
+        self.stale_after = timedelta(seconds=stale_seconds)
+        self.heartbeat_interval = max(1, stale_seconds // 3)
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-gen")
+        self._stopping = threading.Event()
+
+    def submit(
+        self,
+        project_id: int,
+        user_id: int,
+        llm_service,
+        base_url: str,
+        descriptions: List[str],
+        executor_type: str = "playwright"
+    ) -> Dict[str, Any]:
+        """
+        创建批量生成任务并在后台执行
+
+        Args:
+            project_id: 项目ID
+            user_id: 创建用例的用户ID
+            llm_service: 项目的 LLM 服务
+            base_url: 被测站点基础URL
+            descriptions: 自然语言场景列表
+            executor_type: 生成的脚本对应的执行器 (playwright / midscene)
+
+        Returns:
+            任务状态快照
+        """
+        self._purge_expired()
+        job_id = uuid.uuid4().hex
+        db = SessionLocal()
+        try:
+            job = BatchGenerationJob(
+                id=job_id,
+                project_id=project_id,
+                created_by=user_id,
+                executor_type=executor_type,
+                status="running",
+                total=len(descriptions),
+                worker_id=self.worker_id,
+                items=[
+                    BatchGenerationItem(item_index=index, natural_language=text, status="pending")
+                    for index, text in enumerate(descriptions)
+                ]
+            )
+            db.add(job)
+            db.commit()
+            snapshot = self._snapshot(job)
+        finally:
+            db.close()
+
+        thread = threading.Thread(
+            target=self._run,
+            args=(job_id, llm_service, base_url),
+            name=f"batch-gen-{job_id[:8]}",
+            daemon=True
+        )
+        thread.start()
+        print(f"📦 批量生成任务已创建: {job_id}, 项目={project_id}, 场景数={len(descriptions)}")
+        return snapshot
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务状态快照，任务不存在或已过期时返回 None"""
+        db = SessionLocal()
+        try:
+            job = db.query(BatchGenerationJob).filter(BatchGenerationJob.id == job_id).first()
+            if job is None:
+                return None
+            if job.status in ACTIVE_STATUSES and job.updated_at < datetime.utcnow() - self.stale_after:
+                self._fail_stale(db, job)
+            return self._snapshot(job)
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取批量生成统计数据（所有进程的任务合计）"""
+        db = SessionLocal()
+        try:
+            jobs, running, pending_items = db.query(
+                func.count(BatchGenerationJob.id),
+                func.sum(case((BatchGenerationJob.status.in_(ACTIVE_STATUSES), 1), else_=0)),
+                func.sum(BatchGenerationJob.total - BatchGenerationJob.completed)
+            ).one()
+        finally:
+            db.close()
+        return {
+            "concurrency": self.concurrency,
+            "jobs": jobs,
+            "running": int(running or 0),
+            "pending_items": int(pending_items or 0)
+        }
+
+    def shutdown(self):
+        """停止尚未开始的生成（已生成的用例不再保存）"""
+        self._stopping.set()
+        self._executor.shutdown(wait=False)
+
+    def _run(self, job_id: str, llm_service, base_url: str):
+        """生成全部场景后统一保存"""
+        db = SessionLocal()
+        try:
+            job = db.query(BatchGenerationJob).filter(BatchGenerationJob.id == job_id).one()
+            executor_type = job.executor_type
+            items = [(item.id, item.item_index, item.natural_language) for item in job.items]
+        finally:
+            db.close()
+
+        futures = [
+            self._executor.submit(self._generate_item, job_id, item_id, index, text, executor_type, llm_service, base_url)
+            for item_id, index, text in items
+        ]
+        # 等待期间定期刷新 updated_at，表明执行进程仍然存活
+        while wait(futures, timeout=self.heartbeat_interval).not_done:
+            self._update_job(job_id)
+
+        if self._stopping.is_set():
+            self._finish(job_id, "failed", "服务关闭，任务已中止")
+            return
+
+        db = SessionLocal()
+        try:
+            generated = db.query(func.count(BatchGenerationItem.id)).filter(
+                BatchGenerationItem.job_id == job_id,
+                BatchGenerationItem.status == "generated"
+            ).scalar()
+        finally:
+            db.close()
+        if not generated:
+            self._finish(job_id, "failed", "所有场景生成失败")
+            return
+
+        self._update_job(job_id, status="saving")
+        self._persist(job_id)
+
+    def _generate_item(
+        self,
+        job_id: str,
+        item_id: int,
+        index: int,
+        natural_language: str,
+        executor_type: str,
+        llm_service,
+        base_url: str
+    ):
+        """生成单条场景的用例和脚本"""
+        if self._stopping.is_set():
+            self._item_done(job_id, item_id, error="服务关闭，未生成")
+            return
+        self._update_item(item_id, status="running")
+        try:
+            result = llm_service.generate_case_with_script(
+                natural_language=natural_language,
+                base_url=base_url,
+                executor_type=executor_type
+            )
+        except Exception as e:
+            print(f"⚠️ 批量生成第 {index + 1} 条失败: {e}")
+            self._item_done(job_id, item_id, error=str(e))
+            return
+        self._item_done(job_id, item_id, name=str(result["name"])[:200], result=result)
+
+    def _persist(self, job_id: str):
+        """在同一个事务中保存所有生成成功的用例"""
+        db = SessionLocal()
+        try:
+            job = db.query(BatchGenerationJob).filter(BatchGenerationJob.id == job_id).one()
+            executor_type = job.executor_type
+            items = [item for item in job.items if item.status == "generated"]
+            for item in items:
+                result = item.result
+                script = result["script"]
+                test_case = TestCase(
+                    project_id=job.project_id,
+                    name=item.name,
+                    description=result.get("description") or "",
+                    natural_language=item.natural_language,
+                    standard_steps=result["standard_steps"],
+                    # midscene 用例的 playwright_script 与手动创建时一致，保存为空对象
+                    playwright_script=script if executor_type == "playwright" else {},
+                    midscene_script=script if executor_type == "midscene" else None,
+                    expected_result=result["expected_result"],
+                    executor_type=executor_type,
+                    script_base_steps=with_script_base(None, executor_type, result["standard_steps"], script),
+                    created_by=job.created_by
+                )
+                db.add(test_case)
+                db.flush()
+                item.status = "saved"
+                item.test_case_id = test_case.id
+                item.result = None
+            job.status = "completed"
+            job.finished_at = job.updated_at = datetime.utcnow()
+            db.commit()
+            print(f"✅ 批量生成任务完成: {job_id}, 保存 {len(items)}/{job.total} 条用例")
+        except Exception as e:
+            db.rollback()
+            print(f"❌ 批量生成任务保存失败: {job_id}: {e}")
+            self._fail_generated(job_id, f"保存失败: {e}")
+            self._finish(job_id, "failed", f"保存用例失败: {e}")
+        finally:
+            db.close()
+
+    def _update_job(self, job_id: str, **fields):
+        db = SessionLocal()
+        try:
+            fields["updated_at"] = datetime.utcnow()
+            db.query(BatchGenerationJob).filter(BatchGenerationJob.id == job_id).update(fields)
+            db.commit()
+        finally:
+            db.close()
+
+    def _update_item(self, item_id: int, **fields):
+        db = SessionLocal()
+        try:
+            db.query(BatchGenerationItem).filter(BatchGenerationItem.id == item_id).update(fields)
+            db.commit()
+        finally:
+            db.close()
+
+    def _item_done(
+        self,
+        job_id: str,
+        item_id: int,
+        name: Optional[str] = None,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None
+    ):
+        """记录单条场景的生成结果（生成成功的用例在整批保存后才标记为 saved）"""
+        db = SessionLocal()
+        try:
+            db.query(BatchGenerationItem).filter(BatchGenerationItem.id == item_id).update({
+                BatchGenerationItem.status: "failed" if error else "generated",
+                BatchGenerationItem.name: name,
+                BatchGenerationItem.result: result,
+                BatchGenerationItem.error: error
+            }, synchronize_session=False)
+            # 计数用 SQL 自增，多个生成线程并发完成时不会互相覆盖
+            counter = BatchGenerationJob.failed if error else BatchGenerationJob.succeeded
+            db.query(BatchGenerationJob).filter(BatchGenerationJob.id == job_id).update({
+                BatchGenerationJob.completed: BatchGenerationJob.completed + 1,
+                counter: counter + 1,
+                BatchGenerationJob.updated_at: datetime.utcnow()
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _fail_generated(self, job_id: str, error: str):
+        """保存失败时把已生成的场景标记为失败"""
+        db = SessionLocal()
+        try:
+            count = db.query(BatchGenerationItem).filter(
+                BatchGenerationItem.job_id == job_id,
+                BatchGenerationItem.status == "generated"
+            ).update({
+                BatchGenerationItem.status: "failed",
+                BatchGenerationItem.error: error,
+                BatchGenerationItem.result: None
+            }, synchronize_session=False)
+            db.query(BatchGenerationJob).filter(BatchGenerationJob.id == job_id).update({
+                BatchGenerationJob.failed: BatchGenerationJob.failed + count,
+                BatchGenerationJob.succeeded: BatchGenerationJob.succeeded - count
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _finish(self, job_id: str, status: str, error: Optional[str] = None):
+        now = datetime.utcnow()
+        self._update_job(job_id, status=status, error=error, finished_at=now)
+
+    def _fail_stale(self, db: Session, job: BatchGenerationJob):
+        """执行进程已退出的任务标记为失败（条件更新，执行进程恰好刷新时不覆盖）"""
+        now = datetime.utcnow()
+        updated = db.query(BatchGenerationJob).filter(
+            BatchGenerationJob.id == job.id,
+            BatchGenerationJob.status.in_(ACTIVE_STATUSES),
+            BatchGenerationJob.updated_at < now - self.stale_after
+        ).update({
+            BatchGenerationJob.status: "failed",
+            BatchGenerationJob.error: "任务中断（处理进程已退出）",
+            BatchGenerationJob.finished_at: now,
+            BatchGenerationJob.updated_at: now
+        }, synchronize_session=False)
+        db.commit()
+        if updated:
+            print(f"⚠️ 批量生成任务 {job.id} 超过 {int(self.stale_after.total_seconds())} 秒未更新（{job.worker_id}），标记为失败")
+        db.refresh(job)
+
+    def _snapshot(self, job: BatchGenerationJob) -> Dict[str, Any]:
+        return {
+            "job_id": job.id,
+            "project_id": job.project_id,
+            "created_by": job.created_by,
+            "executor_type": job.executor_type,
+            "status": job.status,
+            "total": job.total,
+            "completed": job.completed,
+            "succeeded": job.succeeded,
+            "failed": job.failed,
+            "error": job.error,
+            "created_at": job.created_at,
+            "finished_at": job.finished_at,
+            "items": [
+                {
+                    "index": item.item_index,
+                    "natural_language": item.natural_language,
+                    "status": item.status,
+                    "name": item.name,
+                    "test_case_id": item.test_case_id,
+                    "error": item.error
+                }
+                for item in job.items
+            ]
+        }
+
+    def _purge_expired(self):
+        """清理超过保留时间的已结束任务"""
+        cutoff = datetime.utcnow() - self.job_ttl
+        db = SessionLocal()
+        try:
+            expired = select(BatchGenerationJob.id).where(
+                BatchGenerationJob.finished_at.isnot(None),
+                BatchGenerationJob.finished_at < cutoff
+            )
+            # SQLite 默认不启用外键约束，先删除逐条记录再删除任务
+            db.query(BatchGenerationItem).filter(
+                BatchGenerationItem.job_id.in_(expired)
+            ).delete(synchronize_session=False)
+            db.query(BatchGenerationJob).filter(
+                BatchGenerationJob.id.in_(expired)
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+# 进程级任务管理器
+batch_generation_jobs = BatchGenerationJobs(
+    concurrency=settings.BATCH_GENERATION_CONCURRENCY,
+    job_ttl_seconds=settings.BATCH_GENERATION_JOB_TTL,
+    stale_seconds=settings.BATCH_GENERATION_STALE_SECONDS
+)
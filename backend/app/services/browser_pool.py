@@ -0,0 +1,293 @@
+"""
+浏览器池服务
+长期持有已启动的浏览器，每次运行只创建新的 BrowserContext，避免每次执行都冷启动浏览器
+"""
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Dict, Any, Callable, List, Optional, TypeVar
+from datetime import datetime
+from playwright.sync_api import sync_playwright, Playwright, Browser
+
+from app.config import settings
+
+
+SUPPORTED_BROWSERS = ("chromium", "firefox", "webkit")
+
+T = TypeVar("T")
+
+
+class PooledBrowser:
+    """池中的一个浏览器实例"""
+
+    def __init__(self, browser_type: str, browser: Browser, pooled: bool):
+        """
+        初始化池化浏览器
+
+        Args:
+            browser_type: 浏览器类型
+            browser: Playwright 浏览器实例
+            pooled: 是否归池管理（超出池容量时为临时浏览器，用完即关闭）
+        """
+        self.browser_type = browser_type
+        self.browser = browser
+        self.pooled = pooled
+        self.run_count = 0
+        self.crashed = False
+        self.created_at = datetime.utcnow()
+
+        # 浏览器进程崩溃或被关闭时会触发 disconnected 事件
+        def handle_disconnected(_browser):
+            self.crashed = True
+
+        browser.on("disconnected", handle_disconnected)
+
+    def is_healthy(self) -> bool:
+        """浏览器是否仍可复用"""
+        return not self.crashed and self.browser.is_connected()
+
+
+class BrowserHost:
+    """
+    持有一个 Playwright 驱动和一个空闲浏览器的常驻线程
+
+    Playwright 同步 API 的对象只能在创建它的线程中使用，因此池中的浏览器全部在宿主线程中启动、使用和关闭，
+    运行通过 submit 交给宿主线程执行；宿主线程一直存活到浏览器池关闭，浏览器不会随调用方线程退出而泄漏。
+    """
+
+    def __init__(self, pool: "BrowserPool", index: int):
+        self.pool = pool
+        self.index = index
+        self.idle: Optional[PooledBrowser] = None
+        self.playwright: Optional[Playwright] = None
+        self._tasks: "queue.Queue[Optional[Callable[[], None]]]" = queue.Queue()
+        self.thread = threading.Thread(target=self._loop, name=f"browser-host-{index}", daemon=True)
+        self.thread.start()
+
+    def submit(self, browser_type: str, fn: Callable[[PooledBrowser], T]) -> "Future[T]":
+        """在宿主线程中借出浏览器执行 fn，返回结果的 Future"""
+        future: "Future[T]" = Future()
+
+        def task():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(self._run(browser_type, fn))
+            except BaseException as e:
+                future.set_exception(e)
+
+        self._tasks.put(task)
+        return future
+
+    def stop(self):
+        """处理完已提交的运行后关闭浏览器和驱动"""
+        self._tasks.put(None)
+
+    def _loop(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                break
+            task()
+        self._close()
+
+    def _run(self, browser_type: str, fn: Callable[[PooledBrowser], T]) -> T:
+        """复用空闲浏览器（类型不同或已崩溃时重新启动），执行结束后决定保留还是回收"""
+        pooled_browser = self.idle
+        self.idle = None
+        if pooled_browser and pooled_browser.browser_type != browser_type:
+            self.pool._discard(pooled_browser)
+            pooled_browser = None
+        if pooled_browser and not pooled_browser.is_healthy():
+            # 空闲期间崩溃的浏览器直接丢弃
+            self.pool._discard(pooled_browser, crashed=True)
+            pooled_browser = None
+
+        if pooled_browser:
+            self.pool._count("reused")
+        else:
+            if self.playwright is None:
+                self.playwright = sync_playwright().start()
+            pooled_browser = PooledBrowser(browser_type, self.pool._launch(self.playwright, browser_type), pooled=True)
+            self.pool._count("launched")
+            print(f"🚀 浏览器池启动新浏览器: {browser_type} (常驻 #{self.index})")
+
+        try:
+            return fn(pooled_browser)
+        finally:
+            pooled_browser.run_count += 1
+            if not pooled_browser.is_healthy():
+                self.pool._discard(pooled_browser, crashed=True)
+            elif pooled_browser.run_count >= self.pool.max_runs_per_browser:
+                print(f"♻️ 浏览器已执行 {pooled_browser.run_count} 次运行，回收重启")
+                self.pool._count("recycled")
+                self.pool._discard(pooled_browser)
+            else:
+                self.idle = pooled_browser
+
+    def _close(self):
+        if self.idle:
+            self.pool._discard(self.idle)
+            self.idle = None
+        if self.playwright:
+            try:
+                self.playwright.stop()
+            except Exception as e:
+                print(f"关闭 Playwright 驱动时出错: {e}")
+            self.playwright = None
+
+
+class BrowserPool:
+    """
+    浏览器池
+
+    最多 max_size 个常驻宿主线程，每个宿主线程持有一个空闲浏览器并串行执行交给它的运行；
+    所有宿主都在执行时，运行在调用方线程中使用临时浏览器，用完即关闭。
+    """
+
+    def __init__(self, max_size: int = 4, max_runs_per_browser: int = 50, headless: bool = False):
+        """
+        初始化浏览器池
+
+        Args:
+            max_size: 常驻浏览器（宿主线程）的最大数量
+            max_runs_per_browser: 单个浏览器执行多少次运行后回收重启
+            headless: 是否以无头模式启动浏览器
+        """
+        self.max_size = max_size
+        self.max_runs_per_browser = max_runs_per_browser
+        self.headless = headless
+
+        self._lock = threading.Lock()
+        self._closed = False
+        self._hosts: List[BrowserHost] = []
+        self._free_hosts: List[BrowserHost] = []
+        self._transient_count = 0
+        self._stats = {
+            "launched": 0,
+            "reused": 0,
+            "recycled": 0,
+            "crashed": 0,
+            "transient": 0
+        }
+
+    def run(self, browser_type: str, fn: Callable[[PooledBrowser], T]) -> T:
+        """
+        借用一个浏览器执行 fn 并返回其结果
+
+        Args:
+            browser_type: 浏览器类型 (chromium, firefox, webkit)，未知类型回退到 chromium
+            fn: 使用浏览器执行一次运行的函数；检测到浏览器崩溃时应设置 pooled_browser.crashed
+
+        Returns:
+            fn 的返回值
+        """
+        if browser_type not in SUPPORTED_BROWSERS:
+            browser_type = "chromium"
+
+        host = self._take_host()
+        if host is None:
+            return self._run_transient(browser_type, fn)
+        try:
+            return host.submit(browser_type, fn).result()
+        finally:
+            with self._lock:
+                if self._closed:
+                    host.stop()
+                else:
+                    self._free_hosts.append(host)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取浏览器池统计数据"""
+        with self._lock:
+            return {
+                "enabled": settings.BROWSER_POOL_ENABLED,
+                "closed": self._closed,
+                "max_size": self.max_size,
+                "max_runs_per_browser": self.max_runs_per_browser,
+                "pooled": sum(1 for host in self._hosts if host.thread.is_alive()),
+                "leased": len(self._hosts) - len(self._free_hosts) + self._transient_count,
+                **self._stats
+            }
+
+    def shutdown(self, timeout: float = 30):
+        """
+        关闭浏览器池
+
+        空闲的宿主线程立即关闭浏览器和驱动；正在执行的宿主在当前运行结束后关闭。
+
+        Args:
+            timeout: 等待宿主线程退出的最长时间（秒）
+        """
+        with self._lock:
+            self._closed = True
+            hosts = list(self._hosts)
+            free_hosts = self._free_hosts
+            self._free_hosts = []
+
+        for host in free_hosts:
+            host.stop()
+        for host in hosts:
+            host.thread.join(timeout)
+
+    def _take_host(self) -> Optional[BrowserHost]:
+        """取一个空闲的宿主线程，池未满时新建；池已关闭或全部在执行时返回 None"""
+        with self._lock:
+            if self._closed:
+                self._stats["transient"] += 1
+                self._transient_count += 1
+                return None
+            if self._free_hosts:
+                return self._free_hosts.pop()
+            if len(self._hosts) < self.max_size:
+                host = BrowserHost(self, len(self._hosts) + 1)
+                self._hosts.append(host)
+                return host
+            self._stats["transient"] += 1
+            self._transient_count += 1
+            return None
+
+    def _run_transient(self, browser_type: str, fn: Callable[[PooledBrowser], T]) -> T:
+        """在调用方线程中使用临时浏览器执行，结束后关闭浏览器和驱动"""
+        playwright = sync_playwright().start()
+        try:
+            pooled_browser = PooledBrowser(browser_type, self._launch(playwright, browser_type), pooled=False)
+            self._count("launched")
+            print(f"🚀 浏览器池启动新浏览器: {browser_type} (临时)")
+            try:
+                return fn(pooled_browser)
+            finally:
+                self._discard(pooled_browser, crashed=pooled_browser.crashed)
+        finally:
+            with self._lock:
+                self._transient_count -= 1
+            try:
+                playwright.stop()
+            except Exception as e:
+                print(f"关闭 Playwright 驱动时出错: {e}")
+
+    def _launch(self, playwright: Playwright, browser_type: str) -> Browser:
+        """启动指定类型的浏览器"""
+        return getattr(playwright, browser_type).launch(headless=self.headless)
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _discard(self, pooled_browser: PooledBrowser, crashed: bool = False):
+        """关闭浏览器（必须在启动它的线程中调用）"""
+        if crashed:
+            self._count("crashed")
+        try:
+            if pooled_browser.browser.is_connected():
+                pooled_browser.browser.close()
+        except Exception as e:
+            print(f"关闭浏览器时出错: {e}")
+
+
+# 进程级浏览器池
+browser_pool = BrowserPool(
+    max_size=settings.BROWSER_POOL_MAX_SIZE,
+    max_runs_per_browser=settings.BROWSER_POOL_MAX_RUNS,
+    headless=settings.BROWSER_HEADLESS
+)
@@ -0,0 +1,238 @@
+"""
+LLM响应缓存服务
+按提供商、模型、采样参数和提示词内容寻址，将响应缓存到磁盘（TTL + 按总大小 LRU 淘汰），
+并合并并发的相同请求，只向上游发起一次调用
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Dict, Any, Optional, Callable
+
+from app.config import settings
+from app.services.llm_executor import LLMTaskCancelled
+
+
+class LLMResponseCache:
+    """LLM响应磁盘缓存"""
+
+    def __init__(self, cache_dir: str, ttl_seconds: int = 7 * 24 * 3600, max_bytes: int = 100 * 1024 * 1024):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir: 缓存目录
+            ttl_seconds: 缓存有效期（秒）
+            max_bytes: 缓存文件总大小上限，超过后淘汰最久未使用的记录
+        """
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        # key -> (文件大小, 最近访问时间)，首次使用时从磁盘加载
+        self._index: Optional[Dict[str, tuple]] = None
+        self._total_bytes = 0
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "expired": 0,
+            "evicted": 0,
+            "errors": 0
+        }
+
+    @staticmethod
+    def make_key(provider: str, model: str, base_url: Optional[str], sampling: Dict[str, Any], prompt: str) -> str:
+        """计算缓存键"""
+        payload = json.dumps(
+            {
+                "provider": provider,
+                "model": model,
+                "base_url": base_url or "",
+                "sampling": sampling,
+                "prompt_hash": hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+            },
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_or_compute(self, key: str, compute: Callable[[], str]) -> str:
+        """
+        读取缓存，未命中时调用 compute 并写入缓存
+
+        相同 key 的并发调用只有第一个会执行 compute，其余等待并共享结果（包括异常，
+        但首个调用者因客户端断开被取消时，等待者会重新发起）。
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self._stats["coalesced"] += 1
+
+        if not owner:
+            try:
+                return future.result()
+            except LLMTaskCancelled:
+                # 首个调用者的客户端已断开，由当前调用者重新发起
+                return self.get_or_compute(key, compute)
+
+        try:
+            # 等待期间可能已有其他进程写入缓存
+            value = self.get(key, count=False)
+            if value is None:
+                value = compute()
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def get(self, key: str, count: bool = True) -> Optional[str]:
+        """读取缓存，不存在或已过期时返回 None"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            if count:
+                self._count("misses")
+            return None
+        except Exception as e:
+            print(f"⚠️ 读取LLM缓存失败: {e}")
+            self._count("errors")
+            return None
+
+        if time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            self.invalidate(key)
+            self._count("expired")
+            if count:
+                self._count("misses")
+            return None
+
+        now = time.time()
+        try:
+            # 用文件修改时间记录最近访问时间，重启后据此恢复 LRU 顺序
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            index = self._load_index()
+            if key in index:
+                index[key] = (index[key][0], now)
+            if count:
+                self._stats["hits"] += 1
+        return entry.get("response")
+
+    def set(self, key: str, response: str):
+        """写入缓存"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        data = json.dumps({"created_at": time.time(), "response": response}, ensure_ascii=False)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ 写入LLM缓存失败: {e}")
+            self._count("errors")
+            return
+
+        size = os.path.getsize(path)
+        with self._lock:
+            index = self._load_index()
+            previous = index.get(key)
+            if previous:
+                self._total_bytes -= previous[0]
+            index[key] = (size, time.time())
+            self._total_bytes += size
+            self._evict()
+
+    def invalidate(self, key: str):
+        """删除缓存记录（如响应无法解析时）"""
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            entry = self._load_index().pop(key, None)
+            if entry:
+                self._total_bytes -= entry[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计数据"""
+        with self._lock:
+            index = self._load_index()
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "enabled": settings.LLM_CACHE_ENABLED,
+                "entries": len(index),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "inflight": len(self._inflight),
+                "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else None,
+                **self._stats
+            }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _load_index(self) -> Dict[str, tuple]:
+        """扫描缓存目录建立索引（调用方持有锁）"""
+        if self._index is None:
+            self._index = {}
+            self._total_bytes = 0
+            if os.path.isdir(self.cache_dir):
+                for name in os.listdir(self.cache_dir):
+                    if not name.endswith(".json"):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(self.cache_dir, name))
+                    except OSError:
+                        continue
+                    self._index[name[:-5]] = (stat.st_size, stat.st_mtime)
+                    self._total_bytes += stat.st_size
+        return self._index
+
+    def _evict(self):
+        """总大小超过上限时按最近访问时间淘汰（调用方持有锁）"""
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            del self._index[key]
+            self._total_bytes -= size
+            self._stats["evicted"] += 1
+
+
+# 进程级 LLM 响应缓存
+llm_response_cache = LLMResponseCache(
+    cache_dir=os.path.join(settings.ARTIFACTS_PATH, "llm_cache"),
+    ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+    max_bytes=settings.LLM_CACHE_MAX_MB * 1024 * 1024
+)
@@ -0,0 +1,247 @@
+"""
+接口层 LLM 任务执行器
+async 接口中的同步 LLM 调用和子进程等待统一放到有界线程池中执行，避免阻塞事件循环；
+客户端断开连接后取消尚未开始的任务，已开始的任务在下一次限流等待或重试前中止
+"""
+import asyncio
+import functools
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterator, Optional, TypeVar
+
+from fastapi import HTTPException, Request
+
+from app.config import settings
+
+
+T = TypeVar("T")
+
+# 客户端已断开（nginx 约定的 499 状态码，客户端不会收到，仅用于日志）
+CLIENT_CLOSED_REQUEST = 499
+
+_llm_executor = ThreadPoolExecutor(max_workers=settings.LLM_ENDPOINT_MAX_WORKERS, thread_name_prefix="llm-endpoint")
+# 当前线程所执行任务的取消标记
+_local = threading.local()
+# 流式任务结束标记
+_STREAM_END = object()
+
+
+class LLMTaskCancelled(Exception):
+    """任务已被取消（客户端断开连接）"""
+
+
+def current_cancel_event() -> Optional[threading.Event]:
+    """当前线程正在执行的接口任务的取消标记，不在接口任务中时返回 None"""
+    return getattr(_local, "cancel_event", None)
+
+
+def check_cancelled():
+    """任务已取消时抛出 LLMTaskCancelled"""
+    event = current_cancel_event()
+    if event is not None and event.is_set():
+        raise LLMTaskCancelled("客户端已断开连接，任务已取消")
+
+
+def sleep_unless_cancelled(seconds: float):
+    """等待指定时长，期间任务被取消时立即抛出 LLMTaskCancelled"""
+    event = current_cancel_event()
+    if event is None:
+        time.sleep(seconds)
+        return
+    if event.wait(seconds):
+        raise LLMTaskCancelled("客户端已断开连接，任务已取消")
+
+
+class ChildCancelEvent(threading.Event):
+    """
+    子任务的取消标记：可单独设置（如对冲中落败的请求），父任务被取消时同样视为已取消
+    """
+
+    def __init__(self, parent: Optional[threading.Event] = None):
+        super().__init__()
+        self.parent = parent
+
+    def is_set(self) -> bool:
+        return super().is_set() or (self.parent is not None and self.parent.is_set())
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        if self.parent is None:
+            return super().wait(timeout)
+        # 同时关注父标记，按短间隔轮询
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.is_set():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            super().wait(0.2 if remaining is None else min(0.2, remaining))
+        return True
+
+
+def child_cancel_event() -> ChildCancelEvent:
+    """创建继承当前任务取消标记的子标记"""
+    return ChildCancelEvent(current_cancel_event())
+
+
+def bind_cancel_event(fn: Callable[..., T], cancel_event: Optional[threading.Event] = None) -> Callable[..., T]:
+    """
+    让提交到其他线程池的子任务使用取消标记（如对冲请求）
+
+    Args:
+        fn: 子任务
+        cancel_event: 子任务的取消标记，默认沿用当前任务的取消标记
+    """
+    if cancel_event is None:
+        cancel_event = current_cancel_event()
+    if cancel_event is None:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return _run_with_cancel_event(cancel_event, functools.partial(fn, *args, **kwargs))
+    return wrapper
+
+
+def _run_with_cancel_event(cancel_event: threading.Event, fn: Callable[[], T]) -> T:
+    previous = current_cancel_event()
+    _local.cancel_event = cancel_event
+    try:
+        check_cancelled()
+        return fn()
+    finally:
+        _local.cancel_event = previous
+
+
+async def run_llm_task(request: Optional[Request], fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    在 LLM 线程池中执行同步任务，并在客户端断开连接时取消
+
+    Args:
+        request: 当前请求（为 None 时不检测断开）
+        fn: 同步任务（LLM 调用、子进程等待等）
+        *args, **kwargs: 任务参数
+
+    Returns:
+        任务的返回值
+
+    Raises:
+        HTTPException: 客户端已断开连接（499）
+    """
+    cancel_event = threading.Event()
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(
+        _llm_executor,
+        _run_with_cancel_event,
+        cancel_event,
+        functools.partial(fn, *args, **kwargs)
+    )
+    try:
+        while True:
+            done, _ = await asyncio.wait({future}, timeout=settings.LLM_DISCONNECT_POLL_INTERVAL)
+            if done:
+                break
+            if request is not None and await request.is_disconnected():
+                print(f"🔌 客户端已断开，取消LLM任务: {getattr(fn, '__name__', fn)}")
+                raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="客户端已断开连接，任务已取消")
+    finally:
+        if not future.done():
+            # 尚未开始的任务直接取消；已开始的任务在下一次限流等待或重试前中止
+            cancel_event.set()
+            future.cancel()
+
+    try:
+        return future.result()
+    except LLMTaskCancelled as e:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail=str(e))
+
+
+def submit_llm_task(fn: Callable[..., T], *args, **kwargs):
+    """
+    在 LLM 线程池中执行后台任务（不等待结果，如预生成脚本写入响应缓存）
+
+    后台任务与接口任务共用线程池，失败时只打印日志。
+    """
+    def run():
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            print(f"⚠️ 后台LLM任务失败: {getattr(fn, '__name__', fn)}: {e}")
+
+    return _llm_executor.submit(run)
+
+
+async def stream_llm_task(
+    request: Optional[Request],
+    fn: Callable[..., Iterator[T]],
+    *args,
+    **kwargs
+) -> AsyncIterator[T]:
+    """
+    在 LLM 线程池中执行同步生成器（如流式生成），逐项转发到事件循环
+
+    客户端断开连接或响应被中止时设置取消标记，生成器在产出下一项时停止并关闭上游流。
+    生成器抛出的异常在转发完已产出的项之后原样抛出。
+
+    Args:
+        request: 当前请求（为 None 时不检测断开）
+        fn: 返回同步迭代器的函数
+        *args, **kwargs: 函数参数
+    """
+    cancel_event = threading.Event()
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def put(item, error=None):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    def produce():
+        iterator = None
+        try:
+            iterator = fn(*args, **kwargs)
+            for item in iterator:
+                check_cancelled()
+                put(item)
+        except Exception as e:
+            put(_STREAM_END, e)
+        else:
+            put(_STREAM_END)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+
+    future = loop.run_in_executor(_llm_executor, _run_with_cancel_event, cancel_event, produce)
+    interval = settings.LLM_DISCONNECT_POLL_INTERVAL
+    checked_at = loop.time()
+    try:
+        while True:
+            try:
+                item, error = await asyncio.wait_for(queue.get(), timeout=interval)
+            except asyncio.TimeoutError:
+                item = None
+            # 持续有输出时也按间隔检测断开
+            if request is not None and loop.time() - checked_at >= interval:
+                checked_at = loop.time()
+                if await request.is_disconnected():
+                    print(f"🔌 客户端已断开，取消LLM流式任务: {getattr(fn, '__name__', fn)}")
+                    return
+            if item is None:
+                continue
+            if item is _STREAM_END:
+                if error is not None and not isinstance(error, LLMTaskCancelled):
+                    raise error
+                return
+            yield item
+    finally:
+        if not future.done():
+            cancel_event.set()
+            future.cancel()
+
+
+def shutdown():
+    """关闭线程池（不等待正在执行的任务）"""
+    _llm_executor.shutdown(wait=False)
@@ -0,0 +1,309 @@
+"""
+LLM 限流与重试
+按提供商 + 接口地址 + API 密钥共享令牌桶（同一进程内所有执行线程共用，多进程部署时按 LLM_RATE_LIMIT_PROCESSES 分摊速率），
+遇到 429 时自动降低速率并按 Retry-After / 带抖动的指数退避重试，成功后逐步恢复速率；
+同时记录调用延迟，供请求对冲判断 p95
+"""
+import time
+import random
+import hashlib
+import threading
+from collections import deque
+from typing import Dict, Any, Optional, Callable, TypeVar
+
+import httpx
+
+from app.config import settings
+from app.services.llm_executor import LLMTaskCancelled, check_cancelled, sleep_unless_cancelled
+
+
+T = TypeVar("T")
+
+# 可重试的 HTTP 状态码
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504, 529)
+
+
+class RateLimitWaitTimeout(Exception):
+    """等待令牌超时"""
+
+
+class TokenBucket:
+    """
+    自适应令牌桶
+
+    rate 为每秒补充的令牌数，capacity 为允许的突发请求数。
+    收到 429 时速率减半（不低于初始速率的 1/8），之后每次成功调用按 5% 恢复，直到初始速率。
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: int):
+        self.base_rate = rate_per_minute / 60.0
+        self.rate = self.base_rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        # 服务端要求暂停（Retry-After）期间不发放令牌
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait: float) -> float:
+        """
+        获取一个令牌，必要时等待
+
+        Returns:
+            实际等待的秒数
+
+        Raises:
+            RateLimitWaitTimeout: 超过 max_wait 仍未获得令牌
+        """
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return now - started
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            if time.monotonic() - started + wait > max_wait:
+                raise RateLimitWaitTimeout(f"等待LLM限流令牌超过{max_wait:.0f}秒")
+            sleep_unless_cancelled(min(wait, 1.0))
+
+    def on_rate_limited(self, retry_after: Optional[float]):
+        """收到 429：降低速率，并在 Retry-After 期间暂停发放令牌"""
+        with self._lock:
+            self.rate = max(self.rate / 2, self.base_rate / 8)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def on_success(self):
+        """调用成功：逐步恢复速率"""
+        with self._lock:
+            if self.rate < self.base_rate:
+                self.rate = min(self.base_rate, self.rate * 1.05)
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+class LatencyTracker:
+    """记录最近的调用延迟，计算分位数"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float, min_samples: int = 20) -> Optional[float]:
+        """样本数不足时返回 None"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct))]
+
+
+class LLMRateLimiter:
+    """LLM 调用限流器（按提供商、接口地址和密钥区分）"""
+
+    def __init__(self):
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._latencies: Dict[str, LatencyTracker] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def make_key(provider: str, base_url: Optional[str], api_key: str) -> str:
+        """限流键（密钥只保留哈希）"""
+        key_hash = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+        return f"{provider}|{base_url or ''}|{key_hash}"
+
+    def call(
+        self,
+        key: str,
+        fn: Callable[[], T],
+        rate_per_minute: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        record_latency: bool = True
+    ) -> T:
+        """
+        在限流和重试保护下执行一次 LLM 调用
+
+        Args:
+            key: 限流键（见 make_key）
+            fn: 实际的调用
+            rate_per_minute: 每分钟请求数上限，默认 LLM_RATE_LIMIT_RPM（0 表示不限流）
+            max_retries: 最大重试次数，默认 LLM_MAX_RETRIES
+            record_latency: 是否计入延迟统计（流式请求只建立连接，不计入对冲使用的 p95）
+
+        Returns:
+            fn 的返回值
+        """
+        rate = settings.LLM_RATE_LIMIT_RPM if rate_per_minute is None else rate_per_minute
+        retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+        bucket = self._bucket(key, rate) if rate and rate > 0 else None
+        stats = self._stats_for(key)
+
+        attempt = 0
+        while True:
+            # 接口任务在客户端断开后不再发起新的请求
+            check_cancelled()
+            if bucket:
+                waited = bucket.acquire(settings.LLM_RATE_LIMIT_MAX_WAIT)
+                if waited > 0.05:
+                    self._count(stats, "throttled")
+
+            started = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                status = _status_code(e)
+                if isinstance(e, LLMTaskCancelled):
+                    raise
+                retryable = status in RETRYABLE_STATUS_CODES or (status is None and _is_transient(e))
+                retry_after = _retry_after(e)
+                if status == 429:
+                    self._count(stats, "rate_limited")
+                    if bucket:
+                        bucket.on_rate_limited(retry_after)
+                if retry_after and retry_after > settings.LLM_RATE_LIMIT_MAX_WAIT:
+                    # 服务端要求暂停的时间过长，直接失败
+                    retryable = False
+                if not retryable or attempt >= retries:
+                    self._count(stats, "failed")
+                    raise
+                delay = self._backoff(attempt, retry_after)
+                attempt += 1
+                self._count(stats, "retries")
+                print(f"⏳ LLM调用失败（{status or type(e).__name__}），{delay:.1f}秒后第{attempt}次重试: {e}")
+                sleep_unless_cancelled(delay)
+                continue
+
+            if record_latency:
+                self._latency(key).record(time.monotonic() - started)
+            if bucket:
+                bucket.on_success()
+            self._count(stats, "succeeded")
+            return result
+
+    def p95_latency(self, key: str) -> Optional[float]:
+        """最近调用延迟的 p95（样本不足时返回 None）"""
+        return self._latency(key).percentile(0.95, settings.LLM_HEDGE_MIN_SAMPLES)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取限流统计数据"""
+        with self._lock:
+            keys = list(self._stats)
+        result = {}
+        for key in keys:
+            bucket = self._buckets.get(key)
+            p95 = self.p95_latency(key)
+            provider, base_url, key_hash = key.split("|")
+            result[f"{provider}|{base_url}|{key_hash[:6]}"] = {
+                **self._stats[key],
+                "rate_per_minute": round(bucket.rate * 60, 2) if bucket else None,
+                "base_rate_per_minute": round(bucket.base_rate * 60, 2) if bucket else None,
+                "p95_latency_s": round(p95, 2) if p95 is not None else None
+            }
+        return result
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """带抖动的指数退避（full jitter），服务端给出 Retry-After 时至少等待该时长"""
+        cap = min(settings.LLM_RETRY_MAX_DELAY, settings.LLM_RETRY_BASE_DELAY * (2 ** attempt))
+        delay = random.uniform(0, cap)
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+    def _bucket(self, key: str, rate_per_minute: float) -> TokenBucket:
+        # 令牌桶只在进程内共享，多个进程（API 进程 + 独立 worker）调用同一配额时各自按 1/N 的速率和突发数限流
+        processes = max(1, settings.LLM_RATE_LIMIT_PROCESSES)
+        rate_per_minute = rate_per_minute / processes
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate_per_minute, settings.LLM_RATE_LIMIT_BURST // processes)
+            elif abs(bucket.base_rate * 60 - rate_per_minute) > 1e-6:
+                # 限流配置修改后沿用已有的令牌和退避状态
+                with bucket._lock:
+                    bucket.base_rate = rate_per_minute / 60.0
+                    bucket.rate = min(bucket.rate, bucket.base_rate)
+            return bucket
+
+    def _latency(self, key: str) -> LatencyTracker:
+        with self._lock:
+            tracker = self._latencies.get(key)
+            if tracker is None:
+                tracker = self._latencies[key] = LatencyTracker()
+            return tracker
+
+    def _stats_for(self, key: str) -> Dict[str, int]:
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {
+                    "succeeded": 0,
+                    "failed": 0,
+                    "retries": 0,
+                    "rate_limited": 0,
+                    "throttled": 0,
+                    "hedged": 0,
+                    "hedge_wins": 0
+                }
+            return stats
+
+    def record_hedge(self, key: str, won: bool):
+        """记录一次对冲请求"""
+        stats = self._stats_for(key)
+        self._count(stats, "hedged")
+        if won:
+            self._count(stats, "hedge_wins")
+
+    def _count(self, stats: Dict[str, int], name: str):
+        with self._lock:
+            stats[name] += 1
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """从 SDK 异常中取 HTTP 状态码（openai / anthropic 的 APIStatusError 都有 status_code）"""
+    status = getattr(error, "status_code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _is_transient(error: Exception) -> bool:
+    """连接失败、超时等没有状态码的临时错误"""
+    if isinstance(error, (httpx.TimeoutException, httpx.NetworkError)):
+        return True
+    name = type(error).__name__
+    return name in ("APIConnectionError", "APITimeoutError")
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """解析响应头中的 retry-after-ms / Retry-After（秒数或 HTTP 日期）"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            from email.utils import parsedate_to_datetime
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except Exception:
+        return None
+
+
+# 进程级限流器（所有项目和执行线程共享）
+llm_rate_limiter = LLMRateLimiter()
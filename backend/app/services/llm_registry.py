@@ -0,0 +1,139 @@
+"""
+LLM服务注册表
+进程内按项目和LLM配置缓存 LLMService，复用解密后的密钥和保持长连接的 HTTP 客户端，
+避免每次请求都重新解密密钥、创建客户端和建立 TLS 连接
+"""
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+import httpx
+
+from app.config import settings
+from app.services.llm_service import LLMService
+from app.utils.encryption import decrypt_api_key
+
+
+class LLMServiceRegistry:
+    """LLM服务注册表（LRU）"""
+
+    def __init__(self, max_size: int = 32):
+        """
+        初始化注册表
+
+        Args:
+            max_size: 最多缓存的 LLMService 数量
+        """
+        self.max_size = max_size
+        self._services: "OrderedDict[Tuple[int, str], LLMService]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "evicted": 0,
+            "invalidated": 0
+        }
+
+    def get(self, project, config_override: Optional[Dict[str, Any]] = None) -> LLMService:
+        """
+        获取项目对应的 LLMService，配置未变化时复用已创建的实例
+
+        Args:
+            project: 项目（提供 llm_provider / llm_model / llm_api_key / llm_base_url / llm_config）
+            config_override: 替代项目 llm_config 的配置（如录制转换使用的固定参数）
+
+        Returns:
+            LLMService 实例
+        """
+        config = config_override if config_override is not None else (project.llm_config or {})
+        key = (project.id, self._config_hash(project, config))
+
+        with self._lock:
+            service = self._services.get(key)
+            if service is not None:
+                self._services.move_to_end(key)
+                self._stats["hits"] += 1
+                return service
+            self._stats["misses"] += 1
+
+        # 解密和创建客户端放在锁外，避免阻塞其他项目
+        service = LLMService(
+            provider=project.llm_provider,
+            model=project.llm_model,
+            api_key=decrypt_api_key(project.llm_api_key),
+            base_url=project.llm_base_url,
+            config=config,
+            http_client=self._create_http_client()
+        )
+
+        with self._lock:
+            existing = self._services.get(key)
+            if existing is not None:
+                # 其他线程已创建，使用先创建的实例
+                return existing
+            self._services[key] = service
+            while len(self._services) > self.max_size:
+                # 被淘汰的客户端可能仍在使用中，不主动关闭，由垃圾回收释放连接
+                self._services.popitem(last=False)
+                self._stats["evicted"] += 1
+        return service
+
+    def invalidate(self, project_id: int):
+        """移除项目的所有缓存实例（项目LLM配置修改或项目删除时调用）"""
+        with self._lock:
+            keys = [key for key in self._services if key[0] == project_id]
+            for key in keys:
+                self._services.pop(key)
+            self._stats["invalidated"] += len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取注册表统计数据"""
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "size": len(self._services),
+                **self._stats
+            }
+
+    def shutdown(self):
+        """关闭所有客户端"""
+        with self._lock:
+            services = list(self._services.values())
+            self._services.clear()
+        for service in services:
+            try:
+                service.client.close()
+            except Exception as e:
+                print(f"关闭LLM客户端时出错: {e}")
+
+    def _config_hash(self, project, config: Dict[str, Any]) -> str:
+        """LLM配置的哈希（密钥使用加密后的值，修改密钥后哈希随之变化）"""
+        payload = json.dumps(
+            [project.llm_provider, project.llm_model, project.llm_api_key, project.llm_base_url, config],
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _create_http_client(self) -> httpx.Client:
+        """创建保持长连接的 HTTP 客户端"""
+        return httpx.Client(
+            timeout=httpx.Timeout(settings.LLM_HTTP_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=300
+            )
+        )
+
+
+# 进程级 LLM 服务注册表
+llm_registry = LLMServiceRegistry(max_size=settings.LLM_CLIENT_CACHE_SIZE)
+
+
+def get_llm_service(project, config_override: Optional[Dict[str, Any]] = None) -> LLMService:
+    """获取项目对应的共享 LLMService"""
+    return llm_registry.get(project, config_override)
@@ -1,17 +1,184 @@
 """
 LLM编排服务 - 管理与LLM的交互
 """
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable, Iterator
+import os
 import json
+import math
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from openai import OpenAI
 from anthropic import Anthropic
 import httpx
 
+from app.config import settings
+from app.services.llm_cache import llm_response_cache
+from app.services.llm_rate_limiter import llm_rate_limiter
+from app.services.llm_executor import LLMTaskCancelled, bind_cancel_event, child_cancel_event
+from app.services.assertion_checklist import normalize_checklist
+from app.services.script_regeneration import normalize_generated_segments
+from app.services.page_snapshot import load_snapshot, snapshot_path_for_screenshot, format_snapshot_for_llm
+from app.utils.incremental_json import IncrementalArrayExtractor
+from app.utils.image_processing import (
+    prepare_image_for_vision,
+    build_contact_sheet,
+    target_width_for_model,
+    resolve_artifact_path
+)
+
+
+# 支持图片输入的提供商
+VISION_PROVIDERS = ("openai", "dashscope", "anthropic")
+
+# 多张截图合并为一次请求的分析模式（llm_config.vision_mode）
+BATCH_VISION_MODES = ("multi_image", "contact_sheet")
+
+# 页面分析模式（llm_config.analysis_mode）：vision 发送截图，text 发送页面文本快照
+ANALYSIS_MODES = ("vision", "text")
+
+# 提示词缓存的最小前缀长度（token）：Anthropic 的 Sonnet / Opus 为 1024，Haiku 为 2048，OpenAI 自动缓存为 1024。
+# 短于该长度的前缀服务端不会缓存，VISION_GUIDELINES 需要保持在 2048 以上，分级判定使用的小模型也能命中缓存
+PROMPT_CACHE_MIN_TOKENS = 2048
+
+
+def estimate_prompt_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数（偏保守）：中日韩字符按每个 1 token，其余字符按每 4 个 1 token
+    """
+    cjk = sum(1 for char in text if "\u3000" <= char <= "\u9fff" or "\uff00" <= char <= "\uffef")
+    return cjk + (len(text) - cjk) // 4
+
+
+# 视觉分析的静态指令（分析规则、输出格式和示例，不含任何用例相关内容）。作为 system 提示放在请求最前面，
+# Anthropic 标记为缓存断点、OpenAI 自动缓存相同前缀；预期结果、步骤状态和截图都放在断点之后的 user 消息中，
+# 重复判定时只为这部分计费。修改时保持长度不低于 PROMPT_CACHE_MIN_TOKENS，否则服务端不会缓存
+VISION_GUIDELINES = """你是一个专业的UI测试分析专家，负责根据自动化测试过程中的页面截图判断页面是否符合测试的预期结果。
+用户消息中会给出本次测试的步骤描述、预期结果和截图，你只需要按下面的规则分析并返回JSON。
+
+一、分析要求
+1. 先客观描述截图中实际看到的内容：页面标题、主要区域、关键文字、按钮、表单、列表数据、弹窗和提示信息。
+2. 再逐条对照预期结果判断，只依据截图中可见的内容，不要根据常识推测截图中没有出现的内容。
+3. 以下情况视为不符合预期：页面显示错误提示、错误码、空白页、加载失败、权限不足、404/500 页面，或预期应出现的文字和元素缺失。
+4. 以下情况需要降低 confidence：页面仍在加载（骨架屏、加载动画、进度条）、关键区域被弹窗遮挡、截图被截断、文字过小难以辨认。
+5. 预期结果中的文字应与页面文字基本一致，允许大小写、空格和标点差异；同义但不同的文字需要在 issues 中说明。
+6. 截图较长时可能被按从上到下的顺序切分为多张，也可能裁掉中间部分，请把它们视为同一个页面。
+7. issues 只列出与预期结果相关的问题，没有问题时返回空数组。
+8. confidence 为 0 到 1 之间的数字：页面状态明确且与预期逐条对应时不低于 0.9，存在无法从截图确认的内容时不高于 0.7。
+
+二、判断细则
+1. 预期结果包含多个条件时（例如"跳转到列表页并显示新建的记录"），每个条件都满足才算符合预期，任一条件不满足即不符合。
+2. 提示类信息（Toast、消息条、气泡）可能在截图前已经消失。预期要求出现提示但截图中没有时，如果页面其他部分已体现操作结果（例如列表中出现了新记录），可以判为符合预期，但 confidence 不高于 0.7，并在 issues 中说明未看到提示。
+3. 页面同时出现成功和失败的信号时（例如顶部显示"保存成功"，表单下方又有红色校验错误），以与预期结果直接相关的区域为准，并在 issues 中说明冲突。
+4. 数字、金额、日期、数量需要与预期完全一致；预期只描述"显示金额""显示日期"而没有给出具体值时，只要对应位置有合理的值即可。
+5. 预期要求某个元素"不可见""已删除""已禁用"时，需要在截图中确认该元素确实不存在或呈禁用样式（灰色、不可点击）；无法区分时降低 confidence。
+6. 登录、权限相关的预期：截图显示登录页、"请先登录""无权限访问"等内容时，除非预期就是这些内容，否则视为不符合预期。
+7. 表格和列表：预期要求"包含某条数据"时只需找到该条数据；预期要求"只显示""筛选后全部为"时，需要确认可见的每一行都满足条件，截图只显示部分行时在 issues 中说明。
+8. 表单：预期要求"提交成功"时，页面仍停留在填写状态且没有任何成功信号，视为不符合预期；字段下方出现红色校验提示视为失败。
+9. 弹窗和对话框：预期要求弹窗出现时需要看到弹窗标题或主要内容；预期要求弹窗关闭时，截图中仍有遮罩层或弹窗视为不符合预期。
+10. 页面语言可能与预期结果的语言不同（例如预期为中文，页面为英文），含义一致即可视为符合，并在 observation 中写出页面上的原文。
+11. 不要把浏览器自身的界面（地址栏、书签栏、系统通知）当作页面内容；截图中出现的开发者工具或调试信息也不作为判断依据。
+12. observation 使用简洁的中文，先写页面整体状态，再写与预期相关的关键细节，不超过 150 字。
+
+三、输出格式
+单张截图分析返回一个JSON对象：
+{
+  "observation": "具体观察到的内容",
+  "matches_expectation": true/false,
+  "confidence": 0到1之间的数字，表示你对判断的把握,
+  "issues": ["发现的问题列表"]
+}
+
+多张截图一起分析时（用户消息会说明截图编号和对应的步骤），返回JSON数组，每张截图一项：
+[
+  {
+    "step_index": 截图编号,
+    "observation": "具体观察到的内容",
+    "matches_expectation": true/false,
+    "issues": ["发现的问题列表"]
+  }
+]
+多张截图时逐张判断：中间步骤的截图只需判断该步骤是否正常完成（没有错误提示、页面没有异常），最后一张截图对照完整的预期结果判断。
+
+四、示例（仅用于说明判断方式，不是本次的输入）
+示例1
+步骤描述: 点击"保存"按钮
+预期结果: 提示保存成功，并返回用户列表
+截图内容: 用户列表页，顶部绿色提示"保存成功"，列表第一行为刚创建的用户"张三"
+输出: {"observation": "用户列表页，顶部显示绿色提示'保存成功'，列表第一行为新用户'张三'", "matches_expectation": true, "confidence": 0.95, "issues": []}
+
+示例2
+步骤描述: 输入错误的密码并点击"登录"
+预期结果: 登录成功并进入首页
+截图内容: 仍为登录页，密码输入框下方红色文字"用户名或密码错误"
+输出: {"observation": "仍停留在登录页，密码框下方显示红色错误提示'用户名或密码错误'", "matches_expectation": false, "confidence": 0.95, "issues": ["登录失败，显示'用户名或密码错误'", "未进入首页"]}
+
+示例3
+步骤描述: 点击"查询"按钮
+预期结果: 列表显示查询结果
+截图内容: 列表区域显示骨架屏和加载动画，没有数据行
+输出: {"observation": "列表区域仍在加载，显示骨架屏和加载动画，没有任何数据行", "matches_expectation": false, "confidence": 0.5, "issues": ["页面仍在加载，无法确认查询结果"]}
+
+示例4
+步骤描述: 点击"删除"并在确认框中点击"确定"
+预期结果: 提示删除成功，列表中不再显示该订单
+截图内容: 订单列表页，没有提示信息，列表中已没有订单号 A1001，总数从 10 条变为 9 条
+输出: {"observation": "订单列表页，未看到提示信息；列表中已没有订单A1001，总数显示9条", "matches_expectation": true, "confidence": 0.7, "issues": ["未看到'删除成功'提示，可能已自动消失"]}
+
+示例5
+步骤描述: 打开"订单详情"页
+预期结果: 显示订单金额 ¥128.00 和收货地址
+截图内容: 订单详情页，金额显示 ¥218.00，收货地址"北京市朝阳区某某路1号"
+输出: {"observation": "订单详情页，金额显示¥218.00，收货地址为北京市朝阳区某某路1号", "matches_expectation": false, "confidence": 0.9, "issues": ["订单金额为¥218.00，与预期的¥128.00不一致"]}
+
+示例6（多张截图）
+截图 #1（步骤: 打开新建页面）: 新建表单，字段为空
+截图 #2（步骤: 点击"提交"）: 表单"名称"字段下方红色提示"名称不能为空"
+预期结果: 创建成功
+输出: [{"step_index": 1, "observation": "新建表单已打开，各字段为空", "matches_expectation": true, "issues": []}, {"step_index": 2, "observation": "提交后仍在表单页，名称字段下方提示'名称不能为空'", "matches_expectation": false, "issues": ["表单校验失败：名称不能为空"]}]
+
+只返回JSON，不要包含其他说明文字。"""
+
+
+# 各执行器脚本步骤的字段和动作说明（合并生成、增量重新生成的提示词共用）
+SCRIPT_STEP_RULES = {
+    "playwright": {
+        "name": "Playwright",
+        "fields": "index、action、selector、value、description、screenshot(布尔值,默认true)、timeout(毫秒,可选)",
+        "actions": """支持的action: goto(value为URL)、click、fill、select、waitForSelector、waitTime(需要duration参数)、
+   screenshot、assertText、assertVisible
+   系统会在每个步骤执行后自动等待页面稳定再截图,不需要在每个步骤后手动添加waitTime""",
+        "example": """{"index": 1, "action": "click", "selector": "#login-button", "value": null, "description": "点击登录按钮", "screenshot": true}"""
+    },
+    "midscene": {
+        "name": "Midscene AI",
+        "fields": "index、action、description(自然语言描述目标元素或操作,Midscene的核心)、value(如需要)、screenshot(布尔值,默认true)",
+        "actions": """支持的action: goto(value为URL)、aiTap(AI点击)、aiInput(AI输入,value为输入值)、aiAction(通用AI操作)、
+   aiAssert(AI断言)、aiWaitFor(AI等待)、aiQuery(AI查询)、waitTime(需要duration参数)、screenshot
+   Midscene不需要CSS选择器,直接用自然语言描述元素""",
+        "example": """{"index": 1, "action": "aiTap", "description": "点击登录按钮", "screenshot": true}"""
+    }
+}
+
+# 并发分析截图时，整体超时在单次超时之外额外留出的秒数
+VISION_OVERALL_TIMEOUT_GRACE = 10
+
+# 对冲请求使用的线程池（主请求和备用请求在其中并发执行）
+_hedge_executor = ThreadPoolExecutor(max_workers=settings.LLM_HEDGE_MAX_WORKERS, thread_name_prefix="llm-hedge")
+
 
 class LLMService:
     """LLM服务类"""
     
-    def __init__(self, provider: str, model: str, api_key: str, base_url: Optional[str] = None, config: Optional[Dict[str, Any]] = None):
+    def __init__(
+        self,
+        provider: str,
+        model: str,
+        api_key: str,
+        base_url: Optional[str] = None,
+        config: Optional[Dict[str, Any]] = None,
+        http_client: Optional[httpx.Client] = None
+    ):
         """
         初始化LLM服务
         
@@ -21,34 +188,48 @@ class LLMService:
             api_key: API密钥
             base_url: 自定义API基础URL
             config: 额外配置 (temperature, max_tokens等)
+            http_client: 共享的 HTTP 客户端（保持长连接），不传时由 SDK 自行创建
         """
         self.provider = provider.lower()
         self.model = model
         self.api_key = api_key
         self.base_url = base_url
         self.config = config or {}
+        self.http_client = http_client
+        
+        # 限流、重试和延迟统计按提供商 + 接口地址 + 密钥共享
+        self.rate_limit_key = llm_rate_limiter.make_key(self.provider, base_url, api_key)
+        self._hedge: Optional["LLMService"] = None
+        self._hedge_disabled = False  # 备用提供商缺少密钥时关闭对冲
+        self._hedge_lock = threading.Lock()
         
         # 初始化客户端
         if self.provider == "openai":
             self.client = OpenAI(
                 api_key=api_key,
-                base_url=base_url if base_url else None
+                base_url=base_url if base_url else None,
+                http_client=http_client,
+                max_retries=0  # 重试由 llm_rate_limiter 统一处理
             )
         elif self.provider == "openai-completion":
             # 支持 OpenAI Completion API
             self.client = OpenAI(
                 api_key=api_key,
-                base_url=base_url if base_url else None
+                base_url=base_url if base_url else None,
+                http_client=http_client,
+                max_retries=0  # 重试由 llm_rate_limiter 统一处理
             )
         elif self.provider == "dashscope":
             # 阿里云百炼，使用 OpenAI 客户端但指定 DashScope 的 base_url
             dashscope_base_url = base_url if base_url else "https://dashscope.aliyuncs.com/compatible-mode/v1"
             self.client = OpenAI(
                 api_key=api_key,
-                base_url=dashscope_base_url
+                base_url=dashscope_base_url,
+                http_client=http_client,
+                max_retries=0  # 重试由 llm_rate_limiter 统一处理
             )
         elif self.provider == "anthropic":
-            self.client = Anthropic(api_key=api_key)
+            self.client = Anthropic(api_key=api_key, http_client=http_client, max_retries=0)
         else:
             raise ValueError(f"不支持的LLM提供商: {provider}")
     
@@ -64,8 +245,7 @@ class LLMService:
             标准化测试用例字典
         """
         prompt = self._build_nl_to_case_prompt(natural_language, base_url)
-        response = self._call_llm(prompt)
-        return self._parse_case_response(response)
+        return self._call_llm_cached(prompt, self._parse_case_response)
     
     def generate_playwright_script(
         self, 
@@ -85,8 +265,7 @@ class LLMService:
             Playwright脚本字典
         """
         prompt = self._build_case_to_script_prompt(case_name, standard_steps, base_url)
-        response = self._call_llm(prompt)
-        return self._parse_script_response(response)
+        return self._call_llm_cached(prompt, self._parse_script_response)
     
     def generate_midscene_script(
         self, 
@@ -106,8 +285,94 @@ class LLMService:
             Midscene脚本字典
         """
         prompt = self._build_case_to_midscene_script_prompt(case_name, standard_steps, base_url)
-        response = self._call_llm(prompt)
-        return self._parse_script_response(response)
+        return self._call_llm_cached(prompt, self._parse_script_response)
+    
+    def generate_case_with_script(
+        self,
+        natural_language: str,
+        base_url: str,
+        executor_type: str = "playwright"
+    ) -> Dict[str, Any]:
+        """
+        一次调用同时生成标准化测试用例和执行脚本（省去一次往返和重复的提示词）
+        
+        Args:
+            natural_language: 自然语言描述
+            base_url: 被测站点基础URL
+            executor_type: 脚本对应的执行器 (playwright / midscene)
+            
+        Returns:
+            {name, description, standard_steps, expected_result, script}
+        """
+        prompt = self._build_nl_to_case_with_script_prompt(natural_language, base_url, executor_type)
+        return self._call_llm_cached(prompt, self._parse_case_with_script_response)
+    
+    def generate_script_segments(
+        self,
+        case_name: str,
+        base_url: str,
+        executor_type: str,
+        segments: List[Dict[str, Any]]
+    ) -> Dict[int, List[List[Dict[str, Any]]]]:
+        """
+        只为新增/修改的标准化步骤生成脚本步骤（增量重新生成，见 script_regeneration.py）
+        
+        Args:
+            case_name: 用例名称
+            base_url: 被测站点基础URL
+            executor_type: 执行器类型 (playwright / midscene)
+            segments: 需要生成的片段（标准化步骤、被替换的旧脚本步骤、前后上下文）
+            
+        Returns:
+            片段 id -> 每个标准化步骤对应的脚本步骤列表
+        """
+        prompt = self._build_script_segments_prompt(case_name, base_url, executor_type, segments)
+        return self._call_llm_cached(
+            prompt,
+            lambda response: normalize_generated_segments(self._parse_script_response(response), segments)
+        )
+    
+    def stream_test_case_from_nl(self, natural_language: str, base_url: str) -> Iterator[Dict[str, Any]]:
+        """
+        流式生成标准化测试用例（事件格式见 _stream_generation，step 事件为 standard_steps 中的步骤）
+        
+        Args:
+            natural_language: 自然语言描述
+            base_url: 被测站点基础URL
+        """
+        prompt = self._build_nl_to_case_prompt(natural_language, base_url)
+        return self._stream_generation(prompt, "standard_steps", self._parse_case_response)
+    
+    def stream_playwright_script(
+        self,
+        case_name: str,
+        standard_steps: List[Dict[str, Any]],
+        base_url: str
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        流式生成Playwright脚本（事件格式见 _stream_generation，step 事件为脚本 steps 中的步骤）
+        
+        Args:
+            case_name: 用例名称
+            standard_steps: 标准化步骤列表
+            base_url: 被测站点基础URL
+        """
+        prompt = self._build_case_to_script_prompt(case_name, standard_steps, base_url)
+        return self._stream_generation(prompt, "steps", self._parse_script_response)
+    
+    def compile_assertion_checklist(self, expected_result: str, script_steps: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        将预期结果编译为结构化断言清单
+        
+        Args:
+            expected_result: 预期结果描述
+            script_steps: 脚本步骤（提供可复用的选择器和最终页面上下文）
+            
+        Returns:
+            断言清单 {checks, complete}
+        """
+        prompt = self._build_assertion_checklist_prompt(expected_result, script_steps)
+        return self._call_llm_cached(prompt, lambda response: normalize_checklist(self._parse_case_response(response)))
     
     def analyze_final_result(
         self, 
@@ -137,57 +402,96 @@ class LLMService:
             print("没有截图，使用基础判定")
             return self._analyze_without_vision(expected_result, console_logs, [])
         
+        # 分级模型：先用便宜/快速的模型，不确定时才升级到下一级
+        models = self.config.get("verdict_models") or [self.model]
+        threshold = float(self.config.get("verdict_escalate_below", settings.VERDICT_ESCALATE_BELOW))
+        escalations = []
+        
         try:
-            # 使用视觉大模型分析最后一张截图
-            print(f"使用视觉大模型分析最终截图...")
-            vision_analysis = self._analyze_screenshot_with_vision(
-                screenshot_path=final_screenshot,
-                expected_result=expected_result,
-                step_status=None
-            )
-            
-            print(f"视觉分析结果: {vision_analysis}")
-            
-            # 基于视觉分析和步骤执行状态给出最终判定
-            matches_expectation = vision_analysis.get("matches_expectation")
-            
-            if matches_expectation and all_steps_success:
-                verdict = "passed"
-                confidence = 0.9
-                reason = f"最终截图符合预期结果：{vision_analysis.get('observation', '')}"
-            elif not all_steps_success:
-                verdict = "failed"
-                confidence = 0.85
-                reason = f"有步骤执行失败"
-            elif matches_expectation is False:
-                verdict = "failed"
-                confidence = 0.85
-                reason = f"最终截图不符合预期：{vision_analysis.get('observation', '')}"
-            else:
-                verdict = "unknown"
-                confidence = 0.6
-                reason = f"无法确定是否符合预期"
-            
-            result = {
-                "verdict": verdict,
-                "confidence": confidence,
-                "reason": reason,
-                "observations": [{
-                    "step_index": "final",
-                    "type": "visual",
-                    "description": vision_analysis.get("observation", ""),
-                    "severity": "error" if not matches_expectation else "info"
-                }]
-            }
-            
-            print(f"最终判定结果: {result}")
-            print("########## analyze_final_result 结束 ##########\n")
-            return result
+            for tier, model in enumerate(models):
+                # 分析最后一张截图（文本模式下分析对应的页面快照）
+                print(f"分析最终页面 (第{tier + 1}级模型: {model}, 模式: {self._analysis_mode()})...")
+                try:
+                    vision_analysis = self._analyze_page(
+                        screenshot_path=final_screenshot,
+                        expected_result=expected_result,
+                        step_status=None,
+                        model=model
+                    )
+                except Exception as e:
+                    if tier == len(models) - 1:
+                        raise
+                    # 某一级调用异常时与返回 error 一样升级到下一级
+                    print(f"⚠️ {model} 分析异常: {e}")
+                    vision_analysis = {"error": str(e)}
+                
+                print(f"视觉分析结果: {vision_analysis}")
+                
+                uncertain_reason = self._uncertain_reason(vision_analysis, threshold)
+                if uncertain_reason and tier < len(models) - 1:
+                    print(f"⬆️ {model} 结果不确定（{uncertain_reason}），升级到 {models[tier + 1]}")
+                    escalations.append({"model": model, "reason": uncertain_reason})
+                    continue
+                
+                result = self._verdict_from_vision(vision_analysis, all_steps_success)
+                if len(models) > 1:
+                    result["model"] = model
+                    result["escalations"] = escalations
+                
+                print(f"最终判定结果: {result}")
+                print("########## analyze_final_result 结束 ##########\n")
+                return result
             
         except Exception as e:
             print(f"视觉分析失败: {str(e)}")
-            print("########## analyze_final_result 失败 ##########\n")
-            return self._analyze_without_vision(expected_result, console_logs, [])
+        
+        print("########## analyze_final_result 失败 ##########\n")
+        return self._analyze_without_vision(expected_result, console_logs, [])
+    
+    def _uncertain_reason(self, vision_analysis: Dict[str, Any], threshold: float) -> Optional[str]:
+        """视觉分析结果需要升级模型的原因，结果足够确定时返回 None"""
+        if vision_analysis.get("error"):
+            return "调用失败"
+        if vision_analysis.get("matches_expectation") is None:
+            return "无法判断是否符合预期"
+        confidence = vision_analysis.get("confidence")
+        if isinstance(confidence, (int, float)) and confidence < threshold:
+            return f"置信度 {confidence} 低于 {threshold}"
+        return None
+    
+    def _verdict_from_vision(self, vision_analysis: Dict[str, Any], all_steps_success: bool) -> Dict[str, Any]:
+        """基于视觉分析和步骤执行状态给出最终判定"""
+        matches_expectation = vision_analysis.get("matches_expectation")
+        subject = "最终页面快照" if vision_analysis.get("analysis_mode") == "text" else "最终截图"
+        
+        if matches_expectation and all_steps_success:
+            verdict = "passed"
+            confidence = 0.9
+            reason = f"{subject}符合预期结果：{vision_analysis.get('observation', '')}"
+        elif not all_steps_success:
+            verdict = "failed"
+            confidence = 0.85
+            reason = f"有步骤执行失败"
+        elif matches_expectation is False:
+            verdict = "failed"
+            confidence = 0.85
+            reason = f"{subject}不符合预期：{vision_analysis.get('observation', '')}"
+        else:
+            verdict = "unknown"
+            confidence = 0.6
+            reason = f"无法确定是否符合预期"
+        
+        return {
+            "verdict": verdict,
+            "confidence": confidence,
+            "reason": reason,
+            "observations": [{
+                "step_index": "final",
+                "type": "dom" if vision_analysis.get("analysis_mode") == "text" else "visual",
+                "description": vision_analysis.get("observation", ""),
+                "severity": "error" if not matches_expectation else "info"
+            }]
+        }
     
     def analyze_test_result(
         self, 
@@ -222,75 +526,354 @@ class LLMService:
         
         print(f"有截图，将使用视觉大模型分析")
         
-        # 使用视觉大模型分析每个截图
-        screenshot_analyses = []
-        for idx, screenshot_path in enumerate(step_screenshots):
-            try:
-                analysis = self._analyze_screenshot_with_vision(
-                    screenshot_path,
-                    expected_result,
-                    step_statuses[idx] if idx < len(step_statuses) else None
-                )
-                screenshot_analyses.append({
-                    "step_index": idx + 1,
-                    "screenshot_path": screenshot_path,
-                    "analysis": analysis
-                })
-            except Exception as e:
-                print(f"分析截图 {screenshot_path} 失败: {e}")
-                screenshot_analyses.append({
-                    "step_index": idx + 1,
-                    "screenshot_path": screenshot_path,
-                    "analysis": {"error": str(e)}
-                })
+        vision_mode = self.config.get("vision_mode", "per_step")
+        if vision_mode in BATCH_VISION_MODES and self._analysis_mode() == "vision":
+            # 多张截图合并到一次请求中分析
+            screenshot_analyses = self._analyze_screenshots_batched(
+                step_screenshots,
+                expected_result,
+                step_statuses,
+                vision_mode
+            )
+        else:
+            # 并发分析所有截图或页面快照（结果顺序与截图顺序一致）
+            screenshot_analyses = self._analyze_screenshots_concurrently(
+                step_screenshots,
+                expected_result,
+                step_statuses
+            )
         
         # 综合所有截图分析结果和步骤状态，给出最终判定
         result = self._综合判定(expected_result, screenshot_analyses, console_logs, step_statuses)
+        result["step_analyses"] = [
+            {"step_index": a["step_index"], "analysis": a["analysis"]} for a in screenshot_analyses
+        ]
         print(f"最终判定结果: {result}")
         print("########## analyze_test_result 结束 ##########\n")
         return result
     
-    def _call_llm(self, prompt: str) -> str:
-        """调用LLM API"""
+    def _call_llm_cached(self, prompt: str, parser: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        调用LLM并解析响应，相同提示词和采样参数的响应从缓存读取
+
+        并发的相同请求只会调用一次上游；解析失败的响应会从缓存中删除，下次重新生成。
+        项目 llm_config 中设置 response_cache=false 可关闭缓存。
+
+        Args:
+            prompt: 提示词
+            parser: 响应解析函数
+
+        Returns:
+            解析后的结果
+        """
+        key = self._response_cache_key(prompt)
+        if key is None:
+            return parser(self._call_llm(prompt))
+        
+        response = llm_response_cache.get_or_compute(key, lambda: self._call_llm(prompt))
+        try:
+            return parser(response)
+        except Exception:
+            llm_response_cache.invalidate(key)
+            raise
+    
+    def _response_cache_key(self, prompt: str) -> Optional[str]:
+        """响应缓存键，缓存关闭时返回 None"""
+        if not settings.LLM_CACHE_ENABLED or self.config.get("response_cache") is False:
+            return None
+        sampling = {
+            "temperature": self.config.get("temperature", 0.7),
+            "max_tokens": self.config.get("max_tokens", 2000)
+        }
+        return llm_response_cache.make_key(self.provider, self.model, self.base_url, sampling, prompt)
+    
+    def _stream_generation(
+        self,
+        prompt: str,
+        array_key: str,
+        parser: Callable[[str], Dict[str, Any]]
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        流式调用LLM生成JSON，边生成边产出事件
+        
+        依次产出:
+            {"event": "token", "data": {"text": ...}}   模型输出的文本片段
+            {"event": "step", "data": {...}}            array_key 数组中刚生成完整的元素
+            {"event": "result", "data": {...}}          完整响应经 parser 解析后的结果
+        
+        命中响应缓存时整段输出一次性产出；生成完成且解析成功后写入缓存。
+        """
+        extractor = IncrementalArrayExtractor(array_key)
+        key = self._response_cache_key(prompt)
+        cached = llm_response_cache.get(key) if key else None
+        chunks = [cached] if cached is not None else self._stream_llm(prompt)
+        
+        parts = []
+        for text in chunks:
+            parts.append(text)
+            yield {"event": "token", "data": {"text": text}}
+            for element in extractor.feed(text):
+                yield {"event": "step", "data": element}
+        
+        response = "".join(parts)
+        try:
+            result = parser(response)
+        except Exception:
+            if cached is not None:
+                llm_response_cache.invalidate(key)
+            raise
+        if key and cached is None:
+            llm_response_cache.set(key, response)
+        yield {"event": "result", "data": result}
+    
+    def _stream_llm(self, prompt: str) -> Iterator[str]:
+        """
+        流式调用当前提供商，逐段产出文本
+        
+        限流和重试只作用于建立连接；开始输出后出错直接失败（已发给客户端的内容无法撤回）。
+        不使用对冲请求。
+        """
+        try:
+            stream = llm_rate_limiter.call(
+                self.rate_limit_key,
+                lambda: self._open_stream(prompt),
+                rate_per_minute=self.config.get("rate_limit_rpm"),
+                record_latency=False
+            )
+        except LLMTaskCancelled:
+            raise
+        except Exception as e:
+            raise Exception(f"LLM调用失败: {str(e)}")
+        
+        try:
+            for chunk in stream:
+                text = self._stream_chunk_text(chunk)
+                if text:
+                    yield text
+        except LLMTaskCancelled:
+            raise
+        except Exception as e:
+            raise Exception(f"LLM流式输出中断: {str(e)}")
+        finally:
+            # openai 1.3.7 的 Stream 没有 close()，直接关闭底层 HTTP 响应（anthropic 的 Stream 同样有 response）
+            stream.response.close()
+    
+    def _open_stream(self, prompt: str):
+        """向当前提供商发起流式文本请求，返回 SDK 的流对象"""
         temperature = self.config.get("temperature", 0.7)
         max_tokens = self.config.get("max_tokens", 2000)
         
+        if self.provider in ["openai", "dashscope"]:
+            return self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            )
+        elif self.provider == "openai-completion":
+            return self.client.completions.create(
+                model=self.model,
+                prompt=prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            )
+        elif self.provider == "anthropic":
+            return self.client.messages.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            )
+        else:
+            raise ValueError(f"不支持的提供商: {self.provider}")
+    
+    def _stream_chunk_text(self, chunk: Any) -> Optional[str]:
+        """取出流式响应片段中的文本"""
+        if self.provider == "anthropic":
+            if getattr(chunk, "type", None) == "content_block_delta":
+                return getattr(chunk.delta, "text", None)
+            return None
+        if not chunk.choices:
+            return None
+        if self.provider == "openai-completion":
+            return chunk.choices[0].text
+        return chunk.choices[0].delta.content
+    
+    def _call_llm(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None
+    ) -> str:
+        """
+        调用LLM API（限流、临时错误重试，配置了 llm_config.hedge 时对慢请求发起对冲）
+        
+        model / max_tokens / timeout 默认使用项目配置和客户端超时，可按调用覆盖
+        """
+        hedge = self._hedge_service()
+        if hedge is None:
+            return self._call_llm_limited(prompt, model, max_tokens, timeout)
+        return self._call_llm_hedged(hedge, prompt, model, max_tokens, timeout)
+    
+    def _call_llm_limited(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None
+    ) -> str:
+        """在限流和重试保护下调用当前提供商"""
         try:
-            if self.provider in ["openai", "dashscope"]:
-                # OpenAI Chat Completion API 和百炼共用相同的接口
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=temperature,
-                    max_tokens=max_tokens
-                )
-                return response.choices[0].message.content or ""
-            
-            elif self.provider == "openai-completion":
-                # OpenAI Completion API (传统接口)
-                response = self.client.completions.create(
-                    model=self.model,
-                    prompt=prompt,
-                    temperature=temperature,
-                    max_tokens=max_tokens
-                )
-                return response.choices[0].text or ""
-            
-            elif self.provider == "anthropic":
-                response = self.client.messages.create(
-                    model=self.model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=temperature,
-                    max_tokens=max_tokens
-                )
-                return response.content[0].text
-            
-            else:
-                raise ValueError(f"不支持的提供商: {self.provider}")
-            
+            return self._rate_limited(lambda: self._call_provider(prompt, model, max_tokens, timeout))
+        except LLMTaskCancelled:
+            raise
         except Exception as e:
             raise Exception(f"LLM调用失败: {str(e)}")
     
+    def _call_llm_hedged(
+        self,
+        hedge: "LLMService",
+        prompt: str,
+        model: Optional[str],
+        max_tokens: Optional[int],
+        timeout: Optional[float]
+    ) -> str:
+        """
+        对冲调用：主请求超过最近 p95 延迟仍未返回（或已失败）时，向备用提供商发起同样的请求，采用先成功的结果
+        
+        p95 样本不足时使用 llm_config.hedge_after（默认 LLM_HEDGE_DEFAULT_DELAY）秒作为阈值。
+        """
+        threshold = llm_rate_limiter.p95_latency(self.rate_limit_key) or float(
+            self.config.get("hedge_after", settings.LLM_HEDGE_DEFAULT_DELAY)
+        )
+        # 每个请求单独的取消标记：一方胜出后取消另一方，落败的请求在下一次限流等待或重试前中止
+        cancel_events = {}
+        primary_cancel = child_cancel_event()
+        primary = _hedge_executor.submit(
+            bind_cancel_event(self._call_llm_limited, primary_cancel), prompt, model, max_tokens, timeout
+        )
+        cancel_events[primary] = primary_cancel
+        done, _ = wait([primary], timeout=threshold)
+        if done and primary.exception() is None:
+            return primary.result()
+        
+        reason = "失败" if done else f"超过 {threshold:.1f}秒未返回"
+        print(f"🔀 主请求{reason}，向备用提供商 {hedge.provider}/{hedge.model} 发起对冲请求")
+        # 备用提供商使用自己的模型，不沿用主请求的模型覆盖
+        secondary_cancel = child_cancel_event()
+        secondary = _hedge_executor.submit(
+            bind_cancel_event(hedge._call_llm_limited, secondary_cancel), prompt, None, max_tokens, timeout
+        )
+        cancel_events[secondary] = secondary_cancel
+        pending = {secondary} if done else {primary, secondary}
+        errors = [primary.exception()] if done else []
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future.exception() is None:
+                    for loser in pending:
+                        cancel_events[loser].set()
+                    llm_rate_limiter.record_hedge(self.rate_limit_key, won=future is secondary)
+                    return future.result()
+                errors.append(future.exception())
+        llm_rate_limiter.record_hedge(self.rate_limit_key, won=False)
+        raise errors[0]
+    
+    def _hedge_service(self) -> Optional["LLMService"]:
+        """
+        备用提供商（llm_config.hedge = {provider, model, base_url, api_key_env}）
+        
+        api_key_env 为服务器上保存备用密钥的环境变量名。备用提供商或接口地址与项目不同时必须配置，
+        未配置或环境变量为空时关闭对冲（不把项目密钥发给其他提供商）；与项目相同时可省略，沿用项目密钥。
+        """
+        hedge_config = self.config.get("hedge")
+        if not isinstance(hedge_config, dict) or not hedge_config.get("provider"):
+            return None
+        with self._hedge_lock:
+            if self._hedge is None and not self._hedge_disabled:
+                api_key_env = hedge_config.get("api_key_env")
+                same_endpoint = (
+                    hedge_config["provider"].lower() == self.provider
+                    and (hedge_config.get("base_url") or None) == (self.base_url or None)
+                )
+                if api_key_env:
+                    api_key = os.environ.get(api_key_env, "")
+                elif same_endpoint:
+                    api_key = self.api_key
+                else:
+                    api_key = ""
+                if not api_key:
+                    print(
+                        f"⚠️ 备用提供商 {hedge_config['provider']} 未配置可用的 api_key_env"
+                        f"{f'（环境变量 {api_key_env} 为空）' if api_key_env else ''}，已关闭对冲"
+                    )
+                    self._hedge_disabled = True
+                    return None
+                self._hedge = LLMService(
+                    provider=hedge_config["provider"],
+                    model=hedge_config.get("model") or self.model,
+                    api_key=api_key,
+                    base_url=hedge_config.get("base_url"),
+                    config={k: v for k, v in self.config.items() if k != "hedge"},
+                    http_client=self.http_client
+                )
+            return self._hedge
+    
+    def _rate_limited(self, fn: Callable[[], Any]) -> Any:
+        """在限流和重试保护下执行一次请求（项目可用 llm_config.rate_limit_rpm 覆盖限流速率）"""
+        return llm_rate_limiter.call(self.rate_limit_key, fn, rate_per_minute=self.config.get("rate_limit_rpm"))
+    
+    def _call_provider(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None
+    ) -> str:
+        """向当前提供商发起一次文本请求（SDK 异常原样抛出，由限流器判断是否重试）"""
+        temperature = self.config.get("temperature", 0.7)
+        max_tokens = max_tokens or self.config.get("max_tokens", 2000)
+        options = {"timeout": timeout} if timeout else {}
+        
+        if self.provider in ["openai", "dashscope"]:
+            # OpenAI Chat Completion API 和百炼共用相同的接口
+            response = self.client.chat.completions.create(
+                model=model or self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **options
+            )
+            return response.choices[0].message.content or ""
+        
+        elif self.provider == "openai-completion":
+            # OpenAI Completion API (传统接口)
+            response = self.client.completions.create(
+                model=model or self.model,
+                prompt=prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **options
+            )
+            return response.choices[0].text or ""
+        
+        elif self.provider == "anthropic":
+            response = self.client.messages.create(
+                model=model or self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **options
+            )
+            return response.content[0].text
+        
+        else:
+            raise ValueError(f"不支持的提供商: {self.provider}")
+    
     def _build_nl_to_case_prompt(self, natural_language: str, base_url: str) -> str:
         """构建自然语言转用例的提示词"""
         return f"""你是一个专业的测试工程师。请将以下自然语言描述转换为结构化的测试用例。
@@ -361,6 +944,87 @@ class LLMService:
   "expected_result": "用户成功登录并跳转到主页,显示用户仪表板"
 }}"""
     
+    def _build_nl_to_case_with_script_prompt(self, natural_language: str, base_url: str, executor_type: str) -> str:
+        """构建自然语言同时转用例和脚本的提示词"""
+        rules = SCRIPT_STEP_RULES["midscene" if executor_type == "midscene" else "playwright"]
+        script_rules = f"""4. script: {rules["name"]}脚本配置,包含:
+   - browser: 浏览器类型,默认chromium
+   - viewport: 视口尺寸 {{"width": 1280, "height": 720}}
+   - steps: 步骤数组,每个步骤包含 {rules["fields"]}
+   {rules["actions"]}"""
+        example_step = rules["example"]
+        
+        return f"""你是一个专业的测试工程师和自动化测试专家。请将以下自然语言描述转换为结构化的测试用例,并同时生成对应的自动化脚本。
+
+被测站点: {base_url}
+自然语言描述: {natural_language}
+
+请生成一个JSON对象,包含以下字段:
+1. name: 用例名称(简短明确)
+2. description: 用例描述
+3. standard_steps: 标准化步骤数组,每个步骤包含 index(从1开始)、action(goto/click/fill/select/wait/assertText/assertVisible等)、
+   description、selector(如需要)、value(如需要)、expected(如需要)
+{script_rules}
+5. expected_result: 整体预期结果描述
+
+script 中的步骤应与 standard_steps 一一对应(可为导航或断言补充必要的步骤),goto 的 value 使用完整URL。
+
+请只返回JSON,不要包含其他说明文字。确保JSON格式正确。
+
+输出格式:
+{{
+  "name": "...",
+  "description": "...",
+  "standard_steps": [{{"index": 1, "action": "click", "description": "点击登录按钮", "selector": "#login-button", "value": null, "expected": null}}],
+  "script": {{"browser": "chromium", "viewport": {{"width": 1280, "height": 720}}, "steps": [{example_step}]}},
+  "expected_result": "..."
+}}"""
+    
+    def _build_script_segments_prompt(
+        self,
+        case_name: str,
+        base_url: str,
+        executor_type: str,
+        segments: List[Dict[str, Any]]
+    ) -> str:
+        """构建增量重新生成脚本片段的提示词"""
+        rules = SCRIPT_STEP_RULES["midscene" if executor_type == "midscene" else "playwright"]
+        
+        def dump(steps: List[Dict[str, Any]]) -> str:
+            return json.dumps(steps, ensure_ascii=False) if steps else "无"
+        
+        parts = []
+        for segment in segments:
+            parts.append(f"""片段 {segment['id']}:
+- 需要转换的标准化步骤: {dump(segment['standard_steps'])}
+- 这些步骤原来对应的脚本步骤(仅供参考,可复用其中仍然适用的选择器): {dump(segment['replaced_script_steps'])}
+- 前面的脚本步骤(不要输出): {dump(segment['previous_script_steps'])}
+- 后面的脚本步骤(不要输出): {dump(segment['next_script_steps'])}""")
+        segments_text = "\n\n".join(parts)
+        
+        return f"""你是一个{rules["name"]}自动化测试专家。用户修改了测试用例中的部分标准化步骤,请只为这些步骤生成{rules["name"]}脚本步骤,
+生成的步骤会被插入到已有脚本的对应位置,需要与前后的脚本步骤衔接。
+
+用例名称: {case_name}
+被测站点: {base_url}
+
+脚本步骤包含 {rules["fields"]}
+{rules["actions"]}
+
+{segments_text}
+
+请为每个片段返回 steps 数组,数组长度必须等于该片段标准化步骤的数量,
+第 N 个元素是第 N 个标准化步骤对应的脚本步骤列表(通常为 1 个步骤,必要时可以是多个),index 可以省略。
+
+请只返回JSON,不要包含其他说明文字。
+
+输出格式:
+{{
+  "segments": [
+    {{"id": 0, "steps": [[{rules["example"]}]]}}
+  ]
+}}"""
+    
     def _build_case_to_script_prompt(self, case_name: str, standard_steps: List[Dict[str, Any]], base_url: str) -> str:
         """构建用例转Playwright脚本的提示词"""
         steps_json = json.dumps(standard_steps, ensure_ascii=False, indent=2)
@@ -396,7 +1060,7 @@ class LLMService:
 - assertVisible: 断言元素可见
 
 重要提示：
-- 系统会在每个步骤执行后自动等待3秒再截图，确保页面完全加载
+- 系统会在每个步骤执行后自动等待页面稳定再截图，确保页面完全加载
 - 你不需要在每个步骤后手动添加waitTime，除非有特殊需要
 
 请只返回JSON,不要包含其他说明文字。
@@ -512,6 +1176,48 @@ Midscene的优势：
   ]
 }}}}"""
     
+    def _build_assertion_checklist_prompt(self, expected_result: str, script_steps: List[Dict[str, Any]]) -> str:
+        """构建预期结果转断言清单的提示词"""
+        steps_text = "\n".join(
+            f"{step.get('index')}. [{step.get('action')}] {step.get('description', '')}"
+            + (f" selector={step['selector']}" if step.get("selector") else "")
+            + (f" value={step['value']}" if step.get("value") else "")
+            for step in script_steps
+        ) or "无"
+        
+        return f"""你是一个测试断言设计专家。请把测试用例的预期结果转换为可以在最终页面上直接核对的检查清单。
+
+预期结果:
+{expected_result}
+
+测试步骤:
+{steps_text}
+
+支持的检查类型:
+- text_present: 页面可见文字包含 value
+- text_absent: 页面可见文字不包含 value
+- url_matches: 当前URL匹配正则表达式 value
+- title_contains: 页面标题包含 value
+- element_visible: selector 对应的元素可见；不确定选择器时省略 selector，用 value 给出元素上的文字
+- element_count: selector 对应的可见元素数量在 min 到 max 之间（max 可省略）
+
+要求:
+1. value 必须是页面上会逐字出现的文字，不要使用概括性描述
+2. selector 只能使用测试步骤中出现过的选择器，不要猜测
+3. 预期结果中有无法用以上检查表达的内容（如布局、颜色、图片内容、语义判断）时，complete 设为 false
+4. 预期结果完全被检查项覆盖时，complete 设为 true
+
+请返回JSON格式:
+{{
+  "checks": [
+    {{"type": "text_present", "value": "欢迎回来", "description": "显示欢迎信息"}},
+    {{"type": "url_matches", "value": "/dashboard", "description": "跳转到仪表板"}}
+  ],
+  "complete": true
+}}
+
+请只返回JSON,不要包含其他说明文字。"""
+    
     def _build_verdict_prompt(
         self, 
         expected_result: str,
@@ -577,6 +1283,18 @@ Midscene的优势：
         except Exception as e:
             raise ValueError(f"解析LLM响应失败: {str(e)}\n响应内容: {response}")
     
+    def _parse_case_with_script_response(self, response: str) -> Dict[str, Any]:
+        """解析用例和脚本合并生成的响应，缺少必要字段时抛出异常（响应不会被缓存）"""
+        result = self._parse_case_response(response)
+        missing = [key for key in ("name", "standard_steps", "expected_result") if not result.get(key)]
+        script = result.get("script")
+        if not isinstance(script, dict) or not script.get("steps"):
+            missing.append("script.steps")
+        if missing:
+            raise ValueError(f"解析LLM响应失败: 缺少字段 {', '.join(missing)}\n响应内容: {response}")
+        result.setdefault("description", "")
+        return result
+    
     def _parse_script_response(self, response: str) -> Dict[str, Any]:
         """解析脚本生成响应"""
         return self._parse_case_response(response)
@@ -585,55 +1303,339 @@ Midscene的优势：
         """解析判定响应"""
         return self._parse_case_response(response)
     
-    def _analyze_screenshot_with_vision(self, screenshot_path: str, expected_result: str, step_status: Optional[Dict[str, Any]]) -> Dict[str, Any]:
-        """使用视觉大模型分析截图"""
-        import base64
-        import os
+    def _analyze_screenshots_concurrently(
+        self,
+        step_screenshots: List[str],
+        expected_result: str,
+        step_statuses: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        并发分析多张截图
+
+        并发数和单次超时可通过项目 llm_config 的 vision_concurrency / vision_timeout 调整；
+        失败或超时的截图记录错误信息，其余截图的分析结果照常保留。
+
+        Returns:
+            分析结果列表 [{step_index, screenshot_path, analysis}]，顺序与 step_screenshots 一致
+        """
+        concurrency = max(1, int(self.config.get("vision_concurrency", settings.LLM_VISION_CONCURRENCY)))
+        timeout = float(self.config.get("vision_timeout", settings.LLM_VISION_TIMEOUT))
+        workers = min(concurrency, len(step_screenshots))
+        
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vision")
+        # 整体超时后设置取消标记：已开始的调用在下一次限流等待或重试前中止，不再占用限流配额
+        cancel_event = child_cancel_event()
+        analyze_page = bind_cancel_event(self._analyze_page, cancel_event)
+        futures = [
+            executor.submit(
+                analyze_page,
+                screenshot_path,
+                expected_result,
+                step_statuses[idx] if idx < len(step_statuses) else None,
+                timeout
+            )
+            for idx, screenshot_path in enumerate(step_screenshots)
+        ]
+        # 单次调用自身有超时，这里再按批次数留一个整体上限，防止个别调用卡住整个判定
+        overall_timeout = timeout * math.ceil(len(futures) / workers) + VISION_OVERALL_TIMEOUT_GRACE
+        done, not_done = wait(futures, timeout=overall_timeout)
+        if not_done:
+            cancel_event.set()
+        for future in not_done:
+            future.cancel()
+        executor.shutdown(wait=False)
+        
+        screenshot_analyses = []
+        for idx, (screenshot_path, future) in enumerate(zip(step_screenshots, futures)):
+            if future in done:
+                try:
+                    analysis = future.result()
+                except Exception as e:
+                    print(f"分析截图 {screenshot_path} 失败: {e}")
+                    analysis = {"error": str(e)}
+            else:
+                print(f"分析截图 {screenshot_path} 超时")
+                analysis = {"error": f"视觉分析超时（超过{overall_timeout:.0f}秒）"}
+            screenshot_analyses.append({
+                "step_index": idx + 1,
+                "screenshot_path": screenshot_path,
+                "analysis": analysis
+            })
+        return screenshot_analyses
+    
+    def _analyze_screenshots_batched(
+        self,
+        step_screenshots: List[str],
+        expected_result: str,
+        step_statuses: List[Dict[str, Any]],
+        vision_mode: str
+    ) -> List[Dict[str, Any]]:
+        """
+        在一次视觉请求中分析多张截图
+
+        multi_image 模式每张截图单独压缩并标注步骤编号；contact_sheet 模式拼成一张带编号的总览图。
+        截图数超过 vision_batch_size（默认 VISION_BATCH_MAX_IMAGES）时分批，各批次并发请求。
+
+        Returns:
+            与 _analyze_screenshots_concurrently 相同结构的分析结果列表
+        """
+        batch_size = max(1, int(self.config.get("vision_batch_size", settings.VISION_BATCH_MAX_IMAGES)))
+        timeout = float(self.config.get("vision_timeout", settings.LLM_VISION_TIMEOUT))
+        positions = list(range(len(step_screenshots)))
+        batches = [positions[i:i + batch_size] for i in range(0, len(positions), batch_size)]
         
-        print(f"\n========== 开始视觉分析 ==========")
-        print(f"Provider: {self.provider}")
-        print(f"Model: {self.model}")
-        print(f"截图路径: {screenshot_path}")
+        def analyze_batch(batch: List[int]) -> Dict[int, Dict[str, Any]]:
+            steps = [
+                {
+                    "number": pos + 1,
+                    "screenshot_path": step_screenshots[pos],
+                    "description": (step_statuses[pos] if pos < len(step_statuses) else {}).get("description", "")
+                }
+                for pos in batch
+            ]
+            try:
+                return self._analyze_batch_with_vision(steps, expected_result, vision_mode, timeout)
+            except Exception as e:
+                print(f"批量视觉分析失败: {e}")
+                return {step["number"]: {"error": f"Vision API调用失败: {str(e)}"} for step in steps}
         
-        # 读取截图文件并转为base64
+        workers = min(max(1, int(self.config.get("vision_concurrency", settings.LLM_VISION_CONCURRENCY))), len(batches))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vision-batch") as executor:
+            batch_results = list(executor.map(analyze_batch, batches))
+        
+        analyses = {}
+        for batch_result in batch_results:
+            analyses.update(batch_result)
+        return [
+            {
+                "step_index": pos + 1,
+                "screenshot_path": step_screenshots[pos],
+                "analysis": analyses.get(pos + 1) or {"error": "模型未返回该截图的分析"}
+            }
+            for pos in positions
+        ]
+    
+    def _analyze_batch_with_vision(
+        self,
+        steps: List[Dict[str, Any]],
+        expected_result: str,
+        vision_mode: str,
+        timeout: float
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        一次请求分析一批截图
+
+        Args:
+            steps: [{number, screenshot_path, description}]，number 为截图编号
+            expected_result: 预期结果
+            vision_mode: multi_image / contact_sheet
+            timeout: 超时秒数
+
+        Returns:
+            {截图编号: 分析结果}
+        """
+        if self.provider not in VISION_PROVIDERS:
+            return {
+                step["number"]: {"observation": "当前模型不支持视觉分析", "matches_expectation": None, "issues": []}
+                for step in steps
+            }
+        
+        paths = [resolve_artifact_path(step["screenshot_path"], settings.ARTIFACTS_PATH) for step in steps]
+        image_format = self.config.get("vision_image_format", settings.VISION_IMAGE_FORMAT)
+        quality = int(self.config.get("vision_image_quality", settings.VISION_IMAGE_QUALITY))
+        if vision_mode == "contact_sheet":
+            prepared = build_contact_sheet(
+                paths,
+                [f"#{step['number']}" for step in steps],
+                image_format=image_format,
+                quality=quality
+            )
+            images = prepared["images"]
+            layout = "这些截图已拼成一张总览图，每个格子左上角标注了截图编号（#编号）。"
+        else:
+            # 多图模式下每张图更小，整体 token 与单张大图相当
+            images = []
+            for step, path in zip(steps, paths):
+                image = prepare_image_for_vision(
+                    path,
+                    max_width=int(self.config.get("vision_batch_image_width", 768)),
+                    image_format=image_format,
+                    quality=quality,
+                    max_tiles=1
+                )["images"][0]
+                image["label"] = f"截图 #{step['number']}（步骤: {step['description']}）"
+                images.append(image)
+            layout = "每张截图前标注了截图编号和对应的步骤。"
+        
+        step_lines = "\n".join(f"#{step['number']}: {step['description']}" for step in steps)
+        prompt = f"""下面是一次测试执行中按顺序截取的{len(steps)}张截图。{layout}
+
+各截图对应的步骤:
+{step_lines}
+
+预期结果: {expected_result}
+
+请逐张描述截图中看到的内容，并判断是否符合预期，按多张截图的输出格式返回JSON数组。"""
+        
+        print(f"批量视觉分析: {len(steps)} 张截图，模式 {vision_mode}")
+        result_text = self._call_vision(
+            prompt,
+            images,
+            max_tokens=min(300 * len(steps) + 200, 4000),
+            timeout=timeout,
+            system=VISION_GUIDELINES
+        )
+        parsed = json.loads(result_text.strip().replace("```json", "").replace("```", ""))
+        if isinstance(parsed, dict):
+            parsed = parsed.get("steps") or parsed.get("results") or []
+        
+        analyses = {}
+        for item in parsed:
+            try:
+                number = int(item.get("step_index"))
+            except (TypeError, ValueError):
+                continue
+            analyses[number] = {
+                "observation": item.get("observation", ""),
+                "matches_expectation": item.get("matches_expectation"),
+                "issues": item.get("issues", [])
+            }
+        return analyses
+    
+    def _analysis_mode(self) -> str:
+        """
+        页面分析模式
+
+        项目 llm_config.analysis_mode 设为 text 时发送页面文本快照；不支持图片输入的提供商也使用文本模式。
+        """
+        mode = self.config.get("analysis_mode", "vision")
+        if mode not in ANALYSIS_MODES or self.provider not in VISION_PROVIDERS:
+            mode = "text"
+        return mode
+    
+    def _analyze_page(
+        self,
+        screenshot_path: str,
+        expected_result: str,
+        step_status: Optional[Dict[str, Any]],
+        timeout: Optional[float] = None,
+        model: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """按分析模式分析一个步骤的页面：文本模式优先使用截图旁的页面快照，没有快照时回退到截图"""
+        if self._analysis_mode() == "text":
+            analysis = self._analyze_snapshot_with_text(screenshot_path, expected_result, step_status, timeout, model)
+            if analysis is not None:
+                return analysis
+        return self._analyze_screenshot_with_vision(screenshot_path, expected_result, step_status, timeout, model)
+    
+    def _analyze_snapshot_with_text(
+        self,
+        screenshot_path: str,
+        expected_result: str,
+        step_status: Optional[Dict[str, Any]],
+        timeout: Optional[float] = None,
+        model: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        使用文本模型分析截图对应的页面快照
+
+        模型优先级: model 参数 > llm_config.text_model > 项目模型
+
+        Returns:
+            与 _analyze_screenshot_with_vision 相同结构的分析结果，截图旁没有快照时返回 None
+        """
+        snapshot_path = snapshot_path_for_screenshot(resolve_artifact_path(screenshot_path, settings.ARTIFACTS_PATH))
         try:
-            with open(screenshot_path, "rb") as f:
-                image_data = base64.b64encode(f.read()).decode("utf-8")
-            print(f"截图文件读取成功，大小: {len(image_data)} bytes (base64)")
+            snapshot = load_snapshot(snapshot_path)
         except Exception as e:
-            print(f"读取截图失败: {str(e)}")
-            return {"error": f"读取截图失败: {str(e)}"}
+            print(f"读取页面快照失败: {e}")
+            snapshot = None
+        if not snapshot:
+            print(f"截图 {screenshot_path} 没有对应的页面快照")
+            return None
         
+        model = model or self.config.get("text_model") or self.model
         step_desc = step_status.get("description", "") if step_status else ""
-        
-        prompt = f"""你是一个专业的UI测试分析专家。请分析这张截图。
+        page_text = format_snapshot_for_llm(snapshot, int(self.config.get("text_snapshot_max_chars", 6000)))
+        prompt = f"""你是一个专业的UI测试分析专家。下面是测试执行到某一步时页面的文本快照（URL、标题、按钮、链接、输入框、提示信息和可见文本），请据此分析页面状态。
 
 步骤描述: {step_desc}
 预期结果: {expected_result}
 
-请描述你在截图中看到的内容，并判断是否符合预期。返回JSON格式：
+页面快照:
+{page_text}
+
+请描述页面呈现的内容，并判断是否符合预期。仅凭文本无法判断的内容（如颜色、布局、图片）请在 issues 中说明并降低 confidence。返回JSON格式：
 {{
   "observation": "具体观察到的内容",
   "matches_expectation": true/false,
+  "confidence": 0到1之间的数字，表示你对判断的把握,
   "issues": ["发现的问题列表"]
 }}"""
         
+        try:
+            print(f"📝 使用文本模型分析页面快照: {snapshot_path}，模型: {model}，{len(page_text)} 字符")
+            result_text = self._call_llm(
+                prompt,
+                model=model,
+                max_tokens=500,
+                timeout=timeout or settings.LLM_VISION_TIMEOUT
+            )
+            parsed_result = json.loads(result_text.strip().replace("```json", "").replace("```", ""))
+            parsed_result["analysis_mode"] = "text"
+            return parsed_result
+        except Exception as e:
+            print(f"文本分析失败: {str(e)}")
+            return {"error": f"文本分析失败: {str(e)}", "analysis_mode": "text"}
+    
+    def _analyze_screenshot_with_vision(
+        self,
+        screenshot_path: str,
+        expected_result: str,
+        step_status: Optional[Dict[str, Any]],
+        timeout: Optional[float] = None,
+        model: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        使用视觉大模型分析截图
+
+        timeout 为本次调用的超时秒数（默认使用 LLM_VISION_TIMEOUT），model 可指定本次使用的模型（默认项目模型）
+        """
+        model = model or self.model
+        print(f"\n========== 开始视觉分析 ==========")
+        print(f"Provider: {self.provider}")
+        print(f"Model: {model}")
+        print(f"截图路径: {screenshot_path}")
+        
+        # 读取截图并压缩
+        try:
+            images = self._load_vision_images(screenshot_path, model)
+        except Exception as e:
+            print(f"读取截图失败: {str(e)}")
+            return {"error": f"读取截图失败: {str(e)}"}
+        
+        step_desc = step_status.get("description", "") if step_status else ""
+        tiles_hint = f"\n截图较长，已按从上到下的顺序切分为{len(images)}张。\n" if len(images) > 1 else ""
+        
+        prompt = f"""请分析这张截图。
+{tiles_hint}
+步骤描述: {step_desc}
+预期结果: {expected_result}
+
+请描述你在截图中看到的内容，并判断是否符合预期，按单张截图的输出格式返回JSON。"""
+        
         # 调用视觉大模型
-        if self.provider in ["openai", "dashscope"]:
+        if self.provider in VISION_PROVIDERS:
             try:
-                print(f"调用 {self.provider} Vision API，模型: {self.model}")
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image_data}"}}
-                        ]
-                    }],
-                    max_tokens=500
+                print(f"调用 {self.provider} Vision API，模型: {model}")
+                result_text = self._call_vision(
+                    prompt,
+                    images,
+                    max_tokens=500,
+                    timeout=timeout,
+                    model=model,
+                    system=VISION_GUIDELINES
                 )
-                result_text = response.choices[0].message.content or "{}"
                 print(f"Vision API响应: {result_text[:200]}...")
                 parsed_result = json.loads(result_text.strip().replace("```json", "").replace("```", ""))
                 print(f"解析结果: {parsed_result}")
@@ -648,6 +1650,140 @@ Midscene的优势：
             print(f"========== 视觉分析跳过 ==========\n")
             return {"observation": "当前模型不支持视觉分析", "matches_expectation": None, "issues": []}
     
+    def _load_vision_images(self, screenshot_path: str, model: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        读取截图并按本次使用的模型压缩（缩放、长图切分、重新编码）
+        
+        model 为本次调用的模型（分级判定时为当前一级的模型），默认项目模型。
+        压缩参数可通过项目 llm_config 的 vision_image_max_width / vision_image_format /
+        vision_image_quality / vision_image_max_tiles 调整。
+        
+        Returns:
+            图片列表 [{mime_type, data}]，data 为 base64 字符串
+        """
+        path = resolve_artifact_path(screenshot_path, settings.ARTIFACTS_PATH)
+        
+        try:
+            prepared = prepare_image_for_vision(
+                path,
+                max_width=int(self.config.get("vision_image_max_width") or target_width_for_model(model or self.model)),
+                image_format=self.config.get("vision_image_format", settings.VISION_IMAGE_FORMAT),
+                quality=int(self.config.get("vision_image_quality", settings.VISION_IMAGE_QUALITY)),
+                max_tiles=int(self.config.get("vision_image_max_tiles", settings.VISION_IMAGE_MAX_TILES))
+            )
+        except OSError as e:
+            if not os.path.exists(path):
+                raise
+            # 图片无法解码时按原图上传
+            print(f"⚠️ 截图压缩失败，使用原图: {e}")
+            with open(path, "rb") as f:
+                return [{"mime_type": "image/png", "data": base64.b64encode(f.read()).decode("utf-8")}]
+        
+        saved_ratio = prepared["saved_bytes"] / prepared["original_bytes"] if prepared["original_bytes"] else 0
+        print(
+            f"🖼️ 截图已压缩: {prepared['original_bytes']} -> {prepared['encoded_bytes']} bytes "
+            f"(节省 {saved_ratio:.0%}), 切片 {prepared['tiles']} 张{'（已裁掉中间部分）' if prepared['cropped'] else ''}"
+        )
+        return prepared["images"]
+    
+    def _call_vision(
+        self,
+        prompt: str,
+        images: List[Dict[str, str]],
+        max_tokens: int = 500,
+        timeout: Optional[float] = None,
+        model: Optional[str] = None,
+        system: Optional[str] = None
+    ) -> str:
+        """
+        调用视觉大模型
+        
+        Args:
+            prompt: 文本提示词（用例相关的动态部分）
+            images: 图片列表 [{mime_type, data, label}]，有 label 时在图片前插入该文字
+            max_tokens: 最大输出 token
+            timeout: 超时秒数，默认使用 LLM_VISION_TIMEOUT
+            model: 使用的模型，默认项目模型
+            system: 静态指令，放在请求最前面以便命中提示词缓存
+            
+        Returns:
+            模型输出文本
+        """
+        if self.provider not in VISION_PROVIDERS:
+            raise ValueError(f"Provider {self.provider} 不支持视觉分析")
+        
+        if self.provider == "anthropic":
+            return self._call_anthropic_vision(prompt, images, max_tokens, timeout, model, system)
+        
+        content: List[Dict[str, Any]] = [{"type": "text", "text": prompt}]
+        for image in images:
+            if image.get("label"):
+                content.append({"type": "text", "text": image["label"]})
+            content.append({
+                "type": "image_url",
+                "image_url": {"url": f"data:{image['mime_type']};base64,{image['data']}"}
+            })
+        
+        messages: List[Dict[str, Any]] = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": content})
+        response = self._rate_limited(lambda: self.client.chat.completions.create(
+            model=model or self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            timeout=timeout or settings.LLM_VISION_TIMEOUT
+        ))
+        return response.choices[0].message.content or "{}"
+    
+    def _call_anthropic_vision(
+        self,
+        prompt: str,
+        images: List[Dict[str, str]],
+        max_tokens: int,
+        timeout: Optional[float],
+        model: Optional[str],
+        system: Optional[str]
+    ) -> str:
+        """
+        通过 Anthropic Messages API 调用视觉模型（图片使用与其他提供商相同的压缩结果）
+
+        静态指令放在 system 中并标记为缓存断点，后续请求从缓存读取这部分前缀（VISION_GUIDELINES
+        长度高于 PROMPT_CACHE_MIN_TOKENS）；预期结果、步骤状态和图片都在断点之后的 user 消息中。
+        """
+        content: List[Dict[str, Any]] = []
+        for image in images:
+            if image.get("label"):
+                content.append({"type": "text", "text": image["label"]})
+            content.append({
+                "type": "image",
+                "source": {"type": "base64", "media_type": image["mime_type"], "data": image["data"]}
+            })
+        # 图片在前、文字说明在后
+        content.append({"type": "text", "text": prompt})
+        
+        options: Dict[str, Any] = {}
+        if system and self.config.get("prompt_cache", True):
+            options["system"] = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+        elif system:
+            options["system"] = system
+        
+        response = self._rate_limited(lambda: self.client.messages.create(
+            model=model or self.model,
+            messages=[{"role": "user", "content": content}],
+            max_tokens=max_tokens,
+            timeout=timeout or settings.LLM_VISION_TIMEOUT,
+            **options
+        ))
+        
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            print(
+                f"Anthropic 用量: 输入 {getattr(usage, 'input_tokens', None)}, "
+                f"缓存写入 {getattr(usage, 'cache_creation_input_tokens', None)}, "
+                f"缓存读取 {getattr(usage, 'cache_read_input_tokens', None)}, "
+                f"输出 {getattr(usage, 'output_tokens', None)}"
+            )
+        return "".join(block.text for block in response.content if getattr(block, "type", "") == "text") or "{}"
+    
     def _analyze_without_vision(self, expected_result: str, console_logs: List[str], step_statuses: List[Dict[str, Any]]) -> Dict[str, Any]:
         """不使用视觉分析的基本判定"""
         all_success = all(s.get("status") == "success" for s in step_statuses)
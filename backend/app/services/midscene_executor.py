@@ -4,17 +4,31 @@ Midscene执行引擎服务
 """
 import os
 import json
+import hashlib
+import threading
 import subprocess
 import platform
-from typing import Dict, Any, List, Optional
+from collections import deque
+from typing import Dict, Any, List, Optional, Callable
 from datetime import datetime
 from pathlib import Path
 
+from app.config import settings
+from app.services.midscene_sidecar import midscene_sidecar_pool, MidsceneSidecarError
+
 
 class MidsceneExecutor:
     """Midscene脚本执行器"""
     
-    def __init__(self, artifacts_base_path: str, llm_service=None, expected_result: Optional[str] = None, auth_state_path: Optional[str] = None):
+    def __init__(
+        self,
+        artifacts_base_path: str,
+        llm_service=None,
+        expected_result: Optional[str] = None,
+        auth_state_path: Optional[str] = None,
+        test_case_id: Optional[int] = None,
+        assertion_checklist: Optional[Dict[str, Any]] = None
+    ):
         """
         初始化执行器
         
@@ -23,11 +37,15 @@ class MidsceneExecutor:
             llm_service: LLM服务实例（用于结果分析）
             expected_result: 预期结果描述
             auth_state_path: 认证状态文件路径（可选）
+            test_case_id: 测试用例ID（用于复用 Midscene 规划/定位缓存，可选）
+            assertion_checklist: 断言清单，执行结束时在最终页面上核对（可选）
         """
         self.artifacts_base_path = artifacts_base_path
         self.llm_service = llm_service
         self.expected_result = expected_result
         self.auth_state_path = auth_state_path  # 新增：认证状态路径
+        self.test_case_id = test_case_id
+        self.assertion_checklist = assertion_checklist
         
         # Midscene 执行器脚本路径
         backend_dir = Path(__file__).parent.parent.parent
@@ -38,7 +56,8 @@ class MidsceneExecutor:
         self, 
         script: Dict[str, Any], 
         run_id: int,
-        env_vars: Optional[Dict[str, str]] = None
+        env_vars: Optional[Dict[str, str]] = None,
+        on_step: Optional[Callable[[Dict[str, Any]], None]] = None
     ) -> Dict[str, Any]:
         """
         执行Midscene脚本
@@ -47,6 +66,7 @@ class MidsceneExecutor:
             script: Midscene脚本配置
             run_id: 运行ID
             env_vars: 环境变量（LLM API keys等）
+            on_step: 每个步骤执行完成时的回调（参数为步骤结果），用于实时落库
             
         Returns:
             执行结果 {success, steps, error_message, artifacts_path}
@@ -67,14 +87,21 @@ class MidsceneExecutor:
             "steps": [],
             "error_message": None,
             "artifacts_path": run_artifacts_path,
-            "console_logs": []
+            "console_logs": [],
+            "page_snapshot": None,
+            "assertion_results": None
         }
         
         try:
-            # 准备执行环境
-            exec_env = os.environ.copy()
+            # 准备执行环境（在当前进程环境变量基础上覆盖的部分）
+            env_overrides = {
+                "PAGE_STABILITY_TIMEOUT_MS": str(settings.PAGE_STABILITY_TIMEOUT_MS),
+                "PAGE_STABILITY_QUIET_MS": str(settings.PAGE_STABILITY_QUIET_MS),
+                "BROWSER_HEADLESS": str(settings.BROWSER_HEADLESS).lower(),
+                "PAGE_SNAPSHOT_PER_STEP": str(settings.PAGE_SNAPSHOT_PER_STEP).lower()
+            }
             if env_vars:
-                exec_env.update(env_vars)
+                env_overrides.update(env_vars)
                 print(f"🔑 Midscene 环境变量已设置: {list(env_vars.keys())}")
                 # 打印 API Key 前缀以验证
                 if 'OPENAI_API_KEY' in env_vars:
@@ -92,6 +119,19 @@ class MidsceneExecutor:
             print(f"📦 脚本类型: {type(script)}")
             print(f"📦 脚本内容: {script}")
             
+            cache_options = self._cache_options(script)
+            
+            # 优先交给常驻 sidecar 执行，sidecar 无法启动时回退到单次进程模式
+            if settings.MIDSCENE_SIDECAR_ENABLED:
+                try:
+                    result.update(self._execute_with_sidecar(script, run_id, env_overrides, on_step, cache_options))
+                    return result
+                except MidsceneSidecarError as e:
+                    print(f"⚠️ Midscene sidecar 不可用，回退到单次进程模式: {e}")
+            
+            exec_env = os.environ.copy()
+            exec_env.update(env_overrides)
+            
             # 准备命令行参数
             try:
                 script_json = json.dumps(script, ensure_ascii=False)
@@ -101,6 +141,8 @@ class MidsceneExecutor:
             
             expected_result = self.expected_result or ""
             auth_state_arg = self.auth_state_path if self.auth_state_path else ""
+            cache_arg = json.dumps(cache_options) if cache_options else ""
+            checks_arg = json.dumps(self._checklist_checks(), ensure_ascii=False)
             
             # 根据操作系统选择命令
             is_windows = platform.system() == "Windows"
@@ -115,7 +157,9 @@ class MidsceneExecutor:
                     str(run_id),
                     self.artifacts_base_path,
                     expected_result,
-                    auth_state_arg  # 新增：传递认证状态路径
+                    auth_state_arg,  # 新增：传递认证状态路径
+                    cache_arg,
+                    checks_arg
                 ]
             else:
                 # Linux/Mac: 使用 npx
@@ -127,7 +171,9 @@ class MidsceneExecutor:
                     str(run_id),
                     self.artifacts_base_path,
                     expected_result,
-                    auth_state_arg  # 新增：传递认证状态路径
+                    auth_state_arg,  # 新增：传递认证状态路径
+                    cache_arg,
+                    checks_arg
                 ]
             
             print(f"执行 Midscene 命令: {' '.join(cmd[:3])}...")
@@ -142,50 +188,55 @@ class MidsceneExecutor:
                 text=True,
                 encoding='utf-8',  # 明确指定 UTF-8 编码
                 errors='replace',  # 遇到无法解码的字符时替换而不是报错
+                bufsize=1,
                 shell=is_windows  # Windows 需要 shell=True
             )
             
-            try:
-                stdout, stderr = process.communicate(timeout=300)  # 5分钟超时
-            except subprocess.TimeoutExpired:
+            # stderr 只保留最后若干行用于错误信息，避免长时间运行占用大量内存
+            stderr_tail = deque(maxlen=50)
+            stderr_thread = threading.Thread(
+                target=self._drain_stderr, args=(process, stderr_tail), daemon=True
+            )
+            stderr_thread.start()
+            
+            # 超时后强制结束进程，stdout 随之关闭，下面的逐行读取自然结束
+            timed_out = threading.Event()
+            def kill_on_timeout():
+                timed_out.set()
                 process.kill()
-                result["error_message"] = "执行超时（超过5分钟）"
+            watchdog = threading.Timer(settings.MAX_EXECUTION_TIME, kill_on_timeout)
+            watchdog.start()
+            
+            run_ended = False
+            try:
+                # stdout 每行一个 NDJSON 事件，逐行处理
+                for line in process.stdout:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        print(f"[midscene] {line}")
+                        continue
+                    if self._handle_event(event, result, on_step):
+                        run_ended = True
+                process.wait()
+            finally:
+                watchdog.cancel()
+            stderr_thread.join(timeout=5)
+            
+            if timed_out.is_set():
+                result["error_message"] = f"执行超时（超过{settings.MAX_EXECUTION_TIME}秒）"
                 result["success"] = False
-                return result
-            
-            # 检查是否成功获取输出
-            if stdout is None:
-                stdout = ""
-            if stderr is None:
-                stderr = ""
-            
-            print(f"📤 STDOUT 长度: {len(stdout)}")
-            print(f"📤 STDERR 长度: {len(stderr)}")
-            if stderr:
-                print(f"⚠️ STDERR 内容:\n{stderr}")
-            
-            # 解析结果
-            if stdout and "===MIDSCENE_RESULT_START===" in stdout:
-                start_idx = stdout.find("===MIDSCENE_RESULT_START===") + len("===MIDSCENE_RESULT_START===")
-                end_idx = stdout.find("===MIDSCENE_RESULT_END===")
-                if end_idx > start_idx:
-                    result_json = stdout[start_idx:end_idx].strip()
-                    midscene_result = json.loads(result_json)
-                    result.update(midscene_result)
-            else:
-                # 没有找到结果标记，说明执行失败
-                error_msg = "Midscene 执行失败"
-                if stdout:
-                    error_msg += f"\nSTDOUT (\u524d500\u5b57\u7b26):\n{stdout[:500]}"
-                if stderr:
-                    error_msg += f"\nSTDERR (\u524d500\u5b57\u7b26):\n{stderr[:500]}"
+            elif not run_ended:
+                # 没有收到结束事件，说明执行器异常退出
+                error_msg = f"Midscene 执行失败（退出码 {process.returncode}）"
+                if stderr_tail:
+                    error_msg += "\nSTDERR (最后{}行):\n{}".format(len(stderr_tail), "\n".join(stderr_tail))
                 result["error_message"] = error_msg
                 result["success"] = False
             
-        except subprocess.TimeoutExpired:
-            result["error_message"] = "执行超时（超过5分钟）"
-            result["success"] = False
-            
         except Exception as e:
             import traceback
             print(f"❌ 执行异常详细信息:")
@@ -197,6 +248,139 @@ class MidsceneExecutor:
         
         return result
     
+    def _checklist_checks(self) -> List[Dict[str, Any]]:
+        """传给执行器的断言清单检查项"""
+        return (self.assertion_checklist or {}).get("checks") or []
+
+    def _cache_options(self, script: Dict[str, Any]) -> Optional[Dict[str, str]]:
+        """
+        计算本次运行使用的 Midscene 缓存
+
+        缓存按用例ID、脚本内容哈希和起始页面区分，脚本修改后自动使用新的缓存，
+        同时清理该用例下旧脚本的缓存文件。
+
+        Returns:
+            {id, dir}，未启用缓存或没有用例ID时返回 None
+        """
+        if not settings.MIDSCENE_CACHE_ENABLED or self.test_case_id is None:
+            return None
+
+        script_hash = hashlib.sha256(
+            json.dumps(script, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:12]
+        start_url = next(
+            (step.get("value") or "" for step in script.get("steps", []) if step.get("action") == "goto"),
+            ""
+        )
+        url_hash = hashlib.sha256(start_url.encode("utf-8")).hexdigest()[:8]
+
+        prefix = f"case_{self.test_case_id}_{script_hash}"
+        cache_dir = os.path.join(self.artifacts_base_path, "midscene_cache", f"case_{self.test_case_id}")
+        if os.path.isdir(cache_dir):
+            for name in os.listdir(cache_dir):
+                if not name.startswith(prefix):
+                    os.remove(os.path.join(cache_dir, name))
+
+        return {"id": f"{prefix}_{url_hash}", "dir": os.path.abspath(cache_dir)}
+
+    def _handle_event(
+        self,
+        event: Dict[str, Any],
+        result: Dict[str, Any],
+        on_step: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> bool:
+        """
+        处理执行器输出的单个事件
+
+        Args:
+            event: 事件（step_start / step_end / run_end）
+            result: 累积的执行结果
+            on_step: 步骤完成回调
+
+        Returns:
+            是否为运行结束事件
+        """
+        event_type = event.get("event")
+
+        if event_type == "step_start":
+            print(f"▶️ 步骤 {event.get('index')}: {event.get('description')}")
+
+        elif event_type == "step_end":
+            step = event.get("step") or {}
+            result["steps"].append(step)
+            status_icon = "✅" if step.get("status") == "success" else "❌"
+            print(f"{status_icon} 步骤 {step.get('index')} 完成: {step.get('status')}")
+            if on_step:
+                try:
+                    on_step(step)
+                except Exception as e:
+                    # 实时落库失败不影响执行，运行结束后会补写未保存的步骤
+                    print(f"⚠️ 步骤回调失败: {e}")
+
+        elif event_type == "run_end":
+            result["success"] = event.get("success", False)
+            result["error_message"] = event.get("error_message")
+            result["console_logs"] = event.get("console_logs", [])
+            result["page_snapshot"] = event.get("page_snapshot")
+            result["assertion_results"] = event.get("assertion_results")
+            if event.get("artifacts_path"):
+                result["artifacts_path"] = event["artifacts_path"]
+            return True
+
+        return False
+
+    def _drain_stderr(self, process: subprocess.Popen, tail: deque):
+        """持续读取 stderr 日志，避免管道写满阻塞 Node 进程"""
+        for line in process.stderr:
+            line = line.rstrip()
+            if line:
+                tail.append(line)
+                print(f"[midscene] {line}")
+
+    def _execute_with_sidecar(
+        self,
+        script: Dict[str, Any],
+        run_id: int,
+        env_overrides: Dict[str, str],
+        on_step: Optional[Callable[[Dict[str, Any]], None]] = None,
+        cache_options: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """
+        在常驻 sidecar 进程中执行脚本
+
+        Args:
+            script: Midscene脚本配置
+            run_id: 运行ID
+            env_overrides: 覆盖的环境变量，决定使用哪个 sidecar
+            on_step: 步骤完成回调
+
+        Returns:
+            Midscene 执行结果
+        """
+        sidecar = midscene_sidecar_pool.get(env_overrides)
+        
+        # sidecar 可用之后的错误都属于本次运行，不再回退
+        try:
+            print(f"🔁 使用 Midscene sidecar 执行 (pid={sidecar.process.pid})")
+            return sidecar.call(
+                "execute",
+                {
+                    "script": script,
+                    "runId": run_id,
+                    "artifactsPath": self.artifacts_base_path,
+                    "expectedResult": self.expected_result or "",
+                    "authStatePath": self.auth_state_path or "",
+                    "cache": cache_options,
+                    "checks": self._checklist_checks()
+                },
+                timeout=settings.MAX_EXECUTION_TIME,
+                on_event=lambda event: self._handle_event(event, {"steps": []}, on_step)
+            )
+        except TimeoutError:
+            return {"success": False, "error_message": f"执行超时（超过{settings.MAX_EXECUTION_TIME}秒）"}
+        except MidsceneSidecarError as e:
+            return {"success": False, "error_message": f"执行异常: {str(e)}"}
+    
     def check_installation(self) -> Dict[str, Any]:
         """
         检查 Midscene 是否已正确安装
@@ -0,0 +1,332 @@
+"""
+Midscene 常驻执行进程（sidecar）客户端
+通过 stdin/stdout 按行收发 JSON-RPC 消息，复用同一个 Node 进程和浏览器执行多个 Midscene 脚本
+"""
+import os
+import json
+import time
+import queue
+import hashlib
+import platform
+import threading
+import subprocess
+from typing import Dict, Any, List, Optional, Callable
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from app.config import settings
+
+
+class MidsceneSidecarError(Exception):
+    """sidecar 进程启动失败或通信异常"""
+    pass
+
+
+class MidsceneSidecar:
+    """单个 Midscene sidecar 进程"""
+
+    def __init__(self, midscene_dir: Path, env: Dict[str, str]):
+        """
+        初始化 sidecar
+
+        Args:
+            midscene_dir: midscene 目录（包含 sidecar.ts 和 node_modules）
+            env: 进程环境变量（包含 LLM 配置）
+        """
+        self.midscene_dir = midscene_dir
+        self.env = env
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at: Optional[datetime] = None
+        self.last_used = datetime.utcnow()
+
+        self._next_id = 0
+        self._pending: Dict[int, Future] = {}
+        self._events: Dict[int, queue.Queue] = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def start(self, timeout: float = 60):
+        """启动 sidecar 进程并等待就绪"""
+        is_windows = platform.system() == "Windows"
+        cmd = ["npx.cmd" if is_windows else "npx", "tsx", str(self.midscene_dir / "sidecar.ts")]
+
+        try:
+            self.process = subprocess.Popen(
+                cmd,
+                cwd=str(self.midscene_dir),
+                env=self.env,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding='utf-8',
+                errors='replace',
+                bufsize=1,
+                shell=is_windows
+            )
+        except Exception as e:
+            raise MidsceneSidecarError(f"启动 Midscene sidecar 失败: {e}")
+
+        threading.Thread(target=self._read_stdout, name="midscene-sidecar-stdout", daemon=True).start()
+        threading.Thread(target=self._read_stderr, name="midscene-sidecar-stderr", daemon=True).start()
+
+        if not self._ready.wait(timeout):
+            self.close()
+            raise MidsceneSidecarError(f"Midscene sidecar 启动超时（{timeout}秒）")
+
+        self.started_at = datetime.utcnow()
+        print(f"🟢 Midscene sidecar 已启动: pid={self.process.pid}")
+
+    def is_alive(self) -> bool:
+        """进程是否仍在运行"""
+        return self.process is not None and self.process.poll() is None
+
+    @property
+    def in_flight(self) -> int:
+        """正在执行的请求数"""
+        with self._lock:
+            return len(self._pending)
+
+    def call(
+        self,
+        method: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        on_event: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Any:
+        """
+        发送请求并等待响应
+
+        Args:
+            method: 方法名
+            params: 参数
+            timeout: 超时时间（秒）
+            on_event: 执行过程中事件的回调，在调用方线程中执行（不阻塞读取线程）
+
+        Returns:
+            响应中的 result
+        """
+        if not self.is_alive():
+            raise MidsceneSidecarError("Midscene sidecar 进程已退出")
+
+        future: Future = Future()
+        events: queue.Queue = queue.Queue()
+        with self._lock:
+            self._next_id += 1
+            request_id = self._next_id
+            self._pending[request_id] = future
+            if on_event:
+                self._events[request_id] = events
+            self.last_used = datetime.utcnow()
+            try:
+                message = {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params or {}}
+                self.process.stdin.write(json.dumps(message, ensure_ascii=False) + "\n")
+                self.process.stdin.flush()
+            except Exception as e:
+                self._pending.pop(request_id, None)
+                self._events.pop(request_id, None)
+                raise MidsceneSidecarError(f"发送请求失败: {e}")
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        try:
+            if on_event:
+                # 边等待边处理事件，响应到达后再处理完剩余的事件
+                while not (future.done() and events.empty()):
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise FutureTimeoutError()
+                    try:
+                        on_event(events.get(timeout=0.2))
+                    except queue.Empty:
+                        continue
+                return future.result()
+
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            # 通知 sidecar 中止该请求并关闭其浏览器上下文，否则脚本会在 Node 进程中继续执行
+            self.notify("cancel", {"id": request_id})
+            raise TimeoutError(f"Midscene sidecar 请求超时（超过{timeout}秒）")
+        finally:
+            with self._lock:
+                self._events.pop(request_id, None)
+
+    def notify(self, method: str, params: Optional[Dict[str, Any]] = None):
+        """发送不需要响应的通知，进程已退出或发送失败时忽略"""
+        if not self.is_alive():
+            return
+        with self._lock:
+            try:
+                message = {"jsonrpc": "2.0", "method": method, "params": params or {}}
+                self.process.stdin.write(json.dumps(message, ensure_ascii=False) + "\n")
+                self.process.stdin.flush()
+            except Exception as e:
+                print(f"⚠️ 发送 Midscene sidecar 通知失败: {e}")
+
+    def close(self):
+        """关闭 sidecar 进程"""
+        if not self.process:
+            return
+        try:
+            if self.is_alive():
+                self.process.stdin.close()
+                self.process.wait(timeout=10)
+        except Exception:
+            self.process.kill()
+        self._fail_pending("Midscene sidecar 已关闭")
+
+    def _read_stdout(self):
+        """读取协议消息，将响应和执行事件分发给等待中的请求"""
+        for line in self.process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"[midscene] {line}")
+                continue
+
+            if message.get("method") == "ready":
+                self._ready.set()
+                continue
+
+            if message.get("method") == "event":
+                params = message.get("params") or {}
+                with self._lock:
+                    events = self._events.get(params.get("id"))
+                if events is not None:
+                    events.put(params)
+                continue
+
+            with self._lock:
+                future = self._pending.pop(message.get("id"), None)
+            if future is None:
+                continue
+            if "error" in message:
+                future.set_exception(MidsceneSidecarError(message["error"].get("message", "未知错误")))
+            else:
+                future.set_result(message.get("result"))
+
+        self._fail_pending("Midscene sidecar 进程意外退出")
+
+    def _read_stderr(self):
+        """持续读取日志输出，避免管道写满阻塞 Node 进程"""
+        for line in self.process.stderr:
+            line = line.rstrip()
+            if line:
+                print(f"[midscene] {line}")
+
+    def _fail_pending(self, message: str):
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(MidsceneSidecarError(message))
+
+
+class MidsceneSidecarPool:
+    """
+    Midscene sidecar 进程池
+
+    Midscene 从进程环境变量读取模型配置，因此按环境变量（即项目的 LLM 配置）区分 sidecar；
+    同一配置的运行在同一个 sidecar 中并发执行并共享浏览器。
+    """
+
+    def __init__(self, midscene_dir: Path, max_size: int = 2):
+        """
+        初始化进程池
+
+        Args:
+            midscene_dir: midscene 目录
+            max_size: 最多同时保留的 sidecar 进程数
+        """
+        self.midscene_dir = midscene_dir
+        self.max_size = max_size
+        self._sidecars: Dict[str, MidsceneSidecar] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "started": 0,
+            "evicted": 0,
+            "restarted": 0
+        }
+
+    def get(self, env_overrides: Dict[str, str]) -> MidsceneSidecar:
+        """
+        获取与环境变量匹配的 sidecar，不存在或已退出时启动新的进程
+
+        Args:
+            env_overrides: 在当前进程环境变量基础上覆盖的变量
+        """
+        key = hashlib.sha256(json.dumps(env_overrides, sort_keys=True).encode()).hexdigest()
+
+        evicted: List[MidsceneSidecar] = []
+        try:
+            with self._lock:
+                sidecar = self._sidecars.get(key)
+                if sidecar and sidecar.is_alive():
+                    return sidecar
+                if sidecar:
+                    self._stats["restarted"] += 1
+                    self._sidecars.pop(key)
+
+                evicted = self._evict_if_full()
+
+                env = os.environ.copy()
+                env.update(env_overrides)
+                sidecar = MidsceneSidecar(self.midscene_dir, env)
+                sidecar.start()
+                self._sidecars[key] = sidecar
+                self._stats["started"] += 1
+        finally:
+            # 关闭进程可能等待数秒，在锁外进行
+            for old in evicted:
+                old.close()
+        return sidecar
+
+    def stats(self) -> Dict[str, Any]:
+        """获取进程池统计数据"""
+        with self._lock:
+            return {
+                "enabled": settings.MIDSCENE_SIDECAR_ENABLED,
+                "max_size": self.max_size,
+                "size": len(self._sidecars),
+                "in_flight": sum(s.in_flight for s in self._sidecars.values()),
+                **self._stats
+            }
+
+    def shutdown(self):
+        """关闭所有 sidecar"""
+        with self._lock:
+            sidecars = list(self._sidecars.values())
+            self._sidecars.clear()
+        for sidecar in sidecars:
+            sidecar.close()
+
+    def _evict_if_full(self) -> List[MidsceneSidecar]:
+        """
+        进程数达到上限时移出最久未使用的空闲 sidecar
+
+        Returns:
+            被移出的 sidecar，由调用方在释放锁之后关闭
+        """
+        evicted = []
+        while len(self._sidecars) >= self.max_size:
+            idle = [(k, s) for k, s in self._sidecars.items() if s.in_flight == 0]
+            if not idle:
+                # 全部忙碌时允许临时超出上限，避免阻塞运行
+                break
+            key, sidecar = min(idle, key=lambda item: item[1].last_used)
+            self._sidecars.pop(key)
+            evicted.append(sidecar)
+            self._stats["evicted"] += 1
+        return evicted
+
+
+# 进程级 sidecar 池
+midscene_sidecar_pool = MidsceneSidecarPool(
+    midscene_dir=Path(__file__).parent.parent.parent / "midscene",
+    max_size=settings.MIDSCENE_SIDECAR_POOL_SIZE
+)
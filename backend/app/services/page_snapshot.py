@@ -0,0 +1,139 @@
+"""
+页面快照服务
+在页面中提取精简的文本/可访问性快照（URL、标题、可见文本、标题、按钮、链接、输入框、提示信息），
+供本地规则判定和文本模型分析使用，体积远小于截图
+"""
+import os
+import json
+import gzip
+from typing import Dict, Any, Optional
+
+
+# 可见文本最大长度，超出部分截断
+MAX_SNAPSHOT_TEXT_LENGTH = 8000
+
+# 在页面中提取快照，参数为可见文本最大长度
+PAGE_SNAPSHOT_SCRIPT = """(maxTextLength) => {
+  const clean = (text) => (text || '').replace(/\\s+/g, ' ').trim();
+  const visible = (el) => {
+    const rect = el.getBoundingClientRect();
+    const style = window.getComputedStyle(el);
+    return rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none';
+  };
+  const collect = (selector, limit, mapper) => {
+    const items = [];
+    for (const el of document.querySelectorAll(selector)) {
+      if (items.length >= limit) break;
+      if (!visible(el)) continue;
+      const item = mapper(el);
+      if (item) items.push(item);
+    }
+    return items;
+  };
+  const label = (el) => clean(el.innerText || el.value || el.getAttribute('aria-label') || el.getAttribute('title'));
+
+  const text = clean(document.body ? document.body.innerText : '');
+  return {
+    url: location.href,
+    title: document.title,
+    text: text.slice(0, maxTextLength),
+    text_truncated: text.length > maxTextLength,
+    headings: collect('h1, h2, h3, h4, [role=heading]', 30, (el) => clean(el.innerText)),
+    buttons: collect('button, [role=button], input[type=submit], input[type=button]', 50, label),
+    links: collect('a[href]', 50, label),
+    inputs: collect('input:not([type=hidden]), textarea, select', 30, (el) => ({
+      type: el.type || el.tagName.toLowerCase(),
+      label: clean(
+        (el.labels && el.labels[0] && el.labels[0].innerText) ||
+        el.getAttribute('aria-label') || el.getAttribute('placeholder') || el.name
+      ),
+      value: el.type === 'password' ? '' : clean(el.value).slice(0, 100)
+    })),
+    alerts: collect('[role=alert], [role=status], [aria-live], [role=dialog]', 20, (el) => clean(el.innerText))
+  };
+}"""
+
+
+def capture_page_snapshot(page, max_text_length: int = MAX_SNAPSHOT_TEXT_LENGTH) -> Optional[Dict[str, Any]]:
+    """提取页面快照（同步 Playwright 页面），失败时返回 None"""
+    try:
+        return page.evaluate(PAGE_SNAPSHOT_SCRIPT, max_text_length)
+    except Exception as e:
+        print(f"⚠️ 提取页面快照失败: {e}")
+        return None
+
+
+async def capture_page_snapshot_async(page, max_text_length: int = MAX_SNAPSHOT_TEXT_LENGTH) -> Optional[Dict[str, Any]]:
+    """提取页面快照（异步 Playwright 页面），失败时返回 None"""
+    try:
+        return await page.evaluate(PAGE_SNAPSHOT_SCRIPT, max_text_length)
+    except Exception as e:
+        print(f"⚠️ 提取页面快照失败: {e}")
+        return None
+
+
+def save_snapshot(snapshot: Dict[str, Any], path: str):
+    """以 gzip 压缩的 JSON 保存快照"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+
+
+def load_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    """读取快照，文件不存在时返回 None"""
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def snapshot_searchable_text(snapshot: Dict[str, Any]) -> str:
+    """快照中所有可见文字合并为一个便于匹配的字符串（小写、压缩空白）"""
+    parts = [snapshot.get("title") or "", snapshot.get("text") or ""]
+    for key in ("headings", "buttons", "links", "alerts"):
+        parts.extend(snapshot.get(key) or [])
+    for field in snapshot.get("inputs") or []:
+        parts.extend([field.get("label") or "", field.get("value") or ""])
+    return " ".join(" ".join(parts).lower().split())
+
+
+def snapshot_path_for_screenshot(screenshot_path: str) -> str:
+    """步骤快照与截图保存在同一目录，如 step_3.png -> step_3.snapshot.json.gz"""
+    return f"{os.path.splitext(screenshot_path)[0]}.snapshot.json.gz"
+
+
+def save_step_snapshot(page, screenshot_path: str):
+    """提取当前页面快照并保存到截图旁边（同步 Playwright 页面）"""
+    snapshot = capture_page_snapshot(page)
+    if snapshot:
+        save_snapshot(snapshot, snapshot_path_for_screenshot(screenshot_path))
+
+
+async def save_step_snapshot_async(page, screenshot_path: str):
+    """提取当前页面快照并保存到截图旁边（异步 Playwright 页面）"""
+    snapshot = await capture_page_snapshot_async(page)
+    if snapshot:
+        save_snapshot(snapshot, snapshot_path_for_screenshot(screenshot_path))
+
+
+def format_snapshot_for_llm(snapshot: Dict[str, Any], max_chars: int = 6000) -> str:
+    """将快照整理为发送给文本模型的紧凑文本"""
+    lines = [f"URL: {snapshot.get('url', '')}", f"标题: {snapshot.get('title', '')}"]
+    for key, label in (("headings", "标题元素"), ("alerts", "提示/对话框"), ("buttons", "按钮"), ("links", "链接")):
+        items = [item for item in snapshot.get(key) or [] if item]
+        if items:
+            lines.append(f"{label}: " + " | ".join(items))
+    fields = [
+        f"{field.get('label') or field.get('type')}={field.get('value', '')}"
+        for field in snapshot.get("inputs") or []
+    ]
+    if fields:
+        lines.append("输入框: " + " | ".join(fields))
+
+    header = "\n".join(lines)
+    budget = max(max_chars - len(header), 500)
+    text = snapshot.get("text") or ""
+    truncated = snapshot.get("text_truncated") or len(text) > budget
+    lines.append("页面可见文本" + ("（已截断）" if truncated else "") + ":")
+    lines.append(text[:budget])
+    return "\n".join(lines)
@@ -0,0 +1,257 @@
+"""
+页面稳定性检测服务
+在截图前等待页面静止（无进行中的请求、无DOM变化、无布局偏移、连续两帧相同），取代固定等待时间
+"""
+import time
+import hashlib
+import asyncio
+from typing import Dict, Any, Generator, Optional, Set
+from playwright.sync_api import Page
+from playwright.async_api import Page as AsyncPage
+
+
+# 在页面中记录最近一次DOM变化和布局偏移的时间
+STABILITY_MONITOR_SCRIPT = """() => {
+  if (window.__pageStability || !document.documentElement) return;
+  const state = { lastMutation: performance.now(), lastShift: performance.now() };
+  new MutationObserver(() => { state.lastMutation = performance.now(); }).observe(
+    document.documentElement,
+    { subtree: true, childList: true, attributes: true, characterData: true }
+  );
+  try {
+    new PerformanceObserver((list) => {
+      for (const entry of list.getEntries()) {
+        if (!entry.hadRecentInput) state.lastShift = performance.now();
+      }
+    }).observe({ type: 'layout-shift', buffered: false });
+  } catch (e) {
+    // 浏览器不支持 layout-shift 时只依赖 DOM 变化
+  }
+  window.__pageStability = state;
+}"""
+
+STABILITY_PROBE_SCRIPT = """() => {
+  const state = window.__pageStability;
+  if (!state) return null;
+  const now = performance.now();
+  return {
+    mutation_idle_ms: now - state.lastMutation,
+    shift_idle_ms: now - state.lastShift,
+    ready_state: document.readyState
+  };
+}"""
+
+# 长连接类请求永远不会结束，不计入进行中的请求
+IGNORED_RESOURCE_TYPES = ("eventsource", "websocket")
+
+# 判定逻辑向适配器请求的页面操作
+PROBE = "probe"  # 执行 STABILITY_PROBE_SCRIPT，返回结果；执行上下文被销毁时返回 NAVIGATING
+INSTALL = "install"  # 执行 STABILITY_MONITOR_SCRIPT
+FRAME = "frame"  # 返回当前视口画面的哈希，失败时返回 None
+SLEEP = "sleep"  # 等待一个轮询间隔
+
+NAVIGATING = object()
+
+
+class StabilityLogic:
+    """
+    页面稳定性判定逻辑（同步和异步检测器共用）
+
+    不直接访问页面：wait_steps 生成器依次产出需要执行的页面操作（PROBE / INSTALL / FRAME / SLEEP），
+    由同步或异步适配器执行后把结果发送回来，最终以 {stable, waited_ms, pending} 作为返回值结束。
+    """
+
+    def __init__(self, max_wait_ms: int = 3000, quiet_ms: int = 500, poll_interval_ms: int = 100):
+        """
+        Args:
+            max_wait_ms: 最长等待时间（毫秒），超过后无论是否稳定都返回
+            quiet_ms: 网络、DOM、布局需要保持静止的时间窗口（毫秒）
+            poll_interval_ms: 轮询间隔（毫秒）
+        """
+        self.max_wait_ms = max_wait_ms
+        self.quiet_ms = quiet_ms
+        self.poll_interval_ms = poll_interval_ms
+        self._inflight: Set[Any] = set()
+        self._last_network_activity = time.monotonic()
+
+    def wait_steps(self, max_wait_ms: Optional[int] = None) -> Generator[str, Any, Dict[str, Any]]:
+        """
+        等待页面稳定的判定过程
+
+        Args:
+            max_wait_ms: 本次等待的上限，默认使用初始化时的配置
+
+        Returns:
+            {stable, waited_ms, pending}，pending 为超时时仍未满足的条件
+        """
+        ceiling_ms = self.max_wait_ms if max_wait_ms is None else max_wait_ms
+        start = time.monotonic()
+        last_frame_hash = None
+
+        while True:
+            pending = yield from self._pending_conditions()
+
+            if not pending:
+                # 其他条件都满足后，再确认连续两帧画面一致
+                frame_hash = yield FRAME
+                if frame_hash is not None and frame_hash == last_frame_hash:
+                    return self._result(start, True, [])
+                last_frame_hash = frame_hash
+                pending = ["frame"]
+            else:
+                last_frame_hash = None
+
+            if (time.monotonic() - start) * 1000 >= ceiling_ms:
+                return self._result(start, False, pending)
+
+            yield SLEEP
+
+    def _pending_conditions(self) -> Generator[str, Any, list]:
+        """返回尚未满足的稳定条件"""
+        pending = []
+
+        network_idle_ms = (time.monotonic() - self._last_network_activity) * 1000
+        if self._inflight or network_idle_ms < self.quiet_ms:
+            pending.append("network")
+
+        probe = yield PROBE
+        if probe is NAVIGATING:
+            # 导航过程中执行上下文被销毁
+            pending.append("navigation")
+            return pending
+        if probe is None:
+            # 当前文档在 attach 之前加载，补装监控脚本
+            yield INSTALL
+            pending.append("dom")
+            return pending
+
+        if probe["ready_state"] != "complete":
+            pending.append("load")
+        if probe["mutation_idle_ms"] < self.quiet_ms:
+            pending.append("dom")
+        if probe["shift_idle_ms"] < self.quiet_ms:
+            pending.append("layout")
+        return pending
+
+    def _on_request_start(self, request):
+        if request.resource_type in IGNORED_RESOURCE_TYPES:
+            return
+        self._inflight.add(request)
+        self._last_network_activity = time.monotonic()
+
+    def _on_request_end(self, request):
+        self._inflight.discard(request)
+        self._last_network_activity = time.monotonic()
+
+    def _result(self, start: float, stable: bool, pending: list) -> Dict[str, Any]:
+        return {
+            "stable": stable,
+            "waited_ms": int((time.monotonic() - start) * 1000),
+            "pending": pending
+        }
+
+
+class PageStabilityDetector(StabilityLogic):
+    """页面稳定性检测器"""
+
+    def __init__(self, page: Page, max_wait_ms: int = 3000, quiet_ms: int = 500, poll_interval_ms: int = 100):
+        """
+        初始化检测器
+
+        Args:
+            page: Playwright 页面
+            max_wait_ms: 最长等待时间（毫秒），超过后无论是否稳定都返回
+            quiet_ms: 网络、DOM、布局需要保持静止的时间窗口（毫秒）
+            poll_interval_ms: 轮询间隔（毫秒）
+        """
+        super().__init__(max_wait_ms, quiet_ms, poll_interval_ms)
+        self.page = page
+
+    def attach(self):
+        """注册网络监听和页面监控脚本，需要在页面创建后、执行步骤前调用"""
+        self.page.on("request", self._on_request_start)
+        self.page.on("requestfinished", self._on_request_end)
+        self.page.on("requestfailed", self._on_request_end)
+        # 之后每次导航的新文档都会自动安装监控脚本
+        self.page.add_init_script(f"({STABILITY_MONITOR_SCRIPT})()")
+
+    def wait(self, max_wait_ms: Optional[int] = None) -> Dict[str, Any]:
+        """
+        等待页面稳定
+
+        Returns:
+            {stable, waited_ms, pending}
+        """
+        steps = self.wait_steps(max_wait_ms)
+        reply = None
+        while True:
+            try:
+                action = steps.send(reply)
+            except StopIteration as done:
+                return done.value
+            reply = self._perform(action)
+
+    def _perform(self, action: str) -> Any:
+        try:
+            if action == PROBE:
+                return self.page.evaluate(STABILITY_PROBE_SCRIPT)
+            if action == INSTALL:
+                return self.page.evaluate(STABILITY_MONITOR_SCRIPT)
+            if action == FRAME:
+                return hashlib.md5(self.page.screenshot(type="jpeg", quality=50)).hexdigest()
+        except Exception:
+            return NAVIGATING if action == PROBE else None
+        self.page.wait_for_timeout(self.poll_interval_ms)
+
+
+class AsyncPageStabilityDetector(StabilityLogic):
+    """页面稳定性检测器（asyncio 版本，供 AsyncPlaywrightExecutor 使用）"""
+
+    def __init__(self, page: AsyncPage, max_wait_ms: int = 3000, quiet_ms: int = 500, poll_interval_ms: int = 100):
+        """
+        初始化检测器
+
+        Args:
+            page: Playwright 异步页面
+            max_wait_ms: 最长等待时间（毫秒）
+            quiet_ms: 网络、DOM、布局需要保持静止的时间窗口（毫秒）
+            poll_interval_ms: 轮询间隔（毫秒）
+        """
+        super().__init__(max_wait_ms, quiet_ms, poll_interval_ms)
+        self.page = page
+
+    async def attach(self):
+        """注册网络监听和页面监控脚本"""
+        self.page.on("request", self._on_request_start)
+        self.page.on("requestfinished", self._on_request_end)
+        self.page.on("requestfailed", self._on_request_end)
+        await self.page.add_init_script(f"({STABILITY_MONITOR_SCRIPT})()")
+
+    async def wait(self, max_wait_ms: Optional[int] = None) -> Dict[str, Any]:
+        """
+        等待页面稳定
+
+        Returns:
+            {stable, waited_ms, pending}
+        """
+        steps = self.wait_steps(max_wait_ms)
+        reply = None
+        while True:
+            try:
+                action = steps.send(reply)
+            except StopIteration as done:
+                return done.value
+            reply = await self._perform(action)
+
+    async def _perform(self, action: str) -> Any:
+        try:
+            if action == PROBE:
+                return await self.page.evaluate(STABILITY_PROBE_SCRIPT)
+            if action == INSTALL:
+                return await self.page.evaluate(STABILITY_MONITOR_SCRIPT)
+            if action == FRAME:
+                return hashlib.md5(await self.page.screenshot(type="jpeg", quality=50)).hexdigest()
+        except Exception:
+            return NAVIGATING if action == PROBE else None
+        # 使用 asyncio.sleep 让出事件循环，其他运行可以继续执行
+        await asyncio.sleep(self.poll_interval_ms / 1000)
@@ -8,11 +8,24 @@ from datetime import datetime
 from playwright.sync_api import sync_playwright, Page, Browser, BrowserContext
 from pathlib import Path
 
+from app.config import settings
+from app.services.browser_pool import browser_pool, PooledBrowser
+from app.services.page_stability import PageStabilityDetector
+from app.services.page_snapshot import capture_page_snapshot, save_snapshot, save_step_snapshot
+from app.services.assertion_checklist import evaluate_checklist
+
 
 class PlaywrightExecutor:
     """Playwright脚本执行器"""
     
-    def __init__(self, artifacts_base_path: str, llm_service=None, expected_result: Optional[str] = None, auth_state_path: Optional[str] = None):
+    def __init__(
+        self,
+        artifacts_base_path: str,
+        llm_service=None,
+        expected_result: Optional[str] = None,
+        auth_state_path: Optional[str] = None,
+        assertion_checklist: Optional[Dict[str, Any]] = None
+    ):
         """
         初始化执行器
         
@@ -21,15 +34,19 @@ class PlaywrightExecutor:
             llm_service: LLM服务实例（用于视觉分析）
             expected_result: 预期结果描述
             auth_state_path: 认证状态文件路径（可选）
+            assertion_checklist: 断言清单，执行结束时在最终页面上核对（可选）
         """
         self.artifacts_base_path = artifacts_base_path
         self.llm_service = llm_service
         self.expected_result = expected_result
         self.auth_state_path = auth_state_path  # 新增：认证状态路径
+        self.assertion_checklist = assertion_checklist
         self.browser: Optional[Browser] = None
         self.context: Optional[BrowserContext] = None
         self.page: Optional[Page] = None
         self.playwright = None
+        self.pooled_browser: Optional[PooledBrowser] = None  # 从浏览器池借出的浏览器
+        self.stability: Optional[PageStabilityDetector] = None  # 页面稳定性检测器
         
     def execute_script(
         self, 
@@ -44,8 +61,23 @@ class PlaywrightExecutor:
             run_id: 运行ID
             
         Returns:
-            执行结果 {success, steps, error_message, artifacts_path}
+            执行结果 {success, steps, error_message, artifacts_path, page_snapshot, assertion_results}
         """
+        if settings.BROWSER_POOL_ENABLED:
+            # 在浏览器池的宿主线程中借用已启动的浏览器执行，每次运行只创建新的上下文
+            return browser_pool.run(
+                script.get("browser", "chromium"),
+                lambda pooled_browser: self._run_script(script, run_id, pooled_browser)
+            )
+        return self._run_script(script, run_id)
+    
+    def _run_script(
+        self,
+        script: Dict[str, Any],
+        run_id: int,
+        pooled_browser: Optional[PooledBrowser] = None
+    ) -> Dict[str, Any]:
+        """执行脚本，pooled_browser 为浏览器池借出的浏览器，不传时为本次运行单独启动浏览器"""
         # 创建工件目录
         run_artifacts_path = os.path.join(self.artifacts_base_path, f"runs/{run_id}")
         screenshots_path = os.path.join(run_artifacts_path, "screenshots")
@@ -62,25 +94,21 @@ class PlaywrightExecutor:
             "steps": [],
             "error_message": None,
             "artifacts_path": run_artifacts_path,
-            "console_logs": []
+            "console_logs": [],
+            "page_snapshot": None,
+            "assertion_results": None
         }
         
         console_logs = []
         
         try:
-            # 启动Playwright
-            self.playwright = sync_playwright().start()
-            
             # 获取浏览器类型
             browser_type = script.get("browser", "chromium")
-            if browser_type == "chromium":
-                self.browser = self.playwright.chromium.launch(headless=False)  # 改为有头模式，可以看到浏览器
-            elif browser_type == "firefox":
-                self.browser = self.playwright.firefox.launch(headless=False)  # 改为有头模式
-            elif browser_type == "webkit":
-                self.browser = self.playwright.webkit.launch(headless=False)  # 改为有头模式
+            if pooled_browser:
+                self.pooled_browser = pooled_browser
+                self.browser = pooled_browser.browser
             else:
-                self.browser = self.playwright.chromium.launch(headless=False)  # 改为有头模式
+                self.browser = self._launch_browser(browser_type)
             
             # 创建上下文（支持加载认证状态）
             viewport = script.get("viewport", {"width": 1280, "height": 720})
@@ -99,6 +127,14 @@ class PlaywrightExecutor:
             # 创建页面
             self.page = self.context.new_page()
             
+            # 注册页面稳定性检测（截图前等待页面静止）
+            self.stability = PageStabilityDetector(
+                self.page,
+                max_wait_ms=settings.PAGE_STABILITY_TIMEOUT_MS,
+                quiet_ms=settings.PAGE_STABILITY_QUIET_MS
+            )
+            self.stability.attach()
+            
             # 监听控制台日志
             def handle_console(msg):
                 log_entry = f"[{msg.type}] {msg.text}"
@@ -118,6 +154,12 @@ class PlaywrightExecutor:
                 if step_result["status"] == "failed":
                     break
             
+            # 记录最终页面快照，供本地规则判定使用
+            result["page_snapshot"] = capture_page_snapshot(self.page)
+            if result["page_snapshot"]:
+                save_snapshot(result["page_snapshot"], os.path.join(run_artifacts_path, "final_snapshot.json.gz"))
+            result["assertion_results"] = evaluate_checklist(self.page, self.assertion_checklist)
+            
             # 保存控制台日志
             with open(os.path.join(logs_path, "console.log"), "w", encoding="utf-8") as f:
                 f.write("\n".join(console_logs))
@@ -154,7 +196,8 @@ class PlaywrightExecutor:
             "screenshot_path": None,
             "error_message": None,
             "start_time": datetime.utcnow().isoformat(),
-            "end_time": None
+            "end_time": None,
+            "stability_wait_ms": None
         }
         
         try:
@@ -187,6 +230,7 @@ class PlaywrightExecutor:
                 screenshot_name = f"step_{step['index']}.png"
                 screenshot_path = os.path.join(screenshots_path, screenshot_name)
                 self.page.screenshot(path=screenshot_path, full_page=True)
+                self._save_step_snapshot(screenshot_path)
                 # 保存相对路径
                 relative_path = screenshot_path.replace(self.artifacts_base_path, "").replace("\\", "/").lstrip("/")
                 step_result["screenshot_path"] = relative_path
@@ -205,11 +249,15 @@ class PlaywrightExecutor:
             
             # 默认截屏（不再进行单步视觉分析，只保存截图供后续整体分析）
             if step.get("screenshot", True) and action != "screenshot":
-                # 等待3秒让页面完全加载后再截图
-                self.page.wait_for_timeout(3000)
+                # 等待页面稳定后再截图（超过上限时直接截图）
+                stability = self.stability.wait(step.get("stability_timeout"))
+                step_result["stability_wait_ms"] = stability["waited_ms"]
+                if not stability["stable"]:
+                    print(f"⏱️ 步骤 {step_result['index']} 等待 {stability['waited_ms']}ms 后页面仍未稳定: {stability['pending']}")
                 screenshot_name = f"step_{step['index']}.png"
                 screenshot_path = os.path.join(screenshots_path, screenshot_name)
                 self.page.screenshot(path=screenshot_path, full_page=True)
+                self._save_step_snapshot(screenshot_path)
                 # 保存相对路径（相对于 artifacts 目录），以便前端可以访问
                 relative_path = screenshot_path.replace(self.artifacts_base_path, "").replace("\\", "/").lstrip("/")
                 step_result["screenshot_path"] = relative_path
@@ -221,13 +269,42 @@ class PlaywrightExecutor:
         step_result["end_time"] = datetime.utcnow().isoformat()
         return step_result
     
+    def _save_step_snapshot(self, screenshot_path: str):
+        """在截图旁保存页面文本快照，供文本分析模式使用"""
+        if settings.PAGE_SNAPSHOT_PER_STEP:
+            save_step_snapshot(self.page, screenshot_path)
+    
+    def _launch_browser(self, browser_type: str) -> Browser:
+        """不使用浏览器池时，为本次运行单独启动浏览器"""
+        self.playwright = sync_playwright().start()
+        if browser_type == "firefox":
+            return self.playwright.firefox.launch(headless=settings.BROWSER_HEADLESS)
+        elif browser_type == "webkit":
+            return self.playwright.webkit.launch(headless=settings.BROWSER_HEADLESS)
+        return self.playwright.chromium.launch(headless=settings.BROWSER_HEADLESS)
+    
     def _cleanup(self):
         """清理资源"""
+        crashed = False
         try:
             if self.page:
                 self.page.close()
             if self.context:
+                # 关闭上下文时才会写出 HAR 文件
                 self.context.close()
+        except Exception as e:
+            crashed = True
+            print(f"清理资源时出错: {e}")
+        
+        if self.pooled_browser:
+            # 浏览器由浏览器池在运行结束后回收，崩溃或达到运行次数上限的浏览器会被重启
+            if crashed:
+                self.pooled_browser.crashed = True
+            self.pooled_browser = None
+            self.browser = None
+            return
+        
+        try:
             if self.browser:
                 self.browser.close()
             if self.playwright:
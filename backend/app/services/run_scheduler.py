@@ -0,0 +1,429 @@
+"""
+测试运行调度服务
+以数据库中 queued 状态的 TestRun 作为持久化队列，按先进先出顺序在有限的工作线程中执行，
+并限制每个项目同时运行的数量。
+领取运行时写入 worker 标识和租约并定期续约，多个进程（API 进程或独立 worker）可以共用同一个数据库。
+"""
+import os
+import socket
+import threading
+from typing import Dict, Any, Callable, Optional, Set
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal, DATABASE_URL
+from app.models.test_case import TestCase
+from app.models.test_run import TestRun, TestRunStatus
+
+
+# 没有历史运行数据时，用于估算排队时间的单次运行耗时（秒）
+DEFAULT_RUN_DURATION_SECONDS = 60
+
+
+class RunScheduler:
+    """测试运行调度器"""
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        project_limit: int = 2,
+        poll_interval: float = 2.0,
+        worker_id: Optional[str] = None,
+        lease_seconds: int = 60,
+        heartbeat_interval: int = 15,
+        max_attempts: int = 2
+    ):
+        """
+        初始化调度器
+
+        Args:
+            max_workers: 同时执行的最大运行数
+            project_limit: 每个项目同时执行的最大运行数
+            poll_interval: 没有新任务通知时，扫描队列的间隔（秒）
+            worker_id: 当前进程的 worker 标识，默认使用 主机名-进程号
+            lease_seconds: 运行租约时长（秒）
+            heartbeat_interval: 续约间隔（秒）
+            max_attempts: 单个运行最多被领取的次数
+        """
+        self.max_workers = max_workers
+        self.project_limit = project_limit
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.max_attempts = max_attempts
+
+        self._runner: Optional[Callable[[int, int, str, str, int], None]] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._heartbeat_thread: Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        # 续约线程单独停止：stop() 之后正在执行的运行仍需续约，直到全部执行完毕
+        self._heartbeat_stop = threading.Event()
+        self._lock = threading.Lock()
+        self._active: Set[int] = set()
+        self._stats = {
+            "dispatched": 0,
+            "completed": 0,
+            "requeued": 0,
+            "expired": 0
+        }
+
+    def start(self, runner: Callable[[int, int, str, str, int], None]):
+        """
+        启动调度线程
+
+        Args:
+            runner: 执行单个运行的函数，参数为 (test_run_id, test_case_id, db_url, worker_id, attempt)；
+                worker_id 和 attempt 是本次领取的标识，写入最终结果时用于确认运行仍属于本次领取
+        """
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._runner = runner
+        self._stopping.clear()
+        self._heartbeat_stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="test-run")
+        self._recover_interrupted_runs()
+        self._thread = threading.Thread(target=self._dispatch_loop, name="run-scheduler", daemon=True)
+        self._thread.start()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name="run-heartbeat", daemon=True)
+        self._heartbeat_thread.start()
+        print(f"📋 运行调度器已启动: worker={self.worker_id}, workers={self.max_workers}, project_limit={self.project_limit}")
+
+    def run_forever(self, runner: Callable[[int, int, str, str, int], None]):
+        """
+        以前台方式运行调度器（独立 worker 进程使用），Ctrl+C 后等待正在执行的运行结束再退出
+
+        Args:
+            runner: 执行单个运行的函数
+        """
+        self.start(runner)
+        try:
+            while not self._stopping.wait(1):
+                pass
+        except KeyboardInterrupt:
+            print("⏹️ 收到停止信号，等待正在执行的运行完成...")
+        finally:
+            self.stop()
+            if self._executor:
+                self._executor.shutdown(wait=True)
+            # 所有运行结束后再停止续约，否则等待期间租约过期，运行会被其他 worker 重复执行
+            self._heartbeat_stop.set()
+            if self._heartbeat_thread:
+                self._heartbeat_thread.join()
+
+    def stop(self):
+        """停止调度，不再领取新任务（正在执行的运行会继续完成，并在完成前持续续约）"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    def notify(self):
+        """有新的运行入队时唤醒调度线程"""
+        self._wakeup.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取调度器统计数据"""
+        db = SessionLocal()
+        try:
+            queued = db.query(func.count(TestRun.id)).filter(TestRun.status == TestRunStatus.QUEUED).scalar() or 0
+        finally:
+            db.close()
+
+        with self._lock:
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "worker_id": self.worker_id,
+                "max_workers": self.max_workers,
+                "project_limit": self.project_limit,
+                "active": len(self._active),
+                "queued": queued,
+                **self._stats
+            }
+
+    def queue_estimates(self, db: Session) -> Dict[int, Dict[str, int]]:
+        """
+        一次计算所有排队中运行的队列位置和预计等待时间
+
+        按调度线程的规则模拟派发：先进先出，工作线程占满或项目达到并发上限时跳过，
+        每个运行的耗时取最近运行的平均耗时，正在执行的运行按已执行时间扣除。
+
+        Returns:
+            {run_id: {"queue_position": 位置（从 1 开始）, "eta_seconds": 预计开始执行前的等待秒数}}
+        """
+        queued_runs = (
+            db.query(TestRun.id, TestCase.project_id)
+            .join(TestCase, TestRun.test_case_id == TestCase.id)
+            .filter(TestRun.status == TestRunStatus.QUEUED)
+            .order_by(TestRun.id)
+            .all()
+        )
+        if not queued_runs:
+            return {}
+
+        running_runs = (
+            db.query(TestCase.project_id, TestRun.start_time)
+            .join(TestCase, TestRun.test_case_id == TestCase.id)
+            .filter(TestRun.status == TestRunStatus.RUNNING)
+            .all()
+        )
+        average = self._average_run_seconds(db)
+
+        now = datetime.utcnow()
+        # 执行中的运行: [(预计结束的相对时间, project_id)]
+        in_flight = []
+        for project_id, start_time in running_runs:
+            elapsed = (now - start_time).total_seconds() if start_time else 0
+            in_flight.append((max(average - elapsed, 0), project_id))
+
+        pending = list(queued_runs)
+        starts: Dict[int, float] = {}
+        clock = 0.0
+        while pending:
+            in_flight = [(end, project_id) for end, project_id in in_flight if end > clock]
+            free_slots = self.max_workers - len(in_flight)
+            running_by_project: Dict[int, int] = {}
+            for _, project_id in in_flight:
+                running_by_project[project_id] = running_by_project.get(project_id, 0) + 1
+
+            waiting = []
+            for run_id, project_id in pending:
+                if free_slots > 0 and running_by_project.get(project_id, 0) < self.project_limit:
+                    starts[run_id] = clock
+                    in_flight.append((clock + average, project_id))
+                    running_by_project[project_id] = running_by_project.get(project_id, 0) + 1
+                    free_slots -= 1
+                else:
+                    waiting.append((run_id, project_id))
+            pending = waiting
+            if pending:
+                # 推进到下一个运行结束的时刻
+                clock = min(end for end, _ in in_flight)
+
+        return {
+            run_id: {"queue_position": position, "eta_seconds": int(starts[run_id])}
+            for position, (run_id, _) in enumerate(queued_runs, start=1)
+        }
+
+    def queue_info(self, db: Session, test_run: TestRun) -> Dict[str, Optional[int]]:
+        """获取单个运行的队列位置和预计等待时间"""
+        if test_run.status != TestRunStatus.QUEUED:
+            return {"queue_position": None, "eta_seconds": None}
+        return self.queue_estimates(db).get(test_run.id, {"queue_position": None, "eta_seconds": None})
+
+    def _average_run_seconds(self, db: Session) -> float:
+        """最近运行的平均耗时（秒），没有历史数据时使用默认值"""
+        recent_runs = db.query(TestRun.start_time, TestRun.end_time).filter(
+            TestRun.status.in_([TestRunStatus.SUCCESS, TestRunStatus.FAILED, TestRunStatus.ERROR]),
+            TestRun.start_time.isnot(None),
+            TestRun.end_time.isnot(None)
+        ).order_by(TestRun.end_time.desc()).limit(20).all()
+
+        durations = [(end - start).total_seconds() for start, end in recent_runs if end >= start]
+        return sum(durations) / len(durations) if durations else DEFAULT_RUN_DURATION_SECONDS
+
+    def _recover_interrupted_runs(self):
+        """
+        将没有租约的 running 运行标记为错误
+
+        这些运行来自不支持租约的旧版本进程，无法判断是否仍在执行；带租约的运行由 _reap_expired_leases 处理。
+        """
+        db = SessionLocal()
+        try:
+            count = db.query(TestRun).filter(
+                TestRun.status == TestRunStatus.RUNNING,
+                TestRun.lease_expires_at.is_(None)
+            ).update({
+                TestRun.status: TestRunStatus.ERROR,
+                TestRun.error_message: "服务重启，运行被中断",
+                TestRun.end_time: datetime.utcnow()
+            }, synchronize_session=False)
+            db.commit()
+            if count:
+                print(f"⚠️ 已将 {count} 个中断的运行标记为错误")
+        except Exception as e:
+            print(f"❌ 恢复中断运行失败: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _dispatch_loop(self):
+        """调度主循环"""
+        while not self._stopping.is_set():
+            try:
+                self._reap_expired_leases()
+                self._dispatch_once()
+            except Exception as e:
+                print(f"❌ 调度运行失败: {e}")
+
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _heartbeat_loop(self):
+        """定期为本 worker 正在执行的运行续约，调度停止后继续续约到正在执行的运行全部结束"""
+        while not self._heartbeat_stop.wait(self.heartbeat_interval):
+            with self._lock:
+                active = list(self._active)
+            if not active:
+                if self._stopping.is_set():
+                    break
+                continue
+
+            db = SessionLocal()
+            try:
+                now = datetime.utcnow()
+                db.query(TestRun).filter(
+                    TestRun.id.in_(active),
+                    TestRun.worker_id == self.worker_id,
+                    TestRun.status == TestRunStatus.RUNNING
+                ).update({
+                    TestRun.heartbeat_at: now,
+                    TestRun.lease_expires_at: now + timedelta(seconds=self.lease_seconds)
+                }, synchronize_session=False)
+                db.commit()
+            except Exception as e:
+                print(f"❌ 运行续约失败: {e}")
+                db.rollback()
+            finally:
+                db.close()
+
+    def _reap_expired_leases(self):
+        """租约过期（worker 崩溃或失联）的运行重新入队，超过最大领取次数的标记为错误"""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            expired = TestRun.status == TestRunStatus.RUNNING, TestRun.lease_expires_at < now
+
+            requeued = db.query(TestRun).filter(
+                *expired,
+                TestRun.attempt_count < self.max_attempts
+            ).update({
+                TestRun.status: TestRunStatus.QUEUED,
+                TestRun.worker_id: None,
+                TestRun.lease_expires_at: None
+            }, synchronize_session=False)
+
+            failed = db.query(TestRun).filter(*expired).update({
+                TestRun.status: TestRunStatus.ERROR,
+                TestRun.error_message: "执行节点失联，运行已超过最大重试次数",
+                TestRun.end_time: now
+            }, synchronize_session=False)
+            db.commit()
+
+            if requeued or failed:
+                print(f"⚠️ 租约过期: {requeued} 个运行重新入队，{failed} 个运行标记为错误")
+                with self._lock:
+                    self._stats["requeued"] += requeued
+                    self._stats["expired"] += failed
+        except Exception as e:
+            print(f"❌ 回收过期租约失败: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _dispatch_once(self):
+        """按先进先出顺序领取可执行的运行，直到工作线程占满"""
+        with self._lock:
+            free_slots = self.max_workers - len(self._active)
+        if free_slots <= 0:
+            return
+
+        db = SessionLocal()
+        try:
+            # 各项目正在执行的运行数
+            running_by_project = dict(
+                db.query(TestCase.project_id, func.count(TestRun.id))
+                .join(TestCase, TestRun.test_case_id == TestCase.id)
+                .filter(TestRun.status == TestRunStatus.RUNNING)
+                .group_by(TestCase.project_id)
+                .all()
+            )
+
+            queued_runs = (
+                db.query(TestRun.id, TestRun.test_case_id, TestCase.project_id)
+                .join(TestCase, TestRun.test_case_id == TestCase.id)
+                .filter(TestRun.status == TestRunStatus.QUEUED)
+                .order_by(TestRun.id)
+                .limit(max(free_slots * 10, 50))
+                .all()
+            )
+
+            for run_id, test_case_id, project_id in queued_runs:
+                if free_slots <= 0:
+                    break
+
+                # 项目已达到并发上限时跳过，让后面其他项目的运行先执行
+                if running_by_project.get(project_id, 0) >= self.project_limit:
+                    continue
+
+                attempt = self._claim(db, run_id)
+                if attempt is None:
+                    continue
+
+                running_by_project[project_id] = running_by_project.get(project_id, 0) + 1
+                free_slots -= 1
+                self._submit(run_id, test_case_id, attempt)
+        finally:
+            db.close()
+
+    def _claim(self, db: Session, run_id: int) -> Optional[int]:
+        """
+        将运行从 queued 原子地更新为 running 并写入租约，只有更新成功的 worker 才能执行它
+
+        Returns:
+            领取成功时返回本次领取的序号（attempt_count），否则返回 None
+        """
+        now = datetime.utcnow()
+        updated = db.query(TestRun).filter(
+            TestRun.id == run_id,
+            TestRun.status == TestRunStatus.QUEUED
+        ).update({
+            TestRun.status: TestRunStatus.RUNNING,
+            TestRun.start_time: now,
+            TestRun.worker_id: self.worker_id,
+            TestRun.heartbeat_at: now,
+            TestRun.lease_expires_at: now + timedelta(seconds=self.lease_seconds),
+            TestRun.attempt_count: TestRun.attempt_count + 1
+        }, synchronize_session=False)
+        db.commit()
+        if updated != 1:
+            return None
+        return db.query(TestRun.attempt_count).filter(TestRun.id == run_id).scalar()
+
+    def _submit(self, run_id: int, test_case_id: int, attempt: int):
+        """提交到工作线程执行"""
+        with self._lock:
+            self._active.add(run_id)
+            self._stats["dispatched"] += 1
+
+        print(f"▶️ {self.worker_id} 领取运行 {run_id}（用例 {test_case_id}，第 {attempt} 次）")
+        self._executor.submit(self._run, run_id, test_case_id, attempt)
+
+    def _run(self, run_id: int, test_case_id: int, attempt: int):
+        """在工作线程中执行运行，结束后释放名额并唤醒调度线程"""
+        try:
+            self._runner(run_id, test_case_id, DATABASE_URL, self.worker_id, attempt)
+        except Exception as e:
+            print(f"❌ 运行 {run_id} 执行异常: {e}")
+        finally:
+            with self._lock:
+                self._active.discard(run_id)
+                self._stats["completed"] += 1
+            self.notify()
+
+
+# 进程级调度器
+run_scheduler = RunScheduler(
+    max_workers=settings.RUN_SCHEDULER_WORKERS,
+    project_limit=settings.RUN_SCHEDULER_PROJECT_LIMIT,
+    poll_interval=settings.RUN_SCHEDULER_POLL_INTERVAL,
+    lease_seconds=settings.RUN_LEASE_SECONDS,
+    heartbeat_interval=settings.RUN_HEARTBEAT_INTERVAL,
+    max_attempts=settings.RUN_MAX_ATTEMPTS
+)
@@ -0,0 +1,240 @@
+"""
+脚本增量重新生成
+记录脚本生成时所依据的标准化步骤，以及每个标准化步骤对应的脚本步骤数（step_map）；
+用户修改标准化步骤后，用 difflib 对比新旧步骤，只让模型生成新增/修改的步骤，
+未改动步骤对应的脚本步骤原样保留，再按顺序拼接并重新编号
+"""
+import json
+import difflib
+from typing import Dict, Any, List, Optional, Tuple
+
+
+EXECUTOR_TYPES = ("playwright", "midscene")
+
+# 每个片段前后提供给模型参考的脚本步骤数（延续选择器、URL 等上下文）
+CONTEXT_STEPS = 2
+
+
+def step_signature(step: Dict[str, Any]) -> str:
+    """标准化步骤的比较签名（忽略会随插入/删除变化的 index）"""
+    return json.dumps({k: v for k, v in step.items() if k != "index"}, sort_keys=True, ensure_ascii=False)
+
+
+def initial_step_map(standard_steps: List[Dict[str, Any]], script: Optional[Dict[str, Any]]) -> Optional[List[int]]:
+    """
+    整体生成或手动保存的脚本的 step_map
+
+    脚本步骤数与标准化步骤数相同时按一一对应处理，否则无法确定对应关系，返回 None（下次重新生成时整体生成）。
+    """
+    script_steps = (script or {}).get("steps") or []
+    if standard_steps and len(script_steps) == len(standard_steps):
+        return [1] * len(standard_steps)
+    return None
+
+
+def script_base_entry(standard_steps: List[Dict[str, Any]], step_map: Optional[List[int]]) -> Dict[str, Any]:
+    """script_base_steps 中单个执行器的记录"""
+    return {"standard_steps": standard_steps, "step_map": step_map}
+
+
+def with_script_base(
+    script_base_steps: Optional[Dict[str, Any]],
+    executor_type: str,
+    standard_steps: List[Dict[str, Any]],
+    script: Optional[Dict[str, Any]],
+    step_map: Optional[List[int]] = None
+) -> Dict[str, Any]:
+    """返回更新了指定执行器记录的 script_base_steps（新字典，便于 JSON 列检测到变化）"""
+    bases = dict(script_base_steps or {})
+    if step_map is None:
+        step_map = initial_step_map(standard_steps, script)
+    bases[executor_type] = script_base_entry(standard_steps, step_map)
+    return bases
+
+
+def plan_regeneration(
+    base: Optional[Dict[str, Any]],
+    standard_steps: List[Dict[str, Any]],
+    script: Optional[Dict[str, Any]]
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    对比生成脚本时的标准化步骤和当前步骤
+
+    Returns:
+        按顺序排列的操作列表，每项包含 tag（equal/replace/insert/delete）、
+        base_range / new_range（新旧标准化步骤区间）和 script_range（旧脚本步骤区间）；
+        没有记录、对应关系未知或与脚本不一致时返回 None，需要整体重新生成
+    """
+    if not base or not script:
+        return None
+    base_steps = base.get("standard_steps") or []
+    step_map = base.get("step_map")
+    script_steps = script.get("steps") or []
+    if not step_map or len(step_map) != len(base_steps) or sum(step_map) != len(script_steps):
+        return None
+
+    offsets = [0]
+    for count in step_map:
+        offsets.append(offsets[-1] + count)
+
+    matcher = difflib.SequenceMatcher(
+        a=[step_signature(s) for s in base_steps],
+        b=[step_signature(s) for s in standard_steps],
+        autojunk=False
+    )
+    return [
+        {
+            "tag": tag,
+            "base_range": (i1, i2),
+            "new_range": (j1, j2),
+            "script_range": (offsets[i1], offsets[i2])
+        }
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+    ]
+
+
+def segments_to_generate(
+    plan: List[Dict[str, Any]],
+    standard_steps: List[Dict[str, Any]],
+    script: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """
+    需要模型生成的片段（新增或修改的标准化步骤），附带被替换的旧脚本步骤和前后的脚本步骤作为上下文
+
+    片段的 id 为其在 plan 中的位置。
+    """
+    script_steps = script.get("steps") or []
+    segments = []
+    for position, op in enumerate(plan):
+        if op["tag"] not in ("replace", "insert"):
+            continue
+        j1, j2 = op["new_range"]
+        start, end = op["script_range"]
+        segments.append({
+            "id": position,
+            "standard_steps": standard_steps[j1:j2],
+            "replaced_script_steps": script_steps[start:end],
+            "previous_script_steps": script_steps[max(0, start - CONTEXT_STEPS):start],
+            "next_script_steps": script_steps[end:end + CONTEXT_STEPS]
+        })
+    return segments
+
+
+def splice_script(
+    script: Dict[str, Any],
+    base: Dict[str, Any],
+    plan: List[Dict[str, Any]],
+    generated: Dict[int, List[List[Dict[str, Any]]]]
+) -> Tuple[Dict[str, Any], List[int]]:
+    """
+    按 plan 拼接新脚本：未改动的片段沿用旧脚本步骤，新增/修改的片段使用模型生成的步骤，删除的片段丢弃
+
+    Args:
+        script: 旧脚本
+        base: 旧脚本的生成记录（standard_steps, step_map）
+        plan: plan_regeneration 的结果
+        generated: 片段 id -> 每个标准化步骤对应的脚本步骤列表
+
+    Returns:
+        (新脚本, 新的 step_map)；步骤按顺序重新编号，改动位置之前的步骤编号不变
+    """
+    old_steps = script.get("steps") or []
+    step_map = base["step_map"]
+    steps: List[Dict[str, Any]] = []
+    new_map: List[int] = []
+
+    for position, op in enumerate(plan):
+        if op["tag"] == "equal":
+            start, end = op["script_range"]
+            i1, i2 = op["base_range"]
+            steps.extend(old_steps[start:end])
+            new_map.extend(step_map[i1:i2])
+        elif op["tag"] in ("replace", "insert"):
+            for group in generated[position]:
+                steps.extend(group)
+                new_map.append(len(group))
+
+    new_script = dict(script)
+    new_script["steps"] = [dict(step, index=index) for index, step in enumerate(steps, 1)]
+    return new_script, new_map
+
+
+def normalize_generated_segments(
+    raw: Dict[str, Any],
+    segments: List[Dict[str, Any]]
+) -> Dict[int, List[List[Dict[str, Any]]]]:
+    """
+    校验模型返回的片段：每个片段必须存在，且每个标准化步骤对应一组脚本步骤
+
+    Raises:
+        ValueError: 片段缺失或步骤数量不匹配
+    """
+    by_id = {}
+    for item in raw.get("segments") or []:
+        if isinstance(item, dict) and isinstance(item.get("id"), int):
+            by_id[item["id"]] = item.get("steps")
+
+    generated = {}
+    for segment in segments:
+        groups = by_id.get(segment["id"])
+        expected = len(segment["standard_steps"])
+        if not isinstance(groups, list) or len(groups) != expected:
+            raise ValueError(f"片段 {segment['id']} 应包含 {expected} 组脚本步骤")
+        if not all(isinstance(group, list) and all(isinstance(step, dict) for step in group) for group in groups):
+            raise ValueError(f"片段 {segment['id']} 的脚本步骤格式错误")
+        generated[segment["id"]] = groups
+    return generated
+
+
+def regenerate_script(
+    llm_service,
+    case_name: str,
+    base_url: str,
+    executor_type: str,
+    standard_steps: List[Dict[str, Any]],
+    script: Optional[Dict[str, Any]],
+    base: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    根据当前标准化步骤重新生成脚本，能增量时只生成改动的步骤
+
+    Returns:
+        {script, step_map, mode, changed_steps}；mode 为 unchanged / incremental / full
+    """
+    plan = plan_regeneration(base, standard_steps, script)
+
+    if plan is not None:
+        if all(op["tag"] == "equal" for op in plan):
+            return {"script": script, "step_map": base["step_map"], "mode": "unchanged", "changed_steps": 0}
+
+        segments = segments_to_generate(plan, standard_steps, script)
+        try:
+            generated = {}
+            if segments:
+                generated = llm_service.generate_script_segments(
+                    case_name=case_name,
+                    base_url=base_url,
+                    executor_type=executor_type,
+                    segments=segments
+                )
+            new_script, step_map = splice_script(script, base, plan, generated)
+            changed = sum(
+                max(op["base_range"][1] - op["base_range"][0], op["new_range"][1] - op["new_range"][0])
+                for op in plan if op["tag"] != "equal"
+            )
+            print(f"✂️ 增量重新生成脚本: {len(segments)} 个片段，{changed} 个步骤有改动")
+            return {"script": new_script, "step_map": step_map, "mode": "incremental", "changed_steps": changed}
+        except ValueError as e:
+            # 模型返回的片段无法拼接时整体重新生成
+            print(f"⚠️ 增量生成结果无效，改为整体重新生成: {e}")
+
+    if executor_type == "midscene":
+        new_script = llm_service.generate_midscene_script(case_name=case_name, standard_steps=standard_steps, base_url=base_url)
+    else:
+        new_script = llm_service.generate_playwright_script(case_name=case_name, standard_steps=standard_steps, base_url=base_url)
+    return {
+        "script": new_script,
+        "step_map": initial_step_map(standard_steps, new_script),
+        "mode": "full",
+        "changed_steps": len(standard_steps)
+    }
@@ -0,0 +1,151 @@
+"""
+判定结果缓存服务
+按用例记录历史最终页面的精确指纹（缩小后截图像素的摘要 + 页面文本快照的摘要 + 预期结果）和判定结果，
+新运行的最终页面与历史记录完全一致时直接复用判定，跳过视觉模型调用。
+感知哈希无法区分文字（成功提示和错误提示的横幅只差几位），因此只做精确匹配；没有页面快照时不使用缓存
+"""
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from app.config import settings
+from app.services.page_snapshot import snapshot_searchable_text
+from app.utils.image_processing import pixel_digest, resolve_artifact_path
+
+
+class VerdictCache:
+    """基于最终页面精确指纹的判定结果缓存"""
+
+    # 只缓存视觉模型给出的明确判定，unknown 和回退判定下次仍交给模型
+    CACHEABLE_VERDICTS = ("passed", "failed")
+    MIN_CONFIDENCE = 0.8
+
+    def __init__(self, cache_dir: str, max_entries: int = 20):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir: 缓存目录，每个用例一个索引文件
+            max_entries: 每个用例最多保留的记录数
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def lookup(
+        self,
+        test_case_id: int,
+        expected_result: str,
+        screenshot_path: str,
+        page_snapshot: Optional[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        查找最终页面完全相同的历史判定
+
+        Returns:
+            命中时返回判定结果（已附带 cache 信息），否则返回 None
+        """
+        key = self._key(expected_result, screenshot_path, page_snapshot)
+        if key is None:
+            return None
+
+        with self._lock:
+            entries = self._load(test_case_id)
+        hit = next((entry for entry in reversed(entries) if entry.get("key") == key), None)
+        if hit is None:
+            return None
+
+        verdict_result = dict(hit["result"])
+        verdict_result["reason"] = f"[判定缓存命中: 最终页面与运行 #{hit['run_id']} 完全一致，复用其判定] {verdict_result.get('reason', '')}"
+        verdict_result["cache"] = {
+            "hit": True,
+            "source_run_id": hit["run_id"]
+        }
+        return verdict_result
+
+    def store(
+        self,
+        test_case_id: int,
+        expected_result: str,
+        screenshot_path: str,
+        page_snapshot: Optional[Dict[str, Any]],
+        verdict_result: Dict[str, Any],
+        run_id: int
+    ):
+        """记录一次由模型给出的判定"""
+        if verdict_result.get("verdict") not in self.CACHEABLE_VERDICTS:
+            return
+        if (verdict_result.get("confidence") or 0) < self.MIN_CONFIDENCE:
+            return
+        key = self._key(expected_result, screenshot_path, page_snapshot)
+        if key is None:
+            return
+
+        entry = {
+            "key": key,
+            "result": {k: v for k, v in verdict_result.items() if k != "cache"},
+            "run_id": run_id,
+            "created_at": datetime.utcnow().isoformat()
+        }
+        with self._lock:
+            # 旧格式（感知哈希）的记录不再使用，写入时一并清理
+            entries = [e for e in self._load(test_case_id) if "key" in e and e["key"] != key]
+            entries.append(entry)
+            self._save(test_case_id, entries[-self.max_entries:])
+
+    def clear(self, test_case_id: int):
+        """删除用例的缓存"""
+        with self._lock:
+            try:
+                os.remove(self._path(test_case_id))
+            except FileNotFoundError:
+                pass
+
+    def _key(
+        self,
+        expected_result: str,
+        screenshot_path: str,
+        page_snapshot: Optional[Dict[str, Any]]
+    ) -> Optional[str]:
+        """最终页面指纹，缺少页面快照或截图无法读取时返回 None（不使用缓存）"""
+        if not page_snapshot:
+            return None
+        try:
+            image_digest = pixel_digest(resolve_artifact_path(screenshot_path, settings.ARTIFACTS_PATH))
+        except Exception as e:
+            print(f"⚠️ 计算截图摘要失败: {e}")
+            return None
+        text = f"{page_snapshot.get('url', '')}\n{snapshot_searchable_text(page_snapshot)}"
+        payload = "\n".join([(expected_result or "").strip(), image_digest, text])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, test_case_id: int) -> str:
+        return os.path.join(self.cache_dir, f"case_{test_case_id}.json")
+
+    def _load(self, test_case_id: int) -> List[Dict[str, Any]]:
+        try:
+            with open(self._path(test_case_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            print(f"⚠️ 读取判定缓存失败: {e}")
+            return []
+
+    def _save(self, test_case_id: int, entries: List[Dict[str, Any]]):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(test_case_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+# 进程级判定缓存
+verdict_cache = VerdictCache(
+    cache_dir=os.path.join(settings.ARTIFACTS_PATH, "verdict_cache"),
+    max_entries=settings.VERDICT_CACHE_MAX_ENTRIES
+)
@@ -0,0 +1,138 @@
+"""
+本地规则判定
+预期结果中的关键文字都出现在最终页面快照上时判定通过（脚本末尾的断言步骤也通过时提高置信度），
+结论明确时无需调用视觉模型；无法确定时返回 None，交给视觉模型判定
+"""
+import re
+from typing import Dict, Any, List, Optional
+
+from app.services.page_snapshot import snapshot_searchable_text
+
+
+# 断言类步骤（执行成功即说明页面满足该条件）
+ASSERTION_ACTIONS = ("assertText", "assertVisible", "waitForSelector", "aiAssert", "aiWaitFor")
+# 不改变页面状态的步骤，查找末尾断言时跳过
+PASSIVE_ACTIONS = ("screenshot", "waitTime")
+
+# 预期结果中引号括起的文字
+QUOTED_PATTERN = re.compile(r"[\"“”'‘’「『]([^\"“”'‘’「」『』]{1,50})[\"“”'‘’」』]")
+# 中文提示词后的文字，如“页面显示欢迎回来”
+CN_CUE_PATTERN = re.compile(r"(?:显示|出现|看到|包含|提示|展示)(?:了|出|有)?[:：]?\s*([^，。,.;；!！?？\n、\s\"“”'‘’「」『』]{2,20})")
+# 英文提示词后的文字，如 "shows Welcome back"
+EN_CUE_PATTERN = re.compile(r"\b(?:shows?|displays?|contains?|sees?|reads?)\s+(?:the\s+|a\s+|an\s+)?([a-z0-9][\w '-]{1,40}?)(?=\s*(?:[,.;!?]|\band\b|$))")
+# 英文“X is visible”句式
+EN_VISIBLE_PATTERN = re.compile(r"(?:^|[,.;!?]|\band\b)\s*(?:the\s+|a\s+|an\s+)?([a-z0-9][\w '-]{1,40}?)\s+(?:is|are)\s+(?:visible|displayed|shown)\b")
+
+# 否定类预期（“不显示”“没有出现”等）无法通过文字存在性判断，交给视觉模型
+NEGATION_PATTERN = re.compile(r"不|没有|未|无法|消失|\bnot?\b|\bno longer\b|\bdisappear|\bhidden\b|\bwithout\b")
+# 页面提示中出现这些词时，即使预期文字存在也可能是失败场景
+ERROR_PATTERN = re.compile(r"错误|失败|异常|error|failed|exception", re.IGNORECASE)
+
+
+def extract_expected_phrases(expected_result: str) -> List[str]:
+    """从预期结果中提取应出现在页面上的文字"""
+    text = (expected_result or "").strip()
+    phrases = [m.group(1).strip() for m in QUOTED_PATTERN.finditer(text)]
+    phrases += [m.group(1).strip() for m in CN_CUE_PATTERN.finditer(text)]
+    lowered = text.lower()
+    phrases += [m.group(1).strip() for m in EN_CUE_PATTERN.finditer(lowered)]
+    phrases += [m.group(1).strip() for m in EN_VISIBLE_PATTERN.finditer(lowered)]
+
+    result = []
+    for phrase in phrases:
+        phrase = " ".join(phrase.split())
+        if len(phrase) >= 2 and phrase.lower() not in [p.lower() for p in result]:
+            result.append(phrase)
+    return result[:10]
+
+
+def tail_assertion_steps(script_steps: List[Dict[str, Any]], executed_steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    脚本末尾连续的、已执行成功的断言步骤
+
+    只有最后一个操作之后的断言反映最终页面状态，中途的断言不参与最终判定。
+    """
+    succeeded = {s.get("index") for s in executed_steps if s.get("status") == "success"}
+    assertions = []
+    for step in reversed(script_steps or []):
+        action = step.get("action")
+        if action in PASSIVE_ACTIONS:
+            continue
+        if action not in ASSERTION_ACTIONS or step.get("index") not in succeeded:
+            break
+        assertions.insert(0, step)
+    return assertions
+
+
+def evaluate_verdict_rules(
+    expected_result: str,
+    snapshot: Optional[Dict[str, Any]],
+    executed_steps: List[Dict[str, Any]],
+    script_steps: Optional[List[Dict[str, Any]]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    使用本地规则判定测试结果
+
+    Args:
+        expected_result: 预期结果描述
+        snapshot: 最终页面快照（见 page_snapshot.py）
+        executed_steps: 步骤执行结果
+        script_steps: 脚本步骤配置（用于识别末尾的断言步骤）
+
+    Returns:
+        结论明确时返回与 analyze_final_result 相同结构的判定（source 为 rules），否则返回 None
+    """
+    if not executed_steps or any(s.get("status") != "success" for s in executed_steps):
+        return None
+    if NEGATION_PATTERN.search((expected_result or "").lower()):
+        return None
+
+    checks = []
+    observations = []
+
+    for step in tail_assertion_steps(script_steps or [], executed_steps):
+        target = step.get("expected") or step.get("selector") or step.get("value") or step.get("description", "")
+        checks.append({"type": step["action"], "target": target, "passed": True})
+        observations.append({
+            "step_index": step.get("index"),
+            "type": "assertion",
+            "description": f"断言步骤 {step['action']} 通过: {target}",
+            "severity": "info"
+        })
+
+    phrases = extract_expected_phrases(expected_result)
+    if not phrases or not snapshot:
+        # 预期结果中没有可核对的文字时交给视觉模型：末尾的 waitForSelector / aiWaitFor 常只用于等待页面加载，
+        # 断言步骤通过不足以说明页面符合预期
+        return None
+
+    page_text = snapshot_searchable_text(snapshot)
+    for phrase in phrases:
+        found = " ".join(phrase.lower().split()) in page_text
+        checks.append({"type": "text", "target": phrase, "passed": found})
+        if not found:
+            # 预期文字不在页面上不一定是失败（可能是描述性文字），交给视觉模型
+            return None
+        observations.append({
+            "step_index": "final",
+            "type": "dom",
+            "description": f"最终页面包含预期文字: {phrase}",
+            "severity": "info"
+        })
+
+    if any(ERROR_PATTERN.search(alert) for alert in snapshot.get("alerts") or []) \
+            and not ERROR_PATTERN.search(expected_result or ""):
+        return None
+
+    # 末尾断言步骤也通过时提高置信度
+    has_assertions = any(c["type"] != "text" for c in checks)
+    confidence = 0.95 if has_assertions else 0.9
+
+    return {
+        "verdict": "passed",
+        "confidence": confidence,
+        "reason": "[规则判定] " + "；".join(o["description"] for o in observations),
+        "observations": observations,
+        "source": "rules",
+        "checks": checks
+    }
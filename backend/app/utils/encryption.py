@@ -5,10 +5,12 @@ from cryptography.fernet import Fernet
 from app.config import settings
 import base64
 import hashlib
+from functools import lru_cache
 
 
+@lru_cache(maxsize=1)
 def get_cipher():
-    """获取加密器"""
+    """获取加密器（密钥派生结果在进程内复用）"""
     # 使用JWT密钥派生加密密钥
     key = hashlib.sha256(settings.JWT_SECRET_KEY.encode()).digest()
     key_base64 = base64.urlsafe_b64encode(key)
@@ -0,0 +1,208 @@
+"""
+图片预处理工具 - 视觉分析前压缩截图
+按模型缩放到目标宽度，过长的整页截图切分为多张（超出数量上限时只保留开头和结尾），
+并重新编码为 JPEG/WebP，减少上传体积和图片 token
+"""
+import io
+import os
+import base64
+import hashlib
+from typing import Dict, Any, List, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+
+# 各模型家族的目标宽度（服务端也会缩放超大图片，提前缩小只减少上传体积和 token）。
+# 按顺序匹配第一个出现在模型名中的关键字，小模型（分级判定的低级模型）排在家族之前，使用更小的图片
+MODEL_TARGET_WIDTHS = (
+    ("mini", 768),
+    ("haiku", 1024),
+    ("flash", 1024),
+    ("claude", 1568),
+    ("gpt-4", 1024),
+    ("gpt-5", 1024),
+    ("qwen", 1280),
+    ("glm", 1280),
+)
+DEFAULT_TARGET_WIDTH = 1280
+
+# 单张切片的最大高宽比，超过后切分
+MAX_TILE_ASPECT = 1.6
+
+SUPPORTED_FORMATS = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+def target_width_for_model(model: str) -> int:
+    """模型对应的目标宽度"""
+    model = (model or "").lower()
+    for keyword, width in MODEL_TARGET_WIDTHS:
+        if keyword in model:
+            return width
+    return DEFAULT_TARGET_WIDTH
+
+
+def prepare_image_for_vision(
+    image_path: str,
+    max_width: int = DEFAULT_TARGET_WIDTH,
+    image_format: str = "JPEG",
+    quality: int = 80,
+    max_tiles: int = 3
+) -> Dict[str, Any]:
+    """
+    读取截图并压缩为适合视觉模型的图片
+
+    Args:
+        image_path: 截图路径
+        max_width: 目标宽度，更宽的图片等比缩小
+        image_format: 输出格式（JPEG / WEBP / PNG）
+        quality: JPEG/WebP 压缩质量（1-95）
+        max_tiles: 长截图最多切分的张数
+
+    Returns:
+        {images: [{mime_type, data}], original_bytes, encoded_bytes, saved_bytes, tiles, cropped}
+        data 为 base64 字符串
+    """
+    image_format = image_format.upper()
+    if image_format not in SUPPORTED_FORMATS:
+        image_format = "JPEG"
+
+    original_bytes = os.path.getsize(image_path)
+
+    with Image.open(image_path) as image:
+        image.load()
+        if image_format == "JPEG" and image.mode != "RGB":
+            # JPEG 不支持透明通道
+            image = image.convert("RGB")
+
+        if image.width > max_width:
+            height = round(image.height * max_width / image.width)
+            image = image.resize((max_width, height), Image.LANCZOS)
+
+        tiles, cropped = _split_tall_image(image, max_tiles)
+        encoded = [_encode(tile, image_format, quality) for tile in tiles]
+
+    encoded_bytes = sum(len(raw) for raw in encoded)
+    return {
+        "images": [
+            {"mime_type": SUPPORTED_FORMATS[image_format], "data": base64.b64encode(raw).decode("utf-8")}
+            for raw in encoded
+        ],
+        "original_bytes": original_bytes,
+        "encoded_bytes": encoded_bytes,
+        "saved_bytes": max(original_bytes - encoded_bytes, 0),
+        "tiles": len(encoded),
+        "cropped": cropped
+    }
+
+
+def build_contact_sheet(
+    image_paths: List[str],
+    labels: List[str],
+    cell_width: int = 480,
+    columns: int = 3,
+    image_format: str = "JPEG",
+    quality: int = 80
+) -> Dict[str, Any]:
+    """
+    将多张截图拼成一张带编号的缩略图总览（contact sheet）
+
+    每张截图缩放到 cell_width 宽，过长的截图只保留顶部一屏，左上角标注 labels 中对应的编号。
+
+    Returns:
+        与 prepare_image_for_vision 相同的结构（images 只有一张）
+    """
+    image_format = image_format.upper()
+    if image_format not in SUPPORTED_FORMATS:
+        image_format = "JPEG"
+
+    cell_height = int(cell_width * MAX_TILE_ASPECT)
+    rows = (len(image_paths) + columns - 1) // columns
+    sheet = Image.new("RGB", (cell_width * min(columns, len(image_paths)), cell_height * rows), "white")
+    draw = ImageDraw.Draw(sheet)
+    font = ImageFont.load_default()
+    original_bytes = 0
+
+    for idx, (image_path, label) in enumerate(zip(image_paths, labels)):
+        original_bytes += os.path.getsize(image_path)
+        with Image.open(image_path) as image:
+            image = image.convert("RGB")
+            height = round(image.height * cell_width / image.width)
+            thumb = image.resize((cell_width, height), Image.LANCZOS).crop((0, 0, cell_width, min(height, cell_height)))
+
+        left, top = (idx % columns) * cell_width, (idx // columns) * cell_height
+        sheet.paste(thumb, (left, top))
+        # 编号标签和分隔线，便于模型按编号引用
+        draw.rectangle((left, top, left + 48, top + 22), fill="black")
+        draw.text((left + 6, top + 5), label, fill="yellow", font=font)
+        draw.rectangle((left, top, left + cell_width - 1, top + cell_height - 1), outline="red", width=2)
+
+    raw = _encode(sheet, image_format, quality)
+    return {
+        "images": [{"mime_type": SUPPORTED_FORMATS[image_format], "data": base64.b64encode(raw).decode("utf-8")}],
+        "original_bytes": original_bytes,
+        "encoded_bytes": len(raw),
+        "saved_bytes": max(original_bytes - len(raw), 0),
+        "tiles": 1,
+        "cropped": False
+    }
+
+
+def resolve_artifact_path(image_path: str, artifacts_base_path: str) -> str:
+    """执行器保存的截图路径相对于 artifacts 目录，转换为可直接读取的路径"""
+    if os.path.isabs(image_path) or os.path.exists(image_path):
+        return image_path
+    return os.path.join(artifacts_base_path, image_path)
+
+
+def pixel_digest(image_path: str, width: int = 320) -> str:
+    """
+    缩小后像素的精确摘要
+
+    按宽度等比缩小（消除重复截图间的抗锯齿差异），对尺寸和 RGB 像素计算 SHA-256；
+    任何可见变化（包括文字）都会得到不同的摘要。
+
+    Returns:
+        十六进制摘要字符串
+    """
+    with Image.open(image_path) as image:
+        height = max(1, round(image.height * width / max(image.width, 1)))
+        small = image.convert("RGB").resize((width, height), Image.BILINEAR)
+        digest = hashlib.sha256(f"{small.width}x{small.height}".encode("utf-8"))
+        digest.update(small.tobytes())
+    return digest.hexdigest()
+
+
+def _split_tall_image(image: Image.Image, max_tiles: int) -> Tuple[List[Image.Image], bool]:
+    """
+    将过长的图片从上到下切分
+
+    Returns:
+        (切片列表, 是否丢弃了中间部分)
+    """
+    tile_height = int(image.width * MAX_TILE_ASPECT)
+    if image.height <= tile_height:
+        return [image], False
+
+    boxes = [
+        (0, top, image.width, min(top + tile_height, image.height))
+        for top in range(0, image.height, tile_height)
+    ]
+    cropped = False
+    if len(boxes) > max_tiles:
+        # 页面顶部（导航、提示信息）和底部（最终状态）最有用，丢弃中间部分
+        bottom = (0, image.height - tile_height, image.width, image.height)
+        boxes = boxes[:max(max_tiles - 1, 0)] + [bottom]
+        cropped = True
+    return [image.crop(box) for box in boxes], cropped
+
+
+def _encode(image: Image.Image, image_format: str, quality: int) -> bytes:
+    """编码单张图片"""
+    buffer = io.BytesIO()
+    options: Dict[str, Any] = {}
+    if image_format in ("JPEG", "WEBP"):
+        options["quality"] = max(1, min(int(quality), 95))
+    if image_format == "JPEG":
+        options["optimize"] = True
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
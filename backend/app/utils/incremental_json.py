@@ -0,0 +1,122 @@
+"""
+增量 JSON 解析工具 - 流式生成时提前取出数组元素
+逐段读入模型输出，顶层对象中指定数组（如 standard_steps / steps）的每个元素一旦完整就立即解析返回，
+无需等待整个 JSON 生成完毕；顶层对象之外的文字（如 markdown 代码块标记）会被忽略
+"""
+import json
+from typing import Any, List, Optional
+
+
+class IncrementalArrayExtractor:
+    """
+    从流式 JSON 文本中提取顶层对象里某个数组的元素
+
+    用法:
+        extractor = IncrementalArrayExtractor("steps")
+        for chunk in stream:
+            for step in extractor.feed(chunk):
+                ...
+    """
+
+    def __init__(self, array_key: str):
+        self.array_key = array_key
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        # 顶层对象中最近读完的字符串（可能是键）和当前值对应的键
+        self._last_string: Optional[str] = None
+        self._current_key: Optional[str] = None
+        # 目标数组所在的深度（进入数组后为 2），None 表示不在目标数组中
+        self._array_depth: Optional[int] = None
+        self._element_start: Optional[int] = None
+        self.finished = False
+        self.emitted = 0
+
+    def feed(self, chunk: str) -> List[Any]:
+        """
+        读入一段文本
+
+        Returns:
+            本段文本中新完成的数组元素（只提取对象或数组元素；无法解析的元素会被跳过，最终以完整 JSON 为准）
+        """
+        if not chunk or self.finished:
+            return []
+        self._text += chunk
+        elements = []
+        text = self._text
+
+        while self._pos < len(text):
+            i = self._pos
+            ch = text[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        try:
+                            self._last_string = json.loads(text[self._string_start:i + 1])
+                        except ValueError:
+                            self._last_string = None
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if self._depth == 0 and ch == "[":
+                    # 顶层必须是对象
+                    continue
+                if self._depth == 1 and ch == "[" and self._current_key == self.array_key:
+                    self._array_depth = 2
+                elif self._array_depth is not None and self._depth == self._array_depth:
+                    self._element_start = i
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    continue
+                self._depth -= 1
+                if self._array_depth is not None and self._depth == self._array_depth and self._element_start is not None:
+                    element = self._parse(text[self._element_start:i + 1])
+                    self._element_start = None
+                    if element is not None:
+                        elements.append(element)
+                elif self._array_depth is not None and self._depth == self._array_depth - 1:
+                    # 目标数组结束
+                    self._array_depth = None
+                    self.finished = True
+                    break
+            elif self._depth == 1:
+                if ch == ":":
+                    self._current_key = self._last_string
+                elif ch == ",":
+                    self._current_key = None
+                    self._last_string = None
+
+        # 只保留尚未完成的元素文本，避免长输出反复占用内存
+        keep_from = self._element_start if self._element_start is not None else self._pos
+        if self._in_string and self._depth == 1:
+            keep_from = min(keep_from, self._string_start)
+        if keep_from > 0:
+            self._text = self._text[keep_from:]
+            self._pos -= keep_from
+            self._string_start -= keep_from
+            if self._element_start is not None:
+                self._element_start -= keep_from
+
+        self.emitted += len(elements)
+        return elements
+
+    @staticmethod
+    def _parse(fragment: str) -> Optional[Any]:
+        try:
+            return json.loads(fragment)
+        except ValueError:
+            return None
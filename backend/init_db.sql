@@ -45,6 +45,9 @@ CREATE TABLE IF NOT EXISTS `test_case` (
     `standard_steps` JSON NOT NULL,
     `playwright_script` JSON NOT NULL,
     `expected_result` TEXT NOT NULL,
+    `assertion_checklist` JSON,
+    `assertion_checklist_hash` VARCHAR(64),
+    `script_base_steps` JSON,
     `created_by` INT NOT NULL,
     `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
@@ -59,7 +62,7 @@ CREATE TABLE IF NOT EXISTS `test_case` (
 CREATE TABLE IF NOT EXISTS `test_run` (
     `id` INT AUTO_INCREMENT PRIMARY KEY,
     `test_case_id` INT NOT NULL,
-    `status` ENUM('running', 'success', 'failed', 'error') NOT NULL,
+    `status` ENUM('queued', 'running', 'success', 'failed', 'error') NOT NULL,
     `trigger_by` INT NOT NULL,
     `start_time` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     `end_time` DATETIME,
@@ -68,12 +71,18 @@ CREATE TABLE IF NOT EXISTS `test_run` (
     `error_message` TEXT,
     `artifacts_path` VARCHAR(500),
     `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    `worker_id` VARCHAR(100),
+    `heartbeat_at` DATETIME,
+    `lease_expires_at` DATETIME,
+    `attempt_count` INT NOT NULL DEFAULT 0,
     FOREIGN KEY (`test_case_id`) REFERENCES `test_case`(`id`) ON DELETE CASCADE,
     FOREIGN KEY (`trigger_by`) REFERENCES `user`(`id`) ON DELETE RESTRICT,
     INDEX idx_test_case_id (`test_case_id`),
     INDEX idx_trigger_by (`trigger_by`),
     INDEX idx_status (`status`),
-    INDEX idx_start_time (`start_time`)
+    INDEX idx_start_time (`start_time`),
+    INDEX idx_worker_id (`worker_id`),
+    INDEX idx_lease_expires_at (`lease_expires_at`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='运行记录表';
 
 -- 步骤执行记录表
@@ -109,6 +118,45 @@ CREATE TABLE IF NOT EXISTS `audit_log` (
     INDEX idx_created_at (`created_at`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='审计日志表';
 
+-- 批量生成任务表
+CREATE TABLE IF NOT EXISTS `batch_generation_job` (
+    `id` VARCHAR(32) PRIMARY KEY COMMENT '任务ID',
+    `project_id` INT NOT NULL,
+    `created_by` INT NOT NULL,
+    `executor_type` VARCHAR(20) NOT NULL,
+    `status` VARCHAR(20) NOT NULL COMMENT 'running / saving / completed / failed',
+    `total` INT NOT NULL DEFAULT 0,
+    `completed` INT NOT NULL DEFAULT 0,
+    `succeeded` INT NOT NULL DEFAULT 0,
+    `failed` INT NOT NULL DEFAULT 0,
+    `error` TEXT,
+    `worker_id` VARCHAR(100) COMMENT '执行该任务的进程',
+    `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '执行进程最近一次更新时间',
+    `finished_at` DATETIME,
+    FOREIGN KEY (`project_id`) REFERENCES `project`(`id`) ON DELETE CASCADE,
+    FOREIGN KEY (`created_by`) REFERENCES `user`(`id`) ON DELETE RESTRICT,
+    INDEX idx_project_id (`project_id`),
+    INDEX idx_status (`status`),
+    INDEX idx_updated_at (`updated_at`),
+    INDEX idx_finished_at (`finished_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='批量生成任务表';
+
+-- 批量生成场景表
+CREATE TABLE IF NOT EXISTS `batch_generation_item` (
+    `id` INT AUTO_INCREMENT PRIMARY KEY,
+    `job_id` VARCHAR(32) NOT NULL,
+    `item_index` INT NOT NULL,
+    `natural_language` TEXT NOT NULL,
+    `status` VARCHAR(20) NOT NULL COMMENT 'pending / running / generated / saved / failed',
+    `name` VARCHAR(200),
+    `test_case_id` INT,
+    `error` TEXT,
+    `result` JSON COMMENT '生成结果，整批保存后清空',
+    FOREIGN KEY (`job_id`) REFERENCES `batch_generation_job`(`id`) ON DELETE CASCADE,
+    INDEX idx_job_id (`job_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='批量生成场景表';
+
 -- 插入默认管理员账号 (密码: admin, 使用bcrypt哈希)
 -- bcrypt哈希值: $2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewY5GyYIRSk7HRnW (对应密码: admin)
 INSERT INTO `user` (`username`, `password_hash`, `role`, `is_active`) 
@@ -8,6 +8,7 @@ from app.models.test_case import TestCase
 from app.models.test_run import TestRun
 from app.models.step_execution import StepExecution
 from app.models.audit_log import AuditLog
+from app.models.batch_generation import BatchGenerationJob, BatchGenerationItem
 from app.utils.security import get_password_hash
 
 def init_db():
@@ -6,7 +6,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
 from app.config import settings
-from app.api.endpoints import auth, users, projects, test_cases, test_runs, recorder, auth_states
+from app.api.endpoints import auth, users, projects, test_cases, test_runs, recorder, auth_states, system
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -32,6 +32,7 @@ app.include_router(test_cases.router, prefix="/api")
 app.include_router(test_runs.router, prefix="/api")
 app.include_router(recorder.router, prefix="/api")
 app.include_router(auth_states.router, prefix="/api")  # 认证状态管理
+app.include_router(system.router, prefix="/api")  # 系统状态
 
 # 配置静态文件服务 - 提供测试工件访问
 # artifacts目录在backend目录下
@@ -40,6 +41,33 @@ os.makedirs(artifacts_path, exist_ok=True)
 app.mount("/artifacts", StaticFiles(directory=artifacts_path), name="artifacts")
 
 
+@app.on_event("startup")
+def startup_event():
+    """应用启动时启动运行调度器（关闭内嵌调度时由独立 worker 执行运行）"""
+    from app.services.run_scheduler import run_scheduler
+    if settings.RUN_SCHEDULER_EMBEDDED:
+        run_scheduler.start(test_runs.execute_test_background)
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    """应用关闭时停止调度和批量生成，并释放浏览器池、异步 Playwright 执行器、Midscene sidecar、LLM 任务线程池和 LLM 客户端"""
+    from app.services.run_scheduler import run_scheduler
+    from app.services.browser_pool import browser_pool
+    from app.services.async_playwright_executor import async_playwright_runner
+    from app.services.midscene_sidecar import midscene_sidecar_pool
+    from app.services.llm_registry import llm_registry
+    from app.services import llm_executor
+    from app.services.batch_generation import batch_generation_jobs
+    run_scheduler.stop()
+    batch_generation_jobs.shutdown()
+    browser_pool.shutdown()
+    async_playwright_runner.shutdown()
+    midscene_sidecar_pool.shutdown()
+    llm_executor.shutdown()
+    llm_registry.shutdown()
+
+
 @app.get("/")
 async def root():
     """根路径"""
@@ -2,10 +2,13 @@
  * Midscene 执行器脚本
  * 接收测试用例配置，使用 Midscene AI 能力执行测试
  */
-import { chromium, firefox, webkit } from 'playwright';
+import { chromium, firefox, webkit, Browser } from 'playwright';
 import { PlaywrightAgent } from '@midscene/web/playwright';
 import * as fs from 'fs';
 import * as path from 'path';
+import * as zlib from 'zlib';
+import { pathToFileURL } from 'url';
+import yaml from 'js-yaml';
 
 interface MidsceneStep {
   index: number;
@@ -17,13 +20,13 @@ interface MidsceneStep {
   timeout?: number;
 }
 
-interface MidsceneScript {
+export interface MidsceneScript {
   browser: 'chromium' | 'firefox' | 'webkit';
   viewport: { width: number; height: number };
   steps: MidsceneStep[];
 }
 
-interface ExecutionResult {
+export interface ExecutionResult {
   success: boolean;
   steps: Array<{
     index: number;
@@ -33,19 +36,459 @@ interface ExecutionResult {
     error_message?: string;
     start_time: string;
     end_time: string;
+    stability_wait_ms?: number;
   }>;
   error_message?: string;
   artifacts_path: string;
   console_logs: string[];
+  page_snapshot?: PageSnapshot | null;
+  assertion_results?: AssertionCheckResult[] | null;
 }
 
-async function executeMidsceneScript(
+/**
+ * 断言清单检查项，结构与 app/services/assertion_checklist.py 一致
+ */
+export interface AssertionCheck {
+  type: 'text_present' | 'text_absent' | 'url_matches' | 'title_contains' | 'element_visible' | 'element_count';
+  value?: string;
+  selector?: string;
+  min?: number;
+  max?: number;
+  description?: string;
+}
+
+export type AssertionCheckResult = AssertionCheck & {
+  passed: boolean | null;
+  actual?: string | number;
+  error?: string;
+};
+
+/**
+ * 最终页面的文本/可访问性快照，结构与 app/services/page_snapshot.py 一致
+ */
+export interface PageSnapshot {
+  url: string;
+  title: string;
+  text: string;
+  text_truncated: boolean;
+  headings: string[];
+  buttons: string[];
+  links: string[];
+  inputs: Array<{ type: string; label: string; value: string }>;
+  alerts: string[];
+}
+
+type StepResult = ExecutionResult['steps'][number];
+
+/**
+ * Midscene AI 规划/定位缓存配置
+ * id 由平台按用例、脚本和起始页面计算，dir 为平台持久化缓存文件的目录
+ */
+export interface MidsceneCacheOptions {
+  id: string;
+  dir: string;
+}
+
+/**
+ * 执行过程中的流式事件，命令行模式下每个事件输出为 stdout 中的一行 JSON（NDJSON）
+ */
+export type ExecutionEvent =
+  | { event: 'step_start'; index: number; description: string; start_time: string }
+  | { event: 'step_end'; step: StepResult }
+  | {
+      event: 'run_end';
+      success: boolean;
+      error_message?: string;
+      artifacts_path: string;
+      console_logs: string[];
+      page_snapshot?: PageSnapshot | null;
+      assertion_results?: AssertionCheckResult[] | null;
+    };
+
+// 页面稳定性检测配置（截图前等待页面静止）
+const PAGE_STABILITY_TIMEOUT_MS = parseInt(process.env.PAGE_STABILITY_TIMEOUT_MS || '3000', 10);
+const PAGE_STABILITY_QUIET_MS = parseInt(process.env.PAGE_STABILITY_QUIET_MS || '500', 10);
+const PAGE_STABILITY_POLL_MS = 100;
+// 每步截图时是否在旁边保存页面文本快照
+const PAGE_SNAPSHOT_PER_STEP = process.env.PAGE_SNAPSHOT_PER_STEP !== 'false';
+
+// 在页面中记录最近一次DOM变化和布局偏移的时间
+const STABILITY_MONITOR_SCRIPT = () => {
+  const w = window as any;
+  if (w.__pageStability || !document.documentElement) return;
+  const state = { lastMutation: performance.now(), lastShift: performance.now() };
+  new MutationObserver(() => {
+    state.lastMutation = performance.now();
+  }).observe(document.documentElement, {
+    subtree: true,
+    childList: true,
+    attributes: true,
+    characterData: true,
+  });
+  try {
+    new PerformanceObserver((list) => {
+      for (const entry of list.getEntries() as any[]) {
+        if (!entry.hadRecentInput) state.lastShift = performance.now();
+      }
+    }).observe({ type: 'layout-shift', buffered: false } as any);
+  } catch (e) {
+    // 浏览器不支持 layout-shift 时只依赖 DOM 变化
+  }
+  w.__pageStability = state;
+};
+
+const STABILITY_PROBE_SCRIPT = () => {
+  const state = (window as any).__pageStability;
+  if (!state) return null;
+  const now = performance.now();
+  return {
+    mutationIdleMs: now - state.lastMutation,
+    shiftIdleMs: now - state.lastShift,
+    readyState: document.readyState,
+  };
+};
+
+// 快照中可见文本的最大长度
+const MAX_SNAPSHOT_TEXT_LENGTH = 8000;
+
+// 在页面中提取快照（与 app/services/page_snapshot.py 的 PAGE_SNAPSHOT_SCRIPT 保持一致）
+const PAGE_SNAPSHOT_SCRIPT = (maxTextLength: number) => {
+  const clean = (text: string | null | undefined) => (text || '').replace(/\s+/g, ' ').trim();
+  const visible = (el: Element) => {
+    const rect = el.getBoundingClientRect();
+    const style = window.getComputedStyle(el);
+    return rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none';
+  };
+  const collect = <T>(selector: string, limit: number, mapper: (el: any) => T) => {
+    const items: T[] = [];
+    for (const el of Array.from(document.querySelectorAll(selector))) {
+      if (items.length >= limit) break;
+      if (!visible(el)) continue;
+      const item = mapper(el);
+      if (item) items.push(item);
+    }
+    return items;
+  };
+  const label = (el: any) =>
+    clean(el.innerText || el.value || el.getAttribute('aria-label') || el.getAttribute('title'));
+
+  const text = clean(document.body ? document.body.innerText : '');
+  return {
+    url: location.href,
+    title: document.title,
+    text: text.slice(0, maxTextLength),
+    text_truncated: text.length > maxTextLength,
+    headings: collect('h1, h2, h3, h4, [role=heading]', 30, (el) => clean(el.innerText)),
+    buttons: collect('button, [role=button], input[type=submit], input[type=button]', 50, label),
+    links: collect('a[href]', 50, label),
+    inputs: collect('input:not([type=hidden]), textarea, select', 30, (el) => ({
+      type: el.type || el.tagName.toLowerCase(),
+      label: clean(
+        (el.labels && el.labels[0] && el.labels[0].innerText) ||
+          el.getAttribute('aria-label') ||
+          el.getAttribute('placeholder') ||
+          el.name
+      ),
+      value: el.type === 'password' ? '' : clean(el.value).slice(0, 100),
+    })),
+    alerts: collect('[role=alert], [role=status], [aria-live], [role=dialog]', 20, (el) => clean(el.innerText)),
+  };
+};
+
+/**
+ * 提取页面快照并以 gzip 压缩的 JSON 保存，失败时返回 null
+ */
+async function capturePageSnapshot(page: any, outputPath: string): Promise<PageSnapshot | null> {
+  try {
+    const snapshot: PageSnapshot = await page.evaluate(PAGE_SNAPSHOT_SCRIPT, MAX_SNAPSHOT_TEXT_LENGTH);
+    fs.writeFileSync(outputPath, zlib.gzipSync(JSON.stringify(snapshot)));
+    return snapshot;
+  } catch (error: any) {
+    console.error(`⚠️ 提取页面快照失败: ${error.message || error}`);
+    return null;
+  }
+}
+
+// 在页面中逐项核对断言清单（与 app/services/assertion_checklist.py 的 CHECKLIST_EVAL_SCRIPT 保持一致）
+const CHECKLIST_EVAL_SCRIPT = (checks: AssertionCheck[]): AssertionCheckResult[] => {
+  const norm = (text: string | null | undefined) => (text || '').replace(/\s+/g, ' ').trim().toLowerCase();
+  const visible = (el: Element) => {
+    const rect = el.getBoundingClientRect();
+    const style = window.getComputedStyle(el);
+    return rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none';
+  };
+  const bySelector = (selector: string) => Array.from(document.querySelectorAll(selector)).filter(visible);
+  const byText = (text: string) => {
+    const target = norm(text);
+    return Array.from(document.querySelectorAll('body *'))
+      .filter((el) => el.children.length === 0 || ['BUTTON', 'A', 'LABEL'].includes(el.tagName))
+      .filter((el: any) => visible(el) && norm(el.innerText || el.value).includes(target));
+  };
+  const bodyText = norm(document.body ? document.body.innerText : '');
+
+  const evaluate = (check: AssertionCheck): Omit<AssertionCheckResult, keyof AssertionCheck> => {
+    switch (check.type) {
+      case 'text_present':
+        return { passed: bodyText.includes(norm(check.value)) };
+      case 'text_absent':
+        return { passed: !bodyText.includes(norm(check.value)) };
+      case 'url_matches': {
+        let matched: boolean;
+        try {
+          matched = new RegExp(check.value!).test(location.href);
+        } catch (e) {
+          matched = location.href.includes(check.value!);
+        }
+        return { passed: matched, actual: location.href };
+      }
+      case 'title_contains':
+        return { passed: norm(document.title).includes(norm(check.value)), actual: document.title };
+      case 'element_visible': {
+        const count = check.selector ? bySelector(check.selector).length : byText(check.value!).length;
+        return { passed: count > 0, actual: count };
+      }
+      case 'element_count': {
+        const count = bySelector(check.selector!).length;
+        const min = check.min == null ? 1 : check.min;
+        return { passed: count >= min && (check.max == null || count <= check.max), actual: count };
+      }
+      default:
+        return { passed: null, error: `未知的检查类型: ${(check as any).type}` };
+    }
+  };
+
+  return checks.map((check) => {
+    try {
+      return { ...check, ...evaluate(check) };
+    } catch (e) {
+      // 选择器无效等情况，该项无法判断
+      return { ...check, passed: null, error: String(e) };
+    }
+  });
+};
+
+/**
+ * 在截图旁保存页面文本快照（step_N.png -> step_N.snapshot.json.gz），供文本分析模式使用
+ */
+async function saveStepSnapshot(page: any, screenshotPath: string): Promise<void> {
+  if (!PAGE_SNAPSHOT_PER_STEP) return;
+  await capturePageSnapshot(page, screenshotPath.replace(/\.png$/, '.snapshot.json.gz'));
+}
+
+/**
+ * 页面稳定性检测器
+ * 无进行中的请求、无DOM变化、无布局偏移且连续两帧相同时认为页面稳定
+ */
+class PageStabilityMonitor {
+  private inflight = new Set<any>();
+  private lastNetworkActivity = Date.now();
+
+  constructor(private page: any) {}
+
+  async attach(): Promise<void> {
+    this.page.on('request', (request: any) => {
+      // 长连接类请求永远不会结束，不计入进行中的请求
+      if (['eventsource', 'websocket'].includes(request.resourceType())) return;
+      this.inflight.add(request);
+      this.lastNetworkActivity = Date.now();
+    });
+    const onEnd = (request: any) => {
+      this.inflight.delete(request);
+      this.lastNetworkActivity = Date.now();
+    };
+    this.page.on('requestfinished', onEnd);
+    this.page.on('requestfailed', onEnd);
+    // 之后每次导航的新文档都会自动安装监控脚本
+    await this.page.addInitScript(STABILITY_MONITOR_SCRIPT);
+  }
+
+  async wait(maxWaitMs: number = PAGE_STABILITY_TIMEOUT_MS): Promise<{
+    stable: boolean;
+    waited_ms: number;
+    pending: string[];
+  }> {
+    const start = Date.now();
+    let lastFrame: Buffer | null = null;
+
+    while (true) {
+      let pending = await this.pendingConditions();
+
+      if (pending.length === 0) {
+        // 其他条件都满足后，再确认连续两帧画面一致
+        const frame = await this.page
+          .screenshot({ type: 'jpeg', quality: 50 })
+          .catch(() => null);
+        if (frame && lastFrame && frame.equals(lastFrame)) {
+          return { stable: true, waited_ms: Date.now() - start, pending: [] };
+        }
+        lastFrame = frame;
+        pending = ['frame'];
+      } else {
+        lastFrame = null;
+      }
+
+      if (Date.now() - start >= maxWaitMs) {
+        return { stable: false, waited_ms: Date.now() - start, pending };
+      }
+      await this.page.waitForTimeout(PAGE_STABILITY_POLL_MS);
+    }
+  }
+
+  private async pendingConditions(): Promise<string[]> {
+    const pending: string[] = [];
+    if (this.inflight.size > 0 || Date.now() - this.lastNetworkActivity < PAGE_STABILITY_QUIET_MS) {
+      pending.push('network');
+    }
+
+    let probe: any;
+    try {
+      probe = await this.page.evaluate(STABILITY_PROBE_SCRIPT);
+      if (!probe) {
+        // 当前文档在 attach 之前加载，补装监控脚本
+        await this.page.evaluate(STABILITY_MONITOR_SCRIPT);
+        pending.push('dom');
+        return pending;
+      }
+    } catch (e) {
+      // 导航过程中执行上下文被销毁
+      pending.push('navigation');
+      return pending;
+    }
+
+    if (probe.readyState !== 'complete') pending.push('load');
+    if (probe.mutationIdleMs < PAGE_STABILITY_QUIET_MS) pending.push('dom');
+    if (probe.shiftIdleMs < PAGE_STABILITY_QUIET_MS) pending.push('layout');
+    return pending;
+  }
+}
+
+/**
+ * 启动指定类型的浏览器
+ */
+export async function launchBrowser(browserType: string): Promise<Browser> {
+  const headless = process.env.BROWSER_HEADLESS === 'true';
+  if (browserType === 'firefox') {
+    return firefox.launch({ headless });
+  } else if (browserType === 'webkit') {
+    return webkit.launch({ headless });
+  }
+  return chromium.launch({ headless });
+}
+
+/**
+ * 步骤交给 Midscene 的提示词（与 executeStep 中的调用保持一致），用于定位对应的缓存记录
+ */
+function stepPrompt(step: MidsceneStep): string | null {
+  const action = step.action;
+  if (action === 'click' || action === 'aiTap') {
+    return step.description || step.selector || step.value || '';
+  }
+  if (action === 'fill' || action === 'aiInput') {
+    return step.description || step.selector || '';
+  }
+  if (['aiAction', 'aiAssert', 'aiWaitFor', 'aiQuery'].includes(action)) {
+    return step.description;
+  }
+  return null;
+}
+
+/**
+ * Midscene 读写缓存文件的位置（midscene_run/cache/<id>.cache.yaml）
+ */
+function midsceneCacheFile(cacheId: string): string {
+  const runDir = process.env.MIDSCENE_RUN_DIR || path.join(process.cwd(), 'midscene_run');
+  return path.join(runDir, 'cache', `${cacheId}.cache.yaml`);
+}
+
+/**
+ * 本次运行中 Midscene 使用的缓存 id
+ * 同一用例的多个运行可能在同一个 sidecar 中并发执行，每个运行使用自己的工作文件，互不覆盖
+ */
+function runCacheId(cache: MidsceneCacheOptions, runId: number): string {
+  return `${cache.id}-run${runId}`;
+}
+
+/**
+ * 先写临时文件再重命名，并发读取时不会读到写了一半的文件
+ */
+function writeFileAtomic(target: string, content: string): void {
+  const tmp = `${target}.${process.pid}.${Date.now()}.tmp`;
+  fs.writeFileSync(tmp, content, 'utf-8');
+  fs.renameSync(tmp, target);
+}
+
+/**
+ * 运行前把平台持久化的缓存复制为本次运行的工作文件
+ */
+function restoreCache(cache: MidsceneCacheOptions, runId: number): number {
+  const persisted = path.join(cache.dir, `${cache.id}.cache.yaml`);
+  const target = midsceneCacheFile(runCacheId(cache, runId));
+  fs.mkdirSync(path.dirname(target), { recursive: true });
+
+  if (!fs.existsSync(persisted)) {
+    // 没有可复用的缓存时清掉残留文件，避免读到已失效的记录
+    fs.rmSync(target, { force: true });
+    return 0;
+  }
+  fs.copyFileSync(persisted, target);
+  const content: any = yaml.load(fs.readFileSync(persisted, 'utf-8'));
+  return content?.caches?.length || 0;
+}
+
+/**
+ * 运行后剔除失败步骤对应的缓存记录，再持久化到平台目录，并在本次运行的工件中保留一份
+ */
+function persistCache(
+  cache: MidsceneCacheOptions,
+  runId: number,
+  failedPrompts: string[],
+  runArtifactsPath: string
+): void {
+  const source = midsceneCacheFile(runCacheId(cache, runId));
+  if (!fs.existsSync(source)) return;
+
+  const content: any = yaml.load(fs.readFileSync(source, 'utf-8')) || {};
+  const caches: any[] = content.caches || [];
+  const kept = caches.filter((record) => {
+    const prompt = typeof record.prompt === 'string' ? record.prompt : record.prompt?.prompt;
+    return !failedPrompts.includes(prompt);
+  });
+  if (kept.length < caches.length) {
+    console.log(`🧹 失效 ${caches.length - kept.length} 条 Midscene 缓存（对应步骤执行失败）`);
+  }
+  content.caches = kept;
+
+  const dumped = yaml.dump(content, { lineWidth: -1 });
+  fs.mkdirSync(cache.dir, { recursive: true });
+  writeFileAtomic(path.join(cache.dir, `${cache.id}.cache.yaml`), dumped);
+  fs.writeFileSync(path.join(runArtifactsPath, 'midscene_cache.yaml'), dumped, 'utf-8');
+  console.log(`💾 Midscene 缓存已保存: ${kept.length} 条记录`);
+}
+
+/**
+ * 执行 Midscene 脚本
+ * 传入 sharedBrowser 时（常驻 sidecar 模式）复用该浏览器，只为本次运行创建并关闭独立的上下文
+ */
+export async function executeMidsceneScript(
   scriptConfig: MidsceneScript,
   runId: number,
   artifactsBasePath: string,
   expectedResult: string,
-  authStatePath?: string  // 新增：认证状态路径
+  authStatePath?: string,  // 新增：认证状态路径
+  sharedBrowser?: Browser,
+  onEvent?: (event: ExecutionEvent) => void,
+  cache?: MidsceneCacheOptions,
+  checks?: AssertionCheck[],
+  signal?: AbortSignal
 ): Promise<ExecutionResult> {
+  const emit = (event: ExecutionEvent) => {
+    try {
+      onEvent?.(event);
+    } catch (error) {
+      console.error('事件回调失败:', error);
+    }
+  };
+
   const runArtifactsPath = path.join(artifactsBasePath, `runs/${runId}`);
   const screenshotsPath = path.join(runArtifactsPath, 'screenshots');
   const logsPath = path.join(runArtifactsPath, 'logs');
@@ -64,22 +507,25 @@ async function executeMidsceneScript(
   };
 
   const consoleLogs: string[] = [];
-  let browser = null;
+  let browser: Browser | null = null;
+  let context: any = null;
   let page = null;
   let agent = null;
+  const failedPrompts: string[] = [];
+
+  // 取消时立即关闭上下文，正在进行的页面操作随之失败，浏览器上下文不会被继续占用
+  const onAbort = () => {
+    console.error(`⏹️ 运行 ${runId} 已取消`);
+    if (context) context.close().catch(() => {});
+  };
+  signal?.addEventListener('abort', onAbort, { once: true });
+  const throwIfAborted = () => {
+    if (signal?.aborted) throw new Error('运行已取消');
+  };
 
   try {
-    // 启动浏览器
-    const browserType = scriptConfig.browser || 'chromium';
-    if (browserType === 'chromium') {
-      browser = await chromium.launch({ headless: false });
-    } else if (browserType === 'firefox') {
-      browser = await firefox.launch({ headless: false });
-    } else if (browserType === 'webkit') {
-      browser = await webkit.launch({ headless: false });
-    } else {
-      browser = await chromium.launch({ headless: false });
-    }
+    // 启动浏览器（sidecar 模式下复用已启动的浏览器）
+    browser = sharedBrowser || (await launchBrowser(scriptConfig.browser || 'chromium'));
 
     // 创建上下文（支持加载认证状态）
     const viewport = scriptConfig.viewport || { width: 1280, height: 720 };
@@ -93,9 +539,14 @@ async function executeMidsceneScript(
       console.log(`ℹ️ 未找到认证状态，使用新的浏览器会话`);
     }
     
-    const context = await browser.newContext(contextOptions);
+    context = await browser.newContext(contextOptions);
+    throwIfAborted();
     page = await context.newPage();
 
+    // 注册页面稳定性检测（截图前等待页面静止）
+    const stability = new PageStabilityMonitor(page);
+    await stability.attach();
+
     // 监听控制台日志
     page.on('console', (msg) => {
       const logEntry = `[${msg.type()}] ${msg.text()}`;
@@ -110,31 +561,63 @@ async function executeMidsceneScript(
     console.log(`  - MIDSCENE_MODEL_NAME: ${process.env.MIDSCENE_MODEL_NAME || '未设置'}`);
     console.log(`  - MIDSCENE_USE_QWEN_VL: ${process.env.MIDSCENE_USE_QWEN_VL || '未设置'}`);
     
-    agent = new PlaywrightAgent(page);
+    // 启用缓存后，命中的规划/定位结果直接复用，不再调用模型
+    if (cache) {
+      const restored = restoreCache(cache, runId);
+      console.log(`📦 Midscene 缓存 ${cache.id}: 复用 ${restored} 条记录`);
+    }
+    agent = new PlaywrightAgent(
+      page,
+      cache ? { cache: { id: runCacheId(cache, runId), strategy: 'read-write' } } : undefined
+    );
 
     // 执行步骤
     const steps = scriptConfig.steps || [];
     const totalSteps = steps.length;
 
     for (let idx = 0; idx < totalSteps; idx++) {
+      throwIfAborted();
       const step = steps[idx];
       const isLastStep = idx === totalSteps - 1;
+      emit({
+        event: 'step_start',
+        index: step.index || 0,
+        description: step.description || '',
+        start_time: new Date().toISOString(),
+      });
       const stepResult = await executeStep(
         agent,
         page,
         step,
         screenshotsPath,
         isLastStep,
-        artifactsBasePath  // 传递 artifacts 基础路径
+        artifactsBasePath,  // 传递 artifacts 基础路径
+        stability
       );
       result.steps.push(stepResult);
+      emit({ event: 'step_end', step: stepResult });
 
-      // 如果步骤失败，停止执行
+      // 如果步骤失败，停止执行（该步骤的缓存记录可能已失效）
       if (stepResult.status === 'failed') {
+        const prompt = stepPrompt(step);
+        if (prompt) failedPrompts.push(prompt);
         break;
       }
     }
 
+    // 记录最终页面快照，供本地规则判定使用
+    result.page_snapshot = await capturePageSnapshot(page, path.join(runArtifactsPath, 'final_snapshot.json.gz'));
+
+    // 核对预编译的断言清单
+    if (checks && checks.length > 0) {
+      result.assertion_results = await page
+        .evaluate(CHECKLIST_EVAL_SCRIPT, checks)
+        .catch((error: any) => {
+          console.error(`⚠️ 核对断言清单失败: ${error.message || error}`);
+          return null;
+        });
+    }
+
     // 保存控制台日志
     fs.writeFileSync(
       path.join(logsPath, 'console.log'),
@@ -148,11 +631,35 @@ async function executeMidsceneScript(
     result.error_message = error.message || String(error);
     result.success = false;
   } finally {
+    signal?.removeEventListener('abort', onAbort);
     // 清理资源
-    if (page) await page.close();
-    if (browser) await browser.close();
+    if (page) await page.close().catch(() => {});
+    if (context) await context.close().catch(() => {});
+    if (browser && !sharedBrowser) await browser.close();
+
+    // 取消的运行可能停在步骤中途，不保存其缓存
+    if (cache && !signal?.aborted) {
+      try {
+        persistCache(cache, runId, failedPrompts, runArtifactsPath);
+      } catch (error: any) {
+        console.error(`⚠️ 保存 Midscene 缓存失败: ${error.message || error}`);
+      }
+    }
+    if (cache) {
+      // 本次运行的工作文件已合并到持久化缓存
+      fs.rmSync(midsceneCacheFile(runCacheId(cache, runId)), { force: true });
+    }
   }
 
+  emit({
+    event: 'run_end',
+    success: result.success,
+    error_message: result.error_message,
+    artifacts_path: result.artifacts_path,
+    console_logs: result.console_logs,
+    page_snapshot: result.page_snapshot,
+    assertion_results: result.assertion_results,
+  });
   return result;
 }
 
@@ -162,8 +669,9 @@ async function executeStep(
   step: MidsceneStep,
   screenshotsPath: string,
   isLastStep: boolean,
-  artifactsBasePath: string  // 新增：artifacts 基础路径
-): Promise<any> {
+  artifactsBasePath: string,  // 新增：artifacts 基础路径
+  stability: PageStabilityMonitor
+): Promise<StepResult> {
   const stepResult = {
     index: step.index || 0,
     description: step.description || '',
@@ -172,6 +680,7 @@ async function executeStep(
     error_message: undefined as string | undefined,
     start_time: new Date().toISOString(),
     end_time: '',
+    stability_wait_ms: undefined as number | undefined,
   };
 
   try {
@@ -208,6 +717,7 @@ async function executeStep(
       const screenshotName = `step_${step.index}.png`;
       const screenshotPath = path.join(screenshotsPath, screenshotName);
       await page.screenshot({ path: screenshotPath, fullPage: true });
+      await saveStepSnapshot(page, screenshotPath);
       // 保存相对路径
       const relativePath = screenshotPath
         .replace(artifactsBasePath, '')
@@ -243,10 +753,16 @@ async function executeStep(
 
     // 默认截图（每步执行后）
     if ((step as any).screenshot !== false && action !== 'screenshot') {
-      await page.waitForTimeout(3000); // 等待页面稳定
+      // 等待页面稳定后再截图（超过上限时直接截图）
+      const stable = await stability.wait((step as any).stability_timeout);
+      stepResult.stability_wait_ms = stable.waited_ms;
+      if (!stable.stable) {
+        console.log(`⏱️ 步骤 ${step.index} 等待 ${stable.waited_ms}ms 后页面仍未稳定: ${stable.pending.join(',')}`);
+      }
       const screenshotName = `step_${step.index}.png`;
       const screenshotPath = path.join(screenshotsPath, screenshotName);
       await page.screenshot({ path: screenshotPath, fullPage: true });
+      await saveStepSnapshot(page, screenshotPath);
       // 保存相对路径（相对于 artifacts 目录）
       const relativePath = screenshotPath
         .replace(artifactsBasePath, '')
@@ -264,13 +780,17 @@ async function executeStep(
 }
 
 // 命令行接口
+// stdout 只输出 NDJSON 事件（每行一个），日志统一输出到 stderr，Python 端逐行读取并实时落库
 async function main() {
+  console.log = console.error;
+  console.info = console.error;
+
   try {
     // 从命令行参数获取配置
     const args = process.argv.slice(2);
     if (args.length < 4) {
       console.error(
-        'Usage: node executor.js <scriptConfigJson> <runId> <artifactsPath> <expectedResult> [authStatePath]'
+        'Usage: node executor.js <scriptConfigJson> <runId> <artifactsPath> <expectedResult> [authStatePath] [cacheOptionsJson] [checksJson]'
       );
       process.exit(1);
     }
@@ -280,20 +800,23 @@ async function main() {
     const artifactsPath = args[2];
     const expectedResult = args[3];
     const authStatePath = args[4] || '';  // 新增：认证状态路径（可选）
+    const cache: MidsceneCacheOptions | undefined = args[5] ? JSON.parse(args[5]) : undefined;
+    const checks: AssertionCheck[] = args[6] ? JSON.parse(args[6]) : [];
 
     const result = await executeMidsceneScript(
       scriptConfig,
       runId,
       artifactsPath,
       expectedResult,
-      authStatePath  // 传递认证状态路径
+      authStatePath,  // 传递认证状态路径
+      undefined,
+      (event) => process.stdout.write(JSON.stringify(event) + '\n'),
+      cache,
+      checks
     );
 
-    // 输出结果（Python 端可以解析）
-    console.log('===MIDSCENE_RESULT_START===');
-    console.log(JSON.stringify(result, null, 2));
-    console.log('===MIDSCENE_RESULT_END===');
-
+    // 等待 stdout 缓冲写完再退出，避免最后的事件丢失
+    await new Promise((resolve) => process.stdout.write('', resolve));
     process.exit(result.success ? 0 : 1);
   } catch (error: any) {
     console.error('Midscene executor error:', error);
@@ -301,4 +824,7 @@ async function main() {
   }
 }
 
-main();
+// 仅在作为命令行脚本直接执行时运行（被 sidecar 导入时不执行）
+if (process.argv[1] && import.meta.url === pathToFileURL(path.resolve(process.argv[1])).href) {
+  main();
+}
@@ -0,0 +1,112 @@
+/**
+ * Midscene 常驻执行进程（sidecar）
+ * 通过 stdin/stdout 按行收发 JSON-RPC 2.0 消息，复用同一个 Node 进程和浏览器执行多个脚本，
+ * 省去每次运行的 npx 解析、TypeScript 编译和 Node 启动开销。
+ *
+ * 请求: {"jsonrpc": "2.0", "id": 1, "method": "execute", "params": {script, runId, artifactsPath, expectedResult, authStatePath, cache}}
+ * 执行过程中的事件: {"jsonrpc": "2.0", "method": "event", "params": {"id": 1, ...ExecutionEvent}}
+ * 响应: {"jsonrpc": "2.0", "id": 1, "result": ExecutionResult}
+ * 其他方法: ping, shutdown
+ * 通知（不带 id，无响应）: {"jsonrpc": "2.0", "method": "cancel", "params": {"id": 1}} 中止对应请求并关闭其浏览器上下文
+ */
+import * as readline from 'readline';
+import { Browser } from 'playwright';
+import { executeMidsceneScript, launchBrowser } from './executor';
+
+// stdout 只用于协议消息，日志统一输出到 stderr
+console.log = console.error;
+console.info = console.error;
+
+const browsers = new Map<string, Promise<Browser>>();
+// 正在执行的请求，客户端超时后通过 cancel 通知中止
+const running = new Map<number, AbortController>();
+
+function send(message: any) {
+  process.stdout.write(JSON.stringify({ jsonrpc: '2.0', ...message }) + '\n');
+}
+
+/**
+ * 获取共享浏览器，首次使用或浏览器崩溃时启动
+ */
+async function getBrowser(browserType: string): Promise<Browser> {
+  const cached = browsers.get(browserType);
+  if (cached) {
+    const browser = await cached.catch(() => null);
+    if (browser && browser.isConnected()) return browser;
+  }
+  const launching = launchBrowser(browserType);
+  browsers.set(browserType, launching);
+  return launching;
+}
+
+async function shutdown() {
+  for (const launching of browsers.values()) {
+    const browser = await launching.catch(() => null);
+    if (browser) await browser.close().catch(() => {});
+  }
+  process.exit(0);
+}
+
+async function handleRequest(request: any) {
+  const { id, method, params } = request;
+
+  try {
+    if (method === 'ping') {
+      send({ id, result: 'pong' });
+    } else if (method === 'execute') {
+      const controller = new AbortController();
+      running.set(id, controller);
+      try {
+        const browser = await getBrowser(params.script.browser || 'chromium');
+        const result = await executeMidsceneScript(
+          params.script,
+          params.runId,
+          params.artifactsPath,
+          params.expectedResult || '',
+          params.authStatePath || '',
+          browser,
+          // 步骤事件带上请求 id，客户端据此分发给对应的运行
+          (event) => send({ method: 'event', params: { id, ...event } }),
+          params.cache || undefined,
+          params.checks || [],
+          controller.signal
+        );
+        send({ id, result });
+      } finally {
+        running.delete(id);
+      }
+    } else if (method === 'cancel') {
+      running.get(params?.id)?.abort();
+      if (id !== undefined) send({ id, result: 'ok' });
+    } else if (method === 'shutdown') {
+      send({ id, result: 'ok' });
+      await shutdown();
+    } else {
+      send({ id, error: { code: -32601, message: `Method not found: ${method}` } });
+    }
+  } catch (error: any) {
+    send({ id, error: { code: -32000, message: error?.message || String(error) } });
+  }
+}
+
+const rl = readline.createInterface({ input: process.stdin });
+
+rl.on('line', (line) => {
+  if (!line.trim()) return;
+
+  let request: any;
+  try {
+    request = JSON.parse(line);
+  } catch (error: any) {
+    send({ id: null, error: { code: -32700, message: `Parse error: ${error.message}` } });
+    return;
+  }
+
+  // 不等待上一个请求完成，多个脚本在同一进程中并发执行
+  handleRequest(request);
+});
+
+// 父进程关闭 stdin 时退出
+rl.on('close', shutdown);
+
+send({ method: 'ready', params: { pid: process.pid } });
@@ -0,0 +1,65 @@
+"""
+pytest 配置：将 backend 目录加入导入路径，并提供临时 SQLite 数据库
+执行命令（在 backend 目录下）:
+    pip install -r requirements-dev.txt
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+
+@pytest.fixture
+def db_factory(tmp_path):
+    """建好所有表的临时 SQLite 数据库的会话工厂（与 app.database.SessionLocal 配置一致）"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.database import Base
+    import app.models  # noqa: F401  注册所有模型
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def seed_case(db_factory):
+    """
+    创建用户、项目和用例，返回创建用例的函数 (project_name) -> (project_id, test_case_id)
+
+    第一次调用时创建用户 admin
+    """
+    from app.models import User, Project, TestCase
+
+    def create(project_name: str = "demo"):
+        db = db_factory()
+        try:
+            user = db.query(User).filter(User.username == "admin").first()
+            if user is None:
+                user = User(username="admin", password_hash="x", role="Admin", is_active=True)
+                db.add(user)
+                db.flush()
+            project = db.query(Project).filter(Project.name == project_name).first()
+            if project is None:
+                project = Project(
+                    name=project_name, base_url="https://example.com", llm_provider="openai",
+                    llm_model="gpt-4o", llm_api_key="encrypted", created_by=user.id
+                )
+                db.add(project)
+                db.flush()
+            test_case = TestCase(
+                project_id=project.id, name="用例", natural_language="打开首页", standard_steps=[],
+                playwright_script={"steps": []}, expected_result="页面显示\"欢迎\"", created_by=user.id
+            )
+            db.add(test_case)
+            db.commit()
+            return project.id, test_case.id
+        finally:
+            db.close()
+
+    return create
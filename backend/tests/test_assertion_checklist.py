@@ -0,0 +1,78 @@
+"""
+断言清单判定测试
+"""
+from app.services.assertion_checklist import verdict_from_checklist
+
+
+def check(passed, value="保存成功"):
+    return {"type": "text_present", "value": value, "passed": passed}
+
+
+def test_all_checks_passed_on_complete_checklist_passes():
+    verdict = verdict_from_checklist({"checks": [{}], "complete": True}, [check(True)])
+    assert verdict["verdict"] == "passed"
+    assert verdict["source"] == "checklist"
+
+
+def test_failed_check_is_uncertain():
+    # 模型编译的检查项可能写错，未通过时交给规则和视觉判定
+    checklist = {"checks": [{}, {}], "complete": True}
+    assert verdict_from_checklist(checklist, [check(True), check(False, "删除成功")]) is None
+
+
+def test_incomplete_or_unknown_results_are_uncertain():
+    assert verdict_from_checklist({"checks": [{}], "complete": False}, [check(True)]) is None
+    assert verdict_from_checklist({"checks": [{}], "complete": True}, [check(None)]) is None
+    assert verdict_from_checklist({"checks": [{}], "complete": True}, None) is None
+
+
+class FakeChecklistService:
+    def compile_assertion_checklist(self, expected_result, script_steps):
+        return {"checks": [{"type": "text_present", "value": "欢迎"}], "complete": True}
+
+
+def running_run(db_factory, test_case_id, worker_id="worker-a", attempt=1):
+    from app.models import TestRun
+    from app.models.test_run import TestRunStatus
+
+    db = db_factory()
+    try:
+        run = TestRun(test_case_id=test_case_id, status=TestRunStatus.RUNNING, trigger_by=1,
+                      worker_id=worker_id, attempt_count=attempt)
+        db.add(run)
+        db.commit()
+        return run.id
+    finally:
+        db.close()
+
+
+def test_checklist_is_saved_only_while_the_run_is_claimed(db_factory, seed_case, monkeypatch):
+    from app.api.endpoints import test_runs
+    from app.models import TestCase
+
+    monkeypatch.setattr(test_runs.settings, "ASSERTION_CHECKLIST_ENABLED", True)
+    _, case_id = seed_case()
+    run_id = running_run(db_factory, case_id, attempt=2)
+
+    # 租约已被回收并重新领取（attempt 变为 2），第 1 次领取的执行不能写入用例
+    db = db_factory()
+    test_case = db.get(TestCase, case_id)
+    stale = test_runs._ensure_assertion_checklist(
+        db, FakeChecklistService(), test_case, test_case.playwright_script, run_id, "worker-a", 1
+    )
+    assert stale is None
+    db.close()
+    db = db_factory()
+    assert db.get(TestCase, case_id).assertion_checklist_hash is None
+    db.close()
+
+    db = db_factory()
+    test_case = db.get(TestCase, case_id)
+    checklist = test_runs._ensure_assertion_checklist(
+        db, FakeChecklistService(), test_case, test_case.playwright_script, run_id, "worker-a", 2
+    )
+    db.close()
+    assert checklist["complete"]
+    db = db_factory()
+    assert db.get(TestCase, case_id).assertion_checklist == checklist
+    db.close()
@@ -0,0 +1,145 @@
+"""
+批量生成测试：逐条失败不影响其他场景，成功的用例在同一个事务中保存，执行进程退出的任务标记为失败，过期任务被清理
+"""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import TestCase
+from app.models.batch_generation import BatchGenerationItem, BatchGenerationJob
+from app.services import batch_generation as batch_generation_module
+from app.services.batch_generation import ACTIVE_STATUSES, BatchGenerationJobs
+
+
+class FakeLLMService:
+    def __init__(self, broken=()):
+        self.broken = broken
+
+    def generate_case_with_script(self, natural_language, base_url, executor_type="playwright"):
+        if natural_language.startswith("失败"):
+            raise ValueError("解析LLM响应失败")
+        result = {
+            "name": f"用例-{natural_language}",
+            "standard_steps": [{"index": 1, "action": "goto", "description": "打开首页", "value": base_url}],
+            "script": {"browser": "chromium", "steps": [{"index": 1, "action": "goto", "value": base_url}]},
+            "expected_result": "页面显示\"欢迎\""
+        }
+        if natural_language in self.broken:
+            # 生成阶段通过，保存时缺少必要字段
+            del result["expected_result"]
+        return result
+
+
+@pytest.fixture
+def jobs(db_factory, monkeypatch):
+    monkeypatch.setattr(batch_generation_module, "SessionLocal", db_factory)
+    jobs = BatchGenerationJobs(concurrency=2, job_ttl_seconds=3600, stale_seconds=3)
+    yield jobs
+    jobs.shutdown()
+
+
+def wait_for_job(jobs, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        snapshot = jobs.get(job_id)
+        if snapshot["status"] not in ACTIVE_STATUSES:
+            return snapshot
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def count_cases(db_factory):
+    db = db_factory()
+    try:
+        return db.query(TestCase).count()
+    finally:
+        db.close()
+
+
+def test_failed_items_do_not_block_the_rest(jobs, db_factory, seed_case):
+    project_id, _ = seed_case()
+    cases_before = count_cases(db_factory)
+
+    job = jobs.submit(project_id, 1, FakeLLMService(), "https://example.com", ["登录", "失败的场景", "搜索"])
+    snapshot = wait_for_job(jobs, job["job_id"])
+
+    assert snapshot["status"] == "completed"
+    assert (snapshot["completed"], snapshot["succeeded"], snapshot["failed"]) == (3, 2, 1)
+    assert [item["status"] for item in snapshot["items"]] == ["saved", "failed", "saved"]
+    assert snapshot["items"][1]["error"] == "解析LLM响应失败"
+    assert count_cases(db_factory) == cases_before + 2
+
+    db = db_factory()
+    saved = db.get(TestCase, snapshot["items"][0]["test_case_id"])
+    assert saved.name == "用例-登录" and saved.project_id == project_id
+    assert saved.playwright_script["steps"][0]["action"] == "goto"
+    # 保存后不再保留生成结果
+    assert all(item.result is None for item in db.query(BatchGenerationItem).all())
+    db.close()
+
+
+def test_save_failure_rolls_back_the_whole_batch(jobs, db_factory, seed_case):
+    project_id, _ = seed_case()
+    cases_before = count_cases(db_factory)
+
+    job = jobs.submit(project_id, 1, FakeLLMService(broken=("搜索",)), "https://example.com", ["登录", "搜索"])
+    snapshot = wait_for_job(jobs, job["job_id"])
+
+    assert snapshot["status"] == "failed"
+    assert snapshot["error"].startswith("保存用例失败")
+    assert (snapshot["succeeded"], snapshot["failed"]) == (0, 2)
+    assert all(item["status"] == "failed" and item["test_case_id"] is None for item in snapshot["items"])
+    assert count_cases(db_factory) == cases_before
+
+
+def test_job_fails_when_every_item_fails(jobs, seed_case):
+    project_id, _ = seed_case()
+
+    job = jobs.submit(project_id, 1, FakeLLMService(), "https://example.com", ["失败1", "失败2"])
+    snapshot = wait_for_job(jobs, job["job_id"])
+
+    assert snapshot["status"] == "failed"
+    assert snapshot["error"] == "所有场景生成失败"
+
+
+def add_job(db_factory, project_id, job_id, **fields):
+    db = db_factory()
+    try:
+        db.add(BatchGenerationJob(
+            id=job_id, project_id=project_id, created_by=1, executor_type="playwright", total=1,
+            items=[BatchGenerationItem(item_index=0, natural_language="登录", status="pending")],
+            **fields
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_stale_job_from_an_exited_worker_is_failed(jobs, db_factory, seed_case):
+    project_id, _ = seed_case()
+    now = datetime.utcnow()
+    add_job(db_factory, project_id, "stale", status="running", worker_id="gone", updated_at=now - timedelta(seconds=10))
+    add_job(db_factory, project_id, "alive", status="running", worker_id="other", updated_at=now)
+
+    stale = jobs.get("stale")
+
+    assert stale["status"] == "failed"
+    assert stale["error"] == "任务中断（处理进程已退出）"
+    assert jobs.get("alive")["status"] == "running"
+    stats = jobs.stats()
+    assert stats["jobs"] == 2 and stats["running"] == 1 and stats["pending_items"] == 2
+
+
+def test_expired_jobs_are_purged_on_submit(jobs, db_factory, seed_case):
+    project_id, _ = seed_case()
+    finished = datetime.utcnow() - timedelta(hours=2)
+    add_job(db_factory, project_id, "expired", status="completed", finished_at=finished, updated_at=finished)
+
+    job = jobs.submit(project_id, 1, FakeLLMService(), "https://example.com", ["登录"])
+    wait_for_job(jobs, job["job_id"])
+
+    assert jobs.get("expired") is None
+    db = db_factory()
+    assert db.query(BatchGenerationItem).filter(BatchGenerationItem.job_id == "expired").count() == 0
+    db.close()
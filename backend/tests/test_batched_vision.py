@@ -0,0 +1,106 @@
+"""
+批量视觉分析测试：多图和总览图模式按批次请求，模型返回的编号映射回各步骤，单批失败不影响其他批次
+"""
+import base64
+import io
+import json
+
+from PIL import Image
+
+from app.services.llm_service import LLMService
+from app.utils.image_processing import build_contact_sheet
+
+
+def screenshots(tmp_path, count):
+    paths = []
+    for idx in range(count):
+        path = tmp_path / f"step_{idx + 1}.png"
+        Image.new("RGB", (1920, 1080), "white").save(path)
+        paths.append(str(path))
+    return paths
+
+
+def make_service(replies, **config):
+    service = LLMService("openai", "gpt-4o", "sk-test", config={"rate_limit_rpm": 0, "vision_batch_size": 2, **config})
+    service.requests = []
+
+    def fake_call_vision(prompt, images, max_tokens=500, timeout=None, model=None, system=None):
+        service.requests.append({"prompt": prompt, "images": images, "system": system})
+        reply = replies(prompt)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    service._call_vision = fake_call_vision
+    return service
+
+
+def numbers_in(prompt):
+    return [int(line.split(":")[0][1:]) for line in prompt.splitlines() if line.startswith("#")]
+
+
+def answer_all(prompt):
+    return json.dumps([
+        {"step_index": number, "observation": f"第{number}张", "matches_expectation": True, "issues": []}
+        for number in numbers_in(prompt)
+    ], ensure_ascii=False)
+
+
+def test_multi_image_batches_map_answers_back_to_steps(tmp_path):
+    paths = screenshots(tmp_path, 3)
+    statuses = [{"description": f"步骤{idx + 1}"} for idx in range(3)]
+    service = make_service(answer_all)
+
+    results = service._analyze_screenshots_batched(paths, "显示首页", statuses, "multi_image")
+
+    assert len(service.requests) == 2
+    assert sorted(len(r["images"]) for r in service.requests) == [1, 2]
+    first = next(r for r in service.requests if len(r["images"]) == 2)
+    assert [image["label"] for image in first["images"]] == ["截图 #1（步骤: 步骤1）", "截图 #2（步骤: 步骤2）"]
+    width = Image.open(io.BytesIO(base64.b64decode(first["images"][0]["data"]))).width
+    assert width == 768
+    assert [r["step_index"] for r in results] == [1, 2, 3]
+    assert [r["analysis"]["observation"] for r in results] == ["第1张", "第2张", "第3张"]
+    assert results[2]["screenshot_path"] == paths[2]
+
+
+def test_contact_sheet_sends_one_image_per_batch(tmp_path):
+    paths = screenshots(tmp_path, 4)
+    service = make_service(answer_all, vision_batch_size=4)
+
+    results = service._analyze_screenshots_batched(paths, "显示首页", [], "contact_sheet")
+
+    assert len(service.requests) == 1
+    assert len(service.requests[0]["images"]) == 1
+    assert all(r["analysis"]["matches_expectation"] for r in results)
+
+
+def test_missing_answers_and_failed_batches_are_reported_per_step(tmp_path):
+    paths = screenshots(tmp_path, 4)
+
+    def reply(prompt):
+        numbers = numbers_in(prompt)
+        if 3 in numbers:
+            return RuntimeError("上游错误")
+        # 只返回第一张，且包在对象里
+        return json.dumps({"steps": [{"step_index": numbers[0], "observation": "ok", "matches_expectation": True}]})
+
+    results = make_service(reply)._analyze_screenshots_batched(paths, "显示首页", [], "multi_image")
+
+    analyses = [r["analysis"] for r in results]
+    assert analyses[0]["observation"] == "ok"
+    assert analyses[1] == {"error": "模型未返回该截图的分析"}
+    assert analyses[2]["error"].startswith("Vision API调用失败") and "上游错误" in analyses[2]["error"]
+    assert analyses[3]["error"] == analyses[2]["error"]
+
+
+def test_contact_sheet_layout(tmp_path):
+    paths = screenshots(tmp_path, 4)
+
+    sheet = build_contact_sheet(paths, ["#1", "#2", "#3", "#4"], cell_width=300, columns=3)
+
+    image = Image.open(io.BytesIO(base64.b64decode(sheet["images"][0]["data"])))
+    # 3 列 2 行，每格高为宽的 1.6 倍
+    assert image.size == (900, 960)
+    assert sheet["tiles"] == 1
+    assert sheet["original_bytes"] > 0
@@ -0,0 +1,124 @@
+"""
+浏览器池测试：使用假的 Playwright 驱动，验证复用、回收、崩溃替换、超出容量时的临时浏览器和关闭
+"""
+import threading
+
+import pytest
+
+from app.services import browser_pool as browser_pool_module
+from app.services.browser_pool import BrowserPool
+
+
+class FakeBrowser:
+    def __init__(self, browser_type):
+        self.browser_type = browser_type
+        self.connected = True
+        self.closed_in = None
+        self._handlers = []
+
+    def on(self, event, handler):
+        self._handlers.append(handler)
+
+    def is_connected(self):
+        return self.connected
+
+    def close(self):
+        self.connected = False
+        self.closed_in = threading.current_thread().name
+
+    def crash(self):
+        self.connected = False
+        for handler in self._handlers:
+            handler(self)
+
+
+class FakePlaywright:
+    instances = []
+
+    def __init__(self):
+        self.stopped = False
+        FakePlaywright.instances.append(self)
+
+    def start(self):
+        return self
+
+    def stop(self):
+        self.stopped = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    FakePlaywright.instances = []
+    monkeypatch.setattr(browser_pool_module, "sync_playwright", FakePlaywright)
+    pool = BrowserPool(max_size=1, max_runs_per_browser=3)
+    pool.launched = []
+
+    def launch(playwright, browser_type):
+        browser = FakeBrowser(browser_type)
+        pool.launched.append(browser)
+        return browser
+
+    pool._launch = launch
+    yield pool
+    pool.shutdown(timeout=5)
+
+
+def test_runs_reuse_the_warm_browser_on_the_host_thread(pool):
+    seen = [pool.run("chromium", lambda pb: (pb.browser, threading.current_thread().name)) for _ in range(2)]
+
+    assert seen[0][0] is seen[1][0]
+    assert seen[0][1] == seen[1][1] == "browser-host-1"
+    stats = pool.stats()
+    assert stats["launched"] == 1 and stats["reused"] == 1
+
+
+def test_browser_is_recycled_after_max_runs(pool):
+    browsers = [pool.run("chromium", lambda pb: pb.browser) for _ in range(4)]
+
+    assert browsers[0] is browsers[2]
+    assert browsers[3] is not browsers[0]
+    # 回收的浏览器在启动它的宿主线程中关闭
+    assert browsers[0].closed_in == "browser-host-1"
+    assert pool.stats()["recycled"] == 1
+
+
+def test_crashed_browser_is_replaced(pool):
+    first = pool.run("chromium", lambda pb: pb.browser)
+    first.crash()
+    second = pool.run("chromium", lambda pb: pb.browser)
+
+    assert second is not first
+    assert pool.stats()["crashed"] == 1
+
+
+def test_busy_pool_falls_back_to_a_transient_browser(pool):
+    started = threading.Event()
+    release = threading.Event()
+
+    def hold(pb):
+        started.set()
+        release.wait(5)
+        return pb
+
+    holder = threading.Thread(target=pool.run, args=("chromium", hold))
+    holder.start()
+    started.wait(5)
+    transient = pool.run("firefox", lambda pb: pb)
+    release.set()
+    holder.join(5)
+
+    assert not transient.pooled
+    assert not transient.browser.is_connected()
+    assert pool.stats()["transient"] == 1
+    # 临时浏览器的驱动用完即停止
+    assert sum(p.stopped for p in FakePlaywright.instances) == 1
+
+
+def test_shutdown_closes_idle_browsers_and_drivers(pool):
+    browser = pool.run("chromium", lambda pb: pb.browser)
+
+    pool.shutdown(timeout=5)
+
+    assert not browser.is_connected()
+    assert all(p.stopped for p in FakePlaywright.instances)
+    assert pool.stats()["pooled"] == 0
@@ -0,0 +1,67 @@
+"""
+用例和脚本合并生成测试：一次调用返回用例和脚本，缺少字段的响应报错且不写入缓存
+"""
+import json
+
+import pytest
+
+from app.services import llm_service as llm_service_module
+from app.services.llm_cache import LLMResponseCache
+from app.services.llm_service import LLMService
+
+COMPLETE = {
+    "name": "登录",
+    "standard_steps": [{"index": 1, "action": "goto", "description": "打开登录页", "value": "https://example.com/login"}],
+    "script": {"browser": "chromium", "steps": [{"index": 1, "action": "goto", "value": "https://example.com/login"}]},
+    "expected_result": "页面显示\"欢迎\""
+}
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_service_module, "llm_response_cache", LLMResponseCache(str(tmp_path / "llm_cache")))
+    service = LLMService("openai", "gpt-4o", "sk-test", config={"rate_limit_rpm": 0})
+    service.prompts = []
+    service.replies = []
+
+    def fake_call_llm(prompt):
+        service.prompts.append(prompt)
+        return service.replies.pop(0)
+
+    service._call_llm = fake_call_llm
+    return service
+
+
+def test_one_call_returns_case_and_script(service):
+    service.replies = ["```json\n" + json.dumps(COMPLETE, ensure_ascii=False) + "\n```"]
+
+    result = service.generate_case_with_script("打开登录页", "https://example.com")
+
+    assert result["name"] == "登录"
+    assert result["description"] == ""
+    assert result["script"]["steps"][0]["action"] == "goto"
+    assert len(service.prompts) == 1
+    assert "Playwright" in service.prompts[0] and "https://example.com" in service.prompts[0]
+    # 相同描述再次生成时直接使用缓存
+    assert service.generate_case_with_script("打开登录页", "https://example.com") == result
+    assert len(service.prompts) == 1
+
+
+def test_prompt_follows_the_executor_type(service):
+    service.replies = [json.dumps(COMPLETE)]
+
+    service.generate_case_with_script("打开登录页", "https://example.com", executor_type="midscene")
+
+    assert "Midscene AI" in service.prompts[0]
+
+
+def test_incomplete_response_is_rejected_and_not_cached(service):
+    incomplete = {key: value for key, value in COMPLETE.items() if key != "expected_result"}
+    incomplete["script"] = {"steps": []}
+    service.replies = [json.dumps(incomplete), json.dumps(COMPLETE)]
+
+    with pytest.raises(ValueError, match="expected_result, script.steps"):
+        service.generate_case_with_script("打开登录页", "https://example.com")
+
+    assert service.generate_case_with_script("打开登录页", "https://example.com")["name"] == "登录"
+    assert len(service.prompts) == 2
@@ -0,0 +1,67 @@
+"""
+并发截图分析测试：整体超时后放弃的调用不再重试，不继续占用限流配额
+"""
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+from PIL import Image
+
+from app.config import settings
+from app.services import llm_service as llm_service_module
+from app.services.llm_service import LLMService
+
+REPLY = {"observation": "ok", "matches_expectation": True, "confidence": 0.9, "issues": []}
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.release = threading.Event()
+        self.slow_calls = 0
+
+    def create(self, messages, **kwargs):
+        prompt = messages[-1]["content"][0]["text"]
+        if "慢步骤" in prompt:
+            self.slow_calls += 1
+            self.release.wait(5)
+            raise httpx.ConnectError("connection reset")
+        message = SimpleNamespace(content=json.dumps(REPLY))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def make_service() -> LLMService:
+    service = LLMService.__new__(LLMService)
+    service.provider = "openai"
+    service.model = "gpt-4o"
+    service.base_url = None
+    service.config = {"vision_timeout": 0.2, "vision_concurrency": 2, "rate_limit_rpm": 0}
+    service.rate_limit_key = "test|vision|concurrent"
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    return service
+
+
+def test_timed_out_call_does_not_keep_retrying(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_service_module, "VISION_OVERALL_TIMEOUT_GRACE", 0)
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 3)
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY", 0.01)
+    paths = []
+    for name in ("slow", "fast"):
+        path = tmp_path / f"{name}.png"
+        Image.new("RGB", (640, 360), "white").save(path)
+        paths.append(str(path))
+    service = make_service()
+    completions = service.client.chat.completions
+
+    analyses = service._analyze_screenshots_concurrently(
+        paths, "提示保存成功", [{"description": "慢步骤"}, {"description": "快步骤"}]
+    )
+
+    assert "超时" in analyses[0]["analysis"]["error"]
+    assert analyses[1]["analysis"]["matches_expectation"] is True
+
+    # 放弃后进行中的请求失败，不会再重试
+    completions.release.set()
+    time.sleep(0.5)
+    assert completions.slow_calls == 1
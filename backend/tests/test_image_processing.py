@@ -0,0 +1,83 @@
+"""
+截图预处理测试：按模型缩放、重新编码，以及长截图的切分和超出数量时保留首尾
+"""
+import base64
+import io
+
+from PIL import Image
+
+from app.utils.image_processing import prepare_image_for_vision, target_width_for_model
+
+
+def save(tmp_path, size, mode="RGB", name="shot.png"):
+    path = tmp_path / name
+    Image.new(mode, size, "white").save(path)
+    return str(path)
+
+
+def decode(image):
+    return Image.open(io.BytesIO(base64.b64decode(image["data"])))
+
+
+def test_target_width_matches_model_family():
+    assert target_width_for_model("gpt-4o-mini") == 768
+    assert target_width_for_model("claude-3-5-haiku-20241022") == 1024
+    assert target_width_for_model("claude-3-5-sonnet-20241022") == 1568
+    assert target_width_for_model("qwen-vl-max") == 1280
+    assert target_width_for_model("unknown-model") == 1280
+    assert target_width_for_model(None) == 1280
+
+
+def test_wide_screenshot_is_downscaled_and_reencoded(tmp_path):
+    path = save(tmp_path, (1920, 1080))
+
+    result = prepare_image_for_vision(path, max_width=1024)
+
+    assert result["tiles"] == 1 and not result["cropped"]
+    image = decode(result["images"][0])
+    assert image.format == "JPEG"
+    assert image.size == (1024, 576)
+    assert result["images"][0]["mime_type"] == "image/jpeg"
+    assert result["encoded_bytes"] == len(base64.b64decode(result["images"][0]["data"]))
+
+
+def test_small_screenshot_keeps_its_size_and_transparency_is_dropped(tmp_path):
+    path = save(tmp_path, (800, 600), mode="RGBA")
+
+    result = prepare_image_for_vision(path, max_width=1280)
+
+    image = decode(result["images"][0])
+    assert image.size == (800, 600) and image.mode == "RGB"
+
+
+def test_unsupported_format_falls_back_to_jpeg(tmp_path):
+    path = save(tmp_path, (800, 600))
+
+    assert prepare_image_for_vision(path, image_format="webp")["images"][0]["mime_type"] == "image/webp"
+    assert prepare_image_for_vision(path, image_format="gif")["images"][0]["mime_type"] == "image/jpeg"
+
+
+def test_tall_screenshot_is_split_into_tiles(tmp_path):
+    # 缩放到 1000 宽后高 3000，每张切片最高 1600
+    path = save(tmp_path, (2000, 6000))
+
+    result = prepare_image_for_vision(path, max_width=1000, max_tiles=3)
+
+    assert result["tiles"] == 2 and not result["cropped"]
+    assert [decode(image).size for image in result["images"]] == [(1000, 1600), (1000, 1400)]
+
+
+def test_tiles_over_the_limit_keep_top_and_bottom(tmp_path):
+    image = Image.new("RGB", (1000, 8000), "white")
+    # 页面最底部涂成黑色，用于确认最后一张是页面底部
+    image.paste(Image.new("RGB", (1000, 100), "black"), (0, 7900))
+    path = tmp_path / "long.png"
+    image.save(path)
+
+    result = prepare_image_for_vision(str(path), max_width=1000, max_tiles=3)
+
+    assert result["tiles"] == 3 and result["cropped"]
+    tiles = [decode(image).convert("RGB") for image in result["images"]]
+    assert all(tile.size == (1000, 1600) for tile in tiles)
+    assert tiles[0].getpixel((500, 1590)) == (255, 255, 255)
+    assert max(tiles[2].getpixel((500, 1590))) < 20
@@ -0,0 +1,66 @@
+"""
+增量 JSON 解析工具测试
+"""
+import json
+import random
+
+from app.utils.incremental_json import IncrementalArrayExtractor
+
+
+CASE = {
+    "name": "带 \"steps\": [ {干扰} 的名称",
+    "description": "[] {} 这些括号在字符串中",
+    "standard_steps": [
+        {
+            "index": i,
+            "action": "click",
+            "description": f"步骤 {{{i}}} 含转义 \\ 和 \"引号\"",
+            "nested": {"list": [1, {"text": "]"}]}
+        }
+        for i in range(1, 8)
+    ],
+    "expected_result": "完成"
+}
+
+
+def feed_in_chunks(extractor: IncrementalArrayExtractor, text: str, sizes) -> list:
+    elements = []
+    position = 0
+    for size in sizes:
+        if position >= len(text):
+            break
+        elements += extractor.feed(text[position:position + size])
+        position += size
+    elements += extractor.feed(text[position:])
+    return elements
+
+
+def test_extracts_elements_across_random_chunk_boundaries():
+    text = "```json\n" + json.dumps(CASE, ensure_ascii=False, indent=2) + "\n```"
+    rng = random.Random(0)
+    for _ in range(100):
+        extractor = IncrementalArrayExtractor("standard_steps")
+        sizes = [rng.randint(1, 9) for _ in range(len(text))]
+        assert feed_in_chunks(extractor, text, sizes) == CASE["standard_steps"]
+        assert extractor.finished
+        assert extractor.emitted == len(CASE["standard_steps"])
+
+
+def test_emits_each_element_as_soon_as_it_closes():
+    extractor = IncrementalArrayExtractor("steps")
+    assert extractor.feed('{"browser": "chromium", "steps": [{"index": 1}, {"index"') == [{"index": 1}]
+    assert extractor.feed(': 2}') == [{"index": 2}]
+    assert extractor.feed(']}') == []
+    assert extractor.finished
+
+
+def test_ignores_arrays_under_other_keys_and_nested_keys():
+    extractor = IncrementalArrayExtractor("steps")
+    text = '{"tags": [{"a": 1}], "meta": {"steps": [{"x": 1}]}, "steps": [{"index": 1}]}'
+    assert extractor.feed(text) == [{"index": 1}]
+
+
+def test_missing_key_yields_nothing():
+    extractor = IncrementalArrayExtractor("steps")
+    assert extractor.feed('{"standard_steps": [{"index": 1}]}') == []
+    assert not extractor.finished
@@ -0,0 +1,149 @@
+"""
+LLM响应缓存测试：并发相同请求只调用一次上游、异常和取消的传递、过期与淘汰，以及无法解析的响应不留在缓存中
+"""
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from app.services import llm_service as llm_service_module
+from app.services.llm_cache import LLMResponseCache
+from app.services.llm_executor import LLMTaskCancelled
+from app.services.llm_service import LLMService
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMResponseCache(str(tmp_path / "llm_cache"), ttl_seconds=3600, max_bytes=1024 * 1024)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def run_concurrently(count, target):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(target())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_identical_requests_call_upstream_once(cache):
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "响应"
+
+    threads, results = run_concurrently(5, lambda: cache.get_or_compute("k", compute))
+    wait_until(lambda: cache.stats()["coalesced"] == 4)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == ["响应"] * 5
+    assert cache.get("k") == "响应"
+    assert cache.stats()["inflight"] == 0
+
+
+def test_waiters_share_the_upstream_error(cache):
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise ValueError("上游错误")
+
+    def call():
+        try:
+            return cache.get_or_compute("k", failing)
+        except ValueError as e:
+            return str(e)
+
+    threads, results = run_concurrently(3, call)
+    wait_until(lambda: cache.stats()["coalesced"] == 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["上游错误"] * 3
+    # 失败的响应不写入缓存，下次重新调用
+    assert cache.get_or_compute("k", lambda: "重试成功") == "重试成功"
+
+
+def test_waiter_retries_when_the_first_caller_is_cancelled(cache):
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def cancelled():
+        started.set()
+        release.wait(5)
+        raise LLMTaskCancelled()
+
+    def owner():
+        try:
+            cache.get_or_compute("k", cancelled)
+        except LLMTaskCancelled as e:
+            errors.append(e)
+
+    owner_thread = threading.Thread(target=owner)
+    owner_thread.start()
+    started.wait(5)
+    waiter_threads, results = run_concurrently(1, lambda: cache.get_or_compute("k", lambda: "等待者的响应"))
+    wait_until(lambda: cache.stats()["coalesced"] == 1)
+    release.set()
+    owner_thread.join(5)
+    waiter_threads[0].join(5)
+
+    assert len(errors) == 1
+    assert results == ["等待者的响应"]
+
+
+def test_expired_entries_are_removed(cache):
+    cache.set("k", "旧响应")
+    path = os.path.join(cache.cache_dir, "k.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"created_at": time.time() - 7200, "response": "旧响应"}, f)
+
+    assert cache.get("k") is None
+    assert not os.path.exists(path)
+    assert cache.stats()["expired"] == 1
+
+
+def test_least_recently_used_entries_are_evicted_over_the_size_limit(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm_cache"), max_bytes=350)
+    cache.set("a", "x" * 100)
+    time.sleep(0.01)
+    cache.set("b", "x" * 100)
+    time.sleep(0.01)
+    cache.get("a")
+    cache.set("c", "x" * 100)
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.stats()["evicted"] == 1
+    # 重启后从磁盘恢复索引
+    assert LLMResponseCache(cache.cache_dir, max_bytes=350).stats()["entries"] == 2
+
+
+def test_unparseable_response_is_not_served_again(cache, monkeypatch):
+    monkeypatch.setattr(llm_service_module, "llm_response_cache", cache)
+    service = LLMService("openai", "gpt-4o", "sk-test", config={"rate_limit_rpm": 0})
+    replies = iter(["不是JSON", '{"name": "登录"}'])
+    service._call_llm = lambda prompt: next(replies)
+
+    with pytest.raises(ValueError):
+        service._call_llm_cached("生成用例", json.loads)
+    assert service._call_llm_cached("生成用例", json.loads) == {"name": "登录"}
+    # 第三次直接命中缓存
+    assert service._call_llm_cached("生成用例", json.loads) == {"name": "登录"}
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,92 @@
+"""
+LLM 任务执行器测试：接口任务在线程池中执行，客户端断开后取消；子任务取消标记
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.config import settings
+from app.services.llm_executor import (
+    CLIENT_CLOSED_REQUEST,
+    ChildCancelEvent,
+    LLMTaskCancelled,
+    run_llm_task,
+    sleep_unless_cancelled,
+    submit_llm_task,
+)
+
+
+def test_child_event_can_be_cancelled_alone():
+    parent = threading.Event()
+    child = ChildCancelEvent(parent)
+    sibling = ChildCancelEvent(parent)
+
+    child.set()
+
+    assert child.is_set() and child.wait(0)
+    assert not sibling.is_set()
+    assert not parent.is_set()
+
+
+def test_child_event_follows_parent():
+    parent = threading.Event()
+    child = ChildCancelEvent(parent)
+    assert not child.wait(0.05)
+
+    threading.Timer(0.05, parent.set).start()
+
+    assert child.wait(2)
+    assert child.is_set()
+
+
+class FakeRequest:
+    def __init__(self, disconnect_after=None):
+        self.disconnect_at = None if disconnect_after is None else time.monotonic() + disconnect_after
+
+    async def is_disconnected(self):
+        return self.disconnect_at is not None and time.monotonic() >= self.disconnect_at
+
+
+@pytest.fixture
+def fast_poll(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_DISCONNECT_POLL_INTERVAL", 0.02)
+
+
+def test_run_llm_task_runs_off_the_event_loop(fast_poll):
+    async def main():
+        loop_thread = threading.current_thread().name
+        result = await run_llm_task(FakeRequest(), lambda x: (x * 2, threading.current_thread().name), 21)
+        return loop_thread, result
+
+    loop_thread, (value, task_thread) = asyncio.run(main())
+
+    assert value == 42
+    assert task_thread != loop_thread and task_thread.startswith("llm-endpoint")
+
+
+def test_disconnect_cancels_the_running_task(fast_poll):
+    stopped = threading.Event()
+
+    def slow_llm_call():
+        try:
+            # 模拟限流等待或重试退避
+            sleep_unless_cancelled(5)
+        except LLMTaskCancelled:
+            stopped.set()
+            raise
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(run_llm_task(FakeRequest(disconnect_after=0.05), slow_llm_call))
+
+    assert exc_info.value.status_code == CLIENT_CLOSED_REQUEST
+    assert stopped.wait(2)
+
+
+def test_background_task_failures_are_only_logged():
+    def failing():
+        raise RuntimeError("后台失败")
+
+    assert submit_llm_task(failing).result(timeout=5) is None
@@ -0,0 +1,33 @@
+"""
+对冲备用提供商测试：项目密钥不会发给其他提供商或接口地址
+"""
+from app.services.llm_service import LLMService
+
+
+def make_service(hedge) -> LLMService:
+    return LLMService("openai", "gpt-4o", "sk-primary", config={"hedge": hedge})
+
+
+def test_other_provider_without_api_key_env_disables_hedging():
+    service = make_service({"provider": "dashscope", "model": "qwen-vl-max"})
+    assert service._hedge_service() is None
+    assert service._hedge_disabled
+
+    service = make_service({"provider": "openai", "base_url": "https://proxy.example.com/v1"})
+    assert service._hedge_service() is None
+
+
+def test_api_key_env_supplies_the_hedge_key(monkeypatch):
+    monkeypatch.setenv("HEDGE_KEY", "sk-hedge")
+    hedge = make_service({"provider": "dashscope", "model": "qwen-vl-max", "api_key_env": "HEDGE_KEY"})._hedge_service()
+    assert hedge.api_key == "sk-hedge"
+    assert hedge.provider == "dashscope"
+
+    monkeypatch.setenv("HEDGE_KEY", "")
+    assert make_service({"provider": "dashscope", "api_key_env": "HEDGE_KEY"})._hedge_service() is None
+
+
+def test_same_endpoint_reuses_the_project_key():
+    hedge = make_service({"provider": "openai", "model": "gpt-4o-mini"})._hedge_service()
+    assert hedge.api_key == "sk-primary"
+    assert hedge.model == "gpt-4o-mini"
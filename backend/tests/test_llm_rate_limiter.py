@@ -0,0 +1,106 @@
+"""
+LLM 限流测试：429 时按 Retry-After 等待并降低速率，不可重试的错误和过长的 Retry-After 直接失败
+"""
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services import llm_rate_limiter as rate_limiter_module
+from app.services.llm_rate_limiter import LLMRateLimiter, TokenBucket, _retry_after
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(status_code=status_code, headers=httpx.Headers(headers or {}))
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+
+    def sleep(seconds):
+        delays.append(seconds)
+        time.sleep(seconds)
+
+    monkeypatch.setattr(rate_limiter_module, "sleep_unless_cancelled", sleep)
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY", 0.01)
+    monkeypatch.setattr(settings, "LLM_RETRY_MAX_DELAY", 0.01)
+    return delays
+
+
+def flaky(errors, result="ok"):
+    errors = list(errors)
+
+    def fn():
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    return fn
+
+
+def test_retry_after_header_formats():
+    assert _retry_after(StatusError(429, {"retry-after": "3"})) == 3.0
+    assert _retry_after(StatusError(429, {"retry-after-ms": "1500"})) == 1.5
+    assert _retry_after(StatusError(429, {"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+    assert _retry_after(StatusError(429)) is None
+    assert _retry_after(ValueError("无响应")) is None
+
+
+def test_rate_limited_call_waits_for_retry_after_and_slows_the_bucket(sleeps):
+    limiter = LLMRateLimiter()
+    key = limiter.make_key("openai", None, "sk-test")
+
+    started = time.monotonic()
+    result = limiter.call(key, flaky([StatusError(429, {"retry-after": "0.2"})]), rate_per_minute=600, max_retries=2)
+
+    assert result == "ok"
+    # 退避至少等待 Retry-After，令牌桶在暂停期间也不发放令牌
+    assert sleeps[0] == 0.2
+    assert time.monotonic() - started >= 0.2
+    bucket = limiter._buckets[key]
+    assert bucket.rate < bucket.base_rate
+    stats = limiter.stats()[f"openai||{key.split('|')[2][:6]}"]
+    assert stats["rate_limited"] == 1 and stats["retries"] == 1 and stats["succeeded"] == 1
+
+
+def test_non_retryable_errors_and_long_retry_after_fail_immediately(sleeps):
+    limiter = LLMRateLimiter()
+    key = limiter.make_key("openai", None, "sk-test")
+
+    with pytest.raises(StatusError):
+        limiter.call(key, flaky([StatusError(400)]), rate_per_minute=0)
+    too_long = str(settings.LLM_RATE_LIMIT_MAX_WAIT + 60)
+    with pytest.raises(StatusError):
+        limiter.call(key, flaky([StatusError(429, {"retry-after": too_long})]), rate_per_minute=0)
+
+    assert sleeps == []
+
+
+def test_transient_errors_stop_after_max_retries(sleeps):
+    limiter = LLMRateLimiter()
+    key = limiter.make_key("openai", None, "sk-test")
+    timeouts = [httpx.ReadTimeout("超时") for _ in range(3)]
+
+    with pytest.raises(httpx.ReadTimeout):
+        limiter.call(key, flaky(timeouts), rate_per_minute=0, max_retries=2)
+
+    assert len(sleeps) == 2
+
+
+def test_bucket_pauses_during_retry_after_and_recovers_rate():
+    bucket = TokenBucket(rate_per_minute=60, capacity=1)
+    bucket.on_rate_limited(retry_after=30)
+
+    with pytest.raises(rate_limiter_module.RateLimitWaitTimeout):
+        bucket.acquire(max_wait=5)
+
+    assert bucket.rate == bucket.base_rate / 2
+    for _ in range(20):
+        bucket.on_success()
+    assert bucket.rate == bucket.base_rate
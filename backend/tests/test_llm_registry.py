@@ -0,0 +1,115 @@
+"""
+LLM服务注册表测试：按项目和配置复用实例，配置变化、失效和容量上限时重新创建
+"""
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import llm_registry as llm_registry_module
+from app.services.llm_registry import LLMServiceRegistry
+
+
+class FakeService:
+    created = []
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.client = SimpleNamespace(closed=False)
+        self.client.close = lambda: setattr(self.client, "closed", True)
+        FakeService.created.append(self)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    FakeService.created = []
+    decrypted = []
+
+    def decrypt(value):
+        decrypted.append(value)
+        return f"plain-{value}"
+
+    monkeypatch.setattr(llm_registry_module, "LLMService", FakeService)
+    monkeypatch.setattr(llm_registry_module, "decrypt_api_key", decrypt)
+    registry = LLMServiceRegistry(max_size=2)
+    registry.decrypted = decrypted
+    yield registry
+    registry.shutdown()
+
+
+def make_project(project_id=1, **fields):
+    values = dict(id=project_id, llm_provider="openai", llm_model="gpt-4o", llm_api_key="enc-1",
+                  llm_base_url=None, llm_config={"temperature": 0.2})
+    values.update(fields)
+    return SimpleNamespace(**values)
+
+
+def test_same_config_reuses_service_and_decrypts_once(registry):
+    project = make_project()
+    first = registry.get(project)
+    second = registry.get(make_project())
+
+    assert first is second
+    assert registry.decrypted == ["enc-1"]
+    assert first.kwargs["api_key"] == "plain-enc-1"
+    stats = registry.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_changed_key_or_config_creates_new_service(registry):
+    first = registry.get(make_project())
+
+    assert registry.get(make_project(llm_api_key="enc-2")) is not first
+    assert registry.get(make_project(), config_override={"temperature": 0}) is not first
+    assert registry.get(make_project(), config_override={"temperature": 0}).kwargs["config"] == {"temperature": 0}
+
+
+def test_invalidate_drops_only_that_project(registry):
+    first = registry.get(make_project(1))
+    other = registry.get(make_project(2))
+
+    registry.invalidate(1)
+
+    assert registry.get(make_project(1)) is not first
+    assert registry.get(make_project(2)) is other
+    assert registry.stats()["invalidated"] == 1
+
+
+def test_least_recently_used_service_is_evicted(registry):
+    first = registry.get(make_project(1))
+    second = registry.get(make_project(2))
+    registry.get(make_project(1))
+    registry.get(make_project(3))
+
+    assert registry.get(make_project(1)) is first
+    assert registry.get(make_project(2)) is not second
+    assert registry.stats()["evicted"] == 2
+
+
+def test_concurrent_misses_share_one_service(registry, monkeypatch):
+    barrier = threading.Barrier(4)
+
+    def slow_decrypt(value):
+        barrier.wait(5)
+        return value
+
+    monkeypatch.setattr(llm_registry_module, "decrypt_api_key", slow_decrypt)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get(make_project()))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(FakeService.created) == 4
+    assert all(service is results[0] for service in results)
+    assert registry.stats()["size"] == 1
+
+
+def test_shutdown_closes_clients(registry):
+    service = registry.get(make_project())
+
+    registry.shutdown()
+
+    assert service.client.closed
+    assert registry.stats()["size"] == 0
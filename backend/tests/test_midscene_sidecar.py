@@ -0,0 +1,146 @@
+"""
+Midscene sidecar 测试：用 Python 脚本代替 Node 进程，验证请求响应、事件回调、超时取消通知和进程池淘汰
+"""
+import subprocess
+import sys
+import textwrap
+import threading
+
+import pytest
+
+from app.services import midscene_sidecar as sidecar_module
+from app.services.midscene_sidecar import MidsceneSidecar, MidsceneSidecarError, MidsceneSidecarPool
+
+
+# 按行读写 JSON-RPC 的假 sidecar：echo 立即返回，events 先发事件再返回，hang 不返回，cancelled 返回收到的取消通知
+FAKE_SIDECAR = textwrap.dedent("""
+    import json, sys
+
+    def send(message):
+        sys.stdout.write(json.dumps(message) + "\\n")
+        sys.stdout.flush()
+
+    cancelled = []
+    send({"jsonrpc": "2.0", "method": "ready"})
+    for line in sys.stdin:
+        message = json.loads(line)
+        method = message.get("method")
+        if "id" not in message:
+            if method == "cancel":
+                cancelled.append(message["params"]["id"])
+            continue
+        request_id = message["id"]
+        if method == "echo":
+            send({"jsonrpc": "2.0", "id": request_id, "result": message["params"]})
+        elif method == "events":
+            for step in range(3):
+                send({"jsonrpc": "2.0", "method": "event", "params": {"id": request_id, "step": step}})
+            send({"jsonrpc": "2.0", "id": request_id, "result": "done"})
+        elif method == "fail":
+            send({"jsonrpc": "2.0", "id": request_id, "error": {"message": "脚本执行失败"}})
+        elif method == "cancelled":
+            send({"jsonrpc": "2.0", "id": request_id, "result": cancelled})
+""")
+
+
+@pytest.fixture
+def fake_node(tmp_path, monkeypatch):
+    script = tmp_path / "fake_sidecar.py"
+    script.write_text(FAKE_SIDECAR, encoding="utf-8")
+    real_popen = subprocess.Popen
+
+    def popen(cmd, **kwargs):
+        kwargs.pop("shell", None)
+        return real_popen([sys.executable, str(script)], **kwargs)
+
+    monkeypatch.setattr(sidecar_module.subprocess, "Popen", popen)
+    return tmp_path
+
+
+@pytest.fixture
+def sidecar(fake_node):
+    sidecar = MidsceneSidecar(fake_node, env=None)
+    sidecar.start(timeout=10)
+    yield sidecar
+    sidecar.close()
+
+
+def test_call_returns_result_and_delivers_events(sidecar):
+    assert sidecar.call("echo", {"value": 1}, timeout=5) == {"value": 1}
+
+    events = []
+    assert sidecar.call("events", timeout=5, on_event=events.append) == "done"
+    assert [e["step"] for e in events] == [0, 1, 2]
+    assert sidecar.in_flight == 0
+
+
+def test_error_response_raises(sidecar):
+    with pytest.raises(MidsceneSidecarError, match="脚本执行失败"):
+        sidecar.call("fail", timeout=5)
+
+
+def test_timed_out_request_is_cancelled_in_sidecar(sidecar):
+    with pytest.raises(TimeoutError):
+        sidecar.call("hang", timeout=0.3)
+
+    assert sidecar.in_flight == 0
+    # 超时后通知 sidecar 中止该请求（请求 id 为 1）
+    assert sidecar.call("cancelled", timeout=5) == [1]
+
+
+def test_close_fails_pending_requests(sidecar):
+    errors = []
+
+    def wait():
+        try:
+            sidecar.call("hang", timeout=10)
+        except MidsceneSidecarError as e:
+            errors.append(e)
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    while sidecar.in_flight == 0:
+        threading.Event().wait(0.01)
+    sidecar.close()
+    waiter.join(5)
+
+    assert len(errors) == 1
+    assert not sidecar.is_alive()
+
+
+def test_pool_evicts_idle_sidecar_outside_the_lock(fake_node):
+    pool = MidsceneSidecarPool(fake_node, max_size=1)
+    try:
+        first = pool.get({"MIDSCENE_MODEL_NAME": "a"})
+        assert pool.get({"MIDSCENE_MODEL_NAME": "a"}) is first
+
+        closed_with_lock = []
+        original_close = first.close
+
+        def close():
+            closed_with_lock.append(pool._lock.locked())
+            original_close()
+
+        first.close = close
+        second = pool.get({"MIDSCENE_MODEL_NAME": "b"})
+
+        assert second is not first
+        assert closed_with_lock == [False]
+        assert not first.is_alive()
+        stats = pool.stats()
+        assert stats["size"] == 1 and stats["evicted"] == 1 and stats["started"] == 2
+    finally:
+        pool.shutdown()
+
+
+def test_pool_restarts_exited_sidecar(fake_node):
+    pool = MidsceneSidecarPool(fake_node, max_size=2)
+    try:
+        first = pool.get({"MIDSCENE_MODEL_NAME": "a"})
+        first.close()
+        second = pool.get({"MIDSCENE_MODEL_NAME": "a"})
+
+        assert second is not first and second.is_alive()
+        assert pool.stats()["restarted"] == 1
+    finally:
+        pool.shutdown()
@@ -0,0 +1,100 @@
+"""
+页面稳定性检测测试：同步和异步检测器共用同一套判定逻辑
+"""
+import asyncio
+
+from app.services.page_stability import (
+    AsyncPageStabilityDetector,
+    PageStabilityDetector,
+    StabilityLogic,
+    NAVIGATING,
+    PROBE,
+    FRAME,
+    INSTALL,
+    SLEEP,
+)
+
+SETTLED = {"mutation_idle_ms": 1000, "shift_idle_ms": 1000, "ready_state": "complete"}
+
+
+def drive(steps, replies):
+    """按顺序回复判定过程请求的页面操作，返回 (操作列表, 结果)"""
+    actions = []
+    reply = None
+    while True:
+        try:
+            action = steps.send(reply)
+        except StopIteration as done:
+            return actions, done.value
+        actions.append(action)
+        reply = replies[action].pop(0) if replies.get(action) else None
+
+
+def settled_logic() -> StabilityLogic:
+    logic = StabilityLogic(max_wait_ms=5000, quiet_ms=0)
+    logic._last_network_activity -= 10
+    return logic
+
+
+def test_stable_after_two_identical_frames():
+    actions, result = drive(settled_logic().wait_steps(), {PROBE: [SETTLED, SETTLED], FRAME: ["a", "a"]})
+    assert actions == [PROBE, FRAME, SLEEP, PROBE, FRAME]
+    assert result["stable"] and result["pending"] == []
+
+
+def test_reinstalls_monitor_and_reports_navigation():
+    logic = settled_logic()
+    logic.max_wait_ms = 0
+    actions, result = drive(logic.wait_steps(), {PROBE: [None]})
+    assert actions == [PROBE, INSTALL]
+    assert result == {"stable": False, "waited_ms": result["waited_ms"], "pending": ["dom"]}
+
+    actions, result = drive(logic.wait_steps(), {PROBE: [NAVIGATING]})
+    assert result["pending"] == ["navigation"]
+
+
+def test_inflight_request_keeps_page_unstable():
+    logic = settled_logic()
+    logic._on_request_start(type("Request", (), {"resource_type": "fetch"})())
+    actions, result = drive(logic.wait_steps(0), {PROBE: [SETTLED]})
+    assert result["pending"] == ["network"]
+
+
+class FakeSyncPage:
+    def __init__(self):
+        self.sleeps = 0
+
+    def evaluate(self, script):
+        return SETTLED
+
+    def screenshot(self, **kwargs):
+        return b"frame"
+
+    def wait_for_timeout(self, ms):
+        self.sleeps += 1
+
+
+class FakeAsyncPage:
+    def __init__(self):
+        self.sleeps = 0
+
+    async def evaluate(self, script):
+        return SETTLED
+
+    async def screenshot(self, **kwargs):
+        raise RuntimeError("Target closed")
+
+
+def test_sync_and_async_adapters_share_the_logic():
+    page = FakeSyncPage()
+    detector = PageStabilityDetector(page, max_wait_ms=5000, quiet_ms=0, poll_interval_ms=1)
+    detector._last_network_activity -= 10
+    assert detector.wait()["stable"]
+    assert page.sleeps == 1
+
+    # 截图失败时帧哈希为 None，直到超时都不算稳定
+    detector = AsyncPageStabilityDetector(FakeAsyncPage(), max_wait_ms=20, quiet_ms=0, poll_interval_ms=1)
+    detector._last_network_activity -= 10
+    result = asyncio.run(detector.wait())
+    assert not result["stable"]
+    assert result["pending"] == ["frame"]
@@ -0,0 +1,119 @@
+"""
+运行租约测试：过期租约回收、续约，以及旧的领取不能再写入步骤和结果
+"""
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.api.endpoints.test_runs import _commit_if_claimed
+from app.models import StepExecution, TestRun
+from app.models.step_execution import StepStatus
+from app.models.test_run import TestRunStatus
+from app.services import run_scheduler as run_scheduler_module
+from app.services.run_scheduler import RunScheduler
+
+
+@pytest.fixture
+def make_scheduler(db_factory, monkeypatch):
+    monkeypatch.setattr(run_scheduler_module, "SessionLocal", db_factory)
+
+    def make(worker_id):
+        scheduler = RunScheduler(max_workers=2, project_limit=2, worker_id=worker_id, lease_seconds=60, max_attempts=2)
+        scheduler.submitted = []
+        scheduler._submit = lambda run_id, test_case_id, attempt: scheduler.submitted.append((run_id, attempt))
+        return scheduler
+
+    return make
+
+
+def add_run(db_factory, test_case_id, status=TestRunStatus.QUEUED, **fields):
+    db = db_factory()
+    try:
+        run = TestRun(test_case_id=test_case_id, status=status, trigger_by=1, **fields)
+        db.add(run)
+        db.commit()
+        return run.id
+    finally:
+        db.close()
+
+
+def load(db_factory, run_id):
+    db = db_factory()
+    try:
+        return db.get(TestRun, run_id)
+    finally:
+        db.close()
+
+
+def test_expired_leases_are_requeued_until_max_attempts(make_scheduler, db_factory, seed_case):
+    _, case_id = seed_case()
+    past = datetime.utcnow() - timedelta(seconds=5)
+    retry = add_run(db_factory, case_id, TestRunStatus.RUNNING, worker_id="gone", lease_expires_at=past, attempt_count=1)
+    exhausted = add_run(db_factory, case_id, TestRunStatus.RUNNING, worker_id="gone", lease_expires_at=past, attempt_count=2)
+    alive = add_run(db_factory, case_id, TestRunStatus.RUNNING, worker_id="other",
+                    lease_expires_at=datetime.utcnow() + timedelta(seconds=60), attempt_count=1)
+
+    make_scheduler("worker-a")._reap_expired_leases()
+
+    requeued = load(db_factory, retry)
+    assert requeued.status == TestRunStatus.QUEUED and requeued.worker_id is None
+    failed = load(db_factory, exhausted)
+    assert failed.status == TestRunStatus.ERROR and failed.end_time is not None
+    assert load(db_factory, alive).status == TestRunStatus.RUNNING
+
+
+def test_heartbeat_renews_only_this_workers_runs(make_scheduler, db_factory, seed_case):
+    _, case_id = seed_case()
+    soon = datetime.utcnow() + timedelta(seconds=1)
+    mine = add_run(db_factory, case_id, TestRunStatus.RUNNING, worker_id="worker-a", lease_expires_at=soon, attempt_count=1)
+    theirs = add_run(db_factory, case_id, TestRunStatus.RUNNING, worker_id="worker-b", lease_expires_at=soon, attempt_count=1)
+    scheduler = make_scheduler("worker-a")
+    scheduler.heartbeat_interval = 0.05
+    scheduler._active = {mine, theirs}
+
+    thread = threading.Thread(target=scheduler._heartbeat_loop)
+    thread.start()
+    threading.Event().wait(0.3)
+    scheduler._heartbeat_stop.set()
+    thread.join(5)
+
+    assert load(db_factory, mine).lease_expires_at > datetime.utcnow() + timedelta(seconds=30)
+    assert load(db_factory, theirs).lease_expires_at == soon
+
+
+def test_stale_attempt_cannot_write_after_reclaim(make_scheduler, db_factory, seed_case):
+    _, case_id = seed_case()
+    run_id = add_run(db_factory, case_id)
+    worker_a = make_scheduler("worker-a")
+    worker_a._dispatch_once()
+    assert worker_a.submitted == [(run_id, 1)]
+
+    # worker-a 失联：租约过期后运行重新入队并被 worker-b 领取
+    db = db_factory()
+    db.query(TestRun).filter(TestRun.id == run_id).update({TestRun.lease_expires_at: datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    db.close()
+    worker_b = make_scheduler("worker-b")
+    worker_b._reap_expired_leases()
+    worker_b._dispatch_once()
+    assert worker_b.submitted == [(run_id, 2)]
+
+    db = db_factory()
+    db.add(StepExecution(test_run_id=run_id, step_index=1, step_description="旧的执行",
+                         status=StepStatus.SUCCESS, start_time=datetime.utcnow()))
+    assert not _commit_if_claimed(db, run_id, "worker-a", 1, {TestRun.status: TestRunStatus.SUCCESS})
+    db.close()
+
+    db = db_factory()
+    db.add(StepExecution(test_run_id=run_id, step_index=1, step_description="新的执行",
+                         status=StepStatus.SUCCESS, start_time=datetime.utcnow()))
+    assert _commit_if_claimed(db, run_id, "worker-b", 2, {TestRun.llm_verdict: "passed"})
+    db.close()
+
+    db = db_factory()
+    steps = db.query(StepExecution).filter(StepExecution.test_run_id == run_id).all()
+    assert [step.step_description for step in steps] == ["新的执行"]
+    run = db.get(TestRun, run_id)
+    assert run.status == TestRunStatus.RUNNING and run.worker_id == "worker-b"
+    db.close()
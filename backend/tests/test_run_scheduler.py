@@ -0,0 +1,87 @@
+"""
+运行调度测试：先进先出派发、项目并发上限，以及排队位置和预计等待时间
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import TestRun
+from app.models.test_run import TestRunStatus
+from app.services import run_scheduler as run_scheduler_module
+from app.services.run_scheduler import RunScheduler
+
+
+@pytest.fixture
+def scheduler(db_factory, monkeypatch):
+    monkeypatch.setattr(run_scheduler_module, "SessionLocal", db_factory)
+    scheduler = RunScheduler(max_workers=3, project_limit=2, worker_id="worker-a")
+    scheduler.submitted = []
+    scheduler._submit = lambda run_id, test_case_id, attempt: scheduler.submitted.append((run_id, attempt))
+    return scheduler
+
+
+def add_run(db_factory, test_case_id, status, start_time=None, end_time=None):
+    db = db_factory()
+    try:
+        run = TestRun(test_case_id=test_case_id, status=status, trigger_by=1,
+                      start_time=start_time or datetime.utcnow(), end_time=end_time)
+        db.add(run)
+        db.commit()
+        return run.id
+    finally:
+        db.close()
+
+
+def test_queue_estimates_respect_worker_slots_and_project_limit(scheduler, db_factory, seed_case):
+    _, case_a = seed_case("a")
+    _, case_b = seed_case("b")
+    now = datetime.utcnow()
+    # 最近运行平均耗时 100 秒；项目 a 已有一个运行执行了 40 秒
+    add_run(db_factory, case_a, TestRunStatus.SUCCESS, now - timedelta(seconds=200), now - timedelta(seconds=100))
+    add_run(db_factory, case_a, TestRunStatus.RUNNING, now - timedelta(seconds=40))
+    queued = [add_run(db_factory, case, TestRunStatus.QUEUED) for case in (case_a, case_a, case_a, case_b)]
+
+    db = db_factory()
+    estimates = scheduler.queue_estimates(db)
+    db.close()
+
+    assert [estimates[run_id]["queue_position"] for run_id in queued] == [1, 2, 3, 4]
+    eta = [estimates[run_id]["eta_seconds"] for run_id in queued]
+    # 项目 a 上限为 2：第 1 个立即开始，第 2 个等执行中的运行结束（约 60 秒），第 3 个等第 1 个结束（100 秒）
+    assert eta[0] == 0
+    assert 58 <= eta[1] <= 60
+    assert eta[2] == 100
+    # 项目 b 的运行不受项目 a 的上限影响，使用剩余的工作线程立即开始
+    assert eta[3] == 0
+
+
+def test_queue_info_only_for_queued_runs(scheduler, db_factory, seed_case):
+    _, case_id = seed_case()
+    running = add_run(db_factory, case_id, TestRunStatus.RUNNING)
+    queued = add_run(db_factory, case_id, TestRunStatus.QUEUED)
+
+    db = db_factory()
+    assert scheduler.queue_info(db, db.get(TestRun, running)) == {"queue_position": None, "eta_seconds": None}
+    assert scheduler.queue_info(db, db.get(TestRun, queued))["queue_position"] == 1
+    db.close()
+
+
+def test_dispatch_skips_projects_at_their_limit(scheduler, db_factory, seed_case):
+    _, case_a = seed_case("a")
+    _, case_b = seed_case("b")
+    add_run(db_factory, case_a, TestRunStatus.RUNNING)
+    add_run(db_factory, case_a, TestRunStatus.RUNNING)
+    blocked = add_run(db_factory, case_a, TestRunStatus.QUEUED)
+    later = [add_run(db_factory, case_b, TestRunStatus.QUEUED) for _ in range(3)]
+
+    scheduler._dispatch_once()
+
+    # 项目 a 已达上限，项目 b 的运行先执行，同样受项目上限约束
+    assert [run_id for run_id, _ in scheduler.submitted] == later[:2]
+    db = db_factory()
+    assert db.get(TestRun, blocked).status == TestRunStatus.QUEUED
+    claimed = db.get(TestRun, later[0])
+    assert claimed.status == TestRunStatus.RUNNING
+    assert claimed.worker_id == "worker-a" and claimed.attempt_count == 1
+    assert claimed.lease_expires_at > datetime.utcnow()
+    db.close()
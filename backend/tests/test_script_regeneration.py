@@ -0,0 +1,105 @@
+"""
+脚本增量重新生成测试
+"""
+from app.services.script_regeneration import (
+    plan_regeneration,
+    segments_to_generate,
+    splice_script,
+    with_script_base,
+)
+
+
+def standard(*descriptions):
+    return [{"index": i, "action": "click", "description": d} for i, d in enumerate(descriptions, 1)]
+
+
+def script_for(*descriptions):
+    return {"browser": "chromium", "steps": [{"index": i, "action": "click", "selector": f"#{d}"} for i, d in enumerate(descriptions, 1)]}
+
+
+def test_unchanged_steps_plan_only_equal():
+    steps = standard("a", "b", "c")
+    script = script_for("a", "b", "c")
+    base = with_script_base(None, "playwright", steps, script)["playwright"]
+
+    plan = plan_regeneration(base, standard("a", "b", "c"), script)
+
+    assert [op["tag"] for op in plan] == ["equal"]
+
+
+def test_plan_ignores_index_changes():
+    steps = standard("a", "b")
+    script = script_for("a", "b")
+    base = with_script_base(None, "playwright", steps, script)["playwright"]
+    renumbered = [dict(step, index=step["index"] + 10) for step in steps]
+
+    assert [op["tag"] for op in plan_regeneration(base, renumbered, script)] == ["equal"]
+
+
+def test_plan_maps_changes_to_script_ranges_with_step_map():
+    base_steps = standard("a", "b", "c")
+    # 步骤 b 对应两个脚本步骤
+    script = script_for("a", "b1", "b2", "c")
+    base = with_script_base(None, "playwright", base_steps, script, step_map=[1, 2, 1])["playwright"]
+
+    plan = plan_regeneration(base, standard("a", "B", "c"), script)
+
+    assert [op["tag"] for op in plan] == ["equal", "replace", "equal"]
+    assert plan[1]["base_range"] == (1, 2)
+    assert plan[1]["script_range"] == (1, 3)
+    assert plan[2]["script_range"] == (3, 4)
+
+
+def test_plan_requires_consistent_base():
+    steps = standard("a", "b")
+    script = script_for("a", "b")
+
+    assert plan_regeneration(None, steps, script) is None
+    # 脚本步骤数与标准化步骤数不同，对应关系未知
+    assert plan_regeneration(with_script_base(None, "playwright", steps, script_for("a"))["playwright"], steps, script) is None
+    # step_map 与脚本步骤总数不一致（脚本被单独修改过）
+    base = with_script_base(None, "playwright", steps, script, step_map=[1, 2])["playwright"]
+    assert plan_regeneration(base, steps, script) is None
+
+
+def test_splice_keeps_unchanged_steps_and_renumbers():
+    base_steps = standard("a", "b", "c", "d")
+    script = script_for("a", "b1", "b2", "c", "d")
+    base = with_script_base(None, "playwright", base_steps, script, step_map=[1, 2, 1, 1])["playwright"]
+    new_steps = standard("a", "B", "x", "d")
+
+    plan = plan_regeneration(base, new_steps, script)
+    segments = segments_to_generate(plan, new_steps, script)
+    assert len(segments) == 1
+    segment = segments[0]
+    assert [s["description"] for s in segment["standard_steps"]] == ["B", "x"]
+    assert [s["selector"] for s in segment["replaced_script_steps"]] == ["#b1", "#b2", "#c"]
+
+    generated = {segment["id"]: [
+        [{"index": 0, "action": "click", "selector": "#B"}],
+        [{"index": 0, "action": "fill", "selector": "#x1"}, {"index": 0, "action": "click", "selector": "#x2"}],
+    ]}
+    new_script, step_map = splice_script(script, base, plan, generated)
+
+    assert [s["selector"] for s in new_script["steps"]] == ["#a", "#B", "#x1", "#x2", "#d"]
+    assert [s["index"] for s in new_script["steps"]] == [1, 2, 3, 4, 5]
+    assert step_map == [1, 1, 2, 1]
+    assert new_script["browser"] == "chromium"
+    # 旧脚本未被修改
+    assert [s["index"] for s in script["steps"]] == [1, 2, 3, 4, 5]
+
+
+def test_splice_drops_deleted_steps():
+    base_steps = standard("a", "b", "c")
+    script = script_for("a", "b", "c")
+    base = with_script_base(None, "playwright", base_steps, script)["playwright"]
+    new_steps = standard("a", "c")
+
+    plan = plan_regeneration(base, new_steps, script)
+    assert segments_to_generate(plan, new_steps, script) == []
+
+    new_script, step_map = splice_script(script, base, plan, {})
+
+    assert [s["selector"] for s in new_script["steps"]] == ["#a", "#c"]
+    assert [s["index"] for s in new_script["steps"]] == [1, 2]
+    assert step_map == [1, 1]
@@ -0,0 +1,72 @@
+"""
+流式生成测试：模拟 SDK 的流对象，验证 _stream_generation 逐步产出步骤并以 result 结束
+"""
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.llm_service import LLMService
+
+
+class FakeResponse:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeOpenAIStream:
+    """与 openai 1.3.7 的 Stream 一致：只能迭代，没有 close()，通过 response 关闭连接"""
+
+    def __init__(self, texts):
+        self._texts = texts
+        self.response = FakeResponse()
+
+    def __iter__(self):
+        for text in self._texts:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+def make_service(stream) -> LLMService:
+    service = LLMService.__new__(LLMService)
+    service.provider = "openai"
+    service.model = "test-model"
+    service.base_url = None
+    service.config = {"response_cache": False, "rate_limit_rpm": 0}
+    service.rate_limit_key = "test|stream|generation"
+    service._open_stream = lambda prompt: stream
+    return service
+
+
+def chunked(text: str, size: int):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_stream_generation_yields_steps_then_result_and_closes_response():
+    script = {
+        "browser": "chromium",
+        "steps": [{"index": i, "action": "click", "description": f"步骤{i}"} for i in range(1, 4)]
+    }
+    stream = FakeOpenAIStream(chunked("```json\n" + json.dumps(script, ensure_ascii=False) + "\n```", 7))
+    service = make_service(stream)
+
+    events = list(service._stream_generation("prompt", "steps", service._parse_script_response))
+
+    steps = [event["data"] for event in events if event["event"] == "step"]
+    assert steps == script["steps"]
+    assert events[-1] == {"event": "result", "data": script}
+    # 第一个步骤在输出结束前就已产出
+    first_step = next(i for i, event in enumerate(events) if event["event"] == "step")
+    assert any(event["event"] == "token" for event in events[first_step + 1:])
+    assert stream.response.closed
+
+
+def test_stream_generation_raises_on_invalid_json():
+    stream = FakeOpenAIStream(chunked('{"steps": [{"index": 1}', 5))
+    service = make_service(stream)
+
+    with pytest.raises(ValueError):
+        list(service._stream_generation("prompt", "steps", service._parse_script_response))
+    assert stream.response.closed
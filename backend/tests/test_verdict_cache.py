@@ -0,0 +1,44 @@
+"""
+判定缓存测试：只有最终页面完全一致时才复用判定
+"""
+
+from PIL import Image, ImageDraw
+
+from app.services.verdict_cache import VerdictCache
+
+VERDICT = {"verdict": "passed", "confidence": 0.95, "reason": "出现成功提示"}
+
+
+def banner(path, text: str) -> str:
+    image = Image.new("RGB", (1280, 720), "white")
+    ImageDraw.Draw(image).text((40, 40), text, fill="black")
+    image.save(path)
+    return str(path)
+
+
+def snapshot(text: str) -> dict:
+    return {"url": "https://example.com/form", "title": "表单", "text": text}
+
+
+def test_hit_requires_identical_pixels_and_text(tmp_path):
+    cache = VerdictCache(str(tmp_path / "cache"))
+    success = banner(tmp_path / "success.png", "Saved successfully")
+    cache.store(1, "提示保存成功", success, snapshot("Saved successfully"), VERDICT, run_id=10)
+
+    hit = cache.lookup(1, "提示保存成功", banner(tmp_path / "again.png", "Saved successfully"), snapshot("Saved successfully"))
+    assert hit["verdict"] == "passed"
+    assert hit["cache"]["source_run_id"] == 10
+
+    error = banner(tmp_path / "error.png", "Saved unsuccessfully")
+    assert cache.lookup(1, "提示保存成功", error, snapshot("Saved unsuccessfully")) is None
+    # 像素相同但页面文本不同（例如文字在截图之外）也不命中
+    assert cache.lookup(1, "提示保存成功", success, snapshot("Save failed")) is None
+    # 预期结果改变后不命中
+    assert cache.lookup(1, "提示保存失败", success, snapshot("Saved successfully")) is None
+
+
+def test_no_snapshot_skips_cache(tmp_path):
+    cache = VerdictCache(str(tmp_path / "cache"))
+    success = banner(tmp_path / "success.png", "Saved successfully")
+    cache.store(1, "提示保存成功", success, None, VERDICT, run_id=10)
+    assert cache.lookup(1, "提示保存成功", success, None) is None
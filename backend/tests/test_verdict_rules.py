@@ -0,0 +1,39 @@
+"""
+本地规则判定测试：只有预期文字出现在最终页面上时才跳过视觉模型
+"""
+from app.services.verdict_rules import evaluate_verdict_rules, extract_expected_phrases
+
+EXECUTED = [{"index": 1, "status": "success"}, {"index": 2, "status": "success"}]
+WAIT_TAIL = [
+    {"index": 1, "action": "click", "selector": "#save"},
+    {"index": 2, "action": "waitForSelector", "selector": ".page-loaded"},
+]
+
+
+def snapshot(text, alerts=None):
+    return {"url": "https://example.com", "title": "订单", "text": text, "alerts": alerts or []}
+
+
+def test_extracts_quoted_and_cue_phrases():
+    assert extract_expected_phrases('页面显示"保存成功"') == ["保存成功"]
+    assert extract_expected_phrases("the page shows welcome back") == ["welcome back"]
+
+
+def test_tail_wait_without_expected_text_defers_to_vision():
+    assert evaluate_verdict_rules("订单状态正确", snapshot("订单列表"), EXECUTED, WAIT_TAIL) is None
+
+
+def test_matched_phrase_passes_and_tail_assertion_raises_confidence():
+    result = evaluate_verdict_rules('提示"保存成功"', snapshot("保存成功 订单列表"), EXECUTED)
+    assert result["verdict"] == "passed" and result["confidence"] == 0.9
+
+    result = evaluate_verdict_rules('提示"保存成功"', snapshot("保存成功 订单列表"), EXECUTED, WAIT_TAIL)
+    assert result["confidence"] == 0.95
+    assert [c["type"] for c in result["checks"]] == ["waitForSelector", "text"]
+
+
+def test_missing_phrase_error_alert_or_negation_defers_to_vision():
+    assert evaluate_verdict_rules('提示"保存成功"', snapshot("订单列表"), EXECUTED) is None
+    assert evaluate_verdict_rules('提示"保存成功"', snapshot("保存成功", alerts=["保存失败"]), EXECUTED) is None
+    assert evaluate_verdict_rules('不显示"保存成功"', snapshot("订单列表"), EXECUTED) is None
+    assert evaluate_verdict_rules('提示"保存成功"', None, EXECUTED) is None
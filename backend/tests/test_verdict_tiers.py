@@ -0,0 +1,63 @@
+"""
+分级判定测试：每一级按自己的模型压缩截图，某一级调用异常时升级到下一级
+"""
+import base64
+import io
+
+from PIL import Image
+
+from app.services.llm_service import LLMService
+
+CONFIDENT = '{"observation": "出现保存成功提示", "matches_expectation": true, "confidence": 0.95, "issues": []}'
+
+
+def make_service(models, replies):
+    service = LLMService.__new__(LLMService)
+    service.provider = "openai"
+    service.model = "gpt-4o"
+    service.base_url = None
+    service.config = {"verdict_models": models, "rate_limit_rpm": 0}
+    service.calls = []
+
+    def fake_call_vision(prompt, images, max_tokens=500, timeout=None, model=None, system=None):
+        width = Image.open(io.BytesIO(base64.b64decode(images[0]["data"]))).width
+        service.calls.append((model, width))
+        reply = replies[model]
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    service._call_vision = fake_call_vision
+    return service
+
+
+def screenshot(tmp_path) -> str:
+    path = tmp_path / "final.png"
+    Image.new("RGB", (1920, 1080), "white").save(path)
+    return str(path)
+
+
+def test_each_tier_gets_an_image_sized_for_its_model(tmp_path):
+    service = make_service(["gpt-4o-mini", "gpt-4o"], {
+        "gpt-4o-mini": '{"observation": "看不清", "matches_expectation": true, "confidence": 0.4, "issues": []}',
+        "gpt-4o": CONFIDENT,
+    })
+
+    result = service.analyze_final_result("提示保存成功", screenshot(tmp_path), [], True)
+
+    assert service.calls == [("gpt-4o-mini", 768), ("gpt-4o", 1024)]
+    assert result["verdict"] == "passed"
+    assert result["model"] == "gpt-4o"
+
+
+def test_exception_in_a_tier_escalates_to_the_next(tmp_path):
+    service = make_service(["gpt-4o-mini", "gpt-4o"], {
+        "gpt-4o-mini": RuntimeError("connection reset"),
+        "gpt-4o": CONFIDENT,
+    })
+
+    result = service.analyze_final_result("提示保存成功", screenshot(tmp_path), [], True)
+
+    assert [model for model, _ in service.calls] == ["gpt-4o-mini", "gpt-4o"]
+    assert result["verdict"] == "passed"
+    assert result["escalations"][0]["model"] == "gpt-4o-mini"
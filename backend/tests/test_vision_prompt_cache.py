@@ -0,0 +1,55 @@
+"""
+视觉分析提示词缓存测试：缓存断点前的静态指令足够长，用例相关内容都在断点之后
+"""
+from types import SimpleNamespace
+
+from PIL import Image
+
+from app.services.llm_service import (
+    LLMService,
+    PROMPT_CACHE_MIN_TOKENS,
+    VISION_GUIDELINES,
+    estimate_prompt_tokens,
+)
+
+EXPECTED = "提示保存成功并返回订单列表 #A1001"
+
+
+class FakeMessages:
+    def __init__(self):
+        self.requests = []
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        text = '{"observation": "ok", "matches_expectation": true, "confidence": 0.9, "issues": []}'
+        return SimpleNamespace(content=[SimpleNamespace(type="text", text=text)], usage=None)
+
+
+def make_service() -> LLMService:
+    service = LLMService.__new__(LLMService)
+    service.provider = "anthropic"
+    service.model = "test-model"
+    service.base_url = None
+    service.config = {"rate_limit_rpm": 0}
+    service.rate_limit_key = "test|vision|cache"
+    service.client = SimpleNamespace(messages=FakeMessages())
+    return service
+
+
+def test_cached_block_is_above_minimum_prefix_length():
+    assert estimate_prompt_tokens(VISION_GUIDELINES) >= PROMPT_CACHE_MIN_TOKENS
+
+
+def test_per_run_content_follows_the_cache_breakpoint(tmp_path):
+    screenshot = tmp_path / "final.png"
+    Image.new("RGB", (1280, 720), "white").save(screenshot)
+    service = make_service()
+
+    result = service._analyze_screenshot_with_vision(str(screenshot), EXPECTED, {"description": "点击保存按钮"})
+
+    assert result["matches_expectation"] is True
+    request = service.client.messages.requests[0]
+    assert request["system"] == [{"type": "text", "text": VISION_GUIDELINES, "cache_control": {"type": "ephemeral"}}]
+    user_text = "".join(block.get("text", "") for block in request["messages"][0]["content"])
+    assert EXPECTED in user_text and "点击保存按钮" in user_text
+    assert EXPECTED not in VISION_GUIDELINES
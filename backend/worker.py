@@ -0,0 +1,43 @@
+"""
+独立的测试执行 worker
+从数据库领取 queued 状态的运行并执行，可以在多台机器上启动多个 worker 共用同一个数据库
+执行命令: python worker.py --concurrency 2
+"""
+import argparse
+
+from app.config import settings
+from app.database import DATABASE_URL
+from app.services.run_scheduler import RunScheduler
+from app.services.browser_pool import browser_pool
+from app.services.async_playwright_executor import async_playwright_runner
+from app.api.endpoints.test_runs import execute_test_background
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测试执行 worker")
+    parser.add_argument("--concurrency", type=int, default=settings.RUN_SCHEDULER_WORKERS, help="同时执行的最大运行数")
+    parser.add_argument("--project-limit", type=int, default=settings.RUN_SCHEDULER_PROJECT_LIMIT, help="每个项目同时执行的最大运行数")
+    parser.add_argument("--worker-id", default=None, help="worker 标识，默认使用 主机名-进程号")
+    args = parser.parse_args()
+
+    scheduler = RunScheduler(
+        max_workers=args.concurrency,
+        project_limit=args.project_limit,
+        poll_interval=settings.RUN_SCHEDULER_POLL_INTERVAL,
+        worker_id=args.worker_id,
+        lease_seconds=settings.RUN_LEASE_SECONDS,
+        heartbeat_interval=settings.RUN_HEARTBEAT_INTERVAL,
+        max_attempts=settings.RUN_MAX_ATTEMPTS
+    )
+
+    print(f"🛠️ Worker 启动，数据库: {DATABASE_URL}")
+    print(f"📁 工件目录: {settings.ARTIFACTS_PATH}（多台机器部署时需要挂载共享存储）")
+    try:
+        scheduler.run_forever(execute_test_background)
+    finally:
+        browser_pool.shutdown()
+        async_playwright_runner.shutdown()
+
+
+if __name__ == "__main__":
+    main()
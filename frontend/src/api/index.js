@@ -92,6 +92,29 @@ export const testCaseAPI = {
     })
   },
   
+  // 从自然语言一次生成用例和执行脚本
+  generateFull(projectId, naturalLanguage, executorType = 'playwright', prefetchOtherScript = false) {
+    return apiClient.post('/cases/generate-full', {
+      project_id: projectId,
+      natural_language: naturalLanguage,
+      executor_type: executorType,
+      prefetch_other_script: prefetchOtherScript
+    })
+  },
+
+  // 批量从自然语言生成用例和脚本（返回任务ID）
+  batchGenerate(projectId, descriptions, executorType = 'playwright') {
+    return apiClient.post(`/projects/${projectId}/cases/batch-generate`, {
+      descriptions,
+      executor_type: executorType
+    })
+  },
+
+  // 查询批量生成任务进度
+  getBatchJob(jobId) {
+    return apiClient.get(`/cases/batch-jobs/${jobId}`)
+  },
+
   // 生成Playwright脚本
   generateScript(testCaseId) {
     return apiClient.post('/cases/generate-script', {
@@ -104,6 +127,13 @@ export const testCaseAPI = {
     return apiClient.post('/cases/generate-midscene-script', {
       test_case_id: testCaseId
     })
+  },
+
+  // 按修改后的标准化步骤重新生成并保存脚本（只生成改动的步骤）
+  regenerateScript(testCaseId, executorType = 'playwright') {
+    return apiClient.post(`/cases/${testCaseId}/regenerate-script`, {
+      executor_type: executorType
+    })
   }
 }
 